@@ -0,0 +1,389 @@
+"""
+Benchmarks for the feature managers and the plan executor.
+
+Every scenario runs against a fresh simulated Windows host with a fixed
+latency injected into each registry call and each process launch (sc,
+schtasks, taskkill, explorer). For each scenario the suite records the wall
+time (median and best), the number of registry calls and process launches,
+and the peak memory allocated, then compares them with the stored baseline.
+Any increase in operation counts, or a best-time/memory increase above the
+tolerance, is reported as a regression and makes the run exit with status 1.
+
+The fleet scenario applies the combined plan to many simulated hosts through
+FleetExecutor and also records the throughput (hosts per second) and the
+longest time a host waited for a worker; a drop in throughput or a rise in
+queueing above the tolerance is a regression too.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_features
+    python -m benchmarks.bench_features --only telemetry --repeat 10
+    python -m benchmarks.bench_features --update-baseline
+    python -m benchmarks.bench_features --only fleet --fleet-hosts 5000 --fleet-workers 64
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from src.core.backend import set_backend
+from src.core.log_manager import LogManager
+from src.core.planner import PlanExecutor, build_plan
+from src.core.profiles import load_profile
+from src.core.simulator import SimulatedHost, SimulatorBackend
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Default latencies, in seconds: a local registry call and a process launch
+REGISTRY_LATENCY = 0.001
+PROCESS_LATENCY = 0.02
+
+# Absolute slack on top of the relative tolerance, so scenarios that take a
+# few milliseconds or allocate a few KiB do not fail on noise
+WALL_SLACK = 0.005
+MEMORY_SLACK_KIB = 16
+QUEUE_SLACK = 0.05
+
+# Simulated hosts and workers of the fleet scenario; the default keeps the suite quick
+FLEET_SCENARIO = "fleet"
+FLEET_HOSTS = 200
+FLEET_WORKERS = 32
+
+BUILTIN_PROFILES = ("telemetry", "cortana", "context_menu", "copilot")
+
+
+class Scenario(NamedTuple):
+    """A benchmarked operation; prepare runs untimed on the same host first."""
+    name: str
+    run: Callable[[SimulatorBackend], object]
+    prepare: Optional[Callable[[SimulatorBackend], object]] = None
+
+
+class BenchmarkResult(NamedTuple):
+    """Measurements of one scenario."""
+    name: str
+    wall: float  # median over all repeats, seconds
+    wall_min: float
+    operations: Dict[str, int]
+    peak_kib: float
+    fleet: Optional[Dict[str, float]] = None  # hosts, workers, throughput and max_queued of the fleet scenario
+
+
+def disable_telemetry(backend: SimulatorBackend) -> object:
+    from src.features.telemetry import TelemetryManager
+    return TelemetryManager().disable_all_telemetry()
+
+
+def disable_cortana(backend: SimulatorBackend) -> object:
+    from src.features.cortana import CortanaManager
+    return CortanaManager().disable_all_cortana()
+
+
+def old_context_menu(backend: SimulatorBackend) -> object:
+    from src.features.context_menu import ContextMenuManager
+    return ContextMenuManager().old_context_menu_all()
+
+
+def disable_copilot(backend: SimulatorBackend) -> object:
+    from src.features.copilot import CopilotManager
+    return CopilotManager().disable_copilot()
+
+
+def apply_all_profiles(backend: SimulatorBackend) -> object:
+    plan = build_plan([load_profile(name) for name in BUILTIN_PROFILES])
+    return PlanExecutor.for_transport(backend).execute(plan)
+
+
+SCENARIOS = [
+    Scenario("telemetry", disable_telemetry),
+    Scenario("telemetry_rerun", disable_telemetry, prepare=disable_telemetry),
+    Scenario("cortana", disable_cortana),
+    Scenario("context_menu", old_context_menu),
+    Scenario("copilot", disable_copilot),
+    Scenario("plan_all", apply_all_profiles),
+    Scenario("plan_all_rerun", apply_all_profiles, prepare=apply_all_profiles),
+]
+
+
+def count_operations(host: SimulatedHost) -> Dict[str, int]:
+    """
+    Collect the operation counters of a simulated host.
+
+    Returns:
+        dict: Registry calls by kind and process launches by tool
+    """
+    operations = {f"registry_{name}": count for name, count in host.registry.operations.items()}
+    for tool in ("sc", "schtasks", "taskkill"):
+        operations[tool] = host.command_count([tool, f"{tool}.exe"])
+    operations["process_start"] = len(host.started)
+    return operations
+
+
+def run_once(scenario: Scenario, registry_latency: float, process_latency: float, trace: bool = False):
+    """
+    Run a scenario once on a fresh host.
+
+    Returns:
+        tuple: (wall time in seconds, operation counts, peak KiB allocated or 0)
+    """
+    host = SimulatedHost.windows_default(latency=process_latency, registry_latency=registry_latency)
+    backend = SimulatorBackend(host)
+    set_backend(backend)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if scenario.prepare:
+            scenario.prepare(backend)
+        before = count_operations(host)
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        scenario.run(backend)
+        wall = time.perf_counter() - start
+        peak = 0.0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+    after = count_operations(host)
+    operations = {name: after[name] - before[name] for name in after}
+    return wall, operations, peak
+
+
+def run_scenario(scenario: Scenario, repeat: int, registry_latency: float, process_latency: float) -> BenchmarkResult:
+    """
+    Time a scenario over several runs and measure its allocations in one more.
+
+    Allocations are measured in a separate run because tracing slows every
+    allocation down and would distort the timings.
+    """
+    walls = []
+    operations: Dict[str, int] = {}
+    for _ in range(repeat):
+        wall, operations, _ = run_once(scenario, registry_latency, process_latency)
+        walls.append(wall)
+    _, _, peak = run_once(scenario, registry_latency, process_latency, trace=True)
+    return BenchmarkResult(scenario.name, statistics.median(walls), min(walls), operations, peak)
+
+
+def run_fleet_once(hosts: int, workers: int, registry_latency: float, process_latency: float, trace: bool = False):
+    """
+    Apply all built-in profiles to a fleet of fresh simulated hosts once.
+
+    Returns:
+        tuple: (wall time in seconds, operation counts summed over all hosts,
+        peak KiB allocated or 0, FleetResult)
+    """
+    from src.core.fleet import FleetExecutor
+    from src.core.transport import SimulatedTransport
+
+    fleet = {
+        name: SimulatedHost.windows_default(name, latency=process_latency, registry_latency=registry_latency)
+        for name in (f"sim-{index:05d}" for index in range(hosts))
+    }
+    plan = build_plan([load_profile(name) for name in BUILTIN_PROFILES])
+    executor = FleetExecutor(lambda name: SimulatedTransport(fleet[name]), max_workers=workers, host_timeout=None, retries=0)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = executor.run(list(fleet), plan)
+        wall = time.perf_counter() - start
+        peak = 0.0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+
+    operations: Dict[str, int] = {}
+    for host in fleet.values():
+        for name, count in count_operations(host).items():
+            operations[name] = operations.get(name, 0) + count
+    return wall, operations, peak, result
+
+
+def run_fleet_scenario(repeat: int, hosts: int, workers: int, registry_latency: float, process_latency: float) -> BenchmarkResult:
+    """
+    Time the fleet scenario over several runs (see run_scenario).
+
+    Throughput is taken from the fastest run, queueing is the median of the
+    longest wait for a worker in each run.
+    """
+    walls = []
+    queued = []
+    operations: Dict[str, int] = {}
+    for _ in range(repeat):
+        wall, operations, _, result = run_fleet_once(hosts, workers, registry_latency, process_latency)
+        walls.append(wall)
+        queued.append(result.max_queued)
+    _, _, peak, _ = run_fleet_once(hosts, workers, registry_latency, process_latency, trace=True)
+    fleet = {"hosts": hosts, "workers": workers, "throughput": hosts / min(walls), "max_queued": statistics.median(queued)}
+    return BenchmarkResult(FLEET_SCENARIO, statistics.median(walls), min(walls), operations, peak, fleet)
+
+
+def compare(results: List[BenchmarkResult], baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compare results with a baseline.
+
+    Args:
+        results: The new measurements
+        baseline: Scenario name -> stored measurements
+        tolerance: Allowed relative increase of wall time and peak memory
+
+    Returns:
+        list: One message per regression
+    """
+    regressions = []
+    for result in results:
+        stored = baseline.get(result.name)
+        if stored is None:
+            continue
+        for name, count in result.operations.items():
+            expected = stored["operations"].get(name, 0)
+            if count > expected:
+                regressions.append(f"{result.name}: {name} went from {expected} to {count}")
+        # The fastest run is compared: it is the least disturbed by scheduler noise
+        best = stored.get("wall_min", stored["wall"])
+        if result.wall_min > best * (1 + tolerance) + WALL_SLACK:
+            regressions.append(f"{result.name}: best wall time went from {best * 1000:.1f} ms to {result.wall_min * 1000:.1f} ms")
+        if result.peak_kib > stored["peak_kib"] * (1 + tolerance) + MEMORY_SLACK_KIB:
+            regressions.append(f"{result.name}: peak memory went from {stored['peak_kib']:.0f} KiB to {result.peak_kib:.0f} KiB")
+        fleet = stored.get("fleet")
+        if result.fleet and fleet:
+            if result.fleet["throughput"] < fleet["throughput"] / (1 + tolerance):
+                regressions.append(
+                    f"{result.name}: throughput went from {fleet['throughput']:.1f} to {result.fleet['throughput']:.1f} hosts/s"
+                )
+            if result.fleet["max_queued"] > fleet["max_queued"] * (1 + tolerance) + QUEUE_SLACK:
+                regressions.append(
+                    f"{result.name}: longest wait for a worker went from {fleet['max_queued']:.2f} s to {result.fleet['max_queued']:.2f} s"
+                )
+    return regressions
+
+
+def print_results(results: List[BenchmarkResult], baseline: Dict) -> None:
+    """Print one row per scenario, with the baseline wall time next to the new one."""
+    rows = [("scenario", "wall ms", "baseline ms", "peak KiB", "reg open/query/set", "sc", "schtasks", "launches")]
+    for result in results:
+        stored = baseline.get(result.name)
+        ops = result.operations
+        rows.append((
+            result.name,
+            f"{result.wall * 1000:.1f}",
+            f"{stored['wall'] * 1000:.1f}" if stored else "-",
+            f"{result.peak_kib:.0f}",
+            f"{ops['registry_open']}/{ops['registry_query']}/{ops['registry_set']}",
+            str(ops["sc"]),
+            str(ops["schtasks"]),
+            str(ops["taskkill"] + ops["process_start"]),
+        ))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+    for result in results:
+        if result.fleet:
+            fleet = result.fleet
+            stored = (baseline.get(result.name) or {}).get("fleet")
+            line = (f"\n{result.name}: {fleet['hosts']} hosts on {fleet['workers']} workers, "
+                    f"{fleet['throughput']:.1f} hosts/s, longest wait for a worker {fleet['max_queued']:.2f} s")
+            if stored:
+                line += f" (baseline {stored['throughput']:.1f} hosts/s, {stored['max_queued']:.2f} s)"
+            print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the features on a simulated Windows host")
+    parser.add_argument("--only", action="append", default=[], metavar="NAME",
+                        help="Only run this scenario (can be given several times)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per scenario (default: 5)")
+    parser.add_argument("--registry-latency", type=float, default=REGISTRY_LATENCY,
+                        help=f"Seconds added to every registry call (default: {REGISTRY_LATENCY})")
+    parser.add_argument("--process-latency", type=float, default=PROCESS_LATENCY,
+                        help=f"Seconds added to every process launch (default: {PROCESS_LATENCY})")
+    parser.add_argument("--fleet-hosts", type=int, default=FLEET_HOSTS,
+                        help=f"Simulated hosts in the fleet scenario (default: {FLEET_HOSTS})")
+    parser.add_argument("--fleet-workers", type=int, default=FLEET_WORKERS,
+                        help=f"Workers of the fleet scenario (default: {FLEET_WORKERS})")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="Allowed relative increase of wall time and memory (default: 0.3)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in SCENARIOS if not args.only or s.name in args.only]
+    run_fleet = not args.only or FLEET_SCENARIO in args.only
+    unknown = set(args.only) - {s.name for s in SCENARIOS} - {FLEET_SCENARIO}
+    if unknown:
+        print(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+        return 2
+
+    settings = {"registry_latency": args.registry_latency, "process_latency": args.process_latency}
+    baseline: Dict = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("settings") == settings:
+            baseline = stored.get("results", {})
+        elif not args.update_baseline:
+            print(f"Baseline was recorded with {stored.get('settings')}; not comparing")
+
+    # Log files go to a scratch directory and console logging to nowhere, so
+    # the benchmark neither litters the tree nor times terminal output
+    workdir = tempfile.mkdtemp(prefix="wscript-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    devnull = open(os.devnull, "w")
+    try:
+        LogManager.configure(log_dir=os.path.join(workdir, "logs"))
+        with contextlib.redirect_stderr(devnull):
+            LogManager()
+        results = [run_scenario(s, args.repeat, args.registry_latency, args.process_latency) for s in scenarios]
+        if run_fleet:
+            results.append(run_fleet_scenario(
+                args.repeat, args.fleet_hosts, args.fleet_workers, args.registry_latency, args.process_latency
+            ))
+    finally:
+        set_backend(None)
+        LogManager.shutdown()
+        devnull.close()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # Fleet measurements are only comparable for the same fleet size
+    fleet_result = next((r for r in results if r.fleet), None)
+    stored_fleet = baseline.get(FLEET_SCENARIO, {}).get("fleet")
+    if fleet_result and stored_fleet and (stored_fleet["hosts"], stored_fleet["workers"]) != (args.fleet_hosts, args.fleet_workers):
+        if not args.update_baseline:
+            print(f"Fleet baseline was recorded with {stored_fleet['hosts']} hosts on {stored_fleet['workers']} workers; not comparing")
+        baseline = {name: stored for name, stored in baseline.items() if name != FLEET_SCENARIO}
+
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        stored_results = dict(baseline)
+        for r in results:
+            stored_results[r.name] = {"wall": r.wall, "wall_min": r.wall_min, "operations": r.operations, "peak_kib": r.peak_kib}
+            if r.fleet:
+                stored_results[r.name]["fleet"] = r.fleet
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "results": stored_results}, f, indent=4, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nREGRESSIONS:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nNo regressions" if baseline else "\nNo baseline to compare with (use --update-baseline)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,29 @@
 import argparse
-from src.features.telemetry import TelemetryManager
-from src.features.cortana import CortanaManager
-from src.core.admin_check import AdminCheck
-from src.features.context_menu import ContextMenuManager
-from src.features.copilot import CopilotManager
-from src.features.intscan import IntegrityCheckManager
+import importlib
+from collections import namedtuple
+
+# Everything below src/ is imported only once a feature needs it, so --help
+# and runs without options load nothing but argparse and touch no files.
+
+# A selectable feature: applied through its built-in profile, or run through
+# an entry point ('module:Class.method', constructed only when selected)
+Feature = namedtuple('Feature', 'flag help title profile entry_point')
+
+FEATURES = {
+    'telemetry': Feature('--telemetry', 'Disable Windows telemetry', 'Disabling Telemetry', 'telemetry', None),
+    'cortana': Feature('--cortana', 'Disable Cortana', 'Disabling Cortana', 'cortana', None),
+    'context_menu': Feature('--context-menu', 'Activate older Windows 10 context menu', 'Activating Win10 Context Menu', 'context_menu', None),
+    'copilot': Feature('--copilot', 'Disables Windows Copilot', 'Disabling Copilot', 'copilot', None),
+    'integrity': Feature('--integrity', 'Runs SFC and DISM integrity checks', 'Running integrity checks', None,
+                         'src.features.intscan:IntegrityCheckManager.run_integrity_check'),
+}
+
+def load_entry_point(entry_point):
+    """Import the module of an entry point and return the bound method of a new instance."""
+    module_name, _, target = entry_point.partition(':')
+    class_name, _, method_name = target.partition('.')
+    feature_class = getattr(importlib.import_module(module_name), class_name)
+    return getattr(feature_class(), method_name)
 
 def print_header():
     """Print a formatted header for the application."""
@@ -18,6 +37,452 @@ def print_section_header(title):
     print(f" {title}")
     print("-"*30)
 
+def apply_to_all_users(plan):
+    """Apply the HKEY_CURRENT_USER part of a plan to every user profile on the machine."""
+    from src.core.backend import get_backend
+    from src.core.registry_backend import HIVE_NAMES
+    from src.core.user_hives import UserHiveApplier
+
+    # The hives are unloaded after each user, so no cached handles may point into them
+    results = UserHiveApplier(get_backend().registry).apply(plan)
+    for result in results:
+        if result.error:
+            print(f"  {result.sid} ({result.path}): {result.error}")
+            continue
+        how = "loaded from disk" if result.mounted else "logged on"
+        print(f"  {result.sid} ({result.path}, {how}): {result.changes} change(s)")
+        for failed in (r for r in result.registry if not r.success):
+            location = f"{HIVE_NAMES.get(failed.operation.hive)}\\{failed.operation.key_path}"
+            print(f"    Error setting {failed.operation.value_name} in {location}: {failed.error}")
+    print(f"Per-user settings applied to {len(results)} user profile(s)")
+    return all(result.success for result in results)
+
+def print_compliance(report):
+    """Print how many targets are in the desired state, and the ones that are not."""
+    print(f"Verified: {report.compliant} of {len(report.items)} item(s) in the desired state")
+    for item in report.drifted:
+        print(f"  {item.kind:<9} {item.target}: {item.actual!r}, expected {item.expected!r}")
+    if not report.complete:
+        print("  Some of the current state could not be read.")
+
+def apply_profiles(profile_names, use_cache=True, cache_file=None, all_users=False, bulk=False):
+    """
+    Merge the given profiles into one plan and apply it in a single pass.
+
+    With the compliance cache, profiles whose targets have not changed since
+    their last successful run are skipped. With all_users, the per-user part
+    of the plan is applied to every user profile too (and the cache, which
+    only knows the current user, is not used). With bulk, the registry
+    values are written with a single `reg import`.
+    """
+    from src.core.backend import get_backend
+    from src.core.journal import Journal, set_journal
+    from src.core.planner import PlanExecutor, build_plan
+    from src.core.profiles import ProfileError, load_profile
+    from src.core.state_cache import ComplianceCache, StateDetector, record_results, split_unchanged
+    from src.core.verifier import Verifier
+
+    try:
+        profiles = [load_profile(name) for name in profile_names]
+    except ProfileError as e:
+        print(f"ERROR: {str(e)}")
+        return False
+
+    cache = detector = None
+    if use_cache and not all_users:
+        cache = ComplianceCache(cache_file)
+        detector = StateDetector(get_backend())
+        profiles, unchanged = split_unchanged(profiles, cache, detector)
+        for profile in unchanged:
+            print(f"Skipping '{profile.name}': nothing changed since its last successful run")
+        if not profiles:
+            print("\nEverything is still compliant.")
+            return True
+
+    plan = build_plan(profiles)
+    print(f"Plan: {plan.describe()}")
+    for conflict in plan.conflicts:
+        print(f"  Conflict on {conflict.target}: '{conflict.kept}' overrides '{conflict.dropped}'")
+
+    # The prior state of everything that is changed is journaled for --rollback
+    journal = Journal()
+    set_journal(journal)
+    try:
+        result = PlanExecutor(bulk=bulk).execute(plan)
+        users_ok = apply_to_all_users(plan) if all_users else True
+    finally:
+        set_journal(None)
+        journal.close()
+    print(f"{result.changes} change(s) applied, {result.compliant} item(s) already compliant")
+    print(f"Critical path: {result.schedule.describe_critical_path()}")
+    for error in result.errors:
+        print(f"  Step failed - {error}")
+    # Read back everything the plan describes, so values reverted right away (e.g. by policy) show up
+    report = Verifier().verify(plan)
+    print_compliance(report)
+    if journal.entries:
+        print(f"Run id: {journal.run_id} (undo with --rollback {journal.run_id})")
+    if cache is not None:
+        record_results(profiles, result, cache, detector)
+        try:
+            cache.save()
+        except OSError as e:
+            print(f"Warning: could not save the compliance cache: {str(e)}")
+    success = result.success and users_ok and report.is_compliant
+    if success:
+        print("\nSuccessfully applied all changes!")
+    else:
+        print("\nSome operations failed. Check the logs for details.")
+    return success
+
+def watch_profiles(profile_names, debounce):
+    """Keep the registry values and disabled services of the given profiles in place until Ctrl+C."""
+    from src.core.drift_watch import DriftWatcher
+    from src.core.journal import Journal, set_journal
+    from src.core.planner import build_plan
+    from src.core.profiles import ProfileError, load_profile
+
+    try:
+        plan = build_plan([load_profile(name) for name in profile_names])
+    except ProfileError as e:
+        print(f"ERROR: {str(e)}")
+        return False
+    try:
+        watcher = DriftWatcher(plan, debounce=debounce)
+    except (NotImplementedError, OSError) as e:
+        print(f"ERROR: Cannot watch the registry: {str(e)}")
+        return False
+
+    print(f"\nWatching {len(watcher.watched_keys())} registry key(s) for drift. Press Ctrl+C to stop.")
+    # Repairs are journaled like any other run, so they can be rolled back
+    journal = Journal()
+    set_journal(journal)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        set_journal(None)
+        journal.close()
+    print(f"\nStopped watching: {watcher.passes} check(s), {watcher.repaired} item(s) repaired")
+    if journal.entries:
+        print(f"Run id: {journal.run_id} (undo with --rollback {journal.run_id})")
+    return True
+
+def rollback_run(run_id):
+    """Restore the state from before a journaled run."""
+    from src.core.journal import Journal, set_journal
+    from src.core.rollback import rollback
+
+    # The rollback is journaled too, so it can itself be undone
+    journal = Journal()
+    set_journal(journal)
+    try:
+        result = rollback(run_id)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: Cannot roll back run {run_id}: {str(e)}")
+        return False
+    finally:
+        set_journal(None)
+        journal.close()
+
+    restored = sum(1 for r in result.registry if r.success and not r.compliant)
+    print(f"Rolled back run {result.run_id}: {restored} registry value(s), "
+          f"{len(result.services)} service(s), {sum(1 for r in result.tasks if r.changed)} task(s) restored")
+    for r in result.registry:
+        if not r.success:
+            print(f"  Failed to restore {r.operation.key_path}\\{r.operation.value_name}: {r.error}")
+    for r in result.services:
+        if not r.success:
+            print(f"  Failed to restore service {r.service_name}: {r.error}")
+    for r in result.tasks:
+        if not r.success and r.exists:
+            print(f"  Failed to restore task {r.task_path}: {r.error}")
+    if journal.entries:
+        print(f"Run id: {journal.run_id} (undo with --rollback {journal.run_id})")
+    print("Sign out or restart Explorer for shell changes to take effect.")
+    return result.success
+
+def check_profiles(profile_names):
+    """Check whether this machine is in the state the given profiles describe, without changing anything."""
+    from src.core.planner import build_plan
+    from src.core.profiles import ProfileError, load_profile
+    from src.core.verifier import Verifier
+
+    try:
+        plan = build_plan([load_profile(name) for name in profile_names])
+    except ProfileError as e:
+        print(f"ERROR: {str(e)}")
+        return False
+
+    print(f"Plan: {plan.describe()}")
+    report = Verifier().verify(plan)
+    print_compliance(report)
+    print("\nCompliant." if report.is_compliant else "\nNot compliant.")
+    return report.is_compliant
+
+def registry_operations(profile_names):
+    """Get the registry values the merged plan of some profiles writes, as registry operations."""
+    from src.core.planner import build_plan
+    from src.core.profiles import load_profile
+    from src.core.registry_manager import RegistryOperation
+
+    plan = build_plan([load_profile(name) for name in profile_names])
+    return [
+        RegistryOperation("set", planned.hive, planned.path, planned.name, planned.value, planned.value_type)
+        for planned in plan.registry_values()
+    ]
+
+def export_profiles(profile_names, path):
+    """
+    Write the registry values of the given profiles to a .reg file, or the
+    machine policies among them to a Registry.pol file.
+    """
+    from src.core.profiles import ProfileError
+    from src.core.reg_files import is_policy, write_pol_file, write_reg_file
+    from src.core.registry_backend import HKEY_LOCAL_MACHINE
+
+    try:
+        operations = registry_operations(profile_names)
+        if path.lower().endswith(".pol"):
+            policies = [operation for operation in operations if is_policy(operation) and operation.hive == HKEY_LOCAL_MACHINE]
+            write_pol_file(path, policies)
+            print(f"Wrote {len(policies)} machine policy value(s) to {path}")
+            if len(policies) < len(operations):
+                print(f"{len(operations) - len(policies)} value(s) outside HKEY_LOCAL_MACHINE\\SOFTWARE\\Policies are not included")
+        else:
+            write_reg_file(path, operations)
+            print(f"Wrote {len(operations)} value(s) to {path} (apply with: reg import {path})")
+    except (ProfileError, OSError) as e:
+        print(f"ERROR: {str(e)}")
+        return False
+    return True
+
+def install_policy_profiles(profile_names):
+    """Merge the policy values of the given profiles into the local Group Policy object and run gpupdate."""
+    from src.core.backend import get_backend
+    from src.core.profiles import ProfileError
+    from src.core.reg_files import LOCAL_GPO_DIR, install_policies, is_policy
+
+    try:
+        operations = registry_operations(profile_names)
+        written = install_policies(operations, LOCAL_GPO_DIR)
+    except (ProfileError, OSError) as e:
+        print(f"ERROR: {str(e)}")
+        return False
+
+    for path in written:
+        print(f"Updated {path}")
+    skipped = sum(1 for operation in operations if not is_policy(operation))
+    if skipped:
+        print(f"{skipped} value(s) outside SOFTWARE\\Policies are not policies; apply them without --install-policy")
+    if not written:
+        return True
+    print("Running gpupdate...")
+    result = get_backend().run(["gpupdate", "/force"])
+    if result.returncode != 0:
+        print(f"gpupdate failed: {(result.stderr or result.stdout).strip()}")
+        return False
+    print("Policies applied.")
+    return True
+
+def preview_profiles(profile_names):
+    """Show what applying the given profiles would change, without changing anything."""
+    from src.core.dry_run import describe, predict
+    from src.core.planner import build_plan
+    from src.core.profiles import ProfileError, load_profile
+
+    try:
+        plan = build_plan([load_profile(name) for name in profile_names])
+    except ProfileError as e:
+        print(f"ERROR: {str(e)}")
+        return False
+
+    print(f"Plan: {plan.describe()}")
+    dry_run = predict(plan)
+    if dry_run.simulated:
+        print("Note: the registry cannot be read on this system; assuming a fresh Windows install.")
+    lines = describe(dry_run)
+    for line in lines:
+        print(f"  {line}")
+    if not lines:
+        print("  Nothing to change - the system is already compliant.")
+    result = dry_run.result
+    print(f"\nDry run: {result.changes} change(s) would be applied, {result.compliant} item(s) already compliant")
+    return result.success
+
+def apply_profiles_to_fleet(profile_names, inventory, workers, host_timeout, retries, metrics=None, check=False):
+    """
+    Apply the merged plan to every host of an inventory file and print a
+    result matrix; with check, only report how far each host has drifted.
+    """
+    from src.core.command_runner import MAX_CONCURRENT_COMMANDS, AsyncCommandRunner, set_command_runner
+    from src.core.fleet import FleetExecutor, load_inventory
+    from src.core.planner import PlanExecutor, build_plan
+    from src.core.profiles import ProfileError, load_profile
+    from src.core.transport import LocalTransport, connect
+
+    try:
+        plan = build_plan([load_profile(name) for name in profile_names])
+        hosts = load_inventory(inventory)
+    except (ProfileError, OSError) as e:
+        print(f"ERROR: {str(e)}")
+        return False
+
+    print(f"Plan: {plan.describe()}")
+    print(f"{'Checking' if check else 'Applying to'} {len(hosts)} host(s) with {workers} worker(s)...")
+    # Every worker may be waiting on a remote sc or schtasks call at the same time
+    set_command_runner(AsyncCommandRunner(max_concurrent=max(MAX_CONCURRENT_COMMANDS, workers)))
+    def transport_factory(host):
+        transport = connect(host)
+        # The local backend is already timed when metrics are on
+        if metrics is None or isinstance(transport, LocalTransport):
+            return transport
+        from src.core.metrics import InstrumentedBackend
+        return InstrumentedBackend(transport, metrics)
+
+    if check:
+        from src.core.verifier import Verifier
+        executor_factory = Verifier.for_transport
+    else:
+        executor_factory = PlanExecutor.for_transport
+    fleet = FleetExecutor(
+        transport_factory, executor_factory, max_workers=workers, host_timeout=host_timeout, retries=retries
+    ).run(hosts, plan)
+
+    rows = fleet.matrix()
+    if check:
+        rows[0][4] = "Drifted"
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+    print(f"\n{fleet.succeeded} host(s) succeeded, {fleet.failed} failed in {fleet.duration:.1f}s")
+    if check:
+        compliant = sum(1 for host in fleet.hosts if host.result is not None and host.result.is_compliant)
+        print(f"{compliant} of {len(fleet.hosts)} host(s) compliant")
+        return compliant == len(fleet.hosts)
+    return fleet.failed == 0
+
+def print_options():
+    """Print the available options, for runs without any."""
+    print("No options specified. Use one of the following options:")
+    print("\nAvailable options:")
+    for feature in FEATURES.values():
+        print(f"  {feature.flag}     {feature.help}")
+    print("  --profile FILE     Apply a custom profile (JSON/TOML)")
+    print("  --dry-run     Show what the selected features would change")
+    print("  --check     Only check whether the selected features are applied")
+    print("  --watch       Keep repairing drift of the selected features until Ctrl+C")
+    print("  --rollback RUN_ID     Undo a previous run ('latest' for the last one)")
+    print("  --no-cache     Apply every selected feature even if nothing changed")
+    print("  --hosts FILE     Apply the selected features to many hosts")
+    print("  --bulk     Write the registry values with a single reg import")
+    print("  --export FILE     Write the selected features to a .reg or Registry.pol file")
+    print("  --install-policy     Install the selected policies in the local Group Policy object")
+    print("  --report FILE / --metrics FILE     Write per-operation timings as JSON / Prometheus text")
+    print("  --trace FILE     Write a Chrome trace (or .folded flamegraph stacks) of the run")
+    print("  --log-dir DIR     Keep the rolling log in DIR (--log-keep N, --log-max-age DAYS set retention)")
+    print("  --help        Show this help message")
+
+def enable_metrics():
+    """Time every operation made through the platform backend from now on."""
+    from src.core.backend import get_backend, set_backend
+    from src.core.metrics import InstrumentedBackend, RunMetrics
+
+    metrics = RunMetrics()
+    set_backend(InstrumentedBackend(get_backend(), metrics))
+    return metrics
+
+def write_metrics(metrics, report_file, metrics_file):
+    """Write the run report and/or the Prometheus textfile."""
+    outputs = (("Run report", report_file, metrics.write_report), ("Metrics", metrics_file, metrics.write_prometheus))
+    for label, path, write in outputs:
+        if not path:
+            continue
+        try:
+            write(path)
+            print(f"{label} written to {path}")
+        except OSError as e:
+            print(f"Warning: could not write {path}: {str(e)}")
+
+def write_trace(tracer, trace_file):
+    """Stop tracing and write what was recorded."""
+    from src.core.tracing import set_tracer
+
+    set_tracer(None)
+    try:
+        tracer.write(trace_file)
+        print(f"Trace written to {trace_file} ({len(tracer.events)} spans)")
+    except OSError as e:
+        print(f"Warning: could not write {trace_file}: {str(e)}")
+
+def run_post_actions(scheduler):
+    """Run the Explorer restart or shell refresh requested during the run, once."""
+    if not scheduler.pending():
+        return
+    print_section_header("Refreshing Explorer")
+    for action, ok in scheduler.run().items():
+        print(f"{action}: {'done' if ok else 'failed'}")
+
+def run_selected(args, selected, metrics=None):
+    """Run the rollback, or apply the selected features and profiles."""
+    if args.rollback:
+        print_section_header(f"Rolling back {args.rollback}")
+        rollback_run(args.rollback)
+        return
+
+    from src.core.post_actions import PostActionScheduler, set_post_action_scheduler
+    from src.core.registry_backend import CachedRegistryBackend, get_registry_backend, set_registry_backend
+
+    # All selected profile features are merged into one plan and applied in one pass
+    planned = [dest for dest in selected if FEATURES[dest].profile]
+    profile_names = [FEATURES[dest].profile for dest in planned] + args.profile
+
+    # Explorer restarts and shell refreshes asked for by any feature run once, at the end,
+    # and registry keys opened by any feature stay open until then. Previews, checks and
+    # exports do not change anything (and a preview runs off Windows), so they skip the cache.
+    scheduler = PostActionScheduler()
+    set_post_action_scheduler(scheduler)
+    registry = None
+    if not (args.dry_run or args.check or args.export or args.install_policy):
+        registry = CachedRegistryBackend(get_registry_backend())
+        set_registry_backend(registry)
+    try:
+        if profile_names:
+            print_section_header(" / ".join([FEATURES[dest].title for dest in planned] + args.profile))
+            if args.cortana:
+                print("Warning: This will disable Cortana personal assistant features.")
+                print("Core Windows Search functionality will remain intact.")
+            if args.dry_run:
+                preview_profiles(profile_names)
+            elif args.export:
+                export_profiles(profile_names, args.export)
+            elif args.install_policy:
+                install_policy_profiles(profile_names)
+            elif args.hosts:
+                apply_profiles_to_fleet(profile_names, args.hosts, args.workers, args.host_timeout, args.retries, metrics, args.check)
+            elif args.check:
+                check_profiles(profile_names)
+            else:
+                apply_profiles(profile_names, not args.no_cache, args.cache_file, args.all_users, args.bulk)
+
+        # Features with their own entry point run after the plan, in registry order
+        for dest in selected:
+            feature = FEATURES[dest]
+            if feature.entry_point and not (args.dry_run or args.check or args.export or args.install_policy):
+                print_section_header(feature.title)
+                load_entry_point(feature.entry_point)()
+    finally:
+        set_post_action_scheduler(None)
+        if registry is not None:
+            set_registry_backend(None)
+            registry.close()
+    run_post_actions(scheduler)
+
+    # Watching blocks until Ctrl+C, so it comes last
+    if args.watch and profile_names:
+        watch_profiles(profile_names, args.debounce)
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(
@@ -26,75 +491,193 @@ def main():
     )
     
     # Add arguments
+    for feature in FEATURES.values():
+        parser.add_argument(
+            feature.flag,
+            action='store_true',
+            help=feature.help
+        )
     parser.add_argument(
-        '--telemetry',
+        '--profile',
+        action='append',
+        default=[],
+        metavar='FILE',
+        help='Apply a custom JSON/TOML profile (can be given several times)'
+    )
+    
+    parser.add_argument(
+        '--dry-run',
         action='store_true',
-        help='Disable Windows telemetry'
+        help='Show what the selected features would change without changing anything'
+    )
+    
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='Only check whether the selected features are applied (locally, or on every host with --hosts)'
+    )
+    parser.add_argument(
+        '--bulk',
+        action='store_true',
+        help='Write the registry values with a single reg import of a generated .reg file'
+    )
+    parser.add_argument(
+        '--export',
+        metavar='FILE',
+        help='Only write the registry values of the selected features to a .reg file, or their machine policies to a Registry.pol file (FILE ending in .pol)'
     )
     parser.add_argument(
-        '--cortana',
+        '--install-policy',
         action='store_true',
-        help='Disable Cortana'
+        help='Only merge the policy values of the selected features into the local Group Policy object and run gpupdate'
     )
     parser.add_argument(
-        '--context-menu',
+        '--all-users',
         action='store_true',
-        help='Activate older Windows 10 context menu'
+        help="Also apply per-user settings to every user profile, loading the hives of users who are not logged on"
     )
+
     parser.add_argument(
-        '--copilot',
+        '--watch',
         action='store_true',
-        help='Disables Windows Copilot'
+        help='After applying, keep watching the changed registry keys and repair drift until Ctrl+C'
+    )
+    parser.add_argument(
+        '--debounce',
+        type=float,
+        default=1.0,
+        metavar='SECONDS',
+        help='With --watch, wait until changes have settled for this long before repairing (default: 1)'
     )
     parser.add_argument(
-        '--integrity',
+        '--rollback',
+        metavar='RUN_ID',
+        help="Undo a previous run, using its journal ('latest' for the most recent run)"
+    )
+    parser.add_argument(
+        '--no-cache',
         action='store_true',
-        help='Runs SFC and DISM integrity checks'
+        help='Check and apply every selected feature, even if nothing changed since the last run'
+    )
+    parser.add_argument(
+        '--cache-file',
+        metavar='FILE',
+        help='Compliance cache location (default: %%ProgramData%%\\WScript\\compliance.json)'
+    )
+    
+    parser.add_argument(
+        '--report',
+        metavar='FILE',
+        help='Write a JSON run report with per-operation counts, p50/p95 latencies and failures'
+    )
+    parser.add_argument(
+        '--metrics',
+        metavar='FILE',
+        help='Write the same statistics as a Prometheus textfile (e.g. for the node exporter)'
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        help='Record nested timings of every registry, service and feature call as a Chrome trace '
+             '(FILE.folded: flamegraph stacks)'
+    )
+    
+    parser.add_argument(
+        '--hosts',
+        metavar='FILE',
+        help='Apply the selected features to every host listed in FILE (one per line)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=16,
+        help='Number of hosts handled at the same time with --hosts (default: 16)'
+    )
+    parser.add_argument(
+        '--host-timeout',
+        type=float,
+        default=300.0,
+        help='Seconds before a host is given up with --hosts (default: 300)'
+    )
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=1,
+        help='Retries for a failed host with --hosts (default: 1)'
+    )
+    parser.add_argument(
+        '--log-dir',
+        metavar='DIR',
+        help='Directory of the rolling log and the integrity reports (default: %%ProgramData%%\\WScript\\logs)'
+    )
+    parser.add_argument(
+        '--log-keep',
+        type=int,
+        metavar='N',
+        help='Number of rotated, compressed log segments to keep (default: 30)'
+    )
+    parser.add_argument(
+        '--log-max-age',
+        type=float,
+        metavar='DAYS',
+        help='Delete rotated log segments older than this (default: 30)'
     )
     
     # Parse arguments
     args = parser.parse_args()
 
-    # Check for admin rights
-    if not AdminCheck.is_admin():
-        print("ERROR: This script requires administrator privileges!")
-        print("Please run this script as administrator.")
+    selected = [dest for dest in FEATURES if getattr(args, dest)]
+    if not selected and not args.profile and not args.rollback:
+        print_options()
         return
 
+    from src.core.log_manager import LogManager
+    LogManager.configure(args.log_dir, args.log_keep, args.log_max_age)
+
+    if args.watch and (args.dry_run or args.hosts):
+        print("ERROR: --watch cannot be combined with --dry-run or --hosts.")
+        return
+    if args.all_users and (args.dry_run or args.hosts):
+        print("ERROR: --all-users cannot be combined with --dry-run or --hosts.")
+        return
+    if args.check and (args.dry_run or args.watch or args.all_users or args.rollback):
+        print("ERROR: --check cannot be combined with --dry-run, --watch, --all-users or --rollback.")
+        return
+    if args.bulk and (args.dry_run or args.check or args.hosts):
+        print("ERROR: --bulk cannot be combined with --dry-run, --check or --hosts.")
+        return
+    exporting = args.export or args.install_policy
+    if exporting and (args.dry_run or args.check or args.hosts or args.watch or args.all_users or args.bulk or args.rollback):
+        print("ERROR: --export and --install-policy cannot be combined with other modes.")
+        return
+
+    # Check for admin rights (a dry run, a check or an export only reads the current state)
+    if not (args.dry_run or args.check or args.export):
+        from src.core.admin_check import AdminCheck
+        if not AdminCheck.is_admin():
+            print("ERROR: This script requires administrator privileges!")
+            print("Please run this script as administrator.")
+            return
+
     print_header()
 
-    # Initialize feature managers
-    telemetry = TelemetryManager()
-    cortana = CortanaManager()
-    context_menu = ContextMenuManager()
-    copilot = CopilotManager()
-    integrity = IntegrityCheckManager
-
-    # Handle command line arguments
-    if args.telemetry:
-        print_section_header("Disabling Telemetry")
-        telemetry.disable_all_telemetry()
-    elif args.cortana:
-        print_section_header("Disabling Cortana")
-        cortana.disable_all_cortana()
-    elif args.context_menu:
-        print_section_header("Activating Win10 Context Menu")
-        context_menu.old_context_menu_all()
-    elif args.copilot:
-        print_section_header("Disabling Copilot")
-        copilot.disable_copilot()
-    elif args.integrity:
-        print_section_header("Running integrity checks")
-        integrity.run_integrity_check()
-    else:
-        print("No options specified. Use one of the following options:")
-        print("\nAvailable options:")
-        print("  --telemetry     Disable Windows telemetry")
-        print("  --cortana     Disable Cortana")
-        print("  --context-menu     Activate Win10 Context Menu")
-        print("  --copilot     Disable Copilot")
-        print("  --integrity     Runs integrity checks using SFC and DISM")
-        print("  --help        Show this help message")
+    # Every registry, service, task and process operation is timed for the run report
+    metrics = enable_metrics() if args.report or args.metrics else None
+    # Registry, service, task and feature calls record nested spans only while a tracer is set
+    tracer = None
+    if args.trace:
+        from src.core.tracing import Tracer, set_tracer
+        tracer = Tracer()
+        set_tracer(tracer)
+    try:
+        from src.core.tracing import Trace
+        with Trace.span("main", "main"):
+            run_selected(args, selected, metrics)
+    finally:
+        if metrics is not None:
+            write_metrics(metrics, args.report, args.metrics)
+        if tracer is not None:
+            write_trace(tracer, args.trace)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
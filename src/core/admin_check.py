@@ -1,5 +1,5 @@
-import ctypes
 from typing import Optional
+from .backend import get_backend
 
 class AdminCheck:
     @staticmethod
@@ -10,10 +10,7 @@ class AdminCheck:
         Returns:
             bool: True if running with admin rights, False otherwise
         """
-        try:
-            return ctypes.windll.shell32.IsUserAnAdmin()
-        except:
-            return False
+        return get_backend().is_admin()
     
     @staticmethod
     def require_admin(func):
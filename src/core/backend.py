@@ -0,0 +1,222 @@
+import ctypes
+import subprocess
+import time
+from typing import Callable, Dict, List, Optional
+from .command_runner import CommandResult, run_command
+from .registry_backend import RegistryBackend, WinregBackend, set_registry_backend, winreg
+
+# WM_SETTINGCHANGE broadcast and SHChangeNotify arguments for refreshing the shell
+HWND_BROADCAST = 0xFFFF
+WM_SETTINGCHANGE = 0x001A
+SMTO_ABORTIFHUNG = 0x0002
+SHCNE_ASSOCCHANGED = 0x08000000
+SHCNF_IDLIST = 0x0000
+# Setting area announced by the broadcast; Explorer re-reads its policies on it
+SETTING_AREA = "Policy"
+BROADCAST_TIMEOUT_MS = 2000
+
+
+class PlatformBackend:
+    """
+    Everything the tool needs from the operating system of one host.
+
+    Registry access goes through `registry`, services through `services`,
+    scheduled tasks through the command lines passed to `run` (schtasks,
+    taskkill, and sc when there is no native service API), and
+    processes are started with `start_process`. Swapping the backend swaps the
+    whole platform, e.g. for the in-memory simulator.
+    """
+
+    def __init__(self, host: str = "localhost"):
+        self.host = host
+
+    @property
+    def registry(self) -> RegistryBackend:
+        raise NotImplementedError
+
+    def run(self, args: List[str]) -> CommandResult:
+        """Run a command against the host."""
+        raise NotImplementedError
+
+    @property
+    def services(self) -> "ServiceApi":
+        """The service control manager of the host; `sc` through run() unless overridden."""
+        from .service_manager import ScServiceApi  # imported here, service_manager depends on this module
+        return ScServiceApi(self.run)
+
+    def start_process(self, args: List[str]) -> bool:
+        """Start a process without waiting for it to exit."""
+        raise NotImplementedError
+
+    def is_admin(self) -> bool:
+        """Check if the tool has administrator privileges on the host."""
+        raise NotImplementedError
+
+    # Bound on the wait for the shell to be back after restarting Explorer
+    SHELL_READY_TIMEOUT = 15.0
+    SHELL_POLL_INTERVAL = 0.1
+
+    def shell_ready(self) -> Optional[bool]:
+        """
+        Check if the Explorer shell is up and has created its taskbar.
+
+        Returns:
+            bool: True if ready, or None if the host cannot tell
+        """
+        return None
+
+    def wait_for_shell(self, timeout: float) -> bool:
+        """
+        Wait until the shell is ready, or the timeout passes.
+
+        Returns:
+            bool: True if the shell is ready (or the host cannot tell)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            ready = self.shell_ready()
+            if ready is None or ready:
+                return True
+            if time.monotonic() >= deadline:
+                print(f"Explorer was not ready within {timeout:.0f} seconds")
+                return False
+            time.sleep(self.SHELL_POLL_INTERVAL)
+
+    def restart_explorer(self) -> bool:
+        """
+        Restart Windows Explorer so shell changes take effect, and wait for
+        the shell to be back (at most SHELL_READY_TIMEOUT seconds).
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        result = self.run(["taskkill", "/f", "/im", "explorer.exe"])
+        if result.returncode != 0:
+            print(f"Error stopping explorer.exe: {(result.stderr or result.stdout).strip()}")
+            return False
+        if not self.start_process(["explorer.exe"]):
+            return False
+        return self.wait_for_shell(self.SHELL_READY_TIMEOUT)
+
+    def refresh_shell(self) -> bool:
+        """
+        Tell the running shell to re-read its settings, without restarting it.
+
+        Enough for policy and shell settings that Explorer watches for;
+        shell extension changes (like the context menu) still need a restart.
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        raise NotImplementedError
+
+    def post_actions(self) -> Dict[str, Callable[[], bool]]:
+        """Post actions (e.g. 'restart_explorer') that can be run on the host."""
+        return {"restart_explorer": self.restart_explorer, "refresh_shell": self.refresh_shell}
+
+    def close(self) -> None:
+        """Release any connection held to the host."""
+
+
+class WindowsBackend(PlatformBackend):
+    """The local Windows machine: winreg, real processes and the shell32 admin check."""
+
+    def __init__(self, host: str = "localhost"):
+        super().__init__(host)
+        self._registry: Optional[RegistryBackend] = None
+        self._services = None
+        self._is_admin: Optional[bool] = None
+
+    @property
+    def registry(self) -> RegistryBackend:
+        if self._registry is None:
+            if winreg is None:
+                raise RuntimeError("winreg is not available - use the simulator backend off Windows")
+            self._registry = WinregBackend()
+        return self._registry
+
+    def run(self, args: List[str]) -> CommandResult:
+        return run_command(args)
+
+    @property
+    def services(self) -> "ServiceApi":
+        # One SCM handle for the whole run; `sc` only if the SCM cannot be opened
+        if self._services is None:
+            from .scm import NativeServiceApi
+            try:
+                self._services = NativeServiceApi()
+            except OSError:
+                self._services = super().services
+        return self._services
+
+    def start_process(self, args: List[str]) -> bool:
+        try:
+            subprocess.Popen(args)
+            return True
+        except OSError as e:
+            print(f"Error starting {args[0]}: {str(e)}")
+            return False
+
+    def shell_ready(self) -> Optional[bool]:
+        try:
+            return bool(ctypes.windll.user32.FindWindowW("Shell_TrayWnd", None))
+        except (AttributeError, OSError):
+            return None
+
+    def refresh_shell(self) -> bool:
+        try:
+            from ctypes import wintypes
+            user32 = ctypes.windll.user32
+            shell32 = ctypes.windll.shell32
+        except (ImportError, AttributeError, OSError, ValueError):
+            return False
+        user32.SendMessageTimeoutW.restype = ctypes.c_void_p
+        user32.SendMessageTimeoutW.argtypes = [
+            wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPCWSTR,
+            wintypes.UINT, wintypes.UINT, ctypes.POINTER(ctypes.c_size_t)
+        ]
+        outcome = ctypes.c_size_t()
+        # Hung windows are skipped instead of blocking the broadcast
+        sent = user32.SendMessageTimeoutW(
+            HWND_BROADCAST, WM_SETTINGCHANGE, 0, SETTING_AREA, SMTO_ABORTIFHUNG, BROADCAST_TIMEOUT_MS, ctypes.byref(outcome)
+        )
+        shell32.SHChangeNotify(SHCNE_ASSOCCHANGED, SHCNF_IDLIST, None, None)
+        return bool(sent)
+
+    def is_admin(self) -> bool:
+        # The token of a running process does not change, so ask once
+        if self._is_admin is None:
+            try:
+                self._is_admin = bool(ctypes.windll.shell32.IsUserAnAdmin())
+            except:
+                self._is_admin = False
+        return self._is_admin
+
+
+_default_backend: Optional[PlatformBackend] = None
+
+
+def get_backend() -> PlatformBackend:
+    """
+    Get the platform backend of the local host.
+
+    Returns:
+        PlatformBackend: WindowsBackend unless another one was set
+    """
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = WindowsBackend()
+    return _default_backend
+
+
+def set_backend(backend: Optional[PlatformBackend]) -> None:
+    """
+    Replace the platform backend (e.g. with a SimulatorBackend for a dry run).
+
+    Args:
+        backend: The backend to use, or None to go back to WindowsBackend
+    """
+    global _default_backend
+    _default_backend = backend
+    # Drop any registry-only override so registry access follows the new backend
+    set_registry_backend(None)
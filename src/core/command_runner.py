@@ -0,0 +1,269 @@
+import asyncio
+import contextlib
+import locale
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Iterator, List, NamedTuple, Optional
+from .tracing import Trace
+
+# Seconds a command may run before it is killed; no sc or schtasks call comes close
+DEFAULT_TIMEOUT = 120.0
+# Commands running at the same time, across all threads of the run
+MAX_CONCURRENT_COMMANDS = 8
+# Bytes of stdout and of stderr kept per command; a verbose schtasks listing fits easily
+OUTPUT_LIMIT = 4 * 1024 * 1024
+_CHUNK_SIZE = 4096
+
+
+class CommandResult(NamedTuple):
+    """
+    Outcome of an external command.
+
+    stdout and stderr hold at most the last OUTPUT_LIMIT bytes of each
+    stream; `truncated` tells whether anything before that was dropped.
+    """
+    args: List[str]
+    returncode: int
+    stdout: str = ""
+    stderr: str = ""
+    duration: float = 0.0
+    timed_out: bool = False
+    truncated: bool = False
+
+
+# Anything that takes an argument list and returns a CommandResult can be used
+# in place of run_command, e.g. a fake `sc` for benchmarks off Windows.
+CommandRunner = Callable[[List[str]], CommandResult]
+
+
+class OutputBuffer:
+    """Ring buffer keeping the last `limit` bytes written to it."""
+
+    def __init__(self, limit: int = OUTPUT_LIMIT):
+        self.limit = limit
+        self.data = bytearray()
+        self.truncated = False
+
+    def write(self, chunk: bytes) -> None:
+        self.data += chunk
+        excess = len(self.data) - self.limit
+        if excess > 0:
+            del self.data[:excess]
+            self.truncated = True
+
+    def text(self) -> str:
+        """Decode the kept output like text-mode subprocess pipes do, newlines included."""
+        text = self.data.decode(locale.getpreferredencoding(False), errors="replace")
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class AsyncCommandRunner:
+    """
+    Run external commands as asyncio subprocesses on one background event loop.
+
+    Callers on any thread submit commands and get a Future, or block on
+    run(). At most `max_concurrent` commands run at once; the rest wait
+    their turn. Output is read in chunks into fixed-size ring buffers, so
+    memory does not grow with the amount a tool prints. A command still
+    running after its timeout is killed and reported as timed out.
+
+    on_output callbacks run on the event loop thread and must not block or
+    run commands themselves.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_COMMANDS, output_limit: int = OUTPUT_LIMIT):
+        self.max_concurrent = max_concurrent
+        self.output_limit = output_limit
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._limit: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                # A new loop supports subprocesses on Windows (proactor) and POSIX alike
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="CommandRunner", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    @staticmethod
+    async def _pump(stream: asyncio.StreamReader, buffer: OutputBuffer, on_output: Optional[Callable[[bytes], None]]) -> None:
+        while True:
+            chunk = await stream.read(_CHUNK_SIZE)
+            if not chunk:
+                return
+            buffer.write(chunk)
+            if on_output:
+                on_output(chunk)
+
+    async def _run(
+        self,
+        args: List[str],
+        timeout: Optional[float],
+        on_output: Optional[Callable[[bytes], None]],
+        merge_stderr: bool
+    ) -> CommandResult:
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.max_concurrent)
+        async with self._limit:
+            start = time.monotonic()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *args,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE
+                )
+            except OSError as e:
+                return CommandResult(list(args), -1, "", str(e), time.monotonic() - start)
+
+            stdout = OutputBuffer(self.output_limit)
+            stderr = OutputBuffer(self.output_limit)
+            readers = [self._pump(process.stdout, stdout, on_output)]
+            if not merge_stderr:
+                readers.append(self._pump(process.stderr, stderr, None))
+            timed_out = False
+            try:
+                await asyncio.wait_for(asyncio.gather(*readers, process.wait()), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass  # Exited just now
+                await process.wait()
+
+            error = stderr.text()
+            if timed_out:
+                error += f"Timed out after {timeout} seconds"
+            return CommandResult(
+                list(args),
+                -1 if timed_out else process.returncode,
+                stdout.text(),
+                error,
+                time.monotonic() - start,
+                timed_out,
+                stdout.truncated or stderr.truncated
+            )
+
+    def submit(
+        self,
+        args: List[str],
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+        on_output: Optional[Callable[[bytes], None]] = None,
+        merge_stderr: bool = False
+    ) -> "Future[CommandResult]":
+        """
+        Start a command without waiting for it.
+
+        Args:
+            args: The command and its arguments
+            timeout: Seconds before the command is killed, or None for no limit
+            on_output: Called with every chunk of stdout as it arrives
+            merge_stderr: Read stderr into stdout, like `2>&1`
+
+        Returns:
+            Future: Resolves to the CommandResult
+        """
+        return asyncio.run_coroutine_threadsafe(self._run(args, timeout, on_output, merge_stderr), self._ensure_loop())
+
+    def run(
+        self,
+        args: List[str],
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+        on_output: Optional[Callable[[bytes], None]] = None,
+        merge_stderr: bool = False
+    ) -> CommandResult:
+        """
+        Run a command and wait for it (see submit).
+
+        Returns:
+            CommandResult: Exit code, duration and the tail of the output. A
+            command that cannot be started or times out has returncode -1.
+        """
+        with Trace.span(args[0] if args else "command", "command", args=" ".join(args)):
+            return self.submit(args, timeout, on_output, merge_stderr).result()
+
+    def close(self) -> None:
+        """Stop the event loop; commands still running are not waited for."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = self._limit = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+
+_active_runner: Optional[AsyncCommandRunner] = None
+_runner_lock = threading.Lock()
+# Per-thread cap on command timeouts, set with command_deadline
+_deadlines = threading.local()
+
+
+def get_command_runner() -> AsyncCommandRunner:
+    """Get the runner shared by everything that starts commands, creating it on first use."""
+    global _active_runner
+    with _runner_lock:
+        if _active_runner is None:
+            _active_runner = AsyncCommandRunner()
+        return _active_runner
+
+
+def set_command_runner(runner: Optional[AsyncCommandRunner]) -> None:
+    """
+    Replace the shared command runner.
+
+    Args:
+        runner: The runner to use, or None to create a default one on next use
+    """
+    global _active_runner
+    with _runner_lock:
+        _active_runner = runner
+
+
+@contextlib.contextmanager
+def command_deadline(deadline: Optional[float]) -> Iterator[None]:
+    """
+    Cap the timeout of every command run_command starts on the current
+    thread at a time.monotonic() deadline, inside the with block.
+
+    Used to bound the work done for one host of a fleet run: a command still
+    running at the host's deadline is killed, and none is started after it.
+
+    Args:
+        deadline: The deadline, or None for no cap
+    """
+    previous = getattr(_deadlines, "deadline", None)
+    if deadline is not None and (previous is None or deadline < previous):
+        _deadlines.deadline = deadline
+    try:
+        yield
+    finally:
+        _deadlines.deadline = previous
+
+
+def run_command(args: List[str], timeout: Optional[float] = DEFAULT_TIMEOUT) -> CommandResult:
+    """
+    Run an external command through the shared runner and capture its output.
+
+    Args:
+        args: The command and its arguments
+        timeout: Seconds before the command is killed, or None for no limit;
+            shortened to the deadline set with command_deadline, if any
+
+    Returns:
+        CommandResult: Exit code, duration and captured output. A command that
+        cannot be started or times out is reported with returncode -1.
+    """
+    deadline = getattr(_deadlines, "deadline", None)
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return CommandResult(list(args), -1, "", "Deadline passed before the command was started", 0.0, True)
+        timeout = remaining if timeout is None else min(timeout, remaining)
+    return get_command_runner().run(args, timeout)
@@ -0,0 +1,168 @@
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .backend import PlatformBackend, get_backend
+from .log_manager import LogManager
+from .planner import ExecutionPlan
+from .registry_backend import HIVE_NAMES, HKEY_LOCAL_MACHINE, REG_DWORD, RegistryChangeSource
+from .registry_manager import RegistryOperationResult, RegistryTransaction
+from .service_manager import SERVICES_KEY, ServiceController, ServiceResult
+
+# Start value of a disabled service (SERVICE_DISABLED)
+_DISABLED = 4
+
+
+class DriftWatcher:
+    """
+    Keep the registry values and disabled services of a plan in place.
+
+    Every key the plan writes, and the configuration key of every service it
+    disables, is subscribed to on the registry's change source. The watcher
+    sleeps until one of them changes, waits for the burst of changes to
+    settle (no change for `debounce` seconds, or `max_delay` seconds after
+    the first one at the latest), and then re-applies only the values under
+    the changed keys that no longer match the plan. Its own writes cause one
+    more, read-only, pass that finds everything compliant.
+    """
+
+    def __init__(
+        self,
+        plan: ExecutionPlan,
+        backend: Optional[PlatformBackend] = None,
+        source: Optional[RegistryChangeSource] = None,
+        debounce: float = 1.0,
+        max_delay: float = 10.0
+    ):
+        self.plan = plan
+        self.backend = backend or get_backend()
+        self.source = source or self.backend.registry.change_source()
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.stopped = threading.Event()
+        self.log_manager = LogManager()
+        self.logger = self.log_manager.get_logger('Watch')
+        self.passes = 0
+        self.repaired = 0
+
+        # Service configuration key -> requests of the services it belongs to
+        self.service_keys: Dict[Tuple[int, str], List] = {}
+        for request in plan.services.values():
+            if "disable" in request.actions:
+                key = (HKEY_LOCAL_MACHINE, f"{SERVICES_KEY}\\{request.service_name}".lower())
+                self.service_keys.setdefault(key, []).append(request)
+
+    def watched_keys(self) -> Set[Tuple[int, str]]:
+        """Get every (hive, lower-cased key path) the watcher subscribes to."""
+        return set(self.plan.registry) | set(self.service_keys)
+
+    def repair_registry(self, keys: Iterable[Tuple[int, str]]) -> List[RegistryOperationResult]:
+        """
+        Re-apply the planned values under the given keys that have drifted.
+
+        Args:
+            keys: (hive, lower-cased key path) of the keys to check
+
+        Returns:
+            list: Results of the values that had to be written
+        """
+        transaction = RegistryTransaction(self.backend.registry)
+        for key in keys:
+            for planned in self.plan.registry.get(key, {}).values():
+                transaction.set_value(planned.path, planned.name, planned.value, planned.value_type, planned.hive)
+        if not transaction.operations:
+            return []
+        written = [result for result in transaction.commit(skip_compliant=True) if not result.compliant]
+        by_key: Dict[Tuple[int, str], List[RegistryOperationResult]] = {}
+        for result in written:
+            by_key.setdefault((result.operation.hive, result.operation.key_path), []).append(result)
+        for (hive, path), key_results in by_key.items():
+            location = f"{HIVE_NAMES.get(hive, hive)}\\{path}"
+            values = {r.operation.value_name: r.operation.value for r in key_results}
+            self.log_manager.log_registry_change(self.logger, location, values, all(r.success for r in key_results),
+                                                 duration=sum(r.duration for r in key_results))
+        return written
+
+    def repair_services(self, keys: Iterable[Tuple[int, str]]) -> List[ServiceResult]:
+        """
+        Re-apply the planned actions of services whose start type is no longer disabled.
+
+        The start type is read from the service's configuration key, so a
+        service that is still disabled costs no sc call.
+
+        Args:
+            keys: (hive, lower-cased key path) of the keys that changed
+
+        Returns:
+            list: Results of the services that had to be repaired
+        """
+        requests = [request for key in keys for request in self.service_keys.get(key, [])]
+        if not requests:
+            return []
+        transaction = RegistryTransaction(self.backend.registry)
+        for request in requests:
+            transaction.set_value(f"{SERVICES_KEY}\\{request.service_name}", "Start", _DISABLED, REG_DWORD, HKEY_LOCAL_MACHINE)
+        # A deleted configuration key means the service was uninstalled - nothing to repair
+        drifted = [request for request, diff in zip(requests, transaction.diff()) if diff.exists and not diff.compliant]
+        results = ServiceController(api=self.backend.services).run(drifted)
+        for result in results:
+            action = " and ".join(result.actions or ()) or "change"
+            self.log_manager.log_service_change(self.logger, result.service_name, action, result.success, duration=result.duration)
+        return results
+
+    def repair(self, keys: Iterable[Tuple[int, str]]) -> int:
+        """
+        Repair drift under the given keys.
+
+        Returns:
+            int: Number of registry values and services that were put back
+        """
+        keys = set(keys)
+        self.passes += 1
+        registry = self.repair_registry(keys)
+        services = self.repair_services(keys)
+        repaired = sum(1 for r in registry if r.success) + sum(1 for r in services if r.success)
+        if repaired:
+            print(f"Drift repaired: {repaired} item(s)")
+        self.repaired += repaired
+        return repaired
+
+    def collect(self, changed: Set[Tuple[int, str]]) -> Set[Tuple[int, str]]:
+        """Extend a first set of changed keys with the rest of the burst it belongs to."""
+        first = time.monotonic()
+        while not self.stopped.is_set():
+            remaining = self.max_delay - (time.monotonic() - first)
+            if remaining <= 0:
+                break
+            more = self.source.wait(min(self.debounce, remaining))
+            if not more:
+                break
+            changed |= more
+        return changed
+
+    def run(self) -> None:
+        """
+        Watch until stop() is called.
+
+        Keys are subscribed to before the first full check, so drift that
+        happens in between is not missed.
+        """
+        try:
+            keys = self.watched_keys()
+            for hive, path in keys:
+                self.source.subscribe(hive, path)
+            self.logger.info("Watching %d registry key(s) on %s", len(keys), self.backend.host, extra={
+                'feature': self.logger.name, 'operation': 'watch', 'target': self.backend.host})
+            self.repair(keys)
+            while not self.stopped.is_set():
+                changed = self.source.wait()
+                if changed and not self.stopped.is_set():
+                    self.repair(self.collect(changed))
+        finally:
+            self.source.close()
+            self.logger.info("Stopped watching after %d check(s), %d item(s) repaired", self.passes, self.repaired, extra={
+                'feature': self.logger.name, 'operation': 'watch', 'target': self.backend.host})
+
+    def stop(self) -> None:
+        """Make run() return; can be called from any thread."""
+        self.stopped.set()
+        self.source.wake()
@@ -0,0 +1,181 @@
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from .backend import PlatformBackend, get_backend
+from .planner import ExecutionPlan, PlanExecutor, PlanResult
+from .post_actions import SUPERSEDED_BY
+from .registry_backend import HIVE_NAMES
+from .registry_manager import RegistryDiff, RegistryTransaction
+from .service_manager import START_TYPE_ARGS, ServiceController
+from .simulator import SERVICE_AUTO_START, SimulatedHost, SimulatorBackend
+from .task_manager import TaskInventory, TaskResult
+
+_STATE_NAMES = {1: "stopped", 2: "starting", 3: "stopping", 4: "running"}
+# Logger of the simulated executor; kept out of the rolling log and the console
+_LOGGER_NAME = "DryRun"
+
+
+class DryRunResult(NamedTuple):
+    """Predicted outcome of a plan, with the state it was predicted from."""
+    result: PlanResult
+    registry: List[RegistryDiff]
+    services: Dict[str, Tuple[int, int]]  # lower-cased name -> (state, start type) before the run
+    host: SimulatedHost
+    simulated: bool  # True if the default Windows state was used instead of the real one
+    tasks_error: Optional[str] = None  # Why the scheduled tasks of the host could not be listed
+
+
+def snapshot_host(plan: ExecutionPlan, source: PlatformBackend) -> Tuple[SimulatedHost, Optional[str]]:
+    """
+    Copy the current state of everything a plan touches into a SimulatedHost.
+
+    Registry targets are read through a read-only transaction diff, services
+    through the service control manager and tasks with one schtasks
+    snapshot. Nothing is written to the source host.
+
+    Args:
+        plan: The plan whose targets are copied
+        source: The backend of the host to copy from
+
+    Returns:
+        tuple: Host holding the current state of the plan's targets, and why
+        the scheduled tasks could not be listed (None if they could)
+    """
+    host = SimulatedHost(source.host)
+    transaction = RegistryTransaction(source.registry)
+    for planned in plan.registry_values():
+        transaction.set_value(planned.path, planned.name, planned.value, planned.value_type, planned.hive)
+    for diff in transaction.diff():
+        if diff.exists:
+            operation = diff.operation
+            handle = host.registry.open_key(operation.hive, operation.key_path, create=True, write=True)
+            host.registry.set_value(handle, operation.value_name, diff.current_type, diff.current)
+            host.registry.close_key(handle)
+
+    controller = ServiceController(api=source.services)
+    for request in plan.services.values():
+        state = controller.query_state(request.service_name)
+        if state is None:
+            continue
+        start_type = controller.query_start_type(request.service_name)
+        host.add_service(request.service_name, state, SERVICE_AUTO_START if start_type is None else start_type)
+
+    tasks_error = None
+    if plan.tasks:
+        inventory = TaskInventory(source.run)
+        inventory.refresh()
+        tasks_error = inventory.error
+        for task_path in plan.tasks.values():
+            task = inventory.get(task_path)
+            if task is not None:
+                host.add_task(task.path, task.enabled)
+
+    host.processes["explorer.exe"] = 1
+    return host, tasks_error
+
+
+def predict(plan: ExecutionPlan, source: Optional[PlatformBackend] = None) -> DryRunResult:
+    """
+    Predict the effect of a plan without changing anything.
+
+    The plan is executed against an in-memory copy of the host. When the
+    source host cannot be read (e.g. winreg is not available) a fresh Windows
+    install is assumed instead.
+
+    Args:
+        plan: The plan to predict
+        source: The backend of the host to predict for (default: local host)
+
+    Returns:
+        DryRunResult: Predicted per-item results and the registry state before
+    """
+    source = source or get_backend()
+    simulated = False
+    tasks_error = None
+    try:
+        host, tasks_error = snapshot_host(plan, source)
+    except RuntimeError:
+        host = SimulatedHost.windows_default(source.host)
+        simulated = True
+
+    # The registry state before the run, read from the copy so both cases look the same
+    transaction = RegistryTransaction(host.registry)
+    for planned in plan.registry_values():
+        transaction.set_value(planned.path, planned.name, planned.value, planned.value_type, planned.hive)
+    diffs = transaction.diff()
+    services = {name: (service["state"], service["start_type"]) for name, service in host.services.items()}
+
+    # The simulated changes must not show up in the real log or among the preview lines
+    quiet = logging.getLogger(_LOGGER_NAME)
+    if quiet.propagate:
+        quiet.propagate = False
+        quiet.addHandler(logging.NullHandler())
+
+    backend = SimulatorBackend(host)
+    executor = PlanExecutor(
+        backend.registry,
+        ServiceController(api=backend.services, poll_interval=0),
+        TaskInventory(backend.run),
+        backend.post_actions(),
+        logger_name=_LOGGER_NAME
+    )
+    result = executor.execute(plan)
+    if tasks_error is not None:
+        # The copy has none of the tasks, which would read as "not found"
+        error = f"Could not list scheduled tasks: {tasks_error}"
+        result = result._replace(tasks=[TaskResult(path, False, error=error) for path in plan.tasks.values()])
+    return DryRunResult(result, diffs, services, host, simulated, tasks_error)
+
+
+def _describe_service(state: int, start_type: int) -> str:
+    return f"{_STATE_NAMES.get(state, state)}/{START_TYPE_ARGS.get(start_type, start_type)}"
+
+
+def describe(dry_run: DryRunResult) -> List[str]:
+    """
+    List the predicted changes in readable form.
+
+    Args:
+        dry_run: The prediction
+
+    Returns:
+        list: One line per change that would be made
+    """
+    lines = []
+    for diff in dry_run.registry:
+        if diff.compliant:
+            continue
+        operation = diff.operation
+        target = f"{HIVE_NAMES.get(operation.hive, operation.hive)}\\{operation.key_path}\\{operation.value_name}"
+        current = repr(diff.current) if diff.exists else "(not set)"
+        lines.append(f"registry  {target}: {current} -> {operation.value!r}")
+
+    for result in dry_run.result.services:
+        if not result.exists:
+            lines.append(f"service   {result.service_name}: not installed, skipped")
+        elif result.success and not result.changed:
+            continue
+        elif result.success:
+            before = dry_run.services.get(result.service_name.lower())
+            after = dry_run.host.services.get(result.service_name.lower())
+            change = ""
+            if before and after:
+                change = f" ({_describe_service(*before)} -> {_describe_service(after['state'], after['start_type'])})"
+            lines.append(f"service   {result.service_name}: {' and '.join(result.actions or ())}{change}")
+        else:
+            lines.append(f"service   {result.service_name}: would fail ({result.error})")
+
+    for result in dry_run.result.tasks:
+        if not result.exists:
+            lines.append(f"task      {result.task_path}: not found, skipped")
+        elif not result.success:
+            lines.append(f"task      {result.task_path}: unknown ({result.error})")
+        elif result.changed:
+            lines.append(f"task      {result.task_path}: disable")
+
+    for action in dry_run.result.post_actions:
+        covering = SUPERSEDED_BY.get(action)
+        if covering in dry_run.result.post_actions:
+            lines.append(f"post      {action}: covered by {covering}")
+        else:
+            lines.append(f"post      {action}")
+    return lines
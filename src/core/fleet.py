@@ -0,0 +1,185 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, NamedTuple, Optional
+from .planner import ExecutionPlan, PlanExecutor, PlanResult
+from .transport import DeadlineTransport, Transport, connect
+
+
+class HostResult(NamedTuple):
+    """Outcome of applying a plan to one host."""
+    host: str
+    success: bool
+    attempts: int
+    queued: float  # seconds between submission and the first attempt starting
+    duration: float  # seconds spent on the host, all attempts included
+    timed_out: bool = False
+    error: Optional[str] = None
+    result: Optional[PlanResult] = None
+
+
+class FleetResult(NamedTuple):
+    """Combined results of a fleet run."""
+    hosts: List[HostResult]
+    duration: float
+
+    @property
+    def succeeded(self) -> int:
+        return sum(1 for host in self.hosts if host.success)
+
+    @property
+    def failed(self) -> int:
+        return len(self.hosts) - self.succeeded
+
+    @property
+    def throughput(self) -> float:
+        """Hosts completed per second."""
+        return len(self.hosts) / self.duration if self.duration else 0.0
+
+    @property
+    def max_queued(self) -> float:
+        """Longest time a host waited for a worker, to check fairness."""
+        return max((host.queued for host in self.hosts), default=0.0)
+
+    def matrix(self) -> List[List[str]]:
+        """
+        Build a printable result matrix.
+
+        Returns:
+            list: Header row followed by one row per host
+        """
+        rows = [["Host", "Status", "Attempts", "Seconds", "Changes", "Compliant", "Error"]]
+        for host in self.hosts:
+            status = "timeout" if host.timed_out else ("ok" if host.success else "failed")
+            changes = str(host.result.changes) if host.result else "-"
+            compliant = str(host.result.compliant) if host.result else "-"
+            rows.append([host.host, status, str(host.attempts), f"{host.duration:.2f}", changes, compliant, host.error or ""])
+        return rows
+
+
+def load_inventory(path: str) -> List[str]:
+    """
+    Read a host inventory: one host per line, '#' starts a comment.
+
+    Args:
+        path: Path to the inventory file
+
+    Returns:
+        list: Host names in file order, without duplicates
+    """
+    hosts = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            host = line.split("#", 1)[0].strip()
+            if host and host.lower() not in seen:
+                seen.add(host.lower())
+                hosts.append(host)
+    return hosts
+
+
+class FleetExecutor:
+    """
+    Apply one plan to many hosts on a bounded worker pool.
+
+    Hosts are started in inventory order (first come, first served). A failed
+    attempt is retried up to `retries` times with a growing backoff. A host
+    that takes longer than `host_timeout` seconds in total is reported as timed
+    out. Its work stops at the same time: its transport kills a command still
+    running at the deadline, and fails every later registry, service and
+    command call without reaching the host, so the plan runs out quickly and
+    the worker is freed. A single registry or service call already in flight
+    cannot be interrupted; the worker (and the exit of the process, which
+    joins worker threads) waits for at most that one call.
+    """
+
+    def __init__(
+        self,
+        transport_factory: Callable[[str], Transport] = connect,
+        executor_factory: Callable[[Transport], PlanExecutor] = PlanExecutor.for_transport,
+        max_workers: int = 16,
+        host_timeout: Optional[float] = 300.0,
+        retries: int = 1,
+        backoff: float = 1.0
+    ):
+        self.transport_factory = transport_factory
+        self.executor_factory = executor_factory
+        self.max_workers = max_workers
+        self.host_timeout = host_timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def apply_host(self, host: str, plan: ExecutionPlan, submitted: float, started: Dict[str, float]) -> HostResult:
+        """Apply the plan to one host, retrying failed attempts."""
+        start = time.monotonic()
+        started[host] = start
+        error = None
+        result = None
+        attempts = 0
+        for attempt in range(self.retries + 1):
+            if attempt:
+                if self.host_timeout is not None and time.monotonic() + self.backoff * attempt >= start + self.host_timeout:
+                    break  # No time left for another attempt
+                time.sleep(self.backoff * attempt)
+            attempts = attempt + 1
+            transport = None
+            try:
+                transport = self.transport_factory(host)
+                if self.host_timeout is not None:
+                    transport = DeadlineTransport(transport, self.host_timeout, start)
+                result = self.executor_factory(transport).execute(plan)
+                error = None if result.success else "Some operations failed"
+            except Exception as e:  # keep going with the other hosts whatever happens here
+                result = None
+                error = str(e) or type(e).__name__
+            finally:
+                if transport is not None:
+                    transport.close()
+            if error is None:
+                break
+        return HostResult(host, error is None, attempts, start - submitted, time.monotonic() - start, error=error, result=result)
+
+    def run(self, hosts: List[str], plan: ExecutionPlan) -> FleetResult:
+        """
+        Apply a plan to all hosts.
+
+        Args:
+            hosts: Host names to apply the plan to
+            plan: The plan to apply
+
+        Returns:
+            FleetResult: One HostResult per host, in inventory order
+        """
+        start = time.monotonic()
+        results: Dict[str, HostResult] = {}
+        started: Dict[str, float] = {}
+        if not hosts:
+            return FleetResult([], 0.0)
+
+        pool = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(hosts))))
+        try:
+            pending = {pool.submit(self.apply_host, host, plan, start, started): host for host in hosts}
+            while pending:
+                timeout = None
+                if self.host_timeout is not None:
+                    # Wake up in time for the earliest deadline of a running host
+                    deadlines = [started[host] + self.host_timeout for host in pending.values() if host in started]
+                    timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else 0.05
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    host = pending.pop(future)
+                    results[host] = future.result()
+                if self.host_timeout is None:
+                    continue
+                now = time.monotonic()
+                for future, host in list(pending.items()):
+                    if host in started and now - started[host] >= self.host_timeout:
+                        del pending[future]
+                        results[host] = HostResult(
+                            host, False, 1, started[host] - start, now - started[host],
+                            timed_out=True, error=f"Timed out after {self.host_timeout} seconds"
+                        )
+        finally:
+            # Workers of timed out hosts stop at their next call; do not wait for them here
+            pool.shutdown(wait=False)
+
+        return FleetResult([results[host] for host in hosts], time.monotonic() - start)
@@ -0,0 +1,332 @@
+import os
+import secrets
+import struct
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from .paths import data_dir
+
+# File layout: MAGIC, then records appended one batch at a time. Each record
+# is a kind byte and a uint32 payload length, followed by the payload. Key
+# paths are written once as a path record and then referred to by number.
+MAGIC = b"WSJ1"
+JOURNAL_EXTENSION = ".wsj"
+
+_RECORD_HEADER = struct.Struct("<BI")
+_REGISTRY_HEADER = struct.Struct("<IBII")  # hive, existed, value type, path number
+_SERVICE_HEADER = struct.Struct("<bb")  # start type, state (-1 if unknown)
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_I64 = struct.Struct("<q")
+
+KIND_REGISTRY = 1
+KIND_SERVICE = 2
+KIND_TASK = 3
+KIND_PATH = 4
+
+# Value tags
+_NONE, _UINT, _INT, _STR, _BYTES, _STRS = range(6)
+
+
+class RegistryPrior(NamedTuple):
+    """A registry value as it was before the tool changed it."""
+    hive: int
+    path: str
+    name: str
+    existed: bool
+    value_type: int = 0
+    value: Any = None
+
+
+class ServicePrior(NamedTuple):
+    """A service's start type and state before the tool changed it."""
+    name: str
+    start_type: Optional[int]
+    state: Optional[int]
+
+
+class TaskPrior(NamedTuple):
+    """A scheduled task's enabled flag before the tool changed it."""
+    path: str
+    enabled: bool
+
+
+JournalEntry = Union[RegistryPrior, ServicePrior, TaskPrior]
+
+
+def _pack_str(text: str, length: struct.Struct = _U16) -> bytes:
+    data = text.encode("utf-8")
+    return length.pack(len(data)) + data
+
+
+def _pack_value(value: Any) -> bytes:
+    if value is None:
+        return bytes((_NONE,))
+    if isinstance(value, int):
+        if value >= 0:
+            return bytes((_UINT,)) + _U64.pack(value)
+        return bytes((_INT,)) + _I64.pack(value)
+    if isinstance(value, str):
+        return bytes((_STR,)) + _pack_str(value, _U32)
+    if isinstance(value, (bytes, bytearray)):
+        return bytes((_BYTES,)) + _U32.pack(len(value)) + bytes(value)
+    if isinstance(value, (list, tuple)):
+        return bytes((_STRS,)) + _U32.pack(len(value)) + b"".join(_pack_str(str(item), _U32) for item in value)
+    raise TypeError(f"Cannot journal registry value of type {type(value).__name__}")
+
+
+def encode_path(number: int, path: str) -> bytes:
+    """Encode the record that assigns a number to a key path."""
+    payload = _U32.pack(number) + _pack_str(path)
+    return _RECORD_HEADER.pack(KIND_PATH, len(payload)) + payload
+
+
+def encode_entry(entry: JournalEntry, path_number: int = 0) -> bytes:
+    """
+    Encode a journal entry as one record.
+
+    Args:
+        entry: The prior state to store
+        path_number: Number of the key path of a registry entry, assigned by
+            a path record written earlier
+
+    Returns:
+        bytes: The record, header included
+    """
+    if isinstance(entry, RegistryPrior):
+        kind = KIND_REGISTRY
+        payload = (
+            _REGISTRY_HEADER.pack(entry.hive, entry.existed, entry.value_type, path_number)
+            + _pack_str(entry.name) + _pack_value(entry.value)
+        )
+    elif isinstance(entry, ServicePrior):
+        kind = KIND_SERVICE
+        start_type = -1 if entry.start_type is None else entry.start_type
+        state = -1 if entry.state is None else entry.state
+        payload = _SERVICE_HEADER.pack(start_type, state) + _pack_str(entry.name)
+    else:
+        kind = KIND_TASK
+        payload = bytes((entry.enabled,)) + _pack_str(entry.path)
+    return _RECORD_HEADER.pack(kind, len(payload)) + payload
+
+
+class _Reader:
+    """Cursor over a record payload."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def take(self, size: int) -> bytes:
+        chunk = self.data[self.offset:self.offset + size]
+        if len(chunk) != size:
+            raise ValueError("Truncated journal record")
+        self.offset += size
+        return chunk
+
+    def unpack(self, layout: struct.Struct) -> Tuple:
+        return layout.unpack(self.take(layout.size))
+
+    def text(self, length: struct.Struct = _U16) -> str:
+        return self.take(self.unpack(length)[0]).decode("utf-8")
+
+    def value(self) -> Any:
+        tag = self.take(1)[0]
+        if tag == _NONE:
+            return None
+        if tag == _UINT:
+            return self.unpack(_U64)[0]
+        if tag == _INT:
+            return self.unpack(_I64)[0]
+        if tag == _STR:
+            return self.text(_U32)
+        if tag == _BYTES:
+            return self.take(self.unpack(_U32)[0])
+        if tag == _STRS:
+            return [self.text(_U32) for _ in range(self.unpack(_U32)[0])]
+        raise ValueError(f"Unknown value tag {tag}")
+
+
+def decode_entries(data: bytes) -> Iterator[JournalEntry]:
+    """
+    Decode the records of a journal file.
+
+    A record cut short by a crash ends the journal; everything before it is
+    returned.
+
+    Args:
+        data: Contents of the file, magic included
+
+    Returns:
+        Iterator of RegistryPrior, ServicePrior and TaskPrior entries
+    """
+    if not data.startswith(MAGIC):
+        raise ValueError("Not a journal file")
+    paths: Dict[int, str] = {}
+    offset = len(MAGIC)
+    while offset + _RECORD_HEADER.size <= len(data):
+        kind, length = _RECORD_HEADER.unpack_from(data, offset)
+        offset += _RECORD_HEADER.size
+        if offset + length > len(data):
+            return
+        reader = _Reader(data[offset:offset + length])
+        offset += length
+        if kind == KIND_PATH:
+            number = reader.unpack(_U32)[0]
+            paths[number] = reader.text()
+        elif kind == KIND_REGISTRY:
+            hive, existed, value_type, number = reader.unpack(_REGISTRY_HEADER)
+            name = reader.text()
+            yield RegistryPrior(hive, paths[number], name, bool(existed), value_type, reader.value())
+        elif kind == KIND_SERVICE:
+            start_type, state = reader.unpack(_SERVICE_HEADER)
+            yield ServicePrior(reader.text(), None if start_type < 0 else start_type, None if state < 0 else state)
+        elif kind == KIND_TASK:
+            enabled = bool(reader.take(1)[0])
+            yield TaskPrior(reader.text(), enabled)
+
+
+def default_journal_dir() -> str:
+    """Get the directory journals are written to."""
+    return os.path.join(data_dir(), "journal")
+
+
+def new_run_id() -> str:
+    """Create a run id: start time (to the millisecond) plus a random suffix, sortable by time."""
+    now = datetime.now()
+    return f"{now:%Y%m%d-%H%M%S}{now.microsecond // 1000:03d}-{secrets.token_hex(2)}"
+
+
+class Journal:
+    """
+    Append-only record of the state a run is about to change.
+
+    Prior values are written before the change they protect, one batch per
+    call, and flushed to disk so a run interrupted midway can still be rolled
+    back. The journal of a run lives in its own file named after the run id.
+    """
+
+    def __init__(self, run_id: Optional[str] = None, directory: Optional[str] = None):
+        self.run_id = run_id or new_run_id()
+        self.directory = directory or default_journal_dir()
+        self.path = os.path.join(self.directory, self.run_id + JOURNAL_EXTENSION)
+        self.entries = 0
+        self._paths: Dict[str, int] = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    def record(self, entries: Iterable[JournalEntry]) -> None:
+        """
+        Append prior states to the journal and flush them to disk.
+
+        Args:
+            entries: The prior states, written in one write
+        """
+        with self._lock:
+            records = []
+            count = 0
+            # Paths are only known to be numbered once their record is on disk
+            new_paths: Dict[str, int] = {}
+            for entry in entries:
+                number = 0
+                if isinstance(entry, RegistryPrior):
+                    number = self._paths.get(entry.path, new_paths.get(entry.path))
+                    if number is None:
+                        number = new_paths[entry.path] = len(self._paths) + len(new_paths)
+                        records.append(encode_path(number, entry.path))
+                records.append(encode_entry(entry, number))
+                count += 1
+            if not records:
+                return
+            data = b"".join(records)
+            if self._file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._file = open(self.path, "ab")
+                if self._file.tell() == 0:
+                    self._file.write(MAGIC)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._paths.update(new_paths)
+            self.entries += count
+
+    def close(self) -> None:
+        """Close the journal file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def list_runs(directory: Optional[str] = None) -> List[str]:
+    """
+    List the run ids that have a journal, oldest first.
+
+    Args:
+        directory: The journal directory (default: default_journal_dir())
+
+    Returns:
+        list: Run ids
+    """
+    directory = directory or default_journal_dir()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    return sorted(name[:-len(JOURNAL_EXTENSION)] for name in names if name.endswith(JOURNAL_EXTENSION))
+
+
+def resolve_run_id(run_id: str, directory: Optional[str] = None) -> str:
+    """
+    Turn 'latest' into the id of the most recent run; other ids are returned as-is.
+
+    Raises:
+        FileNotFoundError: If 'latest' is asked for and there is no journal
+    """
+    if run_id != "latest":
+        return run_id
+    runs = list_runs(directory)
+    if not runs:
+        raise FileNotFoundError("No journaled runs found")
+    return runs[-1]
+
+
+def read_journal(run_id: str, directory: Optional[str] = None) -> List[JournalEntry]:
+    """
+    Read every entry of a run's journal.
+
+    Args:
+        run_id: The run id, or 'latest' for the most recent run
+        directory: The journal directory (default: default_journal_dir())
+
+    Returns:
+        list: The entries in the order they were written
+
+    Raises:
+        FileNotFoundError: If there is no journal for the run
+    """
+    directory = directory or default_journal_dir()
+    run_id = resolve_run_id(run_id, directory)
+    with open(os.path.join(directory, run_id + JOURNAL_EXTENSION), "rb") as f:
+        return list(decode_entries(f.read()))
+
+
+_active_journal: Optional[Journal] = None
+
+
+def get_journal() -> Optional[Journal]:
+    """Get the journal that changes are recorded to by default, if any."""
+    return _active_journal
+
+
+def set_journal(journal: Optional[Journal]) -> None:
+    """
+    Set the journal that registry, service and task changes are recorded to
+    when none is passed explicitly.
+
+    Args:
+        journal: The journal, or None to stop journaling
+    """
+    global _active_journal
+    _active_journal = journal
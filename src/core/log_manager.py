@@ -1,113 +1,372 @@
+import atexit
+import gzip
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Optional
+from .paths import data_dir
+
+# Structured fields attached to records through `extra` and written to the JSON log
+STRUCTURED_FIELDS = ('feature', 'operation', 'target', 'duration', 'result', 'values', 'details')
+
+# The log is one rolling file; rotated segments are named wscript.<time>.jsonl.gz
+LOG_NAME = 'wscript'
+LOG_EXTENSION = '.jsonl'
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_ROTATE_INTERVAL = 24 * 60 * 60  # seconds; segments never span two UTC days
+DEFAULT_BACKUP_COUNT = 30
+DEFAULT_MAX_AGE_DAYS = 30
+
+def default_log_dir() -> str:
+    """
+    Get the default log directory.
+
+    Returns:
+        str: The logs directory under the data directory (%ProgramData%\\WScript\\logs on Windows)
+    """
+    return os.path.join(data_dir(), 'logs')
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stock QueueHandler formats the message in the calling thread; here the
+    record is queued as-is so the hot path only pays for creating it.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+class RollingLogHandler(logging.handlers.BaseRotatingHandler):
+    """
+    Rolling log file, rotated once it has grown to `max_bytes` or when it
+    was last written in an earlier rotation interval (by default an earlier
+    UTC day).
+
+    A rotated segment is renamed right away and gzip-compressed on a
+    background thread, which then deletes the oldest segments beyond
+    `backup_count` and any older than `max_age_days`. Segments a previous run
+    left uncompressed are picked up when the handler starts. The directory
+    and the file are only created once something is logged.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        interval: float = DEFAULT_ROTATE_INTERVAL,
+        backup_count: int = DEFAULT_BACKUP_COUNT,
+        max_age_days: float = DEFAULT_MAX_AGE_DAYS
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.max_age_days = max_age_days
+        self._period: Optional[int] = None
+        self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='LogCompressor')
+        super().__init__(os.path.join(directory, LOG_NAME + LOG_EXTENSION), 'a', encoding='utf-8', delay=True)
+        self._compressor.submit(self.compress_leftovers)
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return super()._open()
+
+    def _period_of(self, timestamp: float) -> int:
+        return int(timestamp // self.interval) if self.interval else 0
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.stream is not None:
+            size = self.stream.tell()
+        else:
+            try:
+                stat = os.stat(self.baseFilename)
+            except OSError:
+                return False
+            size = stat.st_size
+            if self._period is None:
+                self._period = self._period_of(stat.st_mtime)
+        if size == 0:
+            return False
+        if self._period is None:
+            self._period = self._period_of(record.created)
+        if self._period != self._period_of(record.created):
+            return True
+        return bool(self.max_bytes) and size >= self.max_bytes
+
+    def doRollover(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self._period = self._period_of(time.time())
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        target = os.path.join(self.directory, f'{LOG_NAME}.{stamp}{LOG_EXTENSION}')
+        suffix = 1
+        while os.path.exists(target) or os.path.exists(target + '.gz'):
+            target = os.path.join(self.directory, f'{LOG_NAME}.{stamp}-{suffix}{LOG_EXTENSION}')
+            suffix += 1
+        try:
+            os.rename(self.baseFilename, target)
+        except OSError:
+            return  # Another run has the file open; keep appending and rotate next time
+        self._compressor.submit(self.compress, target)
+
+    def segments(self):
+        """
+        List the rotated segments, newest first.
+
+        Returns:
+            list: Paths of the compressed and not yet compressed segments
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        active = os.path.basename(self.baseFilename).lower()
+        paths = [
+            os.path.join(self.directory, name) for name in names
+            if name.lower().startswith(LOG_NAME + '.') and name.lower() != active
+            and (name.lower().endswith(LOG_EXTENSION) or name.lower().endswith(LOG_EXTENSION + '.gz'))
+        ]
+        return sorted(paths, key=lambda path: os.path.getmtime(path), reverse=True)
+
+    def compress(self, path: str) -> None:
+        """gzip a rotated segment (keeping its modification time), then apply the retention limits."""
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, 'rb') as source, gzip.open(path + '.gz.tmp', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.utime(path + '.gz.tmp', (mtime, mtime))
+            os.replace(path + '.gz.tmp', path + '.gz')
+            os.remove(path)
+        except OSError:
+            pass  # Left uncompressed; the next run tries again
+        self.prune()
+
+    def compress_leftovers(self) -> None:
+        """Compress segments left uncompressed by an earlier run, then apply the retention limits."""
+        for path in self.segments():
+            if path.lower().endswith(LOG_EXTENSION):
+                self.compress(path)
+        self.prune()
+
+    def prune(self) -> None:
+        """Delete segments beyond backup_count and segments older than max_age_days."""
+        cutoff = time.time() - self.max_age_days * 24 * 60 * 60 if self.max_age_days else None
+        for index, path in enumerate(self.segments()):
+            try:
+                if index >= self.backup_count or (cutoff is not None and os.path.getmtime(path) < cutoff):
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def close(self):
+        super().close()
+        # Pending compressions finish before the process exits
+        self._compressor.shutdown(wait=True)
 
 class LogManager:
     _instance = None
     _initialized = False
-    
+    _listener = None
+    _queue_handler = None
+    # Set with configure(); missing entries use the DEFAULT_* values
+    _settings = {}
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(LogManager, cls).__new__(cls)
         return cls._instance
-    
+
     def __init__(self):
         if not LogManager._initialized:
             self.setup_logging()
             LogManager._initialized = True
-    
+
+    @classmethod
+    def configure(
+        cls,
+        log_dir: Optional[str] = None,
+        backup_count: Optional[int] = None,
+        max_age_days: Optional[float] = None,
+        max_bytes: Optional[int] = None
+    ):
+        """
+        Set where the log is kept and how long. Takes effect right away, also
+        if logging is already set up.
+
+        Args:
+            log_dir: Log directory (default: default_log_dir())
+            backup_count: Number of rotated segments to keep (default: 30)
+            max_age_days: Delete segments older than this (default: 30)
+            max_bytes: Rotate once the log has grown to this size (default: 10 MiB)
+        """
+        settings = {'log_dir': log_dir, 'backup_count': backup_count, 'max_age_days': max_age_days, 'max_bytes': max_bytes}
+        cls._settings = {name: value for name, value in settings.items() if value is not None}
+        if cls._initialized:
+            cls.shutdown()
+            logging.getLogger().removeHandler(cls._queue_handler)
+            cls._instance.setup_logging()
+
+    @classmethod
+    def current_log_dir(cls) -> str:
+        """Get the log directory: the one set with configure(), otherwise default_log_dir()."""
+        return cls._settings.get('log_dir') or default_log_dir()
+
     def setup_logging(self):
-        """Set up logging configuration."""
-        # Create logs directory if it doesn't exist
-        if not os.path.exists('logs'):
-            os.makedirs('logs')
-        
-        # Create a log file with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        log_file = f'logs/system_changes_{timestamp}.log'
-        
-        # Configure logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file),
-                logging.StreamHandler()  # Also print to console
-            ]
+        """
+        Set up logging configuration.
+
+        Records are put on a queue and written by a background listener thread:
+        JSON lines to the rolling log file and a readable line to the console.
+        The queue is drained when the process exits. The log directory and the
+        log file are only created once something is logged.
+        """
+        settings = LogManager._settings
+        self.log_dir = LogManager.current_log_dir()
+        file_handler = RollingLogHandler(
+            self.log_dir,
+            max_bytes=settings.get('max_bytes', DEFAULT_MAX_BYTES),
+            backup_count=settings.get('backup_count', DEFAULT_BACKUP_COUNT),
+            max_age_days=settings.get('max_age_days', DEFAULT_MAX_AGE_DAYS)
         )
-    
+        self.log_file = file_handler.baseFilename
+        file_handler.setFormatter(JsonLinesFormatter())
+        console_handler = logging.StreamHandler()  # Also print to console
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+        log_queue = queue.SimpleQueue()
+        LogManager._listener = logging.handlers.QueueListener(
+            log_queue, file_handler, console_handler, respect_handler_level=True
+        )
+        LogManager._listener.start()
+
+        root = logging.getLogger()
+        root.setLevel(logging.INFO)
+        LogManager._queue_handler = LazyQueueHandler(log_queue)
+        root.addHandler(LogManager._queue_handler)
+        if not LogManager._initialized:
+            atexit.register(LogManager.shutdown)
+
+    @staticmethod
+    def shutdown():
+        """Write out every queued record and stop the background writer."""
+        listener = LogManager._listener
+        if listener is None:
+            return
+        LogManager._listener = None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
     def get_logger(self, feature_name: str) -> logging.Logger:
         """
         Get a logger instance for a specific feature.
-        
+
         Args:
             feature_name: Name of the feature (e.g., 'Cortana', 'Telemetry')
-            
+
         Returns:
             logging.Logger: Configured logger instance
         """
         return logging.getLogger(feature_name)
-    
-    def log_operation(self, logger: logging.Logger, operation: str, status: str, details: str = None):
+
+    def log_operation(self, logger: logging.Logger, operation: str, status: str, details: str = None, duration: float = None):
         """
         Log an operation with consistent formatting.
-        
+
         Args:
             logger: Logger instance
             operation: Name of the operation being performed
             status: Status of the operation ('success' or 'error')
             details: Additional details about the operation
+            duration: Time the operation took, in seconds
         """
+        extra = {'feature': logger.name, 'operation': operation, 'result': status.lower(),
+                 'details': details, 'duration': duration}
         if status.lower() == 'success':
-            logger.info(f"Operation '{operation}' completed successfully")
+            logger.info("Operation '%s' completed successfully", operation, extra=extra)
         else:
-            logger.error(f"Operation '{operation}' failed")
-        
+            logger.error("Operation '%s' failed", operation, extra=extra)
+
         if details:
-            logger.info(f"Details: {details}")
-    
-    def log_registry_change(self, logger: logging.Logger, path: str, values: dict, success: bool):
+            logger.info("Details: %s", details, extra=extra)
+
+    def log_registry_change(self, logger: logging.Logger, path: str, values: dict, success: bool, duration: float = None):
         """
         Log registry changes with consistent formatting.
-        
+
         Args:
             logger: Logger instance
             path: Registry path being modified
             values: Dictionary of values being set
             success: Whether the operation was successful
+            duration: Time the change took, in seconds
         """
+        extra = {'feature': logger.name, 'operation': 'registry_set', 'target': path,
+                 'result': 'success' if success else 'error', 'values': values, 'duration': duration}
         if success:
-            logger.info(f"Registry path modified: {path}")
-            logger.info(f"Values set: {values}")
+            logger.info("Registry path modified: %s - values set: %s", path, values, extra=extra)
         else:
-            logger.error(f"Failed to modify registry path: {path}")
-    
-    def log_service_change(self, logger: logging.Logger, service_name: str, action: str, success: bool):
+            logger.error("Failed to modify registry path: %s", path, extra=extra)
+
+    def log_service_change(self, logger: logging.Logger, service_name: str, action: str, success: bool, duration: float = None):
         """
         Log service changes with consistent formatting.
-        
+
         Args:
             logger: Logger instance
             service_name: Name of the service
             action: Action performed (e.g., 'stop', 'disable')
             success: Whether the operation was successful
+            duration: Time the change took, in seconds
         """
+        extra = {'feature': logger.name, 'operation': 'service_' + action.replace(' ', '_'), 'target': service_name,
+                 'result': 'success' if success else 'error', 'duration': duration}
         if success:
-            logger.info(f"Service '{service_name}' {action}ed successfully")
+            logger.info("Service '%s' %sed successfully", service_name, action, extra=extra)
         else:
-            logger.error(f"Failed to {action} service '{service_name}'")
-    
-    def log_task_change(self, logger: logging.Logger, task_name: str, action: str, success: bool):
+            logger.error("Failed to %s service '%s'", action, service_name, extra=extra)
+
+    def log_task_change(self, logger: logging.Logger, task_name: str, action: str, success: bool, duration: float = None):
         """
         Log task changes with consistent formatting.
-        
+
         Args:
             logger: Logger instance
             task_name: Name of the task
             action: Action performed (e.g., 'disable', 'enable')
             success: Whether the operation was successful
+            duration: Time the change took, in seconds
         """
+        extra = {'feature': logger.name, 'operation': 'task_' + action.replace(' ', '_'), 'target': task_name,
+                 'result': 'success' if success else 'error', 'duration': duration}
         if success:
-            logger.info(f"Task '{task_name}' {action}ed successfully")
+            logger.info("Task '%s' %sed successfully", task_name, action, extra=extra)
         else:
-            logger.error(f"Failed to {action} task '{task_name}'") 
\ No newline at end of file
+            logger.error("Failed to %s task '%s'", action, task_name, extra=extra)
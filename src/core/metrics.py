@@ -0,0 +1,376 @@
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from .backend import PlatformBackend
+from .command_runner import CommandResult
+from .registry_backend import RegistryBackend, RegistryChangeSource
+from .service_manager import ScServiceApi, ServiceApi, ServiceCall
+
+# Prefix of every exported Prometheus metric
+METRIC_PREFIX = "wscript"
+
+
+class OperationStats(NamedTuple):
+    """Aggregated timings of one operation on one host."""
+    host: str
+    category: str  # 'registry', 'service', 'task' or 'process'
+    operation: str
+    count: int
+    failures: int
+    total: float  # seconds
+    p50: float
+    p95: float
+    max: float
+    output_bytes: int
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of an ascending list.
+
+    Args:
+        sorted_values: The values, sorted ascending
+        fraction: The percentile as a fraction (0.95 for p95)
+
+    Returns:
+        float: The smallest value with at least `fraction` of the values at or below it
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class RunMetrics:
+    """
+    Thread-safe collector of operation timings for one run.
+
+    Every operation is recorded under (host, category, operation) with its
+    duration, whether it failed and how many bytes of output it produced.
+    The collected samples are summarized into a JSON report and a Prometheus
+    textfile for the node exporter's textfile collector.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        # (host, category, operation) -> [durations, failures, output bytes]
+        self._samples: Dict[Tuple[str, str, str], List[Any]] = {}
+
+    def record(self, host: str, category: str, operation: str, duration: float, success: bool = True, output_bytes: int = 0) -> None:
+        """
+        Record one timed operation.
+
+        Args:
+            host: The host it ran against
+            category: 'registry', 'service', 'task' or 'process'
+            operation: Name of the operation (e.g. 'open', 'stop', 'schtasks /change')
+            duration: Seconds it took
+            success: False if it failed
+            output_bytes: Bytes of output captured from it
+        """
+        key = (host, category, operation)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = [[], 0, 0]
+            samples[0].append(duration)
+            samples[1] += not success
+            samples[2] += output_bytes
+
+    def timed(self, host: str, category: str, operation: str, call: Callable[[], Any],
+              failed: Callable[[Any], bool] = lambda result: False,
+              output: Callable[[Any], int] = lambda result: 0) -> Any:
+        """
+        Run a call and record how long it took.
+
+        An exception counts as a failure and is re-raised, except
+        FileNotFoundError: a missing key or value is an answer, not a failure.
+
+        Args:
+            host, category, operation: Where to record the timing
+            call: The operation
+            failed: Decides from the result whether the operation failed
+            output: Gets the bytes of output from the result
+
+        Returns:
+            The result of the call
+        """
+        start = time.perf_counter()
+        try:
+            result = call()
+        except FileNotFoundError:
+            self.record(host, category, operation, time.perf_counter() - start)
+            raise
+        except Exception:
+            self.record(host, category, operation, time.perf_counter() - start, False)
+            raise
+        self.record(host, category, operation, time.perf_counter() - start, not failed(result), output(result))
+        return result
+
+    def stats(self) -> List[OperationStats]:
+        """
+        Summarize the samples.
+
+        Returns:
+            list: One OperationStats per host and operation, slowest total first
+        """
+        with self._lock:
+            items = [(key, sorted(samples[0]), samples[1], samples[2]) for key, samples in self._samples.items()]
+        stats = [
+            OperationStats(host, category, operation, len(durations), failures, sum(durations),
+                           percentile(durations, 0.5), percentile(durations, 0.95), durations[-1], output_bytes)
+            for (host, category, operation), durations, failures, output_bytes in items
+        ]
+        return sorted(stats, key=lambda s: s.total, reverse=True)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Build the run report.
+
+        Returns:
+            dict: Run start, duration, per-host totals and per-operation statistics
+        """
+        stats = self.stats()
+        hosts: Dict[str, Dict[str, Any]] = {}
+        for s in stats:
+            host = hosts.setdefault(s.host, {"operations": 0, "failures": 0, "seconds": 0.0})
+            host["operations"] += s.count
+            host["failures"] += s.failures
+            host["seconds"] += s.total
+        return {
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "duration": time.perf_counter() - self._start,
+            "hosts": hosts,
+            "operations": [s._asdict() for s in stats],
+        }
+
+    def prometheus(self) -> str:
+        """
+        Render the statistics in the Prometheus text exposition format.
+
+        Latencies are exported as a summary with 0.5 and 0.95 quantiles,
+        failures and output bytes as counters, labelled by host, category
+        and operation.
+        """
+        def labels(s: OperationStats, **extra: str) -> str:
+            pairs = dict(host=s.host, category=s.category, operation=s.operation, **extra)
+            return ",".join(f'{name}="{_escape(value)}"' for name, value in pairs.items())
+
+        stats = self.stats()
+        name = f"{METRIC_PREFIX}_operation_duration_seconds"
+        lines = [
+            f"# HELP {name} Time taken by registry, service, task and process operations.",
+            f"# TYPE {name} summary",
+        ]
+        for s in stats:
+            lines.append(f"{name}{{{labels(s, quantile='0.5')}}} {s.p50:.6f}")
+            lines.append(f"{name}{{{labels(s, quantile='0.95')}}} {s.p95:.6f}")
+            lines.append(f"{name}_sum{{{labels(s)}}} {s.total:.6f}")
+            lines.append(f"{name}_count{{{labels(s)}}} {s.count}")
+        for metric, help_text, field in (
+            ("operation_failures_total", "Operations that failed.", "failures"),
+            ("operation_output_bytes_total", "Bytes of output captured from commands.", "output_bytes"),
+        ):
+            lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} counter")
+            lines.extend(f"{METRIC_PREFIX}_{metric}{{{labels(s)}}} {getattr(s, field)}" for s in stats)
+        lines.append(f"# HELP {METRIC_PREFIX}_run_timestamp_seconds Start of the last run.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_run_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_run_timestamp_seconds {self.started:.0f}")
+        lines.append(f"# HELP {METRIC_PREFIX}_run_duration_seconds Duration of the last run.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_run_duration_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_run_duration_seconds {time.perf_counter() - self._start:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path: str) -> None:
+        """Write the JSON run report."""
+        _write_atomic(path, json.dumps(self.report(), indent=2) + "\n")
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Write the Prometheus textfile. The file is replaced atomically, so the
+        node exporter never reads a half-written file.
+        """
+        _write_atomic(path, self.prometheus())
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path: str, text: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+def _command_name(args: List[str]) -> str:
+    # Tool and subcommand, e.g. 'sc stop' or 'schtasks /change'; never the target
+    tool = os.path.basename(args[0]).lower() if args else "?"
+    if tool.endswith(".exe"):
+        tool = tool[:-4]
+    subcommand = next((arg.lower() for arg in args[1:] if not arg.startswith("\\\\")), "")
+    return f"{tool} {subcommand}".strip() if tool in ("sc", "schtasks") else tool
+
+
+def _output_bytes(result: CommandResult) -> int:
+    return len(result.stdout.encode("utf-8", "replace")) + len(result.stderr.encode("utf-8", "replace"))
+
+
+_COMMAND_CATEGORIES = {"sc": "service", "schtasks": "task"}
+
+
+class TimedRegistryBackend(RegistryBackend):
+    """Registry backend that times every call to the backend it wraps."""
+
+    def __init__(self, inner: RegistryBackend, metrics: RunMetrics, host: str):
+        self.inner = inner
+        self.metrics = metrics
+        self.host = host
+
+    def _timed(self, operation: str, call: Callable[[], Any]) -> Any:
+        return self.metrics.timed(self.host, "registry", operation, call)
+
+    def open_key(self, hive: int, key_path: str, create: bool = False, write: bool = False) -> Any:
+        return self._timed("open", lambda: self.inner.open_key(hive, key_path, create, write))
+
+    def close_key(self, handle: Any) -> None:
+        self.inner.close_key(handle)
+
+    def set_value(self, handle: Any, value_name: str, value_type: int, value: Any) -> None:
+        self._timed("set", lambda: self.inner.set_value(handle, value_name, value_type, value))
+
+    def delete_value(self, handle: Any, value_name: str) -> None:
+        self._timed("delete", lambda: self.inner.delete_value(handle, value_name))
+
+    def query_value(self, handle: Any, value_name: str) -> Tuple[Any, int]:
+        return self._timed("query", lambda: self.inner.query_value(handle, value_name))
+
+    def query_info_key(self, handle: Any) -> Tuple[int, int, int]:
+        return self._timed("query_info", lambda: self.inner.query_info_key(handle))
+
+    def enum_keys(self, handle: Any) -> List[str]:
+        return self._timed("enum_keys", lambda: self.inner.enum_keys(handle))
+
+    def load_hive(self, name: str, file_path: str) -> None:
+        self._timed("load_hive", lambda: self.inner.load_hive(name, file_path))
+
+    def unload_hive(self, name: str) -> None:
+        self._timed("unload_hive", lambda: self.inner.unload_hive(name))
+
+    def change_source(self) -> RegistryChangeSource:
+        return self.inner.change_source()
+
+    def __getattr__(self, name: str) -> Any:
+        # Anything else (counters of the memory backend, close of the remote one) is the inner backend's
+        return getattr(self.inner, name)
+
+
+class TimedServiceApi(ServiceApi):
+    """Service API that times every call to the API it wraps."""
+
+    def __init__(self, inner: ServiceApi, metrics: RunMetrics, host: str):
+        self.inner = inner
+        self.metrics = metrics
+        self.host = host
+
+    def _timed(self, operation: str, call: Callable[[], ServiceCall]) -> ServiceCall:
+        return self.metrics.timed(self.host, "service", operation, call, failed=lambda result: not result.ok)
+
+    def enumerate(self) -> Optional[Dict[str, int]]:
+        return self.metrics.timed(self.host, "service", "enumerate", self.inner.enumerate,
+                                  failed=lambda result: result is None)
+
+    def query_state(self, service_name: str) -> ServiceCall:
+        return self._timed("query", lambda: self.inner.query_state(service_name))
+
+    def query_start_type(self, service_name: str) -> ServiceCall:
+        return self._timed("query_config", lambda: self.inner.query_start_type(service_name))
+
+    def set_start_type(self, service_name: str, start_type: int) -> ServiceCall:
+        return self._timed("config", lambda: self.inner.set_start_type(service_name, start_type))
+
+    def stop(self, service_name: str) -> ServiceCall:
+        return self._timed("stop", lambda: self.inner.stop(service_name))
+
+    def start(self, service_name: str) -> ServiceCall:
+        return self._timed("start", lambda: self.inner.start(service_name))
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class InstrumentedBackend(PlatformBackend):
+    """
+    Platform backend that records the timing of every registry call, service
+    call, command and process start made through the backend it wraps.
+
+    Commands are recorded by tool and subcommand (e.g. 'schtasks /change'),
+    a command with a non-zero exit code counts as failed, and its stdout and
+    stderr count as captured output.
+    """
+
+    def __init__(self, inner: PlatformBackend, metrics: RunMetrics):
+        super().__init__(inner.host)
+        self.inner = inner
+        self.metrics = metrics
+        self._registry: Optional[TimedRegistryBackend] = None
+        self._services: Optional[TimedServiceApi] = None
+
+    @property
+    def registry(self) -> RegistryBackend:
+        if self._registry is None:
+            self._registry = TimedRegistryBackend(self.inner.registry, self.metrics, self.host)
+        return self._registry
+
+    @property
+    def services(self) -> ServiceApi:
+        if self._services is None:
+            services = self.inner.services
+            if isinstance(services, ScServiceApi):
+                # sc goes through run(), which times it and counts its output
+                self._services = ScServiceApi(self.run)
+            else:
+                self._services = TimedServiceApi(services, self.metrics, self.host)
+        return self._services
+
+    def run(self, args: List[str]) -> CommandResult:
+        operation = _command_name(args)
+        category = _COMMAND_CATEGORIES.get(operation.split(" ")[0], "process")
+        return self.metrics.timed(
+            self.host, category, operation, lambda: self.inner.run(args),
+            failed=lambda result: result.returncode != 0, output=_output_bytes
+        )
+
+    def start_process(self, args: List[str]) -> bool:
+        operation = f"start {_command_name(args)}"
+        return self.metrics.timed(self.host, "process", operation, lambda: self.inner.start_process(args),
+                                  failed=lambda started: not started)
+
+    def is_admin(self) -> bool:
+        return self.inner.is_admin()
+
+    def shell_ready(self) -> Optional[bool]:
+        return self.inner.shell_ready()
+
+    def refresh_shell(self) -> bool:
+        return self.metrics.timed(self.host, "process", "refresh_shell", self.inner.refresh_shell,
+                                  failed=lambda ok: not ok)
+
+    def post_actions(self) -> Dict[str, Callable[[], bool]]:
+        # Run through this backend so the commands and broadcasts are timed
+        own = {"restart_explorer": self.restart_explorer, "refresh_shell": self.refresh_shell}
+        return {name: own.get(name, action) for name, action in self.inner.post_actions().items()}
+
+    def close(self) -> None:
+        self.inner.close()
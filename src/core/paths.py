@@ -0,0 +1,15 @@
+import os
+
+
+def data_dir() -> str:
+    """
+    Get the directory for state kept between runs (compliance cache, journal).
+
+    Returns:
+        str: %ProgramData%\\WScript on Windows, otherwise .wscript in the
+        home directory, so the location does not depend on where the tool is started
+    """
+    program_data = os.environ.get("ProgramData")
+    if program_data:
+        return os.path.join(program_data, "WScript")
+    return os.path.join(os.path.expanduser("~"), ".wscript")
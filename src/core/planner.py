@@ -0,0 +1,453 @@
+import logging
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from .log_manager import LogManager
+from .post_actions import REFRESH_SHELL, RESTART_EXPLORER, PostActionScheduler, get_post_action_scheduler
+from .process_manager import ProcessManager
+from .profiles import SERVICE_ACTIONS, Profile
+from .registry_backend import HIVE_NAMES, RegistryBackend
+from .reg_files import commit_with_reg_import
+from .registry_manager import RegistryOperationResult, RegistryTransaction
+from .service_manager import ServiceController, ServiceRequest, ServiceResult
+from .step_scheduler import ScheduleResult, Step, StepScheduler
+from .task_manager import TaskInventory, TaskResult, normalize_task_path
+from .tracing import Trace
+
+# Names of the steps PlanExecutor runs; item steps are named '<kind>:<item>'
+REGISTRY_STEP = "registry"
+SERVICE_STEP = "service"
+SERVICE_SNAPSHOT_STEP = "service_snapshot"
+TASK_STEP = "task"
+TASK_SNAPSHOT_STEP = "task_snapshot"
+POST_ACTIONS_STEP = "post_actions"
+
+# Actions that can be requested by profiles to run once after everything is applied
+POST_ACTIONS: Dict[str, Callable[[], bool]] = {
+    RESTART_EXPLORER: ProcessManager.restart_explorer,
+    REFRESH_SHELL: ProcessManager.refresh_shell,
+}
+
+
+class PlannedValue(NamedTuple):
+    """A registry value write in the merged plan."""
+    hive: int
+    path: str
+    name: str
+    value: object
+    value_type: int
+    profile: str
+
+
+class PlanConflict(NamedTuple):
+    """Two profiles asking for different results on the same target."""
+    target: str
+    kept: str
+    dropped: str
+
+
+class ExecutionPlan:
+    """
+    Merged, deduplicated set of changes from any number of profiles.
+
+    Registry values are grouped by hive and key, services by name and tasks by
+    path. When two profiles disagree on the same target, the profile added
+    last wins and the conflict is recorded.
+    """
+
+    def __init__(self):
+        self.profiles: List[str] = []
+        self.registry: Dict[Tuple[int, str], Dict[str, PlannedValue]] = {}
+        self.services: Dict[str, ServiceRequest] = {}
+        self.tasks: Dict[str, str] = {}
+        self.post_actions: Dict[str, List[str]] = {}
+        self.profile_keys: Dict[str, Set[Tuple[int, str]]] = {}
+        # (kind, item) -> profiles asking for it; kind is 'registry', 'service', 'task' or 'post_action'
+        self.requesters: Dict[Tuple[str, object], List[str]] = {}
+        self.conflicts: List[PlanConflict] = []
+        self.duplicates = 0
+
+    def add_profile(self, profile: Profile) -> None:
+        """
+        Merge a profile into the plan.
+
+        Args:
+            profile: The profile to merge
+        """
+        self.profiles.append(profile.name)
+        keys = self.profile_keys.setdefault(profile.name, set())
+
+        for entry in profile.registry:
+            key = (entry.hive, entry.path.strip("\\").lower())
+            keys.add(key)
+            self._requested("registry", key, profile.name)
+            planned = self.registry.setdefault(key, {})
+            for name, (value, value_type) in entry.values.items():
+                new = PlannedValue(entry.hive, entry.path, name, value, value_type, profile.name)
+                old = planned.get(name.lower())
+                if old is not None:
+                    if (old.value, old.value_type) == (value, value_type):
+                        self.duplicates += 1
+                        continue
+                    target = f"{HIVE_NAMES.get(entry.hive, entry.hive)}\\{entry.path}\\{name}"
+                    self.conflicts.append(PlanConflict(target, profile.name, old.profile))
+                planned[name.lower()] = new
+
+        for service in profile.services:
+            self._requested("service", service.name.lower(), profile.name)
+            existing = self.services.get(service.name.lower())
+            if existing is None:
+                self.services[service.name.lower()] = ServiceRequest(service.name, service.actions)
+                continue
+            self.duplicates += 1
+            actions = set(existing.actions) | set(service.actions)
+            merged = tuple(action for action in SERVICE_ACTIONS if action in actions)
+            self.services[service.name.lower()] = existing._replace(actions=merged)
+
+        for task in profile.tasks:
+            key = normalize_task_path(task.path)
+            self._requested("task", key, profile.name)
+            if key in self.tasks:
+                self.duplicates += 1
+            else:
+                self.tasks[key] = task.path
+
+        for action in profile.post_actions:
+            self._requested("post_action", action, profile.name)
+            self.post_actions.setdefault(action, []).append(profile.name)
+
+    def _requested(self, kind: str, key: object, profile: str) -> None:
+        profiles = self.requesters.setdefault((kind, key), [])
+        if profile not in profiles:
+            profiles.append(profile)
+
+    def registry_values(self) -> Iterable[PlannedValue]:
+        """Iterate over planned registry values, grouped by key."""
+        for values in self.registry.values():
+            yield from values.values()
+
+    def describe(self) -> str:
+        """
+        Summarize the plan in one line.
+
+        Returns:
+            str: Counts of keys, values, services, tasks and merge results
+        """
+        value_count = sum(len(values) for values in self.registry.values())
+        return (
+            f"{len(self.profiles)} profile(s): {len(self.registry)} registry key(s), {value_count} value(s), "
+            f"{len(self.services)} service(s), {len(self.tasks)} task(s); "
+            f"{self.duplicates} duplicate(s) removed, {len(self.conflicts)} conflict(s)"
+        )
+
+
+def build_plan(profiles: Iterable[Profile]) -> ExecutionPlan:
+    """
+    Merge profiles into a single execution plan.
+
+    Args:
+        profiles: The profiles to merge, in priority order (last wins)
+
+    Returns:
+        ExecutionPlan: The merged plan
+    """
+    plan = ExecutionPlan()
+    for profile in profiles:
+        plan.add_profile(profile)
+    return plan
+
+
+class PlanResult(NamedTuple):
+    """Per-item results of an executed plan."""
+    registry: List[RegistryOperationResult]
+    services: List[ServiceResult]
+    tasks: List[TaskResult]
+    post_actions: Dict[str, bool]
+    errors: Tuple[str, ...] = ()  # Steps that raised or were skipped, as 'step: error'
+    schedule: Optional[ScheduleResult] = None
+
+    @property
+    def success(self) -> bool:
+        # Missing services and tasks have nothing left to disable, so they are not errors
+        return (
+            not self.errors
+            and all(result.success for result in self.registry)
+            and all(result.success or not result.exists for result in self.services)
+            and all(result.success or not result.exists for result in self.tasks)
+            and all(self.post_actions.values())
+        )
+
+    @property
+    def changes(self) -> int:
+        """Number of registry values, services and tasks that were actually changed."""
+        return (
+            sum(1 for result in self.registry if result.success and not result.compliant)
+            + sum(1 for result in self.services if result.success and result.changed)
+            + sum(1 for result in self.tasks if result.changed)
+        )
+
+    @property
+    def compliant(self) -> int:
+        """Number of registry values, services and tasks that were already in the desired state."""
+        return (
+            sum(1 for result in self.registry if result.compliant)
+            + sum(1 for result in self.services if result.success and not result.changed)
+            + sum(1 for result in self.tasks if result.success and not result.changed)
+        )
+
+
+def _profiles_of(plan: ExecutionPlan, kind: str, keys: Iterable) -> List[str]:
+    """Get the profiles that requested any of the given items, in plan order."""
+    requested = {profile for key in keys for profile in plan.requesters.get((kind, key), [])}
+    return [profile for profile in plan.profiles if profile in requested]
+
+
+def _traced_step(step: Step, features: List[str]) -> Callable[..., object]:
+    """Wrap a step's action in a span named after the step and the features it serves."""
+    action, features = step.action, ",".join(features)
+
+    def run(*values):
+        with Trace.span(step.name, "feature", features=features):
+            return action(*values)
+    return run
+
+
+@Trace.traced_class("plan")
+class PlanExecutor:
+    """
+    Apply an ExecutionPlan in one pass.
+
+    Each registry key, service and task is a step on a StepScheduler, so
+    items run concurrently and a step that fails does not stop the others.
+    Keys open once for all their values, and services and tasks are looked
+    up in one shared snapshot. Post actions run at most once, after the
+    registry steps - or, for the local host while a PostActionScheduler is
+    active, at the end of the whole run.
+    """
+
+    def __init__(
+        self,
+        registry_backend: Optional[RegistryBackend] = None,
+        service_controller: Optional[ServiceController] = None,
+        task_inventory: Optional[TaskInventory] = None,
+        post_actions: Optional[Dict[str, Callable[[], bool]]] = None,
+        logger_name: str = 'Plan',
+        max_workers: int = 8,
+        bulk: bool = False
+    ):
+        self.registry_backend = registry_backend
+        self.service_controller = service_controller or ServiceController()
+        self.task_inventory = task_inventory or TaskInventory()
+        # Only the global handlers act on the local host, where the run's scheduler applies
+        self.defer_post_actions = post_actions is None
+        self.post_actions = POST_ACTIONS if post_actions is None else post_actions
+        self.max_workers = max_workers
+        self.bulk = bulk
+        self.log_manager = LogManager()
+        self.logger = self.log_manager.get_logger(logger_name)
+
+    @classmethod
+    def for_transport(cls, transport, poll_interval: float = 0.5) -> "PlanExecutor":
+        """
+        Create an executor that applies plans to the host behind a transport.
+
+        Args:
+            transport: The Transport of the host
+            poll_interval: Seconds between service state polls while stopping
+
+        Returns:
+            PlanExecutor: Executor using the transport's registry and commands
+        """
+        return cls(
+            transport.registry,
+            ServiceController(api=transport.services, poll_interval=poll_interval),
+            TaskInventory(transport.run),
+            transport.post_actions(),
+            logger_name=f"Plan.{transport.host}"
+        )
+
+    def apply_registry(self, values: Iterable[PlannedValue]) -> List[RegistryOperationResult]:
+        """
+        Write planned registry values, opening each key once - or, in bulk
+        mode, with a single `reg import` of the values that differ.
+        """
+        transaction = RegistryTransaction(self.registry_backend)
+        for planned in values:
+            transaction.set_value(planned.path, planned.name, planned.value, planned.value_type, planned.hive)
+        if self.bulk:
+            results = commit_with_reg_import(transaction)
+        else:
+            results = transaction.commit(skip_compliant=True)
+
+        by_key: Dict[Tuple[int, str], List[RegistryOperationResult]] = {}
+        for result in results:
+            by_key.setdefault((result.operation.hive, result.operation.key_path), []).append(result)
+        for (hive, path), key_results in by_key.items():
+            location = f"{HIVE_NAMES.get(hive, hive)}\\{path}"
+            changed = {r.operation.value_name: r.operation.value for r in key_results if not r.compliant}
+            if not changed:
+                self.logger.info("Registry path already compliant: %s", location, extra={
+                    'feature': self.logger.name, 'operation': 'registry_set', 'target': location, 'result': 'compliant'})
+                continue
+            self.log_manager.log_registry_change(self.logger, location, changed, all(r.success for r in key_results),
+                                                 duration=sum(r.duration for r in key_results))
+        return results
+
+    def apply_service(self, request: ServiceRequest) -> ServiceResult:
+        """Apply the planned actions to one service."""
+        result = self.service_controller.apply(request)
+        if not result.exists:
+            self.logger.info("Service %s does not exist - skipping", result.service_name, extra={
+                'feature': self.logger.name, 'operation': 'service_change', 'target': result.service_name, 'result': 'missing'})
+        elif result.success and not result.changed:
+            self.logger.info("Service %s already compliant", result.service_name, extra={
+                'feature': self.logger.name, 'operation': 'service_change', 'target': result.service_name, 'result': 'compliant'})
+        else:
+            action = " and ".join(result.actions or ()) or "change"
+            self.log_manager.log_service_change(self.logger, result.service_name, action, result.success, duration=result.duration)
+        return result
+
+    def apply_task(self, task_path: str) -> TaskResult:
+        """Disable one planned task, looked up in the shared task snapshot."""
+        result = self.task_inventory.disable([task_path])[0]
+        if not result.exists:
+            self.logger.info("Task not found: %s", result.task_path, extra={
+                'feature': self.logger.name, 'operation': 'task_disable', 'target': result.task_path, 'result': 'missing'})
+        elif result.changed or not result.success:
+            self.log_manager.log_task_change(self.logger, result.task_path, "disable", result.success, duration=result.duration)
+        return result
+
+    def run_post_actions(self, plan: ExecutionPlan, registry: List[RegistryOperationResult]) -> Dict[str, bool]:
+        """
+        Run each requested post action once, if the requesting profiles
+        changed something and applied cleanly.
+
+        A refresh is skipped when a restart is requested too. With an
+        active scheduler the actions are handed to it and nothing is
+        returned, since their outcome is not known yet.
+        """
+        def key_of(result):
+            return result.operation.hive, result.operation.key_path.strip("\\").lower()
+
+        failed_keys = {key_of(r) for r in registry if not r.success}
+        changed_keys = {key_of(r) for r in registry if r.success and not r.compliant}
+        scheduler = get_post_action_scheduler() if self.defer_post_actions else None
+        deferred = scheduler is not None
+        if not deferred:
+            scheduler = PostActionScheduler(self.post_actions)
+        for action, profiles in plan.post_actions.items():
+            keys = set().union(*(plan.profile_keys.get(name, set()) for name in profiles))
+            if keys & failed_keys:
+                self.logger.info("Skipping post action '%s' because registry changes failed", action, extra={
+                    'feature': self.logger.name, 'operation': action, 'result': 'skipped'})
+                continue
+            if not keys & changed_keys:
+                self.logger.info("Skipping post action '%s' because nothing changed", action, extra={
+                    'feature': self.logger.name, 'operation': action, 'result': 'skipped'})
+                continue
+            for profile in profiles:
+                scheduler.request(action, profile)
+        if deferred:
+            for action in scheduler.pending():
+                self.logger.info("Post action '%s' deferred to the end of the run", action, extra={
+                    'feature': self.logger.name, 'operation': action, 'result': 'deferred'})
+            return {}
+        outcomes = scheduler.run()
+        for action, ok in outcomes.items():
+            self.log_manager.log_operation(self.logger, action, "success" if ok else "error", duration=scheduler.durations.get(action))
+        return outcomes
+
+    def steps(self, plan: ExecutionPlan) -> List[Step]:
+        """
+        Get the steps applying a plan, with their dependencies.
+
+        Every registry key, service and task is a step of its own, so a
+        failure only affects that item and the critical path names the item
+        that bounded the run. Services and tasks wait for one shared
+        snapshot; post actions wait for every registry step. While tracing is
+        on, each step records a span naming the features that requested it.
+        """
+        steps = []
+        features: Dict[str, List[str]] = {}
+        if self.bulk:
+            # A single `reg import` covers every key
+            steps.append(Step(REGISTRY_STEP, lambda: self.apply_registry(plan.registry_values())))
+            features[REGISTRY_STEP] = [profile for profile, keys in plan.profile_keys.items() if keys]
+        else:
+            for key, values in plan.registry.items():
+                if not values:
+                    continue
+                path = next(iter(values.values())).path
+                name = f"{REGISTRY_STEP}:{HIVE_NAMES.get(key[0], key[0])}\\{path}"
+                steps.append(Step(name, lambda values=values: self.apply_registry(values.values())))
+                features[name] = plan.requesters.get(("registry", key), [])
+        registry_steps = tuple(step.name for step in steps)
+
+        if plan.services:
+            depends_on = ()
+            if len(plan.services) > 1:
+                # One enumeration instead of one query per service
+                steps.append(Step(SERVICE_SNAPSHOT_STEP, self.service_controller.take_snapshot))
+                depends_on = (SERVICE_SNAPSHOT_STEP,)
+                features[SERVICE_SNAPSHOT_STEP] = _profiles_of(plan, "service", plan.services)
+            for key, request in plan.services.items():
+                name = f"{SERVICE_STEP}:{request.service_name}"
+                steps.append(Step(name, lambda *_, request=request: self.apply_service(request), depends_on))
+                features[name] = plan.requesters.get(("service", key), [])
+
+        if plan.tasks:
+            steps.append(Step(TASK_SNAPSHOT_STEP, self.task_inventory.refresh))
+            features[TASK_SNAPSHOT_STEP] = _profiles_of(plan, "task", plan.tasks)
+            for key, task_path in plan.tasks.items():
+                name = f"{TASK_STEP}:{task_path}"
+                steps.append(Step(name, lambda _, task_path=task_path: self.apply_task(task_path), (TASK_SNAPSHOT_STEP,)))
+                features[name] = plan.requesters.get(("task", key), [])
+
+        if plan.post_actions:
+            steps.append(Step(
+                POST_ACTIONS_STEP,
+                lambda *registry: self.run_post_actions(plan, [result for results in registry for result in results]),
+                registry_steps
+            ))
+            features[POST_ACTIONS_STEP] = _profiles_of(plan, "post_action", plan.post_actions)
+        return [step._replace(action=_traced_step(step, features.get(step.name, []))) for step in steps]
+
+    def execute(self, plan: ExecutionPlan) -> PlanResult:
+        """
+        Apply a plan.
+
+        Args:
+            plan: The plan to apply
+
+        Returns:
+            PlanResult: Per-item results
+        """
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("Executing plan: %s", plan.describe(), extra={'feature': self.logger.name, 'operation': 'execute_plan'})
+        for conflict in plan.conflicts:
+            self.logger.info("Conflict on %s: '%s' overrides '%s'", conflict.target, conflict.kept, conflict.dropped, extra={
+                'feature': self.logger.name, 'operation': 'resolve_conflict', 'target': conflict.target})
+
+        steps = self.steps(plan)
+        try:
+            schedule = StepScheduler(self.max_workers, self.logger.name).run(steps)
+        finally:
+            self.service_controller.snapshot = None
+        errors = tuple(f"{step.name}: {step.error}" for step in schedule.failed)
+
+        def values(prefix: str) -> list:
+            # Items whose step raised or was skipped have no result, only an error
+            return [
+                schedule.value(step.name) for step in steps
+                if step.name.startswith(prefix + ":") and schedule.steps[step.name].success
+            ]
+
+        registry = schedule.value(REGISTRY_STEP, []) if self.bulk else [
+            result for results in values(REGISTRY_STEP) for result in results
+        ]
+        return PlanResult(
+            registry,
+            values(SERVICE_STEP),
+            values(TASK_STEP),
+            schedule.value(POST_ACTIONS_STEP, {}),
+            errors,
+            schedule
+        )
@@ -0,0 +1,125 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from .log_manager import LogManager
+
+RESTART_EXPLORER = "restart_explorer"
+REFRESH_SHELL = "refresh_shell"
+
+# An action that is made unnecessary by another one in the same run: a
+# restarted Explorer reads all of its settings anyway
+SUPERSEDED_BY = {REFRESH_SHELL: RESTART_EXPLORER}
+
+
+class PostActionScheduler:
+    """
+    Collect the post actions (Explorer restart, shell refresh) requested
+    during a run and run each of them at most once, at the end.
+
+    Requests are deduplicated by action; an action superseded by another
+    requested action does not run and gets the outcome of the one that
+    covers it. Handlers default to the post actions of the local backend
+    at the time run() is called.
+    """
+
+    def __init__(self, handlers: Optional[Dict[str, Callable[[], bool]]] = None):
+        self.handlers = handlers
+        self.requests: Dict[str, List[str]] = {}
+        # Seconds each action took in the last run()
+        self.durations: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.logger = LogManager().get_logger('PostActions')
+
+    def request(self, action: str, requester: str) -> None:
+        """
+        Ask for an action to run at the end of the run.
+
+        Args:
+            action: Name of the post action (e.g. 'restart_explorer')
+            requester: Profile or feature asking for it, for the log
+        """
+        with self._lock:
+            requesters = self.requests.setdefault(action, [])
+            if requester not in requesters:
+                requesters.append(requester)
+
+    def pending(self) -> List[str]:
+        """Get the requested actions that will actually run, in request order."""
+        with self._lock:
+            return [action for action in self.requests if SUPERSEDED_BY.get(action) not in self.requests]
+
+    def run(self) -> Dict[str, bool]:
+        """
+        Run the pending actions and clear the requests.
+
+        Returns:
+            dict: Outcome of every requested action that ran or was covered by another
+        """
+        if self.handlers is None:
+            from .backend import get_backend
+            handlers = get_backend().post_actions()
+        else:
+            handlers = self.handlers
+        pending = self.pending()
+        with self._lock:
+            requests, self.requests = self.requests, {}
+
+        outcomes: Dict[str, bool] = {}
+        self.durations = {}
+        for action in pending:
+            handler = handlers.get(action)
+            if handler is None:
+                self.logger.info("Post action '%s' is not available on this host - skipping", action, extra={
+                    'feature': self.logger.name, 'operation': action, 'result': 'skipped'})
+                continue
+            self.logger.info("Running post action '%s' for %s", action, ", ".join(requests[action]), extra={
+                'feature': self.logger.name, 'operation': action})
+            started = time.perf_counter()
+            outcomes[action] = handler()
+            self.durations[action] = time.perf_counter() - started
+        for action, requesters in requests.items():
+            covering = SUPERSEDED_BY.get(action)
+            if action not in outcomes and covering in outcomes:
+                self.logger.info("Post action '%s' for %s is covered by '%s'", action, ", ".join(requesters), covering, extra={
+                    'feature': self.logger.name, 'operation': action, 'result': 'covered', 'details': covering})
+                outcomes[action] = outcomes[covering]
+        return outcomes
+
+
+_active_scheduler: Optional[PostActionScheduler] = None
+
+
+def get_post_action_scheduler() -> Optional[PostActionScheduler]:
+    """Get the scheduler collecting post actions for the current run, if any."""
+    return _active_scheduler
+
+
+def set_post_action_scheduler(scheduler: Optional[PostActionScheduler]) -> None:
+    """
+    Collect post actions in the given scheduler instead of running them right away.
+
+    Args:
+        scheduler: The scheduler of the run, or None to stop collecting
+    """
+    global _active_scheduler
+    _active_scheduler = scheduler
+
+
+def request_post_action(action: str, requester: str) -> Optional[bool]:
+    """
+    Run a post action now, or defer it to the end of the run if a scheduler is active.
+
+    Args:
+        action: Name of the post action
+        requester: Profile or feature asking for it
+
+    Returns:
+        bool: Outcome of the action, or None if it was deferred
+    """
+    scheduler = _active_scheduler
+    if scheduler is not None:
+        scheduler.request(action, requester)
+        return None
+    scheduler = PostActionScheduler()
+    scheduler.request(action, requester)
+    return scheduler.run().get(action, False)
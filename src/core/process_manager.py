@@ -0,0 +1,54 @@
+from typing import List
+from .backend import get_backend
+
+
+class ProcessManager:
+    @staticmethod
+    def kill_process(image_name: str) -> bool:
+        """
+        Forcefully terminate all processes with the given image name.
+
+        Args:
+            image_name: The executable name (e.g. 'explorer.exe')
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        result = get_backend().run(["taskkill", "/f", "/im", image_name])
+        if result.returncode != 0:
+            print(f"Error stopping {image_name}: {(result.stderr or result.stdout).strip()}")
+            return False
+        return True
+
+    @staticmethod
+    def start_process(args: List[str]) -> bool:
+        """
+        Start a process without waiting for it to exit.
+
+        Args:
+            args: The command and its arguments
+
+        Returns:
+            bool: True if the process was started, False otherwise
+        """
+        return get_backend().start_process(args)
+
+    @staticmethod
+    def restart_explorer() -> bool:
+        """
+        Restart Windows Explorer so shell changes take effect.
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        return get_backend().restart_explorer()
+
+    @staticmethod
+    def refresh_shell() -> bool:
+        """
+        Broadcast a settings change so Explorer picks up policy changes without a restart.
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        return get_backend().refresh_shell()
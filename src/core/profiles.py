@@ -0,0 +1,193 @@
+import json
+import os
+from typing import Any, Dict, List, NamedTuple, Tuple
+from .registry_backend import (
+    HKEY_CLASSES_ROOT,
+    HKEY_CURRENT_USER,
+    HKEY_LOCAL_MACHINE,
+    HKEY_USERS,
+    REG_BINARY,
+    REG_DWORD,
+    REG_EXPAND_SZ,
+    REG_MULTI_SZ,
+    REG_QWORD,
+    REG_SZ,
+)
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11 - only JSON profiles are supported
+    tomllib = None
+
+# Built-in profiles shipped with the tool
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "profiles")
+
+HIVES = {
+    "HKLM": HKEY_LOCAL_MACHINE,
+    "HKEY_LOCAL_MACHINE": HKEY_LOCAL_MACHINE,
+    "HKCU": HKEY_CURRENT_USER,
+    "HKEY_CURRENT_USER": HKEY_CURRENT_USER,
+    "HKU": HKEY_USERS,
+    "HKEY_USERS": HKEY_USERS,
+    "HKCR": HKEY_CLASSES_ROOT,
+    "HKEY_CLASSES_ROOT": HKEY_CLASSES_ROOT,
+}
+
+VALUE_TYPES = {
+    "REG_SZ": REG_SZ,
+    "REG_EXPAND_SZ": REG_EXPAND_SZ,
+    "REG_BINARY": REG_BINARY,
+    "REG_DWORD": REG_DWORD,
+    "REG_MULTI_SZ": REG_MULTI_SZ,
+    "REG_QWORD": REG_QWORD,
+}
+
+SERVICE_ACTIONS = ("stop", "disable")
+TASK_ACTIONS = ("disable",)
+POST_ACTIONS = ("restart_explorer", "refresh_shell")
+
+
+class ProfileError(ValueError):
+    """Raised when a profile cannot be loaded or is malformed."""
+
+
+class RegistryEntry(NamedTuple):
+    """Registry values to set under one key: value name -> (value, type)."""
+    hive: int
+    path: str
+    values: Dict[str, Tuple[Any, int]]
+
+
+class ServiceEntry(NamedTuple):
+    """Actions to apply to one service."""
+    name: str
+    actions: Tuple[str, ...]
+
+
+class TaskEntry(NamedTuple):
+    """Action to apply to one scheduled task."""
+    path: str
+    action: str = "disable"
+
+
+class Profile(NamedTuple):
+    """A declarative set of registry, service and task changes."""
+    name: str
+    description: str = ""
+    registry: List[RegistryEntry] = []
+    services: List[ServiceEntry] = []
+    tasks: List[TaskEntry] = []
+    post_actions: List[str] = []
+
+
+def _parse_value(value: Any) -> Tuple[Any, int]:
+    # Plain ints are DWORDs and plain strings are REG_SZ, anything else is
+    # spelled out as {"type": "REG_...", "data": ...}
+    if isinstance(value, bool):
+        raise ProfileError(f"Booleans are not valid registry values: {value}")
+    if isinstance(value, int):
+        return value, REG_DWORD
+    if isinstance(value, str):
+        return value, REG_SZ
+    if isinstance(value, dict) and "data" in value:
+        type_name = value.get("type", "REG_DWORD")
+        if type_name not in VALUE_TYPES:
+            raise ProfileError(f"Unknown registry value type: {type_name}")
+        data = value["data"]
+        if VALUE_TYPES[type_name] == REG_BINARY and isinstance(data, str):
+            data = bytes.fromhex(data)
+        return data, VALUE_TYPES[type_name]
+    raise ProfileError(f"Invalid registry value: {value!r}")
+
+
+def parse_profile(data: Dict[str, Any], default_name: str = "") -> Profile:
+    """
+    Build a Profile from its JSON/TOML representation.
+
+    Args:
+        data: The decoded profile document
+        default_name: Name to use if the document has none
+
+    Returns:
+        Profile: The parsed profile
+
+    Raises:
+        ProfileError: If the document is malformed
+    """
+    name = data.get("name", default_name)
+
+    registry = []
+    for entry in data.get("registry", []):
+        hive_name = entry.get("hive", "HKLM").upper()
+        if hive_name not in HIVES:
+            raise ProfileError(f"{name}: unknown registry hive {hive_name}")
+        if "path" not in entry:
+            raise ProfileError(f"{name}: registry entry without a path")
+        values = {value_name: _parse_value(value) for value_name, value in entry.get("values", {}).items()}
+        registry.append(RegistryEntry(HIVES[hive_name], entry["path"], values))
+
+    services = []
+    for entry in data.get("services", []):
+        actions = tuple(entry.get("actions", SERVICE_ACTIONS))
+        unknown = [action for action in actions if action not in SERVICE_ACTIONS]
+        if unknown:
+            raise ProfileError(f"{name}: unknown service actions {unknown}")
+        services.append(ServiceEntry(entry["name"], actions))
+
+    tasks = []
+    for entry in data.get("tasks", []):
+        action = entry.get("action", "disable")
+        if action not in TASK_ACTIONS:
+            raise ProfileError(f"{name}: unknown task action {action}")
+        tasks.append(TaskEntry(entry["path"], action))
+
+    post_actions = list(data.get("post_actions", []))
+    unknown = [action for action in post_actions if action not in POST_ACTIONS]
+    if unknown:
+        raise ProfileError(f"{name}: unknown post actions {unknown}")
+
+    return Profile(
+        name,
+        data.get("description", ""),
+        registry,
+        services,
+        tasks,
+        post_actions
+    )
+
+
+def load_profile(name_or_path: str) -> Profile:
+    """
+    Load a profile by built-in name (e.g. 'telemetry') or from a file.
+
+    Args:
+        name_or_path: Built-in profile name, or path to a .json/.toml file
+
+    Returns:
+        Profile: The loaded profile
+
+    Raises:
+        ProfileError: If the profile cannot be found or parsed
+    """
+    path = name_or_path
+    if not os.path.isfile(path):
+        path = os.path.join(PROFILE_DIR, f"{name_or_path}.json")
+    if not os.path.isfile(path):
+        raise ProfileError(f"Profile not found: {name_or_path}")
+
+    default_name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        if path.lower().endswith(".toml"):
+            if tomllib is None:
+                raise ProfileError("TOML profiles require Python 3.11 or higher")
+            with open(path, "rb") as f:
+                data = tomllib.load(f)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+    except (OSError, ValueError) as e:
+        if isinstance(e, ProfileError):
+            raise
+        raise ProfileError(f"Failed to read profile {path}: {str(e)}")
+
+    return parse_profile(data, default_name)
@@ -0,0 +1,500 @@
+import os
+import re
+import struct
+from typing import Any, Iterable, List, Optional, Tuple
+from .backend import get_backend
+from .command_runner import CommandRunner
+from .journal import get_journal, new_run_id
+from .paths import data_dir
+from .registry_backend import (
+    HIVE_NAMES,
+    HKEY_CLASSES_ROOT,
+    HKEY_CURRENT_USER,
+    HKEY_LOCAL_MACHINE,
+    HKEY_USERS,
+    REG_BINARY,
+    REG_DWORD,
+    REG_EXPAND_SZ,
+    REG_MULTI_SZ,
+    REG_QWORD,
+    REG_SZ,
+)
+from .registry_manager import RegistryOperation, RegistryOperationResult, RegistryTransaction
+
+REG_HEADER = "Windows Registry Editor Version 5.00"
+# Hex data lines are wrapped like regedit does, at about 80 characters
+_HEX_LINE_WIDTH = 76
+
+POL_SIGNATURE = b"PReg"
+POL_VERSION = 1
+# Registry.pol marks a value to delete with this prefix on its name
+POL_DELETE_PREFIX = "**del."
+POLICIES_PATH = r"SOFTWARE\Policies"
+
+# Local Group Policy object, and where each scope keeps its Registry.pol
+LOCAL_GPO_DIR = os.path.join(os.environ.get("SystemRoot", r"C:\Windows"), "System32", "GroupPolicy")
+POLICY_SCOPES = {HKEY_LOCAL_MACHINE: "Machine", HKEY_CURRENT_USER: "User"}
+# Client-side extension and tool GUIDs the registry settings of a GPO are listed under in gpt.ini
+_REGISTRY_EXTENSION = "{35378EAC-683F-11D2-A89A-00C04FBBCFA2}"
+_EXTENSION_NAMES = {
+    "Machine": ("gPCMachineExtensionNames", "{D02B1F72-3407-48AE-BA88-E8213C6761F1}"),
+    "User": ("gPCUserExtensionNames", "{D02B1F73-3407-48AE-BA88-E8213C6761F1}"),
+}
+
+_HIVES_BY_NAME = {name: hive for hive, name in HIVE_NAMES.items()}
+_HIVES_BY_NAME.update({"HKCR": HKEY_CLASSES_ROOT, "HKCU": HKEY_CURRENT_USER, "HKLM": HKEY_LOCAL_MACHINE, "HKU": HKEY_USERS})
+_VALUE_LINE = re.compile(r'^(@|"(?:[^"\\]|\\.)*")\s*=\s*(.*)$')
+_STRING_DATA = re.compile(r'^"((?:[^"\\]|\\.)*)"$')
+_HEX_DATA = re.compile(r"^hex(?:\(([0-9a-fA-F]+)\))?:(.*)$")
+_POL_HEADER = struct.Struct("<4sI")
+_U32 = struct.Struct("<I")
+
+
+class RegFileError(ValueError):
+    """Raised when a .reg or Registry.pol file is malformed or uses something unsupported."""
+
+
+def encode_data(value: Any, value_type: int) -> bytes:
+    """
+    Encode a value the way the registry stores it.
+
+    Args:
+        value: The value (int, str, list of str or bytes, depending on the type)
+        value_type: The REG_* type
+
+    Returns:
+        bytes: The raw data
+    """
+    if value_type in (REG_SZ, REG_EXPAND_SZ):
+        return (str(value) + "\0").encode("utf-16-le")
+    if value_type == REG_MULTI_SZ:
+        return "".join(item + "\0" for item in value).encode("utf-16-le") + b"\0\0"
+    if value_type == REG_DWORD:
+        return struct.pack("<I", value & 0xFFFFFFFF)
+    if value_type == REG_QWORD:
+        return struct.pack("<Q", value & 0xFFFFFFFFFFFFFFFF)
+    return bytes(value)
+
+
+def decode_data(data: bytes, value_type: int) -> Any:
+    """
+    Decode raw registry data (see encode_data).
+
+    Returns:
+        The value: int for DWORD/QWORD, str, list of str for MULTI_SZ, otherwise bytes
+    """
+    if value_type in (REG_SZ, REG_EXPAND_SZ):
+        text = data.decode("utf-16-le", errors="replace")
+        return text[:-1] if text.endswith("\0") else text
+    if value_type == REG_MULTI_SZ:
+        text = data.decode("utf-16-le", errors="replace").rstrip("\0")
+        return text.split("\0") if text else []
+    if value_type == REG_DWORD and len(data) == 4:
+        return struct.unpack("<I", data)[0]
+    if value_type == REG_QWORD and len(data) == 8:
+        return struct.unpack("<Q", data)[0]
+    return bytes(data)
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _unescape(text: str) -> str:
+    return re.sub(r"\\(.)", r"\1", text)
+
+
+def _hex_lines(prefix: str, data: bytes) -> str:
+    # "name"=hex(7):41,00,... wrapped with a trailing backslash, continued indented
+    pairs = [f"{byte:02x}" for byte in data]
+    lines = []
+    line = prefix
+    for index, pair in enumerate(pairs):
+        piece = pair + ("," if index < len(pairs) - 1 else "")
+        if len(line) + len(piece) > _HEX_LINE_WIDTH and line.strip():
+            lines.append(line + "\\")
+            line = "  "
+        line += piece
+    lines.append(line)
+    return "\r\n".join(lines)
+
+
+def format_reg(operations: Iterable[RegistryOperation]) -> str:
+    """
+    Render registry operations as the text of a .reg file.
+
+    Keys appear in the order they are first used; deletes become "name"=-.
+
+    Args:
+        operations: The writes and deletes
+
+    Returns:
+        str: The file content, with Windows line endings
+    """
+    groups: List[Tuple[str, List[RegistryOperation]]] = []
+    by_key = {}
+    for operation in operations:
+        if operation.hive not in HIVE_NAMES:
+            raise RegFileError(f"Unsupported hive: {operation.hive}")
+        path = operation.key_path.strip("\\")
+        key = f"{HIVE_NAMES[operation.hive]}\\{path}"
+        if key.lower() not in by_key:
+            by_key[key.lower()] = []
+            groups.append((key, by_key[key.lower()]))
+        by_key[key.lower()].append(operation)
+
+    lines = [REG_HEADER, ""]
+    for key, key_operations in groups:
+        lines.append(f"[{key}]")
+        for operation in key_operations:
+            name = f'"{_escape(operation.value_name)}"' if operation.value_name else "@"
+            if operation.action == "delete":
+                lines.append(f"{name}=-")
+            elif operation.value_type == REG_DWORD:
+                lines.append(f"{name}=dword:{operation.value & 0xFFFFFFFF:08x}")
+            elif operation.value_type == REG_SZ and not re.search(r"[\r\n\0]", str(operation.value)):
+                lines.append(f'{name}="{_escape(str(operation.value))}"')
+            else:
+                kind = "hex" if operation.value_type == REG_BINARY else f"hex({operation.value_type:x})"
+                lines.append(_hex_lines(f"{name}={kind}:", encode_data(operation.value, operation.value_type)))
+        lines.append("")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def _logical_lines(text: str) -> Iterable[str]:
+    # Joins hex data continued with a trailing backslash
+    pending = ""
+    for raw in text.splitlines():
+        line = raw.strip()
+        if pending:
+            line = pending + line
+            pending = ""
+        match = _VALUE_LINE.match(line)
+        if line.endswith("\\") and match and match.group(2).lower().startswith("hex"):
+            pending = line[:-1]
+            continue
+        yield line
+    if pending:
+        yield pending
+
+
+def parse_reg(text: str) -> List[RegistryOperation]:
+    """
+    Parse the text of a .reg file (version 5.00) into registry operations.
+
+    Args:
+        text: The file content
+
+    Returns:
+        list: One operation per value line, in file order
+
+    Raises:
+        RegFileError: On an unknown header, hive or data format, or a key deletion
+    """
+    lines = iter(_logical_lines(text.lstrip("\ufeff")))
+    header = next((line for line in lines if line), "")
+    if header != REG_HEADER:
+        raise RegFileError(f"Not a version 5.00 .reg file: {header!r}")
+
+    operations = []
+    hive = path = None
+    for line in lines:
+        if not line or line.startswith(";"):
+            continue
+        if line.startswith("["):
+            if line.startswith("[-"):
+                raise RegFileError(f"Key deletions are not supported: {line}")
+            root, _, path = line.strip("[]").partition("\\")
+            if root.upper() not in _HIVES_BY_NAME:
+                raise RegFileError(f"Unknown hive: {root}")
+            hive = _HIVES_BY_NAME[root.upper()]
+            continue
+        match = _VALUE_LINE.match(line)
+        if not match or hive is None:
+            raise RegFileError(f"Unexpected line: {line}")
+        name = "" if match.group(1) == "@" else _unescape(match.group(1)[1:-1])
+        data = match.group(2).strip()
+        if data == "-":
+            operations.append(RegistryOperation("delete", hive, path, name))
+            continue
+        string = _STRING_DATA.match(data)
+        hex_data = _HEX_DATA.match(data)
+        if string:
+            operations.append(RegistryOperation("set", hive, path, name, _unescape(string.group(1)), REG_SZ))
+        elif data.lower().startswith("dword:"):
+            operations.append(RegistryOperation("set", hive, path, name, int(data[6:], 16), REG_DWORD))
+        elif hex_data:
+            value_type = int(hex_data.group(1), 16) if hex_data.group(1) else REG_BINARY
+            raw = bytes(int(pair, 16) for pair in re.split(r"[,\s]+", hex_data.group(2)) if pair)
+            operations.append(RegistryOperation("set", hive, path, name, decode_data(raw, value_type), value_type))
+        else:
+            raise RegFileError(f"Unsupported value data: {line}")
+    return operations
+
+
+def write_reg_file(path: str, operations: Iterable[RegistryOperation]) -> None:
+    """Write a .reg file in the UTF-16 encoding regedit and `reg import` expect."""
+    with open(path, "w", encoding="utf-16-le", newline="") as f:
+        f.write("\ufeff" + format_reg(operations))
+
+
+def read_reg_file(path: str) -> List[RegistryOperation]:
+    """Read a .reg file written by regedit, `reg export` or write_reg_file (see parse_reg)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    encoding = "utf-16" if data[:2] in (b"\xff\xfe", b"\xfe\xff") else "utf-8-sig"
+    return parse_reg(data.decode(encoding))
+
+
+def encode_pol(operations: Iterable[RegistryOperation]) -> bytes:
+    """
+    Encode registry operations as a Registry.pol file.
+
+    The hive is implied by where the file is placed (Machine or User), so
+    it is not stored. Deletes become **del.<name> entries.
+
+    Returns:
+        bytes: The file content
+    """
+    parts = [_POL_HEADER.pack(POL_SIGNATURE, POL_VERSION)]
+    for operation in operations:
+        if operation.action == "delete":
+            name, value_type, data = POL_DELETE_PREFIX + operation.value_name, REG_SZ, encode_data(" ", REG_SZ)
+        else:
+            name, value_type, data = operation.value_name, operation.value_type, encode_data(operation.value, operation.value_type)
+        parts.append(b"".join((
+            "[".encode("utf-16-le"),
+            (operation.key_path.strip("\\") + "\0").encode("utf-16-le"), ";".encode("utf-16-le"),
+            (name + "\0").encode("utf-16-le"), ";".encode("utf-16-le"),
+            _U32.pack(value_type), ";".encode("utf-16-le"),
+            _U32.pack(len(data)), ";".encode("utf-16-le"),
+            data,
+            "]".encode("utf-16-le"),
+        )))
+    return b"".join(parts)
+
+
+def decode_pol(data: bytes, hive: int = HKEY_LOCAL_MACHINE) -> List[RegistryOperation]:
+    """
+    Decode a Registry.pol file (see encode_pol).
+
+    Other special entries (e.g. **delvals.) are kept as plain values, so
+    they survive a round trip.
+
+    Args:
+        data: The file content
+        hive: Hive the entries belong to (HKEY_LOCAL_MACHINE for Machine, HKEY_CURRENT_USER for User)
+
+    Returns:
+        list: One operation per entry, in file order
+
+    Raises:
+        RegFileError: If the file is not a valid Registry.pol
+    """
+    if len(data) < _POL_HEADER.size or _POL_HEADER.unpack_from(data)[0] != POL_SIGNATURE:
+        raise RegFileError("Not a Registry.pol file")
+    if _POL_HEADER.unpack_from(data)[1] != POL_VERSION:
+        raise RegFileError(f"Unsupported Registry.pol version: {_POL_HEADER.unpack_from(data)[1]}")
+
+    def expect(position: int, char: str) -> int:
+        if data[position:position + 2] != char.encode("utf-16-le"):
+            raise RegFileError(f"Expected '{char}' at offset {position}")
+        return position + 2
+
+    def string(position: int) -> Tuple[str, int]:
+        # Null-terminated UTF-16LE, aligned to two bytes
+        for end in range(position, len(data) - 1, 2):
+            if data[end:end + 2] == b"\0\0":
+                return data[position:end].decode("utf-16-le"), end + 2
+        raise RegFileError(f"Unterminated string at offset {position}")
+
+    operations = []
+    position = _POL_HEADER.size
+    while position < len(data):
+        position = expect(position, "[")
+        key_path, position = string(position)
+        position = expect(position, ";")
+        name, position = string(position)
+        position = expect(position, ";")
+        if position + 4 > len(data):
+            raise RegFileError("Truncated entry")
+        value_type = _U32.unpack_from(data, position)[0]
+        position = expect(position + 4, ";")
+        if position + 4 > len(data):
+            raise RegFileError("Truncated entry")
+        size = _U32.unpack_from(data, position)[0]
+        position = expect(position + 4, ";")
+        raw = data[position:position + size]
+        if len(raw) != size:
+            raise RegFileError("Truncated entry")
+        position = expect(position + size, "]")
+        if name.lower().startswith(POL_DELETE_PREFIX):
+            operations.append(RegistryOperation("delete", hive, key_path, name[len(POL_DELETE_PREFIX):]))
+        else:
+            operations.append(RegistryOperation("set", hive, key_path, name, decode_data(raw, value_type), value_type))
+    return operations
+
+
+def write_pol_file(path: str, operations: Iterable[RegistryOperation]) -> None:
+    """Write a Registry.pol file, replacing it atomically."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(encode_pol(operations))
+    os.replace(temp_path, path)
+
+
+def read_pol_file(path: str, hive: int = HKEY_LOCAL_MACHINE) -> List[RegistryOperation]:
+    """Read a Registry.pol file (see decode_pol)."""
+    with open(path, "rb") as f:
+        return decode_pol(f.read(), hive)
+
+
+def is_policy(operation: RegistryOperation) -> bool:
+    """Tell whether an operation targets a Group Policy path (SOFTWARE\\Policies in HKLM or HKCU)."""
+    path = operation.key_path.strip("\\").lower()
+    prefix = POLICIES_PATH.lower()
+    return operation.hive in POLICY_SCOPES and (path == prefix or path.startswith(prefix + "\\"))
+
+
+def merge_policies(existing: List[RegistryOperation], changes: Iterable[RegistryOperation]) -> List[RegistryOperation]:
+    """
+    Merge policy entries: a change replaces an existing entry for the same
+    value (set or delete), everything else is kept in order.
+    """
+    def target(operation):
+        return operation.key_path.strip("\\").lower(), operation.value_name.lower()
+
+    changes = list(changes)
+    replaced = {target(operation) for operation in changes}
+    return [operation for operation in existing if target(operation) not in replaced] + changes
+
+
+def _bump_gpt_ini(path: str, scopes: Iterable[str]) -> None:
+    # Version holds the user version in the high word and the machine version
+    # in the low word; gpupdate only re-applies a scope whose version changed
+    lines = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    if not any(line.strip().lower() == "[general]" for line in lines):
+        lines.insert(0, "[General]")
+
+    settings = {}
+    for line in lines:
+        name, sep, value = line.partition("=")
+        if sep:
+            settings[name.strip().lower()] = value.strip()
+    version = int(settings.get("version", "0") or 0)
+    machine, user = version & 0xFFFF, version >> 16
+    updates = {}
+    for scope in scopes:
+        if scope == "Machine":
+            machine = (machine + 1) & 0xFFFF
+        else:
+            user = (user + 1) & 0xFFFF
+        setting, tool = _EXTENSION_NAMES[scope]
+        entries = re.findall(r"\[[^\]]*\]", settings.get(setting.lower(), ""))
+        if not any(_REGISTRY_EXTENSION.lower() in entry.lower() for entry in entries):
+            entries.append(f"[{_REGISTRY_EXTENSION}{tool}]")
+        updates[setting] = "".join(sorted(entries, key=str.upper))
+    updates["Version"] = str((user << 16) | machine)
+
+    result = []
+    for line in lines:
+        name = line.partition("=")[0].strip()
+        match = next((setting for setting in updates if setting.lower() == name.lower()), None)
+        if match is None:
+            result.append(line)
+        else:
+            result.append(f"{match}={updates.pop(match)}")
+    general = next(index for index, line in enumerate(result) if line.strip().lower() == "[general]")
+    for offset, (setting, value) in enumerate(updates.items(), 1):
+        result.insert(general + offset, f"{setting}={value}")
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8", newline="\r\n") as f:
+        f.write("\n".join(result) + "\n")
+    os.replace(temp_path, path)
+
+
+def install_policies(operations: Iterable[RegistryOperation], gpo_dir: str = LOCAL_GPO_DIR) -> List[str]:
+    """
+    Merge the policy operations into the Registry.pol files of a Group
+    Policy object and bump its version, so the next gpupdate applies them.
+
+    Operations outside SOFTWARE\\Policies are ignored.
+
+    Args:
+        operations: The desired policy values
+        gpo_dir: Directory of the GPO (default: the local Group Policy object)
+
+    Returns:
+        list: Paths of the Registry.pol files written
+    """
+    by_scope = {}
+    for operation in operations:
+        if is_policy(operation):
+            by_scope.setdefault(POLICY_SCOPES[operation.hive], []).append(operation)
+
+    written = []
+    for scope, changes in by_scope.items():
+        directory = os.path.join(gpo_dir, scope)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "Registry.pol")
+        hive = next(hive for hive, name in POLICY_SCOPES.items() if name == scope)
+        existing = read_pol_file(path, hive) if os.path.exists(path) else []
+        write_pol_file(path, merge_policies(existing, changes))
+        written.append(path)
+    if by_scope:
+        _bump_gpt_ini(os.path.join(gpo_dir, "gpt.ini"), by_scope)
+    return written
+
+
+def default_import_dir() -> str:
+    """Directory keeping the .reg files applied with reg import, one per run."""
+    return os.path.join(data_dir(), "imports")
+
+
+def commit_with_reg_import(
+    transaction: RegistryTransaction,
+    run: Optional[CommandRunner] = None,
+    directory: Optional[str] = None
+) -> List[RegistryOperationResult]:
+    """
+    Apply a transaction with a single `reg import` instead of one call per value.
+
+    Values that are already right are skipped and prior values are
+    journaled, the same way commit(skip_compliant=True) does. The rest go
+    into one .reg file that is kept as a record of the run.
+
+    Args:
+        transaction: The queued operations
+        run: Command runner (default: the current platform backend's)
+        directory: Where the .reg file is kept (default: default_import_dir())
+
+    Returns:
+        list: One RegistryOperationResult per queued operation. If the import
+        fails, every value it contained fails with reg's error message.
+    """
+    results = transaction.prepare(skip_compliant=True)
+    pending = [operation for operation, result in zip(transaction.operations, results) if result is None]
+    if pending:
+        directory = directory or default_import_dir()
+        journal = transaction.journal or get_journal()
+        path = os.path.join(directory, f"{journal.run_id if journal is not None else new_run_id()}.reg")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            write_reg_file(path, pending)
+            outcome = (run or get_backend().run)(["reg", "import", path])
+            error = None if outcome.returncode == 0 else (
+                (outcome.stderr or outcome.stdout).strip() or f"reg exited with {outcome.returncode}"
+            )
+            # One import writes every value, so each gets an equal share of its time
+            duration = outcome.duration / len(pending)
+        except OSError as e:
+            error, duration = str(e), 0.0
+        pending_results = iter(
+            RegistryOperationResult(operation, error is None, error, duration=duration) for operation in pending
+        )
+        results = [result if result is not None else next(pending_results) for result in results]
+    transaction.operations = []
+    return results
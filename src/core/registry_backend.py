@@ -0,0 +1,797 @@
+import ctypes
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import winreg
+except ImportError:  # Not on Windows - only the in-memory backend is usable
+    winreg = None
+
+# Registry hives and value types. The numbers match the ones exposed by winreg
+# so they can be passed straight through to the Windows API.
+HKEY_CLASSES_ROOT = 0x80000000
+HKEY_CURRENT_USER = 0x80000001
+HKEY_LOCAL_MACHINE = 0x80000002
+HKEY_USERS = 0x80000003
+
+REG_SZ = 1
+REG_EXPAND_SZ = 2
+REG_BINARY = 3
+REG_DWORD = 4
+REG_MULTI_SZ = 7
+REG_QWORD = 11
+
+# RegNotifyChangeKeyValue filter and the handful of kernel32 wait constants it needs
+KEY_NOTIFY = 0x0010
+REG_NOTIFY_CHANGE_NAME = 0x00000001
+REG_NOTIFY_CHANGE_LAST_SET = 0x00000004
+MAXIMUM_WAIT_OBJECTS = 64
+WAIT_OBJECT_0 = 0x00000000
+WAIT_TIMEOUT = 0x00000102
+WAIT_FAILED = 0xFFFFFFFF
+
+# Token privileges needed to load and unload hive files (RegLoadKey / RegUnLoadKey)
+HIVE_PRIVILEGES = ("SeBackupPrivilege", "SeRestorePrivilege")
+TOKEN_ADJUST_PRIVILEGES = 0x0020
+TOKEN_QUERY = 0x0008
+SE_PRIVILEGE_ENABLED = 0x00000002
+ERROR_NOT_ALL_ASSIGNED = 1300
+
+HIVE_NAMES = {
+    HKEY_CLASSES_ROOT: "HKEY_CLASSES_ROOT",
+    HKEY_CURRENT_USER: "HKEY_CURRENT_USER",
+    HKEY_LOCAL_MACHINE: "HKEY_LOCAL_MACHINE",
+    HKEY_USERS: "HKEY_USERS",
+}
+
+
+class RegistryBackend:
+    """
+    Interface used by RegistryManager to talk to a registry.
+
+    Handles returned by open_key are opaque to callers and must be released
+    with close_key. Missing keys and values raise FileNotFoundError, the same
+    way winreg does.
+    """
+
+    def open_key(self, hive: int, key_path: str, create: bool = False, write: bool = False) -> Any:
+        raise NotImplementedError
+
+    def close_key(self, handle: Any) -> None:
+        raise NotImplementedError
+
+    def set_value(self, handle: Any, value_name: str, value_type: int, value: Any) -> None:
+        raise NotImplementedError
+
+    def delete_value(self, handle: Any, value_name: str) -> None:
+        raise NotImplementedError
+
+    def query_value(self, handle: Any, value_name: str) -> Tuple[Any, int]:
+        raise NotImplementedError
+
+    def query_info_key(self, handle: Any) -> Tuple[int, int, int]:
+        """Return (subkey count, value count, last write time) like winreg.QueryInfoKey."""
+        raise NotImplementedError
+
+    def enum_keys(self, handle: Any) -> List[str]:
+        """Return the names of the subkeys of an open key."""
+        raise NotImplementedError
+
+    def load_hive(self, name: str, file_path: str) -> None:
+        """
+        Mount a hive file (e.g. a user's NTUSER.DAT) as HKEY_USERS\\<name>.
+
+        Args:
+            name: Name of the key to mount the hive under
+            file_path: Path of the hive file on the machine of the registry
+
+        Raises:
+            OSError: If the hive cannot be loaded (e.g. the file is in use)
+        """
+        raise NotImplementedError(f"{type(self).__name__} cannot load hive files")
+
+    def unload_hive(self, name: str) -> None:
+        """
+        Unmount a hive loaded with load_hive, writing it back to its file.
+
+        Every handle to a key in the hive must be closed first.
+        """
+        raise NotImplementedError(f"{type(self).__name__} cannot load hive files")
+
+    def last_write_time(self, hive: int, key_path: str) -> Optional[int]:
+        """
+        Get the last time a key or any of its values was written.
+
+        Args:
+            hive: The registry hive (e.g. HKEY_LOCAL_MACHINE)
+            key_path: The registry key path
+
+        Returns:
+            int: Opaque timestamp that changes on every write to the key, or
+            None if the key does not exist
+        """
+        try:
+            handle = self.open_key(hive, key_path)
+        except OSError:
+            return None
+        try:
+            return self.query_info_key(handle)[2]
+        finally:
+            self.close_key(handle)
+
+    def change_source(self) -> "RegistryChangeSource":
+        """
+        Create a source of change notifications for keys of this registry.
+
+        Raises:
+            NotImplementedError: If the registry cannot notify about changes
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support change notifications")
+
+    def key_exists(self, hive: int, key_path: str) -> bool:
+        """
+        Check if a registry key exists.
+
+        Args:
+            hive: The registry hive (e.g. HKEY_LOCAL_MACHINE)
+            key_path: The registry key path
+
+        Returns:
+            bool: True if the key exists, False otherwise
+        """
+        try:
+            handle = self.open_key(hive, key_path)
+        except OSError:
+            return False
+        self.close_key(handle)
+        return True
+
+
+class WinregBackend(RegistryBackend):
+    """Registry backend using the real Windows registry through winreg."""
+
+    # Enabled in the process token on the first hive load, and then kept
+    _hive_privileges_enabled = False
+
+    def open_key(self, hive: int, key_path: str, create: bool = False, write: bool = False) -> Any:
+        access = winreg.KEY_READ | (winreg.KEY_WRITE if write else 0)
+        if create:
+            return winreg.CreateKeyEx(hive, key_path, 0, access)
+        return winreg.OpenKey(hive, key_path, 0, access)
+
+    def close_key(self, handle: Any) -> None:
+        winreg.CloseKey(handle)
+
+    def set_value(self, handle: Any, value_name: str, value_type: int, value: Any) -> None:
+        winreg.SetValueEx(handle, value_name, 0, value_type, value)
+
+    def delete_value(self, handle: Any, value_name: str) -> None:
+        winreg.DeleteValue(handle, value_name)
+
+    def query_value(self, handle: Any, value_name: str) -> Tuple[Any, int]:
+        return winreg.QueryValueEx(handle, value_name)
+
+    def query_info_key(self, handle: Any) -> Tuple[int, int, int]:
+        return winreg.QueryInfoKey(handle)
+
+    def enum_keys(self, handle: Any) -> List[str]:
+        return [winreg.EnumKey(handle, index) for index in range(winreg.QueryInfoKey(handle)[0])]
+
+    @classmethod
+    def _enable_hive_privileges(cls) -> None:
+        if cls._hive_privileges_enabled:
+            return
+        from ctypes import wintypes
+
+        class LUID_AND_ATTRIBUTES(ctypes.Structure):
+            _fields_ = [("LowPart", wintypes.DWORD), ("HighPart", wintypes.LONG), ("Attributes", wintypes.DWORD)]
+
+        class TOKEN_PRIVILEGES(ctypes.Structure):
+            _fields_ = [("PrivilegeCount", wintypes.DWORD), ("Privileges", LUID_AND_ATTRIBUTES * len(HIVE_PRIVILEGES))]
+
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        advapi32 = ctypes.WinDLL("advapi32", use_last_error=True)
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        advapi32.OpenProcessToken.argtypes = [wintypes.HANDLE, wintypes.DWORD, ctypes.POINTER(wintypes.HANDLE)]
+        advapi32.LookupPrivilegeValueW.argtypes = [wintypes.LPCWSTR, wintypes.LPCWSTR, ctypes.c_void_p]
+        advapi32.AdjustTokenPrivileges.argtypes = [
+            wintypes.HANDLE, wintypes.BOOL, ctypes.c_void_p, wintypes.DWORD, ctypes.c_void_p, ctypes.c_void_p
+        ]
+
+        privileges = TOKEN_PRIVILEGES(len(HIVE_PRIVILEGES))
+        for entry, name in zip(privileges.Privileges, HIVE_PRIVILEGES):
+            # The LUID is the first two fields of LUID_AND_ATTRIBUTES
+            if not advapi32.LookupPrivilegeValueW(None, name, ctypes.byref(entry)):
+                raise ctypes.WinError(ctypes.get_last_error())
+            entry.Attributes = SE_PRIVILEGE_ENABLED
+        token = wintypes.HANDLE()
+        if not advapi32.OpenProcessToken(kernel32.GetCurrentProcess(), TOKEN_ADJUST_PRIVILEGES | TOKEN_QUERY, ctypes.byref(token)):
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            # Succeeds even if the token does not hold the privileges; that is only in the last error
+            if not advapi32.AdjustTokenPrivileges(token, False, ctypes.byref(privileges), 0, None, None):
+                raise ctypes.WinError(ctypes.get_last_error())
+            error = ctypes.get_last_error()
+            if error == ERROR_NOT_ALL_ASSIGNED:
+                raise ctypes.WinError(error)
+        finally:
+            kernel32.CloseHandle(token)
+        cls._hive_privileges_enabled = True
+
+    def load_hive(self, name: str, file_path: str) -> None:
+        self._enable_hive_privileges()
+        winreg.LoadKey(winreg.HKEY_USERS, name, file_path)
+
+    def unload_hive(self, name: str) -> None:
+        self._enable_hive_privileges()
+        # winreg has no RegUnLoadKey
+        advapi32 = ctypes.WinDLL("advapi32", use_last_error=True)
+        advapi32.RegUnLoadKeyW.argtypes = [ctypes.c_void_p, ctypes.c_wchar_p]
+        status = advapi32.RegUnLoadKeyW(HKEY_USERS, name)
+        if status != 0:
+            raise ctypes.WinError(status)
+
+    def change_source(self) -> "RegistryChangeSource":
+        return WinregChangeSource()
+
+
+class RemoteWinregBackend(WinregBackend):
+    """
+    Registry backend for another machine through the Remote Registry service.
+
+    Only HKEY_LOCAL_MACHINE and HKEY_USERS can be opened remotely.
+    """
+
+    def __init__(self, computer_name: str):
+        self.computer_name = computer_name
+        self.connections: Dict[int, Any] = {}
+
+    def open_key(self, hive: int, key_path: str, create: bool = False, write: bool = False) -> Any:
+        if not isinstance(hive, int):  # Relative to a key already opened on the remote machine
+            return super().open_key(hive, key_path, create, write)
+        if hive not in self.connections:
+            self.connections[hive] = winreg.ConnectRegistry(f"\\\\{self.computer_name}", hive)
+        return super().open_key(self.connections[hive], key_path, create, write)
+
+    def change_source(self) -> "RegistryChangeSource":
+        # Asynchronous notifications are only delivered for local keys
+        raise NotImplementedError("Change notifications are not available for remote registries")
+
+    def load_hive(self, name: str, file_path: str) -> None:
+        # Needs the backup and restore privileges on the remote machine
+        raise NotImplementedError("Hive files can only be loaded into the local registry")
+
+    def unload_hive(self, name: str) -> None:
+        raise NotImplementedError("Hive files can only be loaded into the local registry")
+
+    def close(self) -> None:
+        """Close the connections to the remote hives."""
+        for handle in self.connections.values():
+            winreg.CloseKey(handle)
+        self.connections = {}
+
+
+class MemoryRegistryBackend(RegistryBackend):
+    """
+    In-memory registry used for testing and simulation off Windows.
+
+    Key paths and value names are case-insensitive like on Windows. The
+    backend counts how many keys were opened and how many values were read,
+    written and deleted, so callers can check that batching actually saves
+    registry calls. Each call can be delayed by a fixed latency to mimic a
+    slow (e.g. remote) registry.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        # (hive, lower-cased key path) -> {lower-cased value name: (name, value, type)}
+        self.keys: Dict[Tuple[int, str], Dict[str, Tuple[str, Any, int]]] = {}
+        self.latency = latency
+        self.open_count = 0
+        self.open_handles = 0
+        self.operations: Dict[str, int] = {"open": 0, "query": 0, "set": 0, "delete": 0}
+        # Guards the counters, which concurrent plan steps update together
+        self._counter_lock = threading.Lock()
+        # Last write "time" per key, from a counter bumped on every write
+        self.last_writes: Dict[Tuple[int, str], int] = {}
+        self.write_clock = 0
+        # Called with the (hive, key path) of every key written, e.g. by MemoryChangeSource
+        self.listeners: List[Callable[[Tuple[int, str]], None]] = []
+        # Unloaded hive files: lower-cased file path -> {key path relative to the hive root: values}
+        self.hive_files: Dict[str, Dict[str, Dict[str, Tuple[str, Any, int]]]] = {}
+        # Name under HKEY_USERS -> file path of the hives loaded with load_hive
+        self.loaded_hives: Dict[str, str] = {}
+
+    @staticmethod
+    def _normalize(key_path: str) -> str:
+        return key_path.strip("\\").lower()
+
+    def _touch(self, key: Tuple[int, str]) -> None:
+        self.write_clock += 1
+        self.last_writes[key] = self.write_clock
+        for listener in list(self.listeners):
+            listener(key)
+
+    def _create(self, key: Tuple[int, str]) -> None:
+        # Creating a key implicitly creates its missing parents
+        hive, path = key
+        parts = path.split("\\")
+        for depth in range(1, len(parts) + 1):
+            parent = (hive, "\\".join(parts[:depth]))
+            if parent not in self.keys:
+                self.keys[parent] = {}
+                self._touch(parent)
+
+    def _record(self, operation: str) -> None:
+        with self._counter_lock:
+            self.operations[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def open_key(self, hive: int, key_path: str, create: bool = False, write: bool = False) -> Any:
+        self._record("open")
+        if isinstance(hive, tuple):  # Relative to an open key, like a winreg handle passed as the hive
+            hive, key_path = hive[0], f"{hive[1]}\\{key_path}"
+        key = (hive, self._normalize(key_path))
+        if key not in self.keys:
+            if not create:
+                raise FileNotFoundError(2, "The system cannot find the file specified", key_path)
+            self._create(key)
+        with self._counter_lock:
+            self.open_count += 1
+            self.open_handles += 1
+        return key
+
+    def close_key(self, handle: Any) -> None:
+        with self._counter_lock:
+            self.open_handles -= 1
+
+    def set_value(self, handle: Any, value_name: str, value_type: int, value: Any) -> None:
+        self._record("set")
+        self.keys[handle][value_name.lower()] = (value_name, value, value_type)
+        self._touch(handle)
+
+    def delete_value(self, handle: Any, value_name: str) -> None:
+        self._record("delete")
+        try:
+            del self.keys[handle][value_name.lower()]
+        except KeyError:
+            raise FileNotFoundError(2, "The system cannot find the file specified", value_name)
+        self._touch(handle)
+
+    def query_value(self, handle: Any, value_name: str) -> Tuple[Any, int]:
+        self._record("query")
+        try:
+            _, value, value_type = self.keys[handle][value_name.lower()]
+        except KeyError:
+            raise FileNotFoundError(2, "The system cannot find the file specified", value_name)
+        return value, value_type
+
+    def query_info_key(self, handle: Any) -> Tuple[int, int, int]:
+        prefix = handle[1] + "\\"
+        subkeys = sum(1 for hive, path in self.keys if hive == handle[0] and path.startswith(prefix) and "\\" not in path[len(prefix):])
+        return subkeys, len(self.keys[handle]), self.last_writes.get(handle, 0)
+
+    def enum_keys(self, handle: Any) -> List[str]:
+        prefix = handle[1] + "\\"
+        return sorted(
+            path[len(prefix):] for hive, path in list(self.keys)
+            if hive == handle[0] and path.startswith(prefix) and "\\" not in path[len(prefix):]
+        )
+
+    def load_hive(self, name: str, file_path: str) -> None:
+        root = self._normalize(name)
+        if root in self.loaded_hives or (HKEY_USERS, root) in self.keys:
+            raise PermissionError(32, "The process cannot access the file because it is being used by another process", name)
+        try:
+            hive = self.hive_files.pop(file_path.lower())
+        except KeyError:
+            raise FileNotFoundError(2, "The system cannot find the file specified", file_path)
+        for path, values in hive.items():
+            self.keys[(HKEY_USERS, f"{root}\\{path}" if path else root)] = values
+        self.loaded_hives[root] = file_path.lower()
+
+    def unload_hive(self, name: str) -> None:
+        root = self._normalize(name)
+        try:
+            file_path = self.loaded_hives.pop(root)
+        except KeyError:
+            raise FileNotFoundError(2, "The system cannot find the file specified", name)
+        hive = {}
+        for hive_key, path in [key for key in list(self.keys) if key[0] == HKEY_USERS]:
+            if path == root or path.startswith(root + "\\"):
+                hive[path[len(root) + 1:]] = self.keys.pop((hive_key, path))
+        self.hive_files[file_path] = hive
+
+    def change_source(self) -> "RegistryChangeSource":
+        return MemoryChangeSource(self)
+
+    def get_value(self, hive: int, key_path: str, value_name: str) -> Optional[Any]:
+        """
+        Read a value without going through a handle.
+
+        Returns:
+            The stored value, or None if the key or value does not exist
+        """
+        entry = self.keys.get((hive, self._normalize(key_path)), {}).get(value_name.lower())
+        return entry[1] if entry else None
+
+    def put_key(self, hive: int, key_path: str) -> None:
+        """Create a key (and its parents) without going through a handle or the call counters."""
+        self._create((hive, self._normalize(key_path)))
+
+    def put_value(self, hive: int, key_path: str, value_name: str, value: Any, value_type: int) -> None:
+        """
+        Write a value without going through a handle or the call counters, the
+        way Windows components (e.g. the service manager) change the registry
+        behind the tool's back.
+        """
+        handle = (hive, self._normalize(key_path))
+        self._create(handle)
+        self.keys[handle][value_name.lower()] = (value_name, value, value_type)
+        self._touch(handle)
+
+    def remove_value(self, hive: int, key_path: str, value_name: str) -> None:
+        """Delete a value, if it exists, without going through a handle or the call counters (see put_value)."""
+        handle = (hive, self._normalize(key_path))
+        if self.keys.get(handle, {}).pop(value_name.lower(), None) is not None:
+            self._touch(handle)
+
+
+class _CachedKey:
+    """A key handle owned by CachedRegistryBackend."""
+
+    def __init__(self, handle: Any, writable: bool):
+        self.handle = handle
+        self.writable = writable
+        self.users = 0
+        self.cached = True
+
+
+class CachedRegistryBackend(RegistryBackend):
+    """
+    Registry backend that keeps the keys opened through it open for reuse.
+
+    Up to `capacity` key handles are kept in least-recently-used order, so
+    reading and then writing the same key, or touching it from several
+    features, costs one open. A key that is not cached is opened relative to
+    its nearest cached parent (e.g. `Software\\Classes\\CLSID\\{...}`), so
+    repeated writes under the same subtree do not walk the path from the
+    hive again. close_key only releases a caller's use; the handles
+    themselves stay open until evicted or until close() at the end of the run.
+    """
+
+    def __init__(self, inner: RegistryBackend, capacity: int = 32):
+        self.inner = inner
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        # (hive, lower-cased key path) -> cached key, least recently used first
+        self._keys: "OrderedDict[Tuple[int, str], _CachedKey]" = OrderedDict()
+        # id(handle) -> cached key, including handles replaced while still in use
+        self._handles: Dict[int, _CachedKey] = {}
+
+    def _open(self, hive: int, key_path: str, create: bool, write: bool) -> Any:
+        parts = key_path.strip("\\").split("\\")
+        for depth in range(len(parts) - 1, 0, -1):
+            parent_key = (hive, "\\".join(parts[:depth]).lower())
+            parent = self._keys.get(parent_key)
+            # Creating subkeys needs a parent opened for writing
+            if parent is not None and (parent.writable or not create):
+                self._keys.move_to_end(parent_key)
+                return self.inner.open_key(parent.handle, "\\".join(parts[depth:]), create, write)
+        return self.inner.open_key(hive, key_path, create, write)
+
+    def _release(self, entry: _CachedKey) -> None:
+        del self._handles[id(entry.handle)]
+        self.inner.close_key(entry.handle)
+
+    def _evict(self) -> None:
+        # Handles still in use are skipped; the cache shrinks back once they are closed
+        excess = len(self._keys) - self.capacity
+        if excess <= 0:
+            return
+        idle = [key for key, entry in self._keys.items() if entry.users == 0]
+        for key in idle[:excess]:
+            self._release(self._keys.pop(key))
+
+    def open_key(self, hive: int, key_path: str, create: bool = False, write: bool = False) -> Any:
+        key = (hive, key_path.strip("\\").lower())
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is None or (write and not entry.writable):
+                handle = self._open(hive, key_path, create, write)
+                if entry is not None:
+                    # A read handle is replaced by a writable one; closed once its users are done
+                    entry.cached = False
+                    if entry.users == 0:
+                        self._release(entry)
+                entry = _CachedKey(handle, write)
+                self._keys[key] = entry
+                self._handles[id(handle)] = entry
+            self._keys.move_to_end(key)
+            entry.users += 1
+            self._evict()
+            return entry.handle
+
+    def close_key(self, handle: Any) -> None:
+        with self._lock:
+            entry = self._handles.get(id(handle))
+            if entry is None:
+                self.inner.close_key(handle)
+                return
+            entry.users -= 1
+            if entry.users == 0 and not entry.cached:
+                self._release(entry)
+            self._evict()
+
+    def set_value(self, handle: Any, value_name: str, value_type: int, value: Any) -> None:
+        self.inner.set_value(handle, value_name, value_type, value)
+
+    def delete_value(self, handle: Any, value_name: str) -> None:
+        self.inner.delete_value(handle, value_name)
+
+    def query_value(self, handle: Any, value_name: str) -> Tuple[Any, int]:
+        return self.inner.query_value(handle, value_name)
+
+    def query_info_key(self, handle: Any) -> Tuple[int, int, int]:
+        return self.inner.query_info_key(handle)
+
+    def enum_keys(self, handle: Any) -> List[str]:
+        return self.inner.enum_keys(handle)
+
+    def load_hive(self, name: str, file_path: str) -> None:
+        self.inner.load_hive(name, file_path)
+
+    def unload_hive(self, name: str) -> None:
+        # Cached handles under the hive would keep it from unloading
+        root = name.strip("\\").lower()
+        with self._lock:
+            for key, entry in list(self._keys.items()):
+                hive, path = key
+                if hive == HKEY_USERS and (path == root or path.startswith(root + "\\")) and entry.users == 0:
+                    self._release(self._keys.pop(key))
+        self.inner.unload_hive(name)
+
+    def change_source(self) -> "RegistryChangeSource":
+        return self.inner.change_source()
+
+    def close(self) -> None:
+        """Close every cached handle, in use or not; call once the run is over."""
+        with self._lock:
+            for entry in list(self._handles.values()):
+                self._release(entry)
+            self._keys.clear()
+
+    def __getattr__(self, name: str) -> Any:
+        # Anything else (counters of the memory backend) is the inner backend's
+        return getattr(self.inner, name)
+
+
+class RegistryChangeSource:
+    """
+    Delivers notifications when watched registry keys change.
+
+    Keys are reported as (hive, lower-cased key path), the same key the
+    planner groups registry values by. A change is a value being written or
+    deleted, or the key itself being created or deleted.
+    """
+
+    def subscribe(self, hive: int, key_path: str) -> None:
+        """Start watching a key; a key that does not exist yet is reported once it is created."""
+        raise NotImplementedError
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Tuple[int, str]]:
+        """
+        Block until watched keys change, wake() is called or the timeout passes.
+
+        Args:
+            timeout: Seconds to wait at most, or None to wait indefinitely
+
+        Returns:
+            set: The keys that changed since the last call; empty on timeout or wake()
+        """
+        raise NotImplementedError
+
+    def wake(self) -> None:
+        """Make a blocked wait() return early, e.g. to stop a watcher from another thread."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Stop watching every key."""
+
+
+class MemoryChangeSource(RegistryChangeSource):
+    """Change notifications for a MemoryRegistryBackend, driven by its writes."""
+
+    def __init__(self, registry: MemoryRegistryBackend):
+        self.registry = registry
+        self.watched: Set[Tuple[int, str]] = set()
+        self.pending: Set[Tuple[int, str]] = set()
+        self.woken = False
+        self.condition = threading.Condition()
+        registry.listeners.append(self._on_write)
+
+    def _on_write(self, key: Tuple[int, str]) -> None:
+        with self.condition:
+            if key in self.watched:
+                self.pending.add(key)
+                self.condition.notify_all()
+
+    def subscribe(self, hive: int, key_path: str) -> None:
+        with self.condition:
+            self.watched.add((hive, MemoryRegistryBackend._normalize(key_path)))
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Tuple[int, str]]:
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending or self.woken, timeout)
+            changed, self.pending = self.pending, set()
+            self.woken = False
+            return changed
+
+    def wake(self) -> None:
+        with self.condition:
+            self.woken = True
+            self.condition.notify_all()
+
+    def close(self) -> None:
+        if self._on_write in self.registry.listeners:
+            self.registry.listeners.remove(self._on_write)
+
+
+class _KeyWatch:
+    """One armed RegNotifyChangeKeyValue registration."""
+
+    def __init__(self, hive: int, key_path: str, event: int):
+        self.hive = hive
+        self.key_path = key_path
+        self.event = event
+        self.handle = None
+        self.subtree = False
+
+
+class WinregChangeSource(RegistryChangeSource):
+    """
+    Change notifications from RegNotifyChangeKeyValue.
+
+    Each watched key gets an auto-reset event that the registry signals on
+    the next change; the events are waited on together with
+    WaitForMultipleObjects, so an idle watcher uses no CPU. A notification
+    fires once, so the key is re-armed after each one. A key that does not
+    exist is watched through its nearest existing parent (with subtree
+    notifications) until it is created.
+    """
+
+    # WaitForMultipleObjects is given short slices so Ctrl+C is still noticed
+    WAIT_SLICE = 1.0
+
+    def __init__(self):
+        from ctypes import wintypes
+
+        self.kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        self.advapi32 = ctypes.WinDLL("advapi32", use_last_error=True)
+        self.kernel32.CreateEventW.restype = wintypes.HANDLE
+        self.kernel32.CreateEventW.argtypes = [ctypes.c_void_p, wintypes.BOOL, wintypes.BOOL, wintypes.LPCWSTR]
+        self.kernel32.SetEvent.argtypes = [wintypes.HANDLE]
+        self.kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        self.kernel32.WaitForSingleObject.restype = wintypes.DWORD
+        self.kernel32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+        self.kernel32.WaitForMultipleObjects.restype = wintypes.DWORD
+        self.kernel32.WaitForMultipleObjects.argtypes = [
+            wintypes.DWORD, ctypes.POINTER(wintypes.HANDLE), wintypes.BOOL, wintypes.DWORD
+        ]
+        self.advapi32.RegNotifyChangeKeyValue.restype = ctypes.c_long
+        self.advapi32.RegNotifyChangeKeyValue.argtypes = [
+            wintypes.HANDLE, wintypes.BOOL, wintypes.DWORD, wintypes.HANDLE, wintypes.BOOL
+        ]
+        self.handle_type = wintypes.HANDLE
+        self.wake_event = self._create_event()
+        self.watches: List[_KeyWatch] = []
+
+    def _create_event(self) -> int:
+        event = self.kernel32.CreateEventW(None, False, False, None)
+        if not event:
+            raise ctypes.WinError(ctypes.get_last_error())
+        return event
+
+    def _arm(self, watch: _KeyWatch) -> None:
+        if watch.handle is not None:
+            winreg.CloseKey(watch.handle)
+            watch.handle = None
+        path = watch.key_path
+        watch.subtree = False
+        while True:
+            try:
+                watch.handle = winreg.OpenKey(watch.hive, path, 0, KEY_NOTIFY)
+                break
+            except FileNotFoundError:
+                if not path:
+                    raise
+                # Watch the parent, with its subtree, until the key is created
+                path = path.rpartition("\\")[0]
+                watch.subtree = True
+        status = self.advapi32.RegNotifyChangeKeyValue(
+            int(watch.handle),
+            watch.subtree,
+            REG_NOTIFY_CHANGE_NAME | REG_NOTIFY_CHANGE_LAST_SET,
+            watch.event,
+            True
+        )
+        if status != 0:
+            raise ctypes.WinError(status)
+
+    def subscribe(self, hive: int, key_path: str) -> None:
+        if len(self.watches) >= MAXIMUM_WAIT_OBJECTS - 1:
+            raise ValueError(f"At most {MAXIMUM_WAIT_OBJECTS - 1} keys can be watched at once")
+        watch = _KeyWatch(hive, key_path.strip("\\"), self._create_event())
+        self.watches.append(watch)
+        self._arm(watch)
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Tuple[int, str]]:
+        events = [self.wake_event] + [watch.event for watch in self.watches]
+        handles = (self.handle_type * len(events))(*events)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = self.WAIT_SLICE if deadline is None else min(self.WAIT_SLICE, max(0.0, deadline - time.monotonic()))
+            status = self.kernel32.WaitForMultipleObjects(len(events), handles, False, int(remaining * 1000))
+            if status == WAIT_FAILED:
+                raise ctypes.WinError(ctypes.get_last_error())
+            if status == WAIT_TIMEOUT:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return set()
+                continue
+            if status == WAIT_OBJECT_0:
+                return set()
+            break
+
+        # The wait reset the event that ended it; the other signaled ones are
+        # collected too, so a burst is reported in one call
+        signaled = self.watches[status - WAIT_OBJECT_0 - 1]
+        changed = set()
+        for watch in self.watches:
+            if watch is signaled or self.kernel32.WaitForSingleObject(watch.event, 0) == WAIT_OBJECT_0:
+                self._arm(watch)
+                changed.add((watch.hive, watch.key_path.lower()))
+        return changed
+
+    def wake(self) -> None:
+        self.kernel32.SetEvent(self.wake_event)
+
+    def close(self) -> None:
+        for watch in self.watches:
+            if watch.handle is not None:
+                winreg.CloseKey(watch.handle)
+            self.kernel32.CloseHandle(watch.event)
+        self.watches = []
+        if self.wake_event:
+            self.kernel32.CloseHandle(self.wake_event)
+            self.wake_event = None
+
+
+_default_backend: Optional[RegistryBackend] = None
+
+
+def get_registry_backend() -> RegistryBackend:
+    """
+    Get the registry backend used when none is passed explicitly.
+
+    Returns:
+        RegistryBackend: The backend set with set_registry_backend, otherwise
+        the registry of the current platform backend
+    """
+    if _default_backend is not None:
+        return _default_backend
+    from .backend import get_backend  # imported here, backend.py depends on this module
+    return get_backend().registry
+
+
+def set_registry_backend(backend: Optional[RegistryBackend]) -> None:
+    """
+    Override the default registry backend (e.g. with a MemoryRegistryBackend).
+
+    Args:
+        backend: The backend to use, or None to follow the platform backend again
+    """
+    global _default_backend
+    _default_backend = backend
@@ -1,79 +1,394 @@
-import winreg
-from typing import Dict, List, Union, Optional
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+from .journal import Journal, RegistryPrior, get_journal
+from .registry_backend import (
+    HIVE_NAMES,
+    HKEY_LOCAL_MACHINE,
+    REG_DWORD,
+    RegistryBackend,
+    get_registry_backend,
+)
+from .tracing import Trace
 
+
+class RegistryOperation(NamedTuple):
+    """A single queued registry write or delete."""
+    action: str  # 'set' or 'delete'
+    hive: int
+    key_path: str
+    value_name: str
+    value: Any = None
+    value_type: int = REG_DWORD
+
+
+class RegistryOperationResult(NamedTuple):
+    """Outcome of a single registry operation."""
+    operation: RegistryOperation
+    success: bool
+    error: Optional[str] = None
+    compliant: bool = False  # True if nothing was written because the value was already right
+    duration: float = 0.0  # Seconds spent writing or deleting the value
+
+
+class RegistryDiff(NamedTuple):
+    """Current state of the target of a queued operation."""
+    operation: RegistryOperation
+    current: Any = None
+    current_type: Optional[int] = None
+    exists: bool = False
+    compliant: bool = False
+
+
+@Trace.traced_class("registry")
+class RegistryTransaction:
+    """
+    Collect registry writes and deletes and apply them in one batch.
+
+    Operations are grouped by hive and key so every key is opened exactly once,
+    no matter how many values are changed under it. Within a key, operations
+    run in the order they were added.
+
+    Example:
+        tx = RegistryTransaction()
+        tx.set_values(r"SOFTWARE\\Policies\\Microsoft\\Windows\\DataCollection", {"AllowTelemetry": 0})
+        tx.delete_value(r"SOFTWARE\\Some\\Key", "Obsolete")
+        results = tx.commit()
+    """
+
+    def __init__(self, backend: Optional[RegistryBackend] = None, journal: Optional[Journal] = None):
+        self.backend = backend
+        self.journal = journal
+        self.operations: List[RegistryOperation] = []
+
+    def set_value(
+        self,
+        key_path: str,
+        value_name: str,
+        value: Union[int, str],
+        value_type: int = REG_DWORD,
+        hive: int = HKEY_LOCAL_MACHINE
+    ) -> "RegistryTransaction":
+        """
+        Queue a registry value write.
+
+        Args:
+            key_path: The registry key path
+            value_name: The name of the value to set
+            value: The value to set
+            value_type: The type of the value (default: REG_DWORD)
+            hive: The registry hive (default: HKEY_LOCAL_MACHINE)
+
+        Returns:
+            RegistryTransaction: self, so calls can be chained
+        """
+        self.operations.append(RegistryOperation("set", hive, key_path, value_name, value, value_type))
+        return self
+
+    def set_values(
+        self,
+        key_path: str,
+        values: Dict[str, Union[int, str, Tuple[Any, int]]],
+        value_type: int = REG_DWORD,
+        hive: int = HKEY_LOCAL_MACHINE
+    ) -> "RegistryTransaction":
+        """
+        Queue several writes under the same key.
+
+        Args:
+            key_path: The registry key path
+            values: Dictionary of value names and their values; a (value, type)
+                tuple gives the type of that value (like Profile entries)
+            value_type: The type of the other values (default: REG_DWORD)
+            hive: The registry hive (default: HKEY_LOCAL_MACHINE)
+
+        Returns:
+            RegistryTransaction: self, so calls can be chained
+        """
+        for name, value in values.items():
+            if isinstance(value, tuple):
+                self.set_value(key_path, name, value[0], value[1], hive)
+            else:
+                self.set_value(key_path, name, value, value_type, hive)
+        return self
+
+    def delete_value(self, key_path: str, value_name: str, hive: int = HKEY_LOCAL_MACHINE) -> "RegistryTransaction":
+        """
+        Queue a registry value delete.
+
+        Args:
+            key_path: The registry key path
+            value_name: The name of the value to delete
+            hive: The registry hive (default: HKEY_LOCAL_MACHINE)
+
+        Returns:
+            RegistryTransaction: self, so calls can be chained
+        """
+        self.operations.append(RegistryOperation("delete", hive, key_path, value_name))
+        return self
+
+    def group_by_key(self) -> Dict[Tuple[int, str], List[Tuple[int, RegistryOperation]]]:
+        """
+        Group queued operations by key, keeping the order keys were first used.
+
+        Returns:
+            dict: (hive, lower-cased key path) -> list of (index, operation)
+        """
+        groups: Dict[Tuple[int, str], List[Tuple[int, RegistryOperation]]] = {}
+        for index, operation in enumerate(self.operations):
+            key = (operation.hive, operation.key_path.strip("\\").lower())
+            groups.setdefault(key, []).append((index, operation))
+        return groups
+
+    def diff(self) -> List[RegistryDiff]:
+        """
+        Read the current state of every queued target and compare it with the
+        desired one, opening each key once for reading.
+
+        A write is compliant if the value already exists with the same data and
+        type. A delete is compliant if the value (or its key) does not exist.
+
+        Returns:
+            list: One RegistryDiff per queued operation, in the order the
+            operations were added
+        """
+        backend = self.backend or get_registry_backend()
+        diffs: List[Optional[RegistryDiff]] = [None] * len(self.operations)
+
+        for group in self.group_by_key().values():
+            first = group[0][1]
+            try:
+                handle = backend.open_key(first.hive, first.key_path)
+            except OSError:
+                handle = None
+
+            # Value name -> (exists, data, type), updated as operations are
+            # replayed so a later operation sees the effect of an earlier one
+            state: Dict[str, Tuple[bool, Any, Optional[int]]] = {}
+            try:
+                for index, operation in group:
+                    name = operation.value_name.lower()
+                    if name not in state:
+                        state[name] = (False, None, None)
+                        if handle is not None:
+                            try:
+                                current, current_type = backend.query_value(handle, operation.value_name)
+                                state[name] = (True, current, current_type)
+                            except OSError:
+                                pass
+                    exists, current, current_type = state[name]
+                    if operation.action == "set":
+                        compliant = exists and current == operation.value and current_type == operation.value_type
+                        state[name] = (True, operation.value, operation.value_type)
+                    else:
+                        compliant = not exists
+                        state[name] = (False, None, None)
+                    diffs[index] = RegistryDiff(operation, current, current_type, exists, compliant)
+            finally:
+                if handle is not None:
+                    backend.close_key(handle)
+
+        return diffs
+
+    def prepare(self, skip_compliant: bool = False) -> List[Optional[RegistryOperationResult]]:
+        """
+        Do what comes before the first write of a commit: find the targets
+        that are already compliant (with skip_compliant) and journal the
+        prior value of the others, if a journal is set.
+
+        Returns:
+            list: Per queued operation, its final result if it must not be
+            written (compliant, or failed because the journal could not be
+            written), otherwise None
+        """
+        journal = self.journal or get_journal()
+        results: List[Optional[RegistryOperationResult]] = [None] * len(self.operations)
+        if not skip_compliant and journal is None:
+            return results
+
+        priors = []
+        for index, item in enumerate(self.diff()):
+            if skip_compliant and item.compliant:
+                results[index] = RegistryOperationResult(item.operation, True, compliant=True)
+            elif journal is not None:
+                operation = item.operation
+                priors.append(RegistryPrior(
+                    operation.hive, operation.key_path, operation.value_name,
+                    item.exists, item.current_type or 0, item.current
+                ))
+        if priors:
+            # Written before anything changes, so an interrupted run can be
+            # rolled back; nothing is changed if the journal cannot be written
+            try:
+                journal.record(priors)
+            except OSError as e:
+                error = f"Could not journal prior values: {str(e)}"
+                return [result or RegistryOperationResult(operation, False, error)
+                        for result, operation in zip(results, self.operations)]
+        return results
+
+    def commit(self, skip_compliant: bool = False) -> List[RegistryOperationResult]:
+        """
+        Apply all queued operations.
+
+        A failure on one value does not stop the others. If a key cannot be
+        opened, every operation under that key fails with the same error.
+
+        Args:
+            skip_compliant: Read the current values first and only write the ones
+                that differ (see diff). Keys with nothing to change are never
+                opened for writing.
+
+        When a journal is set (here or with set_journal), the prior value of
+        every target is recorded before the first write.
+
+        Returns:
+            list: One RegistryOperationResult per queued operation, in the order
+            the operations were added
+        """
+        backend = self.backend or get_registry_backend()
+        results = self.prepare(skip_compliant)
+
+        for group in self.group_by_key().values():
+            group = [(index, operation) for index, operation in group if results[index] is None]
+            if not group:
+                continue
+            first = group[0][1]
+            has_writes = any(operation.action == "set" for _, operation in group)
+            try:
+                handle = backend.open_key(first.hive, first.key_path, create=has_writes, write=True)
+            except OSError as e:
+                for index, operation in group:
+                    results[index] = RegistryOperationResult(operation, False, str(e))
+                continue
+
+            try:
+                for index, operation in group:
+                    started = time.perf_counter()
+                    try:
+                        if operation.action == "set":
+                            backend.set_value(handle, operation.value_name, operation.value_type, operation.value)
+                        else:
+                            backend.delete_value(handle, operation.value_name)
+                        results[index] = RegistryOperationResult(operation, True, duration=time.perf_counter() - started)
+                    except OSError as e:
+                        results[index] = RegistryOperationResult(operation, False, str(e), duration=time.perf_counter() - started)
+            finally:
+                backend.close_key(handle)
+
+        self.operations = []
+        return results
+
+
+@Trace.traced_class("registry")
 class RegistryManager:
+    @staticmethod
+    def key_exists(key_path: str, hive: int = HKEY_LOCAL_MACHINE) -> bool:
+        """
+        Check if a registry key exists.
+
+        Args:
+            key_path: The registry key path
+            hive: The registry hive (default: HKEY_LOCAL_MACHINE)
+
+        Returns:
+            bool: True if the key exists, False otherwise
+        """
+        return get_registry_backend().key_exists(hive, key_path)
+
+    @staticmethod
+    def last_write_time(key_path: str, hive: int = HKEY_LOCAL_MACHINE, backend: Optional[RegistryBackend] = None) -> Optional[int]:
+        """
+        Get the last write time of a registry key (QueryInfoKey).
+
+        Args:
+            key_path: The registry key path
+            hive: The registry hive (default: HKEY_LOCAL_MACHINE)
+            backend: The registry to read (default: the current backend)
+
+        Returns:
+            int: The last write time, or None if the key does not exist
+        """
+        return (backend or get_registry_backend()).last_write_time(hive, key_path)
+
+    @staticmethod
+    def report_failures(results: List[RegistryOperationResult]) -> bool:
+        """
+        Print the failed operations of a committed transaction.
+
+        Args:
+            results: Results returned by RegistryTransaction.commit
+
+        Returns:
+            bool: True if every operation succeeded, False otherwise
+        """
+        success = True
+        for result in results:
+            if not result.success:
+                operation = result.operation
+                location = f"{HIVE_NAMES.get(operation.hive, operation.hive)}\\{operation.key_path}"
+                verb = "setting" if operation.action == "set" else "deleting"
+                print(f"Error {verb} registry value {operation.value_name} in {location}: {result.error}")
+                success = False
+        return success
+
     @staticmethod
     def set_registry_value(
         key_path: str,
         value_name: str,
         value: Union[int, str],
-        value_type: int = winreg.REG_DWORD
+        value_type: int = REG_DWORD,
+        hive: int = HKEY_LOCAL_MACHINE
     ) -> bool:
         """
         Set a registry value.
-        
+
         Args:
             key_path: The registry key path
             value_name: The name of the value to set
             value: The value to set
             value_type: The type of the value (default: REG_DWORD)
-            
+            hive: The registry hive (default: HKEY_LOCAL_MACHINE)
+
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            key = winreg.CreateKeyEx(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_WRITE)
-            winreg.SetValueEx(key, value_name, 0, value_type, value)
-            winreg.CloseKey(key)
-            return True
-        except WindowsError as e:
-            print(f"Error setting registry value {value_name} in {key_path}: {str(e)}")
-            return False
-    
+        results = RegistryTransaction().set_value(key_path, value_name, value, value_type, hive).commit()
+        return RegistryManager.report_failures(results)
+
     @staticmethod
     def set_multiple_values(
         key_path: str,
-        values: Dict[str, Union[int, str]],
-        value_type: int = winreg.REG_DWORD
+        values: Dict[str, Union[int, str, Tuple[Any, int]]],
+        value_type: int = REG_DWORD,
+        hive: int = HKEY_LOCAL_MACHINE
     ) -> bool:
         """
         Set multiple registry values at once.
-        
+
         Args:
             key_path: The registry key path
-            values: Dictionary of value names and their values
-            value_type: The type of the values (default: REG_DWORD)
-            
+            values: Dictionary of value names and their values, or (value, type) tuples
+            value_type: The type of the values given without a type (default: REG_DWORD)
+            hive: The registry hive (default: HKEY_LOCAL_MACHINE)
+
         Returns:
             bool: True if all values were set successfully, False otherwise
         """
-        try:
-            key = winreg.CreateKeyEx(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_WRITE)
-            for name, value in values.items():
-                winreg.SetValueEx(key, name, 0, value_type, value)
-            winreg.CloseKey(key)
-            return True
-        except WindowsError as e:
-            print(f"Error setting multiple registry values in {key_path}: {str(e)}")
-            return False
-    
+        results = RegistryTransaction().set_values(key_path, values, value_type, hive).commit()
+        return RegistryManager.report_failures(results)
+
     @staticmethod
-    def delete_value(key_path: str, value_name: str) -> bool:
+    def delete_value(key_path: str, value_name: str, hive: int = HKEY_LOCAL_MACHINE) -> bool:
         """
         Delete a registry value.
-        
+
         Args:
             key_path: The registry key path
             value_name: The name of the value to delete
-            
+            hive: The registry hive (default: HKEY_LOCAL_MACHINE)
+
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            key = winreg.CreateKeyEx(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_WRITE)
-            winreg.DeleteValue(key, value_name)
-            winreg.CloseKey(key)
-            return True
-        except WindowsError as e:
-            print(f"Error deleting registry value {value_name} in {key_path}: {str(e)}")
-            return False 
\ No newline at end of file
+        results = RegistryTransaction().delete_value(key_path, value_name, hive).commit()
+        return RegistryManager.report_failures(results)
@@ -0,0 +1,148 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from .backend import PlatformBackend, get_backend
+from .journal import JournalEntry, RegistryPrior, ServicePrior, TaskPrior, read_journal, resolve_run_id
+from .registry_backend import HKEY_USERS
+from .registry_manager import RegistryOperation, RegistryOperationResult, RegistryTransaction
+from .service_manager import SERVICE_RUNNING, ServiceController
+from .task_manager import TaskInventory, TaskResult, normalize_task_path
+from .user_hives import CLASSES_SUFFIX, list_user_profiles, mount_user_hives, unmount_user_hives
+
+
+class ServiceRestore(NamedTuple):
+    """Outcome of restoring one service."""
+    service_name: str
+    success: bool
+    error: Optional[str] = None
+
+
+class RollbackResult(NamedTuple):
+    """Per-item results of a rollback."""
+    run_id: str
+    registry: List[RegistryOperationResult]
+    services: List[ServiceRestore]
+    tasks: List[TaskResult]
+
+    @property
+    def success(self) -> bool:
+        return (
+            all(result.success for result in self.registry)
+            and all(result.success for result in self.services)
+            and all(result.success or not result.exists for result in self.tasks)
+        )
+
+
+def original_state(entries: List[JournalEntry]) -> List[JournalEntry]:
+    """
+    Keep the first recorded state of every target.
+
+    A target changed several times in one run is journaled each time; only
+    the first entry holds the state from before the run.
+
+    Args:
+        entries: Journal entries in the order they were written
+
+    Returns:
+        list: One entry per target, in journal order
+    """
+    seen = set()
+    original = []
+    for entry in entries:
+        if isinstance(entry, RegistryPrior):
+            key: Tuple = ("registry", entry.hive, entry.path.strip("\\").lower(), entry.name.lower())
+        elif isinstance(entry, ServicePrior):
+            key = ("service", entry.name.lower())
+        else:
+            key = ("task", normalize_task_path(entry.path))
+        if key not in seen:
+            seen.add(key)
+            original.append(entry)
+    return original
+
+
+def rollback(run_id: str, backend: Optional[PlatformBackend] = None, directory: Optional[str] = None) -> RollbackResult:
+    """
+    Restore everything a run changed to its state before the run.
+
+    Registry values go back in one transaction (values that did not exist
+    are deleted), services get their start type back and are started again
+    if they were running, and tasks are re-enabled from one task snapshot.
+
+    Args:
+        run_id: The run to undo, or 'latest'
+        backend: The host to restore (default: the local host)
+        directory: The journal directory (default: default_journal_dir())
+
+    Returns:
+        RollbackResult: Per-item results
+
+    Raises:
+        FileNotFoundError: If there is no journal for the run
+    """
+    backend = backend or get_backend()
+    run_id = resolve_run_id(run_id, directory)
+    entries = original_state(read_journal(run_id, directory))
+
+    # Values written to users who are not logged on (--all-users) need their hives loaded again
+    user_hives: Dict[str, set] = {}
+    for entry in entries:
+        if isinstance(entry, RegistryPrior) and entry.hive == HKEY_USERS:
+            hive = entry.path.strip("\\").split("\\")[0].upper()
+            sid = hive[:-len(CLASSES_SUFFIX)] if hive.endswith(CLASSES_SUFFIX.upper()) else hive
+            user_hives.setdefault(sid, set()).add(hive)
+    mounted: List[str] = []
+    unavailable: Dict[str, str] = {}
+    if user_hives:
+        profiles = {profile.sid: profile for profile in list_user_profiles(backend.registry)}
+        for sid, hives in user_hives.items():
+            if sid not in profiles:
+                continue  # Not a user hive, or the user is gone
+            try:
+                mount_user_hives(backend.registry, profiles[sid], hives, mounted)
+            except OSError as e:
+                unavailable.update((hive, f"Could not load the user's hive: {str(e)}") for hive in hives)
+
+    registry: List[RegistryOperationResult] = []
+    transaction = RegistryTransaction(backend.registry)
+    try:
+        for entry in entries:
+            if not isinstance(entry, RegistryPrior):
+                continue
+            hive = entry.path.strip("\\").split("\\")[0].upper() if entry.hive == HKEY_USERS else None
+            if hive in unavailable:
+                action = "set" if entry.existed else "delete"
+                operation = RegistryOperation(action, entry.hive, entry.path, entry.name, entry.value, entry.value_type)
+                registry.append(RegistryOperationResult(operation, False, unavailable[hive]))
+            elif entry.existed:
+                transaction.set_value(entry.path, entry.name, entry.value, entry.value_type, entry.hive)
+            else:
+                transaction.delete_value(entry.path, entry.name, entry.hive)
+        registry += transaction.commit(skip_compliant=True)
+    finally:
+        unmount_user_hives(backend.registry, mounted)
+
+    controller = ServiceController(api=backend.services)
+    services = []
+    for entry in entries:
+        if not isinstance(entry, ServicePrior):
+            continue
+        errors = []
+        if entry.start_type is not None:
+            ok, error = controller.set_start_type(entry.name, entry.start_type)
+            if not ok:
+                errors.append(error)
+        if entry.state == SERVICE_RUNNING and not errors:
+            ok, error = controller.start(entry.name)
+            if not ok:
+                errors.append(error)
+        services.append(ServiceRestore(entry.name, not errors, "; ".join(errors) or None))
+
+    tasks_by_state: Dict[bool, List[str]] = {True: [], False: []}
+    for entry in entries:
+        if isinstance(entry, TaskPrior):
+            tasks_by_state[entry.enabled].append(entry.path)
+    tasks = []
+    if tasks_by_state[True] or tasks_by_state[False]:
+        inventory = TaskInventory(backend.run)
+        tasks = inventory.enable(tasks_by_state[True]) + inventory.disable(tasks_by_state[False])
+
+    return RollbackResult(run_id, registry, services, tasks)
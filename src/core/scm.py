@@ -0,0 +1,202 @@
+import ctypes
+import struct
+import threading
+from typing import Dict, Optional
+from .service_manager import ServiceApi, ServiceCall
+
+# Access rights (winsvc.h)
+SC_MANAGER_CONNECT = 0x0001
+SC_MANAGER_ENUMERATE_SERVICE = 0x0004
+SERVICE_QUERY_CONFIG = 0x0001
+SERVICE_CHANGE_CONFIG = 0x0002
+SERVICE_QUERY_STATUS = 0x0004
+SERVICE_START = 0x0010
+SERVICE_STOP = 0x0020
+
+SC_ENUM_PROCESS_INFO = 0
+SC_STATUS_PROCESS_INFO = 0
+SERVICE_WIN32 = 0x00000030
+SERVICE_STATE_ALL = 0x00000003
+SERVICE_CONTROL_STOP = 0x00000001
+SERVICE_NO_CHANGE = 0xFFFFFFFF
+
+ERROR_INSUFFICIENT_BUFFER = 122
+ERROR_MORE_DATA = 234
+
+# Enumeration buffer; grown to what the SCM asks for if too small
+ENUM_BUFFER_SIZE = 256 * 1024
+
+try:
+    from ctypes import wintypes
+    _advapi32 = ctypes.WinDLL("advapi32", use_last_error=True)
+except (ImportError, AttributeError, OSError, ValueError):  # Not on Windows - only `sc` through a runner is usable
+    wintypes = None
+    _advapi32 = None
+
+
+if _advapi32 is not None:
+    class SERVICE_STATUS(ctypes.Structure):
+        _fields_ = [
+            ("dwServiceType", wintypes.DWORD),
+            ("dwCurrentState", wintypes.DWORD),
+            ("dwControlsAccepted", wintypes.DWORD),
+            ("dwWin32ExitCode", wintypes.DWORD),
+            ("dwServiceSpecificExitCode", wintypes.DWORD),
+            ("dwCheckPoint", wintypes.DWORD),
+            ("dwWaitHint", wintypes.DWORD),
+        ]
+
+    class SERVICE_STATUS_PROCESS(ctypes.Structure):
+        _fields_ = SERVICE_STATUS._fields_ + [
+            ("dwProcessId", wintypes.DWORD),
+            ("dwServiceFlags", wintypes.DWORD),
+        ]
+
+    class ENUM_SERVICE_STATUS_PROCESSW(ctypes.Structure):
+        _fields_ = [
+            ("lpServiceName", wintypes.LPWSTR),
+            ("lpDisplayName", wintypes.LPWSTR),
+            ("ServiceStatusProcess", SERVICE_STATUS_PROCESS),
+        ]
+
+    _SC_HANDLE = wintypes.HANDLE
+    _LPDWORD = ctypes.POINTER(wintypes.DWORD)
+    _PROTOTYPES = {
+        "OpenSCManagerW": (_SC_HANDLE, [wintypes.LPCWSTR, wintypes.LPCWSTR, wintypes.DWORD]),
+        "OpenServiceW": (_SC_HANDLE, [_SC_HANDLE, wintypes.LPCWSTR, wintypes.DWORD]),
+        "CloseServiceHandle": (wintypes.BOOL, [_SC_HANDLE]),
+        "EnumServicesStatusExW": (wintypes.BOOL, [
+            _SC_HANDLE, ctypes.c_int, wintypes.DWORD, wintypes.DWORD, ctypes.c_void_p, wintypes.DWORD,
+            _LPDWORD, _LPDWORD, _LPDWORD, wintypes.LPCWSTR
+        ]),
+        "QueryServiceStatusEx": (wintypes.BOOL, [_SC_HANDLE, ctypes.c_int, ctypes.c_void_p, wintypes.DWORD, _LPDWORD]),
+        "QueryServiceConfigW": (wintypes.BOOL, [_SC_HANDLE, ctypes.c_void_p, wintypes.DWORD, _LPDWORD]),
+        "ChangeServiceConfigW": (wintypes.BOOL, [
+            _SC_HANDLE, wintypes.DWORD, wintypes.DWORD, wintypes.DWORD, wintypes.LPCWSTR, wintypes.LPCWSTR,
+            _LPDWORD, wintypes.LPCWSTR, wintypes.LPCWSTR, wintypes.LPCWSTR, wintypes.LPCWSTR
+        ]),
+        "ControlService": (wintypes.BOOL, [_SC_HANDLE, wintypes.DWORD, ctypes.POINTER(SERVICE_STATUS)]),
+        "StartServiceW": (wintypes.BOOL, [_SC_HANDLE, wintypes.DWORD, ctypes.c_void_p]),
+    }
+    for _name, (_restype, _argtypes) in _PROTOTYPES.items():
+        _function = getattr(_advapi32, _name)
+        _function.restype = _restype
+        _function.argtypes = _argtypes
+
+
+def _failure(error: Optional[int] = None) -> ServiceCall:
+    error = ctypes.get_last_error() if error is None else error
+    return ServiceCall(error, None, ctypes.FormatError(error).strip())
+
+
+class NativeServiceApi(ServiceApi):
+    """
+    Service control through the Service Control Manager API (advapi32).
+
+    One SCM handle is opened for the lifetime of the object and shared by
+    every thread; each call opens the service with only the access it needs.
+    Nothing is parsed from text output, so it works the same on every
+    display language. Creating it raises OSError if the service control
+    manager (of `machine`, or the local one) cannot be opened.
+    """
+
+    def __init__(self, machine: Optional[str] = None):
+        if _advapi32 is None:
+            raise OSError("The Service Control Manager API is only available on Windows")
+        self.machine = machine
+        self._lock = threading.Lock()
+        self._manager = _advapi32.OpenSCManagerW(
+            f"\\\\{machine}" if machine else None, None, SC_MANAGER_CONNECT | SC_MANAGER_ENUMERATE_SERVICE
+        )
+        if not self._manager:
+            raise ctypes.WinError(ctypes.get_last_error())
+
+    def _call(self, service_name: str, access: int, action) -> ServiceCall:
+        handle = _advapi32.OpenServiceW(self._manager, service_name, access)
+        if not handle:
+            return _failure()
+        try:
+            return action(handle)
+        finally:
+            _advapi32.CloseServiceHandle(handle)
+
+    def enumerate(self) -> Optional[Dict[str, int]]:
+        states: Dict[str, int] = {}
+        size = ENUM_BUFFER_SIZE
+        needed = wintypes.DWORD()
+        returned = wintypes.DWORD()
+        resume = wintypes.DWORD(0)
+        while True:
+            buffer = ctypes.create_string_buffer(size)
+            done = _advapi32.EnumServicesStatusExW(
+                self._manager, SC_ENUM_PROCESS_INFO, SERVICE_WIN32, SERVICE_STATE_ALL, buffer, size,
+                ctypes.byref(needed), ctypes.byref(returned), ctypes.byref(resume), None
+            )
+            error = 0 if done else ctypes.get_last_error()
+            if error not in (0, ERROR_MORE_DATA):
+                return None
+            entries = ctypes.cast(buffer, ctypes.POINTER(ENUM_SERVICE_STATUS_PROCESSW))
+            for index in range(returned.value):
+                entry = entries[index]
+                states[entry.lpServiceName.lower()] = entry.ServiceStatusProcess.dwCurrentState
+            if error == 0:
+                return states
+            # The rest follows from the resume handle
+            size = max(size, needed.value)
+
+    def query_state(self, service_name: str) -> ServiceCall:
+        def query(handle) -> ServiceCall:
+            status = SERVICE_STATUS_PROCESS()
+            needed = wintypes.DWORD()
+            if not _advapi32.QueryServiceStatusEx(
+                handle, SC_STATUS_PROCESS_INFO, ctypes.byref(status), ctypes.sizeof(status), ctypes.byref(needed)
+            ):
+                return _failure()
+            return ServiceCall(0, status.dwCurrentState)
+        return self._call(service_name, SERVICE_QUERY_STATUS, query)
+
+    def query_start_type(self, service_name: str) -> ServiceCall:
+        def query(handle) -> ServiceCall:
+            needed = wintypes.DWORD()
+            if _advapi32.QueryServiceConfigW(handle, None, 0, ctypes.byref(needed)):
+                return _failure(ERROR_INSUFFICIENT_BUFFER)
+            error = ctypes.get_last_error()
+            if error != ERROR_INSUFFICIENT_BUFFER:
+                return _failure(error)
+            buffer = ctypes.create_string_buffer(needed.value)
+            if not _advapi32.QueryServiceConfigW(handle, buffer, needed.value, ctypes.byref(needed)):
+                return _failure()
+            # QUERY_SERVICE_CONFIGW starts with dwServiceType, dwStartType
+            return ServiceCall(0, struct.unpack_from("<II", buffer.raw)[1])
+        return self._call(service_name, SERVICE_QUERY_CONFIG, query)
+
+    def set_start_type(self, service_name: str, start_type: int) -> ServiceCall:
+        def change(handle) -> ServiceCall:
+            if not _advapi32.ChangeServiceConfigW(
+                handle, SERVICE_NO_CHANGE, start_type, SERVICE_NO_CHANGE,
+                None, None, None, None, None, None, None
+            ):
+                return _failure()
+            return ServiceCall()
+        return self._call(service_name, SERVICE_CHANGE_CONFIG, change)
+
+    def stop(self, service_name: str) -> ServiceCall:
+        def stop(handle) -> ServiceCall:
+            status = SERVICE_STATUS()
+            if not _advapi32.ControlService(handle, SERVICE_CONTROL_STOP, ctypes.byref(status)):
+                return _failure()
+            return ServiceCall(0, status.dwCurrentState)
+        return self._call(service_name, SERVICE_STOP, stop)
+
+    def start(self, service_name: str) -> ServiceCall:
+        def start(handle) -> ServiceCall:
+            if not _advapi32.StartServiceW(handle, 0, None):
+                return _failure()
+            return ServiceCall()
+        return self._call(service_name, SERVICE_START, start)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._manager:
+                _advapi32.CloseServiceHandle(self._manager)
+                self._manager = None
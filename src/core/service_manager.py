@@ -1,54 +1,476 @@
-import subprocess
-from typing import Optional
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from .backend import get_backend
+from .command_runner import CommandResult, CommandRunner
+from .journal import Journal, ServicePrior, get_journal
+from .tracing import Trace
 
+# Service states as reported by `sc query` (SERVICE_STATUS.dwCurrentState)
+SERVICE_STOPPED = 1
+SERVICE_START_PENDING = 2
+SERVICE_STOP_PENDING = 3
+SERVICE_RUNNING = 4
+
+# Win32 error codes returned as the exit code of `sc`
+ERROR_SERVICE_DOES_NOT_EXIST = 1060
+ERROR_SERVICE_NOT_ACTIVE = 1062
+
+# Registry key holding the configuration of every service (the Start value is
+# the start type); its last write time changes whenever `sc config` runs
+SERVICES_KEY = r"SYSTEM\CurrentControlSet\Services"
+
+# Large enough for every service on a stock install in one enumeration call
+ENUM_BUFFER_SIZE = 262144
+
+_SERVICE_NAME_PATTERN = re.compile(r"^SERVICE_NAME:\s*(.+?)\s*$")
+_START_TYPE_PATTERN = re.compile(r"^\s*START_TYPE\s*:\s*(\d+)", re.MULTILINE)
+
+# `sc config start=` arguments by start type (SERVICE_CONFIG.dwStartType)
+START_TYPE_ARGS = {0: "boot", 1: "system", 2: "auto", 3: "demand", 4: "disabled"}
+SERVICE_DISABLED = 4
+
+# The state name is not localized, unlike the "STATE" label in front of it
+_STATE_PATTERN = re.compile(
+    r"(\d+)\s+(STOPPED|START_PENDING|STOP_PENDING|RUNNING|CONTINUE_PENDING|PAUSE_PENDING|PAUSED)\b"
+)
+
+
+def parse_start_type(output: str) -> Optional[int]:
+    """
+    Extract the start type from `sc qc` output.
+
+    Args:
+        output: stdout of `sc qc <service>`
+
+    Returns:
+        int: The start type (e.g. 4 for disabled), or None if not found
+    """
+    match = _START_TYPE_PATTERN.search(output)
+    return int(match.group(1)) if match else None
+
+
+def parse_service_list(output: str) -> Dict[str, int]:
+    """
+    Extract the state of every service from `sc query type= service state= all`.
+
+    Args:
+        output: stdout of the enumeration
+
+    Returns:
+        dict: Lower-cased service name -> service state
+    """
+    states: Dict[str, int] = {}
+    name = None
+    for line in output.splitlines():
+        match = _SERVICE_NAME_PATTERN.match(line)
+        if match:
+            name = match.group(1).lower()
+            continue
+        if name is not None:
+            state = parse_service_state(line)
+            if state is not None:
+                states[name] = state
+                name = None
+    return states
+
+
+class ServiceRequest(NamedTuple):
+    """Actions to perform on one service, applied in order ('stop', 'disable')."""
+    service_name: str
+    actions: Sequence[str] = ("stop", "disable")
+
+
+class ServiceResult(NamedTuple):
+    """Outcome of a ServiceRequest."""
+    service_name: str
+    success: bool
+    exists: bool = True
+    changed: bool = False  # False if the service was already stopped and disabled as requested
+    state: Optional[int] = None
+    actions: Optional[Dict[str, bool]] = None  # Action -> success; None if nothing was attempted
+    error: Optional[str] = None
+    duration: float = 0.0  # Seconds spent applying the request
+
+
+def parse_service_state(output: str) -> Optional[int]:
+    """
+    Extract the current state from `sc query` output.
+
+    Args:
+        output: stdout of `sc query <service>`
+
+    Returns:
+        int: The service state (e.g. SERVICE_RUNNING), or None if not found
+    """
+    match = _STATE_PATTERN.search(output)
+    return int(match.group(1)) if match else None
+
+
+class ServiceCall(NamedTuple):
+    """Outcome of one call to the service control manager."""
+    error: int = 0  # Win32 error code, 0 on success
+    value: Optional[int] = None  # State or start type returned by a query
+    message: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.error == 0
+
+
+class ServiceApi:
+    """
+    The service control manager of one host.
+
+    Every call reports failures as Win32 error codes (e.g.
+    ERROR_SERVICE_DOES_NOT_EXIST), whether it went through the SCM API or
+    through `sc`, whose exit code is the same error code. Decisions are made
+    on the codes only, never on the (localized) messages.
+    """
+
+    def enumerate(self) -> Optional[Dict[str, int]]:
+        """
+        Get the state of every service in one call.
+
+        Returns:
+            dict: Lower-cased service name -> service state, or None if the
+            enumeration failed
+        """
+        raise NotImplementedError
+
+    def query_state(self, service_name: str) -> ServiceCall:
+        """Get the current state of a service (ServiceCall.value)."""
+        raise NotImplementedError
+
+    def query_start_type(self, service_name: str) -> ServiceCall:
+        """Get the start type of a service (ServiceCall.value)."""
+        raise NotImplementedError
+
+    def set_start_type(self, service_name: str, start_type: int) -> ServiceCall:
+        """Change the start type of a service."""
+        raise NotImplementedError
+
+    def stop(self, service_name: str) -> ServiceCall:
+        """Ask a service to stop, without waiting for it to be stopped."""
+        raise NotImplementedError
+
+    def start(self, service_name: str) -> ServiceCall:
+        """Start a service, without waiting for it to be running."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any handle held to the service control manager."""
+
+
+class ScServiceApi(ServiceApi):
+    """Service control through the `sc` command line, one process per call."""
+
+    def __init__(self, runner: CommandRunner):
+        self.runner = runner
+
+    @staticmethod
+    def _call(result: CommandResult, value: Optional[int] = None) -> ServiceCall:
+        if result.returncode == 0:
+            return ServiceCall(0, value)
+        command = result.args[1] if len(result.args) > 1 else "sc"
+        message = (result.stdout or result.stderr).strip() or f"sc {command} exited with {result.returncode}"
+        return ServiceCall(result.returncode, None, message)
+
+    def enumerate(self) -> Optional[Dict[str, int]]:
+        result = self.runner(["sc", "query", "type=", "service", "state=", "all", "bufsize=", str(ENUM_BUFFER_SIZE)])
+        if result.returncode != 0 or "more data" in result.stdout.lower():
+            return None
+        return parse_service_list(result.stdout)
+
+    def query_state(self, service_name: str) -> ServiceCall:
+        result = self.runner(["sc", "query", service_name])
+        return self._call(result, parse_service_state(result.stdout))
+
+    def query_start_type(self, service_name: str) -> ServiceCall:
+        result = self.runner(["sc", "qc", service_name])
+        return self._call(result, parse_start_type(result.stdout))
+
+    def set_start_type(self, service_name: str, start_type: int) -> ServiceCall:
+        return self._call(self.runner(["sc", "config", service_name, "start=", START_TYPE_ARGS[start_type]]))
+
+    def stop(self, service_name: str) -> ServiceCall:
+        return self._call(self.runner(["sc", "stop", service_name]))
+
+    def start(self, service_name: str) -> ServiceCall:
+        return self._call(self.runner(["sc", "start", service_name]))
+
+
+@Trace.traced_class("service")
+class ServiceController:
+    """
+    Apply service actions to many services on a bounded thread pool.
+
+    Each service is handled by one worker: its actions run in order, and a
+    stop waits for STOP_PENDING to finish (up to stop_timeout seconds) before
+    the next action. Different services are handled concurrently.
+
+    Services are reached through a ServiceApi: the host's native service
+    control manager when available, `sc` otherwise. A runner passed in
+    directly always uses `sc`. When several services are handled at once,
+    all services are enumerated in one call first, so existence and the
+    initial state are lookups in that snapshot instead of one query each.
+    """
+
+    def __init__(
+        self,
+        runner: Optional[CommandRunner] = None,
+        max_workers: int = 8,
+        stop_timeout: float = 30.0,
+        poll_interval: float = 0.5,
+        sleep: Callable[[float], None] = time.sleep,
+        journal: Optional[Journal] = None,
+        api: Optional[ServiceApi] = None
+    ):
+        if api is None:
+            api = ScServiceApi(runner) if runner is not None else get_backend().services
+        self.api = api
+        self.journal = journal
+        self.max_workers = max_workers
+        self.stop_timeout = stop_timeout
+        self.poll_interval = poll_interval
+        self.sleep = sleep
+        self.snapshot: Optional[Dict[str, int]] = None
+
+    def query_state(self, service_name: str) -> Optional[int]:
+        """
+        Get the current state of a service.
+
+        Args:
+            service_name: The name of the service
+
+        Returns:
+            int: The service state, or None if the service does not exist or
+            the state could not be read
+        """
+        return self.api.query_state(service_name).value
+
+    def query_all(self) -> Optional[Dict[str, int]]:
+        """
+        Get the state of every service with a single enumeration.
+
+        Returns:
+            dict: Lower-cased service name -> service state, or None if the
+            enumeration failed
+        """
+        return self.api.enumerate()
+
+    def take_snapshot(self) -> bool:
+        """
+        Enumerate every service once, so later existence checks and initial
+        states are lookups.
+
+        Returns:
+            bool: True if the snapshot was taken
+        """
+        self.snapshot = self.api.enumerate()
+        return self.snapshot is not None
+
+    def wait_for_stop(self, service_name: str) -> Optional[int]:
+        """
+        Poll a service until it leaves STOP_PENDING or the deadline passes.
+
+        Args:
+            service_name: The name of the service
+
+        Returns:
+            int: The last observed state
+        """
+        deadline = time.monotonic() + self.stop_timeout
+        state = self.query_state(service_name)
+        while state == SERVICE_STOP_PENDING and time.monotonic() < deadline:
+            self.sleep(self.poll_interval)
+            state = self.query_state(service_name)
+        return state
+
+    def stop(self, service_name: str, state: Optional[int]) -> Tuple[bool, Optional[int], Optional[str]]:
+        """Stop a service unless it is already stopped, then wait for it to finish stopping."""
+        if state == SERVICE_STOPPED:
+            return True, state, None
+        call = self.api.stop(service_name)
+        if call.error not in (0, ERROR_SERVICE_NOT_ACTIVE):
+            return False, state, call.message
+        state = self.wait_for_stop(service_name)
+        if state != SERVICE_STOPPED:
+            return False, state, f"Service did not stop within {self.stop_timeout} seconds"
+        return True, state, None
+
+    def query_start_type(self, service_name: str) -> Optional[int]:
+        """Get the start type of a service, or None if it cannot be read."""
+        return self.api.query_start_type(service_name).value
+
+    def set_start_type(self, service_name: str, start_type: int) -> Tuple[bool, Optional[str]]:
+        """Change the start type of a service."""
+        call = self.api.set_start_type(service_name, start_type)
+        return call.ok, call.message or None
+
+    def disable(self, service_name: str) -> Tuple[bool, Optional[str]]:
+        """Set the start type of a service to disabled."""
+        return self.set_start_type(service_name, SERVICE_DISABLED)
+
+    def start(self, service_name: str) -> Tuple[bool, Optional[str]]:
+        """Start a service without waiting for it to be running."""
+        call = self.api.start(service_name)
+        return call.ok, call.message or None
+
+    def apply(self, request: ServiceRequest) -> ServiceResult:
+        """
+        Apply the actions of a single request.
+
+        Args:
+            request: The service and the actions to perform
+
+        Actions whose target state is already reached cost no change: a
+        stopped service is not stopped again and a disabled one is not
+        reconfigured.
+
+        Returns:
+            ServiceResult: Per-action outcome. A missing service is reported
+            with exists=False and success=False.
+        """
+        name = request.service_name
+        started = time.perf_counter()
+        if self.snapshot is not None:
+            exists = name.lower() in self.snapshot
+            state = self.snapshot.get(name.lower())
+            queried = exists
+        else:
+            query = self.api.query_state(name)
+            exists = query.error != ERROR_SERVICE_DOES_NOT_EXIST
+            state = query.value
+            queried = query.ok
+        if not exists:
+            return ServiceResult(name, False, exists=False, error="The specified service does not exist",
+                                 duration=time.perf_counter() - started)
+
+        # A running service has to be stopped anyway; a stopped one may already be
+        # fully compliant, which the start type tells without reconfiguring it
+        journal = self.journal or get_journal()
+        start_type = None
+        if "disable" in request.actions and (journal is not None or state == SERVICE_STOPPED):
+            start_type = self.query_start_type(name)
+        if journal is not None:
+            try:
+                journal.record([ServicePrior(name, start_type, state)])
+            except OSError as e:
+                return ServiceResult(name, False, state=state, error=f"Could not journal prior state: {str(e)}",
+                                     duration=time.perf_counter() - started)
+
+        outcomes = {}
+        errors = []
+        changed = False
+        for action in request.actions:
+            if action == "stop":
+                changed = changed or state != SERVICE_STOPPED
+                ok, state, error = self.stop(name, state)
+            elif action == "disable":
+                if start_type == SERVICE_DISABLED:
+                    ok, error = True, None
+                else:
+                    changed = True
+                    ok, error = self.disable(name)
+            elif action == "query":
+                ok, error = queried, None
+            else:
+                ok, error = False, f"Unknown service action: {action}"
+            outcomes[action] = ok
+            if error:
+                errors.append(f"{action}: {error}")
+
+        return ServiceResult(
+            name,
+            all(outcomes.values()),
+            changed=changed,
+            state=state,
+            actions=outcomes,
+            error="; ".join(errors) or None,
+            duration=time.perf_counter() - started
+        )
+
+    def run(self, requests: List[ServiceRequest]) -> List[ServiceResult]:
+        """
+        Apply many requests concurrently.
+
+        Args:
+            requests: The services and actions to apply
+
+        Returns:
+            list: One ServiceResult per request, in the same order
+        """
+        if not requests:
+            return []
+        # One enumeration instead of one query per service; if it fails, every
+        # service is queried on its own
+        if len(requests) > 1:
+            self.take_snapshot()
+        try:
+            workers = max(1, min(self.max_workers, len(requests)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(self.apply, requests))
+        finally:
+            self.snapshot = None
+
+
+@Trace.traced_class("service")
 class ServiceManager:
+    @staticmethod
+    def run_requests(requests: List[ServiceRequest], controller: Optional[ServiceController] = None) -> List[ServiceResult]:
+        """
+        Apply service actions for several services at once.
+
+        Args:
+            requests: The services and actions to apply
+            controller: Controller to use (default: a new ServiceController)
+
+        Returns:
+            list: One ServiceResult per request, in the same order
+        """
+        results = (controller or ServiceController()).run(requests)
+        for request, result in zip(requests, results):
+            if not result.success:
+                print(f"Error applying {'/'.join(request.actions)} to service {result.service_name}: {result.error}")
+        return results
+
     @staticmethod
     def stop_service(service_name: str) -> bool:
         """
         Stop a Windows service.
-        
+
         Args:
             service_name: The name of the service to stop
-            
+
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            subprocess.run(["sc", "stop", service_name], check=True)
-            return True
-        except subprocess.CalledProcessError as e:
-            print(f"Error stopping service {service_name}: {str(e)}")
-            return False
-    
+        return ServiceManager.run_requests([ServiceRequest(service_name, ("stop",))])[0].success
+
     @staticmethod
     def disable_service(service_name: str) -> bool:
         """
         Disable a Windows service.
-        
+
         Args:
             service_name: The name of the service to disable
-            
+
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            subprocess.run(["sc", "config", service_name, "start=disabled"], check=True)
-            return True
-        except subprocess.CalledProcessError as e:
-            print(f"Error disabling service {service_name}: {str(e)}")
-            return False
-    
+        return ServiceManager.run_requests([ServiceRequest(service_name, ("disable",))])[0].success
+
     @staticmethod
     def stop_and_disable_service(service_name: str) -> bool:
         """
         Stop and disable a Windows service.
-        
+
         Args:
             service_name: The name of the service to stop and disable
-            
+
         Returns:
             bool: True if successful, False otherwise
         """
-        stop_success = ServiceManager.stop_service(service_name)
-        disable_success = ServiceManager.disable_service(service_name)
-        return stop_success and disable_success 
\ No newline at end of file
+        return ServiceManager.run_requests([ServiceRequest(service_name, ("stop", "disable"))])[0].success
@@ -0,0 +1,309 @@
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from .backend import PlatformBackend
+from .command_runner import CommandResult
+from .registry_backend import (
+    HKEY_LOCAL_MACHINE,
+    HKEY_USERS,
+    REG_DWORD,
+    REG_EXPAND_SZ,
+    MemoryRegistryBackend,
+    RegistryBackend,
+)
+from .service_manager import (
+    ERROR_SERVICE_DOES_NOT_EXIST,
+    ERROR_SERVICE_NOT_ACTIVE,
+    SERVICE_RUNNING,
+    SERVICE_STOP_PENDING,
+    SERVICE_STOPPED,
+    SERVICES_KEY,
+)
+from .task_manager import normalize_task_path
+
+# Service start types (SERVICE_CONFIG.dwStartType)
+SERVICE_AUTO_START = 2
+SERVICE_DEMAND_START = 3
+SERVICE_DISABLED = 4
+
+_STATE_NAMES = {1: "STOPPED", 2: "START_PENDING", 3: "STOP_PENDING", 4: "RUNNING"}
+_START_TYPE_NAMES = {0: "BOOT_START", 1: "SYSTEM_START", 2: "AUTO_START", 3: "DEMAND_START", 4: "DISABLED"}
+_START_TYPE_ARGS = {"boot": 0, "system": 1, "auto": 2, "demand": 3, "disabled": 4}
+
+_TASK_HEADER = '"HostName","TaskName","Next Run Time","Status","Logon Mode","Last Run Time","Last Result","Author","Task To Run","Start In","Comment","Scheduled Task State"'
+
+# Services and tasks found on a stock Windows install that the built-in profiles touch
+DEFAULT_SERVICES = ("DiagTrack", "WSearch")
+DEFAULT_TASKS = (
+    r"Microsoft\Windows\Application Experience\Microsoft Compatibility Appraiser",
+    r"Microsoft\Windows\Application Experience\ProgramDataUpdater",
+    r"Microsoft\Windows\Customer Experience Improvement Program\Consolidator",
+    r"Microsoft\Windows\Customer Experience Improvement Program\UsbCeip",
+    r"Microsoft\Windows\Customer Experience Improvement Program\KernelCeipTask",
+)
+
+
+class SimulatedHost:
+    """
+    In-memory stand-in for a Windows machine.
+
+    Keeps registry, service, scheduled task and process state and answers the
+    `sc`, `schtasks` and `taskkill` command lines the tool uses with output in
+    the same format as the real tools. Every command and process start can be
+    delayed by a fixed latency and fail at random with the given rate, and
+    every registry call by registry_latency, to benchmark schedulers.
+    """
+
+    def __init__(
+        self,
+        name: str = "localhost",
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+        registry_latency: float = 0.0
+    ):
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.registry = MemoryRegistryBackend(registry_latency)
+        self.services: Dict[str, Dict] = {}
+        self.tasks: Dict[str, Dict] = {}
+        self.processes: Dict[str, int] = {}
+        self.admin = True
+        self.commands: List[List[str]] = []
+        self.started: List[List[str]] = []
+        self.shell_refreshes = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def windows_default(cls, name: str = "localhost", **kwargs) -> "SimulatedHost":
+        """
+        Create a host that looks like a fresh Windows install.
+
+        Returns:
+            SimulatedHost: Host with the default services running, the default
+            tasks enabled and explorer.exe running
+        """
+        host = cls(name, **kwargs)
+        for service in DEFAULT_SERVICES:
+            host.add_service(service)
+        for task in DEFAULT_TASKS:
+            host.add_task(task)
+        host.processes["explorer.exe"] = 1
+        return host
+
+    def add_service(self, name: str, state: int = SERVICE_RUNNING, start_type: int = SERVICE_AUTO_START) -> None:
+        self.services[name.lower()] = {"name": name, "state": state, "start_type": start_type, "pending": 0}
+        self._store_start_type(name, start_type)
+
+    def _store_start_type(self, name: str, start_type: int) -> None:
+        # The service manager keeps the configuration under Services\<name>
+        self.registry.put_value(HKEY_LOCAL_MACHINE, f"{SERVICES_KEY}\\{name}", "Start", start_type, REG_DWORD)
+
+    def add_user_profile(self, sid: str, path: str, logged_on: bool = False) -> None:
+        """
+        Register a user profile, with its hives mounted under HKEY_USERS if
+        the user is logged on, or stored as hive files in the profile directory.
+        """
+        from .user_hives import CLASSES_SUFFIX, NTUSER_FILE, PROFILE_LIST_KEY, USRCLASS_FILE
+
+        self.registry.put_value(HKEY_LOCAL_MACHINE, f"{PROFILE_LIST_KEY}\\{sid}", "ProfileImagePath", path, REG_EXPAND_SZ)
+        for hive, file_name in ((sid, NTUSER_FILE), (sid + CLASSES_SUFFIX, USRCLASS_FILE)):
+            if logged_on:
+                self.registry.put_key(HKEY_USERS, hive)
+            else:
+                self.registry.hive_files[f"{path}\\{file_name}".lower()] = {"": {}}
+
+    def add_task(self, path: str, enabled: bool = True) -> None:
+        self.tasks[normalize_task_path(path)] = {"path": "\\" + path.lstrip("\\"), "enabled": enabled}
+
+    def start_process(self, args: List[str]) -> bool:
+        """Mark a process as running."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.started.append(list(args))
+            image = args[0].lower()
+            self.processes[image] = self.processes.get(image, 0) + 1
+        return True
+
+    def run(self, args: List[str]) -> CommandResult:
+        """
+        Execute a simulated command line.
+
+        Args:
+            args: The command and its arguments
+
+        Returns:
+            CommandResult: Output in the format of the real tool
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.commands.append(list(args))
+            if self.failure_rate and self.random.random() < self.failure_rate:
+                return CommandResult(args, 1, "", "Simulated failure")
+            tool = args[0].lower()
+            if tool in ("sc", "sc.exe"):
+                return self._sc(args)
+            if tool in ("schtasks", "schtasks.exe"):
+                return self._schtasks(args)
+            if tool in ("taskkill", "taskkill.exe"):
+                return self._taskkill(args)
+            if tool in ("reg", "reg.exe"):
+                return self._reg(args)
+            return CommandResult(args, -1, "", f"Unknown command: {args[0]}")
+
+    def _sc(self, args: List[str]) -> CommandResult:
+        rest = [arg for arg in args[1:] if not arg.startswith("\\\\")]  # drop \\host
+        if rest and rest[0].lower() == "query" and (len(rest) == 1 or rest[1].endswith("=")):
+            return self._sc_enumerate(args)
+        if len(rest) < 2:
+            return CommandResult(args, 1639, "", "Invalid command line")
+        command, name = rest[0].lower(), rest[1]
+        service = self.services.get(name.lower())
+        if service is None:
+            return CommandResult(args, ERROR_SERVICE_DOES_NOT_EXIST, f"[SC] OpenService FAILED {ERROR_SERVICE_DOES_NOT_EXIST}:\n\nThe specified service does not exist as an installed service.\n")
+
+        if command == "query":
+            if service["pending"]:
+                service["pending"] -= 1
+                if not service["pending"]:
+                    service["state"] = SERVICE_STOPPED
+            state = service["state"]
+            return CommandResult(args, 0, (
+                f"\nSERVICE_NAME: {service['name']}\n"
+                f"        TYPE               : 10  WIN32_OWN_PROCESS\n"
+                f"        STATE              : {state}  {_STATE_NAMES[state]}\n"
+            ))
+        if command == "qc":
+            start_type = service["start_type"]
+            return CommandResult(args, 0, (
+                f"[SC] QueryServiceConfig SUCCESS\n\nSERVICE_NAME: {service['name']}\n"
+                f"        START_TYPE         : {start_type}   {_START_TYPE_NAMES[start_type]}\n"
+            ))
+        if command == "stop":
+            if service["state"] == SERVICE_STOPPED:
+                return CommandResult(args, ERROR_SERVICE_NOT_ACTIVE, f"[SC] ControlService FAILED {ERROR_SERVICE_NOT_ACTIVE}:\n")
+            # The service reports STOP_PENDING for one query before it is stopped
+            service["state"] = SERVICE_STOP_PENDING
+            service["pending"] = 1
+            return CommandResult(args, 0, "")
+        if command == "start":
+            service["state"] = SERVICE_RUNNING
+            service["pending"] = 0
+            return CommandResult(args, 0, "")
+        if command == "config":
+            options = rest[2:]
+            for index, option in enumerate(options):
+                if option.lower().startswith("start="):
+                    value = option[6:] or (options[index + 1] if index + 1 < len(options) else "")
+                    if value.lower() not in _START_TYPE_ARGS:
+                        return CommandResult(args, 87, "", "The parameter is incorrect.")
+                    service["start_type"] = _START_TYPE_ARGS[value.lower()]
+                    self._store_start_type(service["name"], service["start_type"])
+            return CommandResult(args, 0, "[SC] ChangeServiceConfig SUCCESS\n")
+        return CommandResult(args, 1639, "", f"Unsupported sc command: {command}")
+
+    def _sc_enumerate(self, args: List[str]) -> CommandResult:
+        blocks = []
+        for service in self.services.values():
+            state = service["state"]
+            blocks.append(
+                f"SERVICE_NAME: {service['name']}\n"
+                f"DISPLAY_NAME: {service['name']}\n"
+                f"        TYPE               : 10  WIN32_OWN_PROCESS\n"
+                f"        STATE              : {state}  {_STATE_NAMES[state]}\n"
+            )
+        return CommandResult(args, 0, "\n" + "\n".join(blocks))
+
+    def _schtasks(self, args: List[str]) -> CommandResult:
+        lowered = [arg.lower() for arg in args]
+        if "/query" in lowered:
+            rows = [_TASK_HEADER]
+            for task in self.tasks.values():
+                status = "Ready" if task["enabled"] else "Disabled"
+                state = "Enabled" if task["enabled"] else "Disabled"
+                rows.append(f'"{self.name}","{task["path"]}","N/A","{status}","Interactive/Background","N/A","0","Microsoft","","","","{state}"')
+            return CommandResult(args, 0, "\n".join(rows) + "\n")
+        if "/change" in lowered and "/tn" in lowered:
+            path = args[lowered.index("/tn") + 1]
+            task = self.tasks.get(normalize_task_path(path))
+            if task is None:
+                return CommandResult(args, 1, "", "ERROR: The system cannot find the file specified.")
+            if "/disable" in lowered:
+                task["enabled"] = False
+            elif "/enable" in lowered:
+                task["enabled"] = True
+            return CommandResult(args, 0, f'SUCCESS: The parameters of scheduled task "{path}" have been changed.')
+        return CommandResult(args, 1, "", "ERROR: Invalid syntax.")
+
+    def _taskkill(self, args: List[str]) -> CommandResult:
+        lowered = [arg.lower() for arg in args]
+        image = args[lowered.index("/im") + 1].lower() if "/im" in lowered else ""
+        if not self.processes.get(image):
+            return CommandResult(args, 128, "", f'ERROR: The process "{image}" not found.')
+        self.processes[image] = 0
+        return CommandResult(args, 0, f'SUCCESS: The process "{image}" has been terminated.')
+
+    def _reg(self, args: List[str]) -> CommandResult:
+        # Only `reg import FILE`; like the real reg.exe, it bypasses the tool's registry calls
+        from .reg_files import RegFileError, read_reg_file
+
+        if len(args) != 3 or args[1].lower() != "import":
+            return CommandResult(args, 1, "", "ERROR: Invalid syntax.")
+        try:
+            operations = read_reg_file(args[2])
+        except (OSError, RegFileError) as e:
+            return CommandResult(args, 1, "", f"ERROR: Error opening the file. {str(e)}")
+        for operation in operations:
+            if operation.action == "set":
+                self.registry.put_value(operation.hive, operation.key_path, operation.value_name, operation.value, operation.value_type)
+            else:
+                self.registry.remove_value(operation.hive, operation.key_path, operation.value_name)
+        return CommandResult(args, 0, "", "The operation completed successfully.")
+
+    def command_count(self, tools: Iterable[str] = ()) -> int:
+        """
+        Count the simulated process launches.
+
+        Args:
+            tools: Only count these tools (e.g. ['sc']); all if empty
+
+        Returns:
+            int: Number of commands run so far
+        """
+        tools = {tool.lower() for tool in tools}
+        return sum(1 for command in self.commands if not tools or command[0].lower() in tools)
+
+
+class SimulatorBackend(PlatformBackend):
+    """Platform backend running everything against a SimulatedHost."""
+
+    def __init__(self, simulated_host: Optional[SimulatedHost] = None):
+        simulated_host = simulated_host or SimulatedHost.windows_default()
+        super().__init__(simulated_host.name)
+        self.simulated_host = simulated_host
+
+    @property
+    def registry(self) -> RegistryBackend:
+        return self.simulated_host.registry
+
+    def run(self, args: List[str]) -> CommandResult:
+        return self.simulated_host.run(args)
+
+    def start_process(self, args: List[str]) -> bool:
+        return self.simulated_host.start_process(args)
+
+    def shell_ready(self) -> Optional[bool]:
+        return bool(self.simulated_host.processes.get("explorer.exe"))
+
+    def refresh_shell(self) -> bool:
+        with self.simulated_host.lock:
+            self.simulated_host.shell_refreshes += 1
+        return True
+
+    def is_admin(self) -> bool:
+        return self.simulated_host.admin
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from .backend import PlatformBackend
+from .paths import data_dir
+from .planner import PlanResult
+from .profiles import Profile
+from .registry_backend import HIVE_NAMES, HKEY_LOCAL_MACHINE
+from .registry_manager import RegistryManager
+from .service_manager import SERVICES_KEY, ServiceController
+from .task_manager import TaskInventory
+
+CACHE_VERSION = 1
+
+
+def default_cache_file() -> str:
+    """
+    Get the default location of the compliance cache.
+
+    Returns:
+        str: compliance.json in the data directory (%ProgramData%\\WScript)
+    """
+    return os.path.join(data_dir(), "compliance.json")
+
+
+def profile_hash(profile: Profile) -> str:
+    """
+    Hash everything a profile asks for, so an edited profile is never skipped.
+
+    Returns:
+        str: Hex SHA-256 of the profile contents
+    """
+    data = json.dumps(profile, sort_keys=True, default=repr)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class StateDetector:
+    """
+    Cheap change detectors for the targets of a profile.
+
+    Registry keys are fingerprinted by their last write time (QueryInfoKey),
+    services by their current state plus the last write time of their
+    configuration key, and scheduled tasks by their enabled flag. Services
+    and tasks come from one service enumeration and one schtasks snapshot,
+    shared by every profile fingerprinted with the same detector.
+    """
+
+    def __init__(self, backend: PlatformBackend):
+        self.backend = backend
+        self.services: Optional[Dict[str, int]] = None
+        self.tasks: Optional[TaskInventory] = None
+        self.complete = True
+
+    def refresh(self) -> None:
+        """Forget the service and task snapshots, e.g. after applying changes."""
+        self.services = None
+        self.tasks = None
+        self.complete = True
+
+    def _service_states(self) -> Dict[str, int]:
+        if self.services is None:
+            self.services = ServiceController(api=self.backend.services).query_all()
+            if self.services is None:
+                # Without a full enumeration nothing can be shown to be unchanged
+                self.complete = False
+                self.services = {}
+        return self.services
+
+    def fingerprint(self, profile: Profile) -> Dict[str, object]:
+        """
+        Fingerprint the current state of everything a profile touches.
+
+        Args:
+            profile: The profile
+
+        Returns:
+            dict: Target -> observed state, comparable with a stored fingerprint
+        """
+        registry = self.backend.registry
+        fingerprint: Dict[str, object] = {}
+        for entry in profile.registry:
+            path = entry.path.strip("\\").lower()
+            target = f"registry:{HIVE_NAMES.get(entry.hive, entry.hive)}\\{path}"
+            fingerprint[target] = RegistryManager.last_write_time(entry.path, entry.hive, registry)
+
+        if profile.services:
+            states = self._service_states()
+            for service in profile.services:
+                config = RegistryManager.last_write_time(f"{SERVICES_KEY}\\{service.name}", HKEY_LOCAL_MACHINE, registry)
+                fingerprint[f"service:{service.name.lower()}"] = [states.get(service.name.lower()), config]
+
+        if profile.tasks:
+            if self.tasks is None:
+                self.tasks = TaskInventory(self.backend.run)
+                self.tasks.refresh()
+                if self.tasks.error is not None:
+                    # Unlisted tasks would read as missing, so nothing can be shown to be unchanged
+                    self.complete = False
+            for task in profile.tasks:
+                found = self.tasks.get(task.path)
+                fingerprint[f"task:{task.path.lower()}"] = None if found is None else found.enabled
+
+        return fingerprint
+
+
+def profile_succeeded(profile: Profile, result: PlanResult) -> bool:
+    """
+    Check that every target of a profile was applied (or already compliant).
+
+    Args:
+        profile: The profile
+        result: Results of the plan the profile was part of
+
+    Returns:
+        bool: True if nothing the profile asked for failed
+    """
+    keys = {(entry.hive, entry.path.strip("\\").lower()) for entry in profile.registry}
+    services = {service.name.lower() for service in profile.services}
+    tasks = {task.path.strip("\\").lower() for task in profile.tasks}
+    return (
+        all(r.success for r in result.registry if (r.operation.hive, r.operation.key_path.strip("\\").lower()) in keys)
+        and all(r.success or not r.exists for r in result.services if r.service_name.lower() in services)
+        and all(r.success or not r.exists for r in result.tasks if r.task_path.strip("\\").lower() in tasks)
+        and all(ok for action, ok in result.post_actions.items() if action in profile.post_actions)
+    )
+
+
+class ComplianceCache:
+    """
+    On-disk record of profiles applied successfully and the state they left behind.
+
+    An entry stores the profile hash and the fingerprint of its targets after
+    the run. A later run can skip the profile while both still match. Entries
+    older than max_age are dropped, and only the max_entries most recent ones
+    are kept.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 256, max_age: float = 7 * 24 * 3600):
+        self.path = path or default_cache_file()
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries: Dict[str, Dict] = {}
+        self.load()
+
+    @staticmethod
+    def _key(host: str, profile: Profile) -> str:
+        return f"{host.lower()}|{profile.name}"
+
+    def load(self) -> None:
+        """Read the cache file; a missing or unreadable file gives an empty cache."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.entries = data.get("entries", {}) if data.get("version") == CACHE_VERSION else {}
+        self.evict()
+
+    def evict(self, now: Optional[float] = None) -> int:
+        """
+        Drop expired entries and the oldest ones beyond max_entries.
+
+        Returns:
+            int: Number of entries dropped
+        """
+        now = time.time() if now is None else now
+        before = len(self.entries)
+        fresh = sorted(
+            ((key, entry) for key, entry in self.entries.items() if now - entry.get("time", 0) <= self.max_age),
+            key=lambda item: item[1]["time"],
+            reverse=True
+        )
+        self.entries = dict(fresh[:self.max_entries])
+        return before - len(self.entries)
+
+    def is_current(self, host: str, profile: Profile, fingerprint: Dict[str, object]) -> bool:
+        """
+        Check if a profile was applied successfully and its targets have not changed since.
+
+        Args:
+            host: The host the profile is applied to
+            profile: The profile
+            fingerprint: The current fingerprint of its targets
+
+        Returns:
+            bool: True if the profile can be skipped
+        """
+        entry = self.entries.get(self._key(host, profile))
+        if entry is None or time.time() - entry["time"] > self.max_age:
+            return False
+        return entry["hash"] == profile_hash(profile) and entry["fingerprint"] == fingerprint
+
+    def record(self, host: str, profile: Profile, fingerprint: Dict[str, object]) -> None:
+        """Store the state left behind by a successful run of a profile."""
+        self.entries[self._key(host, profile)] = {
+            "hash": profile_hash(profile),
+            "fingerprint": fingerprint,
+            "time": time.time(),
+        }
+
+    def forget(self, host: str, profile: Profile) -> None:
+        """Drop the entry of a profile, so it is applied in full next time."""
+        self.entries.pop(self._key(host, profile), None)
+
+    def save(self) -> None:
+        """Write the cache atomically, creating its directory if needed."""
+        self.evict()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "entries": self.entries}, f)
+        os.replace(temp_path, self.path)
+
+
+def split_unchanged(
+    profiles: List[Profile],
+    cache: ComplianceCache,
+    detector: StateDetector
+) -> Tuple[List[Profile], List[Profile]]:
+    """
+    Split profiles into those that need to run and those that can be skipped.
+
+    Args:
+        profiles: The selected profiles
+        cache: The compliance cache
+        detector: Detector for the host the profiles are applied to
+
+    Returns:
+        tuple: (profiles to apply, profiles unchanged since their last successful run)
+    """
+    pending, unchanged = [], []
+    for profile in profiles:
+        fingerprint = detector.fingerprint(profile)
+        if detector.complete and cache.is_current(detector.backend.host, profile, fingerprint):
+            unchanged.append(profile)
+        else:
+            pending.append(profile)
+    return pending, unchanged
+
+
+def record_results(profiles: List[Profile], result: PlanResult, cache: ComplianceCache, detector: StateDetector) -> None:
+    """
+    Record the profiles of an executed plan that applied cleanly, with the
+    state they left behind, and forget the ones that did not.
+    """
+    detector.refresh()
+    host = detector.backend.host
+    for profile in profiles:
+        if not profile_succeeded(profile, result):
+            cache.forget(host, profile)
+            continue
+        fingerprint = detector.fingerprint(profile)
+        if detector.complete:
+            cache.record(host, profile, fingerprint)
+        else:
+            cache.forget(host, profile)
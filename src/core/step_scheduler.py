@@ -0,0 +1,198 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from .log_manager import LogManager
+
+
+class Step(NamedTuple):
+    """
+    A unit of work that may run once the steps it depends on have succeeded.
+
+    The action is called with the values returned by those steps, in the
+    order of `depends_on`.
+    """
+    name: str
+    action: Callable[..., Any]
+    depends_on: Tuple[str, ...] = ()
+
+
+class StepResult(NamedTuple):
+    """Outcome and timing of one step; times are seconds since the run started."""
+    name: str
+    value: Any
+    error: Optional[str]
+    start: float
+    end: float
+    skipped: bool = False  # Not run because a dependency failed
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class ScheduleResult(NamedTuple):
+    """Results of all steps of a run, in the order the steps were given."""
+    steps: Dict[str, StepResult]
+    dependencies: Dict[str, Tuple[str, ...]]
+    duration: float
+
+    @property
+    def success(self) -> bool:
+        return all(step.success for step in self.steps.values())
+
+    @property
+    def failed(self) -> List[StepResult]:
+        return [step for step in self.steps.values() if not step.success]
+
+    def value(self, name: str, default: Any = None) -> Any:
+        """Get what a step returned, or `default` if it failed or was skipped."""
+        step = self.steps.get(name)
+        return step.value if step is not None and step.success else default
+
+    def critical_path(self) -> List[StepResult]:
+        """
+        Get the chain of steps that bounded the run.
+
+        Starting from the step that finished last, each step is preceded by
+        the dependency that finished last, i.e. the one it had to wait for.
+
+        Returns:
+            list: The steps of the chain, first to last
+        """
+        ran = [step for step in self.steps.values() if not step.skipped]
+        if not ran:
+            return []
+        path = [max(ran, key=lambda step: step.end)]
+        while True:
+            before = [self.steps[name] for name in self.dependencies.get(path[-1].name, ()) if name in self.steps]
+            if not before:
+                break
+            path.append(max(before, key=lambda step: step.end))
+        return list(reversed(path))
+
+    def describe_critical_path(self) -> str:
+        """Summarize the critical path, e.g. 'registry (0.12s) -> post_actions (1.50s)'."""
+        return " -> ".join(f"{step.name} ({step.duration:.2f}s)" for step in self.critical_path())
+
+
+class StepScheduler:
+    """
+    Run a graph of steps on a bounded worker pool.
+
+    A step starts as soon as all the steps it depends on have succeeded, so
+    independent steps overlap (e.g. registry writes while service and task
+    commands are in flight). A step that raises only fails itself: steps
+    that do not depend on it keep running, and the ones that do are skipped.
+    """
+
+    def __init__(self, max_workers: int = 4, logger_name: str = 'Steps'):
+        self.max_workers = max_workers
+        self.logger = LogManager().get_logger(logger_name)
+
+    @staticmethod
+    def check_graph(steps: Iterable[Step]) -> None:
+        """
+        Check that step names are unique, every dependency exists and there are no cycles.
+
+        Raises:
+            ValueError: If the steps do not form a valid graph
+        """
+        steps = list(steps)
+        names = set()
+        for step in steps:
+            if step.name in names:
+                raise ValueError(f"Duplicate step '{step.name}'")
+            names.add(step.name)
+        for step in steps:
+            for dependency in step.depends_on:
+                if dependency not in names:
+                    raise ValueError(f"Step '{step.name}' depends on unknown step '{dependency}'")
+
+        # Kahn's algorithm: whatever cannot be ordered is part of a cycle
+        remaining = {step.name: set(step.depends_on) for step in steps}
+        while remaining:
+            ready = [name for name, dependencies in remaining.items() if not dependencies]
+            if not ready:
+                raise ValueError(f"Dependency cycle between steps: {', '.join(sorted(remaining))}")
+            for name in ready:
+                del remaining[name]
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+
+    def run(self, steps: Iterable[Step]) -> ScheduleResult:
+        """
+        Run every step once its dependencies have succeeded.
+
+        Args:
+            steps: The steps; dependencies refer to other steps by name
+
+        Returns:
+            ScheduleResult: One StepResult per step
+
+        Raises:
+            ValueError: If the steps do not form a valid graph
+        """
+        steps = list(steps)
+        self.check_graph(steps)
+        dependencies = {step.name: tuple(step.depends_on) for step in steps}
+        results: Dict[str, StepResult] = {}
+        started = time.perf_counter()
+
+        def run_step(step: Step, inputs: List[Any]) -> StepResult:
+            begin = time.perf_counter() - started
+            try:
+                value, error = step.action(*inputs), None
+            except Exception as e:
+                value, error = None, f"{type(e).__name__}: {str(e)}"
+                self.logger.error("Step '%s' failed: %s", step.name, error, extra={
+                    'feature': self.logger.name, 'operation': 'step', 'target': step.name, 'result': 'error', 'details': error})
+            return StepResult(step.name, value, error, begin, time.perf_counter() - started)
+
+        def settle(pending: Dict[str, Step]) -> List[Step]:
+            # Skip steps whose dependencies failed, and return the ones that can start
+            ready = []
+            changed = True
+            while changed:
+                changed = False
+                for name, step in list(pending.items()):
+                    failed = [dep for dep in step.depends_on if dep in results and not results[dep].success]
+                    if failed:
+                        now = time.perf_counter() - started
+                        error = f"Skipped because '{failed[0]}' failed"
+                        self.logger.info("Step '%s': %s", name, error, extra={
+                            'feature': self.logger.name, 'operation': 'step', 'target': name, 'result': 'skipped'})
+                        results[name] = StepResult(name, None, error, now, now, skipped=True)
+                        del pending[name]
+                        changed = True
+                    elif all(dep in results for dep in step.depends_on):
+                        ready.append(step)
+                        del pending[name]
+            return ready
+
+        pending = {step.name: step for step in steps}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(steps) or 1))) as pool:
+            running = {}
+            while True:
+                for step in settle(pending):
+                    inputs = [results[dependency].value for dependency in step.depends_on]
+                    running[pool.submit(run_step, step, inputs)] = step.name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    result = future.result()
+                    results[result.name] = result
+
+        schedule = ScheduleResult(
+            {step.name: results[step.name] for step in steps}, dependencies, time.perf_counter() - started
+        )
+        if steps and self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("Critical path: %s", schedule.describe_critical_path(), extra={
+                'feature': self.logger.name, 'operation': 'schedule', 'duration': schedule.duration})
+        return schedule
@@ -0,0 +1,140 @@
+import codecs
+import locale
+import re
+import time
+from collections import deque
+from typing import Callable, List, NamedTuple, Optional
+from .command_runner import AsyncCommandRunner, get_command_runner
+
+# Matches "Verification 45% complete." (sfc) and "[=====   20.0%   ]" (DISM)
+_PERCENT_PATTERN = re.compile(r"(\d{1,3}(?:[.,]\d+)?)\s*%")
+_LINE_BREAK = re.compile(r"[\r\n]")
+
+
+class ProgressEvent(NamedTuple):
+    """A progress update parsed from a child process."""
+    stage: str
+    percent: float
+    line: str
+    elapsed: float
+
+
+class StreamResult(NamedTuple):
+    """Outcome of a streamed command."""
+    stage: str
+    args: List[str]
+    returncode: Optional[int]
+    duration: float
+    timed_out: bool
+    percent: Optional[float]
+    lines: List[str]
+
+
+def parse_progress(line: str) -> Optional[float]:
+    """
+    Extract a percent-complete value from a line of tool output.
+
+    Args:
+        line: One line of output
+
+    Returns:
+        float: The percentage (0-100), or None if the line has none
+    """
+    match = _PERCENT_PATTERN.search(line)
+    if not match:
+        return None
+    percent = float(match.group(1).replace(",", "."))
+    return percent if 0 <= percent <= 100 else None
+
+
+def _detect_encoding(chunk: bytes) -> str:
+    # sfc writes UTF-16LE when its output is redirected, other tools use the
+    # console code page
+    if chunk.startswith(codecs.BOM_UTF16_LE) or (len(chunk) > 1 and chunk[1] == 0):
+        return "utf-16-le"
+    return locale.getpreferredencoding(False)
+
+
+class StreamRunner:
+    """
+    Run a command through the shared command runner and read its output
+    incrementally.
+
+    Output is split on both carriage returns and newlines, since progress bars
+    redraw themselves with \\r. Progress lines are reported through on_progress
+    as they arrive, everything else through on_line. Only the last max_lines
+    lines are kept in memory.
+    """
+
+    def __init__(self, runner: Optional[AsyncCommandRunner] = None, max_lines: int = 200):
+        self.runner = runner
+        self.max_lines = max_lines
+
+    def run(
+        self,
+        stage: str,
+        args: List[str],
+        timeout: Optional[float] = None,
+        on_progress: Optional[Callable[[ProgressEvent], None]] = None,
+        on_line: Optional[Callable[[str], None]] = None
+    ) -> StreamResult:
+        """
+        Run a command to completion or until the timeout expires.
+
+        Args:
+            stage: Label used in progress events (e.g. 'sfc')
+            args: The command and its arguments
+            timeout: Seconds before the process is killed (default: no limit)
+            on_progress: Called for every parsed progress update
+            on_line: Called for every other non-empty output line
+
+        Returns:
+            StreamResult: Exit code, timing, last progress and the output tail
+        """
+        start = time.monotonic()
+        lines = deque(maxlen=self.max_lines)
+        last_percent = [None]
+        decoder = [None]
+        pending = [""]
+
+        def emit(line: str) -> None:
+            line = line.strip()
+            if not line:
+                return
+            percent = parse_progress(line)
+            if percent is not None:
+                if percent != last_percent[0]:
+                    last_percent[0] = percent
+                    if on_progress:
+                        on_progress(ProgressEvent(stage, percent, line, time.monotonic() - start))
+                return
+            lines.append(line)
+            if on_line:
+                on_line(line)
+
+        def on_output(chunk: bytes) -> None:
+            if decoder[0] is None:
+                decoder[0] = codecs.getincrementaldecoder(_detect_encoding(chunk))(errors="replace")
+            parts = _LINE_BREAK.split(pending[0] + decoder[0].decode(chunk))
+            pending[0] = parts.pop()
+            for part in parts:
+                emit(part)
+
+        runner = self.runner or get_command_runner()
+        result = runner.run(args, timeout, on_output=on_output, merge_stderr=True)
+        if result.returncode == -1 and not result.timed_out and decoder[0] is None:
+            # Could not be started; the reason is all there is to show
+            return StreamResult(stage, args, None, 0.0, False, None, [result.stderr])
+        if decoder[0] is not None:
+            pending[0] += decoder[0].decode(b"", final=True)
+        emit(pending[0])
+
+        return StreamResult(
+            stage,
+            args,
+            None if result.timed_out else result.returncode,
+            time.monotonic() - start,
+            result.timed_out,
+            last_percent[0],
+            list(lines)
+        )
@@ -0,0 +1,229 @@
+import csv
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from .backend import get_backend
+from .command_runner import CommandRunner
+from .journal import Journal, TaskPrior, get_journal
+from .tracing import Trace
+
+# Column positions of `schtasks /query /fo CSV /v`, used when the header is
+# localized and the English column names cannot be found
+_DEFAULT_COLUMNS = {"TaskName": 1, "Status": 3, "Scheduled Task State": 11}
+# "Disabled" as schtasks prints it in the Status and Scheduled Task State columns, per display language
+_DISABLED_STATES = {
+    "disabled", "deaktiviert", "désactivé", "désactivée", "deshabilitado", "deshabilitada",
+    "disabilitato", "disabilitata", "desabilitado", "desabilitada", "uitgeschakeld",
+    "wyłączone", "отключено", "無効", "已禁用", "사용 안 함",
+}
+
+
+class ScheduledTask(NamedTuple):
+    """A scheduled task as listed by schtasks."""
+    path: str
+    status: str
+    enabled: bool
+
+
+class TaskResult(NamedTuple):
+    """Outcome of changing a scheduled task."""
+    task_path: str
+    success: bool
+    exists: bool = True
+    changed: bool = False
+    error: Optional[str] = None
+    duration: float = 0.0  # Seconds schtasks took to change the task
+
+
+def normalize_task_path(task_path: str) -> str:
+    """
+    Normalize a task path for lookups (leading backslash, case-insensitive).
+
+    Args:
+        task_path: Task path with or without the leading backslash
+
+    Returns:
+        str: The lookup key for the task
+    """
+    return "\\" + task_path.strip().lstrip("\\").lower()
+
+
+def parse_schtasks_csv(output: str) -> Dict[str, ScheduledTask]:
+    """
+    Parse the output of `schtasks /query /fo CSV /v` into a task table.
+
+    The header row is repeated for every task folder and tasks with several
+    triggers are listed once per trigger; both are collapsed here. With a
+    localized header the columns are found by position, and disabled tasks
+    are recognized in the common display languages.
+
+    Args:
+        output: stdout of schtasks
+
+    Returns:
+        dict: Normalized task path -> ScheduledTask
+    """
+    tasks: Dict[str, ScheduledTask] = {}
+    header: Optional[List[str]] = None
+    columns = dict(_DEFAULT_COLUMNS)
+
+    for row in csv.reader(io.StringIO(output)):
+        if not row or not any(field.strip() for field in row):
+            continue
+        if header is None:
+            header = row
+            for name in columns:
+                if name in header:
+                    columns[name] = header.index(name)
+            continue
+        if row == header:
+            continue
+        if len(row) <= max(columns.values()):
+            continue
+
+        path = row[columns["TaskName"]]
+        key = normalize_task_path(path)
+        if key in tasks:
+            continue
+        status = row[columns["Status"]]
+        state = row[columns["Scheduled Task State"]]
+        enabled = state.strip().lower() not in _DISABLED_STATES and status.strip().lower() not in _DISABLED_STATES
+        tasks[key] = ScheduledTask(path, status, enabled)
+
+    return tasks
+
+
+@Trace.traced_class("task")
+class TaskInventory:
+    """
+    In-memory snapshot of all scheduled tasks, taken with a single schtasks call.
+
+    Existence and state lookups are answered from the snapshot. Changes are
+    applied on a small thread pool and reflected back into the snapshot.
+    """
+
+    def __init__(self, runner: Optional[CommandRunner] = None, max_workers: int = 4, journal: Optional[Journal] = None):
+        self.runner = runner or get_backend().run
+        self.max_workers = max_workers
+        self.journal = journal
+        self.tasks: Optional[Dict[str, ScheduledTask]] = None
+        # Why the last snapshot could not be taken; its tasks are then unknown, not missing
+        self.error: Optional[str] = None
+
+    def refresh(self) -> Dict[str, ScheduledTask]:
+        """
+        Reload the snapshot from schtasks.
+
+        Returns:
+            dict: Normalized task path -> ScheduledTask (empty if the query
+            failed, in which case `error` says why)
+        """
+        result = self.runner(["schtasks", "/query", "/fo", "CSV", "/v"])
+        if result.returncode == 0:
+            self.tasks, self.error = parse_schtasks_csv(result.stdout), None
+        else:
+            self.tasks = {}
+            if result.timed_out:
+                self.error = "schtasks timed out"
+            else:
+                self.error = (result.stderr or result.stdout).strip() or f"schtasks exited with {result.returncode}"
+        return self.tasks
+
+    def get(self, task_path: str) -> Optional[ScheduledTask]:
+        """
+        Look up a task, taking the snapshot on first use.
+
+        Args:
+            task_path: The task path (e.g. Microsoft\\Windows\\...\\Consolidator)
+
+        Returns:
+            ScheduledTask: The task, or None if it does not exist
+        """
+        if self.tasks is None:
+            self.refresh()
+        return self.tasks.get(normalize_task_path(task_path))
+
+    def exists(self, task_path: str) -> bool:
+        """Check if a scheduled task exists."""
+        return self.get(task_path) is not None
+
+    def is_enabled(self, task_path: str) -> bool:
+        """Check if a scheduled task exists and is enabled."""
+        task = self.get(task_path)
+        return task is not None and task.enabled
+
+    def _change(self, task_path: str, enable: bool) -> TaskResult:
+        started = time.perf_counter()
+        result = self.runner(["schtasks", "/change", "/tn", task_path, "/enable" if enable else "/disable"])
+        duration = time.perf_counter() - started
+        if result.returncode != 0:
+            error = (result.stderr or result.stdout).strip() or f"schtasks exited with {result.returncode}"
+            return TaskResult(task_path, False, error=error, duration=duration)
+        key = normalize_task_path(task_path)
+        self.tasks[key] = self.tasks[key]._replace(status="Ready" if enable else "Disabled", enabled=enable)
+        return TaskResult(task_path, True, changed=True, duration=duration)
+
+    def _set_enabled(self, task_paths: Iterable[str], enable: bool) -> List[TaskResult]:
+        task_paths = list(task_paths)
+        if self.tasks is None:
+            self.refresh()
+        if self.error is not None:
+            # Without a listing a task cannot be told apart from a missing one
+            error = f"Could not list scheduled tasks: {self.error}"
+            return [TaskResult(task_path, False, error=error) for task_path in task_paths]
+        results: List[Optional[TaskResult]] = [None] * len(task_paths)
+        pending = []
+        for index, task_path in enumerate(task_paths):
+            task = self.get(task_path)
+            if task is None:
+                results[index] = TaskResult(task_path, False, exists=False, error="Task not found")
+            elif task.enabled == enable:
+                results[index] = TaskResult(task_path, True)
+            else:
+                pending.append(index)
+
+        journal = self.journal or get_journal()
+        if pending and journal is not None:
+            try:
+                journal.record([TaskPrior(task_paths[index], not enable) for index in pending])
+            except OSError as e:
+                for index in pending:
+                    results[index] = TaskResult(task_paths[index], False, error=f"Could not journal prior state: {str(e)}")
+                return results
+
+        if len(pending) == 1:
+            results[pending[0]] = self._change(task_paths[pending[0]], enable)
+        elif pending:
+            # Each schtasks /change touches a different task, so they can run side by side
+            workers = max(1, min(self.max_workers, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                changed = pool.map(lambda path: self._change(path, enable), [task_paths[index] for index in pending])
+                for index, result in zip(pending, changed):
+                    results[index] = result
+
+        return results
+
+    def disable(self, task_paths: Iterable[str]) -> List[TaskResult]:
+        """
+        Disable tasks, skipping missing and already disabled ones.
+
+        Args:
+            task_paths: The tasks to disable
+
+        Returns:
+            list: One TaskResult per task, in the same order
+        """
+        return self._set_enabled(task_paths, False)
+
+    def enable(self, task_paths: Iterable[str]) -> List[TaskResult]:
+        """
+        Enable tasks, skipping missing and already enabled ones.
+
+        Args:
+            task_paths: The tasks to enable
+
+        Returns:
+            list: One TaskResult per task, in the same order
+        """
+        return self._set_enabled(task_paths, True)
@@ -0,0 +1,238 @@
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Tracing is off unless a tracer is set; every hook checks this one global first
+_active_tracer: Optional["Tracer"] = None
+
+
+class _Frame:
+    """A span that is still open on a thread's stack."""
+
+    __slots__ = ("name", "start", "children")
+
+    def __init__(self, name: str, start: float):
+        self.name = name
+        self.start = start
+        self.children = 0.0  # Time spent in nested spans, for self time
+
+
+class Tracer:
+    """
+    Record nested spans with their timestamps and thread ids.
+
+    Each thread keeps its own stack of open spans, so spans nest per thread.
+    The recording can be written in Chrome trace-event format (for
+    chrome://tracing, Perfetto or speedscope) or as folded stacks with self
+    times (for flamegraph.pl).
+    """
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.folded: Dict[str, float] = {}
+        self.threads: Dict[int, str] = {}
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def begin(self, name: str) -> _Frame:
+        """Open a span on the calling thread."""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = _Frame(name, time.perf_counter())
+        stack.append(frame)
+        return frame
+
+    def end(self, frame: _Frame, category: str, args: Optional[Dict[str, Any]] = None) -> None:
+        """Close the innermost span of the calling thread and record it."""
+        duration = time.perf_counter() - frame.start
+        stack = self._local.stack
+        path = ";".join(open_frame.name for open_frame in stack)
+        stack.pop()
+        if stack:
+            stack[-1].children += duration
+        thread = threading.current_thread()
+        event = {
+            "name": frame.name,
+            "cat": category,
+            "ph": "X",
+            "ts": (frame.start - self._origin) * 1e6,
+            "dur": duration * 1e6,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+            self.threads[thread.ident] = thread.name
+            stack_key = f"{thread.name};{path}"
+            self.folded[stack_key] = self.folded.get(stack_key, 0.0) + duration - frame.children
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """
+        Build the recording in Chrome trace-event format.
+
+        Returns:
+            dict: {'traceEvents': [...]} with complete ('X') events and thread names
+        """
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+            names = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in self.threads.items()
+            ]
+        return {"traceEvents": names + events, "displayTimeUnit": "ms"}
+
+    def folded_stacks(self) -> List[str]:
+        """
+        Build the recording as folded stacks, e.g. 'MainThread;a;b 1200'.
+
+        Returns:
+            list: One line per distinct stack, with its self time in microseconds
+        """
+        with self._lock:
+            return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in sorted(self.folded.items())]
+
+    def write(self, path: str) -> None:
+        """
+        Write the recording: folded stacks if the file name ends in .folded,
+        Chrome trace-event JSON otherwise.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            if path.lower().endswith(".folded"):
+                f.write("\n".join(self.folded_stacks()) + "\n")
+            else:
+                json.dump(self.chrome_trace(), f)
+
+
+class _Span:
+    """Context manager recording one span on the active tracer."""
+
+    __slots__ = ("tracer", "name", "category", "args", "frame")
+
+    def __init__(self, tracer: Tracer, name: str, category: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.frame = self.tracer.begin(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args = dict(self.args, error=exc_type.__name__)
+        self.tracer.end(self.frame, self.category, self.args)
+        return False
+
+
+class _NoSpan:
+    """Context manager doing nothing, used while tracing is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Trace:
+    @staticmethod
+    def span(name: str, category: str = "app", **args):
+        """
+        Context manager recording a span while tracing is on.
+
+        Args:
+            name: Span name
+            category: Span category (e.g. 'registry', 'command')
+            **args: Extra details shown with the span
+
+        Returns:
+            A context manager; a shared no-op one while tracing is off
+        """
+        tracer = _active_tracer
+        if tracer is None:
+            return _NO_SPAN
+        return _Span(tracer, name, category, args)
+
+    @staticmethod
+    def traced(func, category: str = "app"):
+        """
+        Decorator recording a span named after the function for every call.
+
+        Args:
+            func: The function to decorate
+            category: Span category
+
+        Returns:
+            The decorated function; while tracing is off it only adds one check
+        """
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _active_tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            frame = tracer.begin(name)
+            error = None
+            try:
+                return func(*args, **kwargs)
+            except BaseException as e:
+                error = {"error": type(e).__name__}
+                raise
+            finally:
+                tracer.end(frame, category, error)
+        return wrapper
+
+    @staticmethod
+    def traced_class(category: str):
+        """
+        Class decorator applying traced to every public method, static and
+        class methods included.
+
+        Args:
+            category: Span category for all methods of the class
+
+        Returns:
+            The class decorator
+        """
+        def decorate(cls):
+            for name, member in list(vars(cls).items()):
+                if name.startswith("_"):
+                    continue
+                if isinstance(member, staticmethod):
+                    setattr(cls, name, staticmethod(Trace.traced(member.__func__, category)))
+                elif isinstance(member, classmethod):
+                    setattr(cls, name, classmethod(Trace.traced(member.__func__, category)))
+                elif callable(member) and not isinstance(member, type):
+                    setattr(cls, name, Trace.traced(member, category))
+            return cls
+        return decorate
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Get the tracer recording the current run, if tracing is on."""
+    return _active_tracer
+
+
+def set_tracer(tracer: Optional[Tracer]) -> None:
+    """
+    Turn tracing on or off.
+
+    Args:
+        tracer: The tracer to record spans in, or None to stop tracing
+    """
+    global _active_tracer
+    _active_tracer = tracer
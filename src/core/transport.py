@@ -0,0 +1,285 @@
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .backend import PlatformBackend, get_backend
+from .command_runner import CommandResult, command_deadline, run_command
+from .registry_backend import RegistryBackend, RegistryChangeSource, RemoteWinregBackend
+from .scm import NativeServiceApi
+from .service_manager import ServiceApi, ServiceCall
+from .simulator import SimulatorBackend
+
+LOCAL_HOSTS = ("localhost", ".", "127.0.0.1")
+# Win32 ERROR_TIMEOUT, reported for service calls made after a host's deadline
+ERROR_TIMEOUT = 1460
+
+# A transport is the platform backend of one host in the inventory. The
+# registry, service and task layers only talk to a host through it, so the
+# same plan can be applied locally, remotely or to a simulated host.
+Transport = PlatformBackend
+SimulatedTransport = SimulatorBackend
+
+
+class LocalTransport(PlatformBackend):
+    """The machine the tool runs on, through the current platform backend."""
+
+    def __init__(self, host: str = "localhost"):
+        super().__init__(host)
+
+    @property
+    def registry(self) -> RegistryBackend:
+        return get_backend().registry
+
+    def run(self, args: List[str]) -> CommandResult:
+        return get_backend().run(args)
+
+    @property
+    def services(self) -> ServiceApi:
+        return get_backend().services
+
+    def start_process(self, args: List[str]) -> bool:
+        return get_backend().start_process(args)
+
+    def shell_ready(self) -> Optional[bool]:
+        return get_backend().shell_ready()
+
+    def refresh_shell(self) -> bool:
+        return get_backend().refresh_shell()
+
+    def is_admin(self) -> bool:
+        return get_backend().is_admin()
+
+
+class RemoteTransport(PlatformBackend):
+    """
+    Another Windows machine, reached through the Remote Registry service, its
+    service control manager, and the remote options of sc (\\\\host),
+    schtasks (/s host) and taskkill (/s host).
+    """
+
+    def __init__(self, host: str):
+        super().__init__(host)
+        self._registry = RemoteWinregBackend(host)
+        self._services: Optional[ServiceApi] = None
+
+    @property
+    def registry(self) -> RegistryBackend:
+        return self._registry
+
+    def run(self, args: List[str]) -> CommandResult:
+        tool = args[0].lower()
+        if tool in ("sc", "sc.exe"):
+            args = [args[0], f"\\\\{self.host}"] + list(args[1:])
+        elif tool in ("schtasks", "schtasks.exe", "taskkill", "taskkill.exe"):
+            args = [args[0], args[1], "/s", self.host] + list(args[2:]) if len(args) > 1 else list(args)
+        return run_command(args)
+
+    @property
+    def services(self) -> ServiceApi:
+        # The remote SCM is opened once over RPC; `sc \\host` is the fallback
+        if self._services is None:
+            try:
+                self._services = NativeServiceApi(self.host)
+            except OSError:
+                self._services = super().services
+        return self._services
+
+    def start_process(self, args: List[str]) -> bool:
+        # Processes cannot be started in a remote user's session
+        return False
+
+    def is_admin(self) -> bool:
+        # Checked by the remote side on every call
+        return True
+
+    def post_actions(self) -> Dict[str, Callable[[], bool]]:
+        return {}
+
+    def close(self) -> None:
+        self._registry.close()
+        if self._services is not None:
+            self._services.close()
+            self._services = None
+
+
+class _Deadline:
+    """A host's time.monotonic() deadline, shared by the wrappers of one transport."""
+
+    def __init__(self, host: str, deadline: float, limit: float):
+        self.host = host
+        self.deadline = deadline
+        self.limit = limit
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+    @property
+    def message(self) -> str:
+        return f"Time limit of {self.limit} seconds for {self.host} reached"
+
+    def check(self) -> None:
+        """
+        Raises:
+            TimeoutError: If the deadline has passed (an OSError, so callers treat it as a failed call)
+        """
+        if self.expired:
+            raise TimeoutError(self.message)
+
+
+class DeadlineRegistryBackend(RegistryBackend):
+    """Registry backend that fails every call once the host's deadline has passed."""
+
+    def __init__(self, inner: RegistryBackend, deadline: _Deadline):
+        self.inner = inner
+        self.deadline = deadline
+
+    def open_key(self, hive: int, key_path: str, create: bool = False, write: bool = False) -> Any:
+        self.deadline.check()
+        return self.inner.open_key(hive, key_path, create, write)
+
+    def close_key(self, handle: Any) -> None:
+        # Handles are always released, also after the deadline
+        self.inner.close_key(handle)
+
+    def set_value(self, handle: Any, value_name: str, value_type: int, value: Any) -> None:
+        self.deadline.check()
+        self.inner.set_value(handle, value_name, value_type, value)
+
+    def delete_value(self, handle: Any, value_name: str) -> None:
+        self.deadline.check()
+        self.inner.delete_value(handle, value_name)
+
+    def query_value(self, handle: Any, value_name: str) -> Tuple[Any, int]:
+        self.deadline.check()
+        return self.inner.query_value(handle, value_name)
+
+    def query_info_key(self, handle: Any) -> Tuple[int, int, int]:
+        self.deadline.check()
+        return self.inner.query_info_key(handle)
+
+    def enum_keys(self, handle: Any) -> List[str]:
+        self.deadline.check()
+        return self.inner.enum_keys(handle)
+
+    def load_hive(self, name: str, file_path: str) -> None:
+        self.deadline.check()
+        self.inner.load_hive(name, file_path)
+
+    def unload_hive(self, name: str) -> None:
+        self.inner.unload_hive(name)
+
+    def change_source(self) -> RegistryChangeSource:
+        return self.inner.change_source()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+
+class DeadlineServiceApi(ServiceApi):
+    """
+    Service API that fails every call once the host's deadline has passed,
+    and caps the timeout of `sc` commands at it.
+    """
+
+    def __init__(self, inner: ServiceApi, deadline: _Deadline):
+        self.inner = inner
+        self.deadline = deadline
+
+    def _call(self, call: Callable[[], ServiceCall]) -> ServiceCall:
+        if self.deadline.expired:
+            return ServiceCall(ERROR_TIMEOUT, message=self.deadline.message)
+        with command_deadline(self.deadline.deadline):
+            return call()
+
+    def enumerate(self) -> Optional[Dict[str, int]]:
+        if self.deadline.expired:
+            return None
+        with command_deadline(self.deadline.deadline):
+            return self.inner.enumerate()
+
+    def query_state(self, service_name: str) -> ServiceCall:
+        return self._call(lambda: self.inner.query_state(service_name))
+
+    def query_start_type(self, service_name: str) -> ServiceCall:
+        return self._call(lambda: self.inner.query_start_type(service_name))
+
+    def set_start_type(self, service_name: str, start_type: int) -> ServiceCall:
+        return self._call(lambda: self.inner.set_start_type(service_name, start_type))
+
+    def stop(self, service_name: str) -> ServiceCall:
+        return self._call(lambda: self.inner.stop(service_name))
+
+    def start(self, service_name: str) -> ServiceCall:
+        return self._call(lambda: self.inner.start(service_name))
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class DeadlineTransport(PlatformBackend):
+    """
+    Transport that stops working on a host once its time limit is used up.
+
+    Commands are started with their timeout capped at the deadline, so one
+    still running then is killed. Registry and service calls made after the
+    deadline fail right away, without reaching the host. A registry or
+    service call already in flight cannot be interrupted and is waited for.
+    """
+
+    def __init__(self, inner: PlatformBackend, limit: float, start: Optional[float] = None):
+        super().__init__(inner.host)
+        self.inner = inner
+        self.deadline = _Deadline(inner.host, (time.monotonic() if start is None else start) + limit, limit)
+        self._registry: Optional[DeadlineRegistryBackend] = None
+        self._services: Optional[DeadlineServiceApi] = None
+
+    @property
+    def registry(self) -> RegistryBackend:
+        if self._registry is None:
+            self._registry = DeadlineRegistryBackend(self.inner.registry, self.deadline)
+        return self._registry
+
+    @property
+    def services(self) -> ServiceApi:
+        if self._services is None:
+            self._services = DeadlineServiceApi(self.inner.services, self.deadline)
+        return self._services
+
+    def run(self, args: List[str]) -> CommandResult:
+        if self.deadline.expired:
+            return CommandResult(list(args), -1, "", self.deadline.message, 0.0, True)
+        with command_deadline(self.deadline.deadline):
+            return self.inner.run(args)
+
+    def start_process(self, args: List[str]) -> bool:
+        return not self.deadline.expired and self.inner.start_process(args)
+
+    def is_admin(self) -> bool:
+        return self.inner.is_admin()
+
+    def shell_ready(self) -> Optional[bool]:
+        return self.inner.shell_ready()
+
+    def refresh_shell(self) -> bool:
+        return not self.deadline.expired and self.inner.refresh_shell()
+
+    def post_actions(self) -> Dict[str, Callable[[], bool]]:
+        own = {"restart_explorer": self.restart_explorer, "refresh_shell": self.refresh_shell}
+        return {name: own.get(name, action) for name, action in self.inner.post_actions().items()}
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+def connect(host: str) -> Transport:
+    """
+    Create the transport for a host name from an inventory.
+
+    Args:
+        host: Host name; 'localhost' or '.' means this machine
+
+    Returns:
+        Transport: LocalTransport or RemoteTransport
+    """
+    if host.lower() in LOCAL_HOSTS:
+        return LocalTransport(host)
+    return RemoteTransport(host)
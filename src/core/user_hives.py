@@ -0,0 +1,209 @@
+import ntpath
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+from .log_manager import LogManager
+from .planner import ExecutionPlan
+from .registry_backend import HKEY_CURRENT_USER, HKEY_LOCAL_MACHINE, HKEY_USERS, RegistryBackend, get_registry_backend
+from .registry_manager import RegistryOperationResult, RegistryTransaction
+
+PROFILE_LIST_KEY = r"SOFTWARE\Microsoft\Windows NT\CurrentVersion\ProfileList"
+# Local and domain user accounts; the service accounts (S-1-5-18/19/20) are left alone
+USER_SID_PREFIX = "S-1-5-21-"
+
+# Hive files in a profile directory: HKCU itself, and HKCU\Software\Classes,
+# which Windows mounts separately as HKEY_USERS\<SID>_Classes
+NTUSER_FILE = "NTUSER.DAT"
+USRCLASS_FILE = r"AppData\Local\Microsoft\Windows\UsrClass.dat"
+CLASSES_PATH = r"Software\Classes"
+CLASSES_SUFFIX = "_Classes"
+
+
+class UserProfile(NamedTuple):
+    """A user profile registered on the machine."""
+    sid: str
+    path: str  # Profile directory, e.g. C:\Users\name
+
+
+class UserHiveResult(NamedTuple):
+    """Outcome of applying the HKEY_CURRENT_USER part of a plan to one user."""
+    sid: str
+    path: str
+    registry: List[RegistryOperationResult]
+    mounted: List[str]  # Hives that were loaded from their files for the run
+    error: Optional[str] = None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None and all(result.success for result in self.registry)
+
+    @property
+    def changes(self) -> int:
+        return sum(1 for result in self.registry if result.success and not result.compliant)
+
+
+def list_user_profiles(registry: Optional[RegistryBackend] = None) -> List[UserProfile]:
+    """
+    List the user profiles of the machine from the ProfileList key.
+
+    Args:
+        registry: The registry to read (default: the current backend)
+
+    Returns:
+        list: One UserProfile per user account with a profile directory
+    """
+    registry = registry or get_registry_backend()
+    try:
+        handle = registry.open_key(HKEY_LOCAL_MACHINE, PROFILE_LIST_KEY)
+    except OSError:
+        return []
+    try:
+        # SIDs are case-insensitive; S-1-5-... is their canonical form
+        sids = [sid.upper() for sid in registry.enum_keys(handle) if sid.upper().startswith(USER_SID_PREFIX)]
+    finally:
+        registry.close_key(handle)
+
+    profiles = []
+    for sid in sids:
+        try:
+            key = registry.open_key(HKEY_LOCAL_MACHINE, f"{PROFILE_LIST_KEY}\\{sid}")
+        except OSError:
+            continue
+        try:
+            path, _ = registry.query_value(key, "ProfileImagePath")
+        except OSError:
+            continue
+        finally:
+            registry.close_key(key)
+        # Stored as REG_EXPAND_SZ, e.g. %SystemDrive%\Users\name
+        profiles.append(UserProfile(sid, os.path.expandvars(path)))
+    return profiles
+
+
+def user_location(sid: str, key_path: str) -> Tuple[str, str]:
+    """
+    Map a HKEY_CURRENT_USER key path to where it lives for a given user.
+
+    Args:
+        sid: The user's SID
+        key_path: Path below HKEY_CURRENT_USER
+
+    Returns:
+        tuple: (name of the hive under HKEY_USERS, path below HKEY_USERS)
+    """
+    path = key_path.strip("\\")
+    if path.lower() == CLASSES_PATH.lower() or path.lower().startswith(CLASSES_PATH.lower() + "\\"):
+        hive = sid + CLASSES_SUFFIX
+        rest = path[len(CLASSES_PATH) + 1:]
+    else:
+        hive, rest = sid, path
+    return hive, f"{hive}\\{rest}" if rest else hive
+
+
+def mount_user_hives(registry: RegistryBackend, profile: UserProfile, hives: Iterable[str], mounted: List[str]) -> None:
+    """
+    Load the hive files of a user that are not mounted under HKEY_USERS yet.
+
+    Args:
+        registry: The registry to load them into
+        profile: The user
+        hives: Names under HKEY_USERS, e.g. '<SID>' and '<SID>_Classes'
+        mounted: Gets the names of the hives that were loaded, to unload them later
+
+    Raises:
+        OSError: If a hive file cannot be loaded (the ones loaded before stay in `mounted`)
+    """
+    for hive in sorted(hives):
+        if registry.key_exists(HKEY_USERS, hive):
+            continue  # The user is logged on
+        file_name = USRCLASS_FILE if hive.upper().endswith(CLASSES_SUFFIX.upper()) else NTUSER_FILE
+        registry.load_hive(hive, ntpath.join(profile.path, file_name))
+        mounted.append(hive)
+
+
+def unmount_user_hives(registry: RegistryBackend, mounted: List[str]) -> List[str]:
+    """
+    Unload hives loaded by mount_user_hives, in reverse order.
+
+    Returns:
+        list: One error message per hive that could not be unloaded
+    """
+    errors = []
+    for hive in reversed(mounted):
+        try:
+            registry.unload_hive(hive)
+        except OSError as e:
+            errors.append(f"Could not unload HKEY_USERS\\{hive}: {str(e)}")
+    return errors
+
+
+class UserHiveApplier:
+    """
+    Apply the HKEY_CURRENT_USER part of a plan to every user profile.
+
+    A user who is logged on already has their hives mounted under
+    HKEY_USERS\\<SID> (and <SID>_Classes) and is changed in place. For
+    everyone else, NTUSER.DAT and UsrClass.dat are loaded from the profile
+    directory under the same names, written, and unloaded again. Users are
+    processed `max_workers` at a time. Changes go through RegistryTransaction,
+    so they are journaled like every other registry change.
+    """
+
+    def __init__(self, registry: Optional[RegistryBackend] = None, max_workers: int = 4):
+        self.registry = registry or get_registry_backend()
+        self.max_workers = max_workers
+        self.logger = LogManager().get_logger('Users')
+
+    def apply_user(self, profile: UserProfile, plan: ExecutionPlan) -> UserHiveResult:
+        """
+        Apply the HKEY_CURRENT_USER values of a plan to one user.
+
+        Args:
+            profile: The user
+            plan: The plan; values in other hives are ignored
+
+        Returns:
+            UserHiveResult: Per-value results and the hives that were loaded
+        """
+        transaction = RegistryTransaction(self.registry)
+        hives = set()
+        for planned in plan.registry_values():
+            if planned.hive != HKEY_CURRENT_USER:
+                continue
+            hive, path = user_location(profile.sid, planned.path)
+            hives.add(hive)
+            transaction.set_value(path, planned.name, planned.value, planned.value_type, HKEY_USERS)
+
+        mounted: List[str] = []
+        try:
+            mount_user_hives(self.registry, profile, hives, mounted)
+            results = transaction.commit(skip_compliant=True)
+        except OSError as e:
+            return UserHiveResult(profile.sid, profile.path, [], mounted, f"Could not load the user's hive: {str(e)}")
+        finally:
+            for error in unmount_user_hives(self.registry, mounted):
+                self.logger.error(error)
+
+        result = UserHiveResult(profile.sid, profile.path, results, mounted)
+        status = "success" if result.success else "error"
+        self.logger.info("User %s (%s): %d change(s), %s", profile.sid, profile.path, result.changes, status, extra={
+            'feature': self.logger.name, 'operation': 'apply_user', 'target': profile.sid, 'result': status})
+        return result
+
+    def apply(self, plan: ExecutionPlan, profiles: Optional[List[UserProfile]] = None) -> List[UserHiveResult]:
+        """
+        Apply the HKEY_CURRENT_USER values of a plan to every user profile.
+
+        Args:
+            plan: The plan
+            profiles: The users (default: every profile on the machine)
+
+        Returns:
+            list: One UserHiveResult per user, in the order of the profiles
+        """
+        if profiles is None:
+            profiles = list_user_profiles(self.registry)
+        if not profiles or not any(planned.hive == HKEY_CURRENT_USER for planned in plan.registry_values()):
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(profiles)))) as pool:
+            return list(pool.map(lambda profile: self.apply_user(profile, plan), profiles))
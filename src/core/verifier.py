@@ -0,0 +1,191 @@
+from typing import Any, Iterable, List, NamedTuple, Optional
+from .planner import ExecutionPlan, build_plan
+from .profiles import Profile
+from .registry_backend import HIVE_NAMES, HKEY_LOCAL_MACHINE, REG_DWORD, RegistryBackend
+from .registry_manager import RegistryTransaction
+from .service_manager import SERVICE_STOPPED, SERVICES_KEY, START_TYPE_ARGS, ServiceController
+from .task_manager import TaskInventory
+from .tracing import Trace
+
+# Start value of a disabled service (SERVICE_DISABLED)
+_DISABLED = 4
+_STATE_NAMES = {1: "stopped", 2: "start pending", 3: "stop pending", 4: "running"}
+
+
+class CheckResult(NamedTuple):
+    """Desired and actual state of one target."""
+    kind: str  # 'registry', 'service' or 'task'
+    target: str
+    expected: Any
+    actual: Any
+    compliant: bool
+
+
+class ComplianceReport(NamedTuple):
+    """
+    Result of checking a plan against a host.
+
+    `complete` is False if part of the state could not be read (e.g. the
+    service enumeration failed); the affected targets are reported as not
+    compliant.
+    """
+    items: List[CheckResult]
+    complete: bool = True
+
+    @property
+    def success(self) -> bool:
+        return self.complete
+
+    @property
+    def changes(self) -> int:
+        """Number of targets that are not in the desired state."""
+        return sum(1 for item in self.items if not item.compliant)
+
+    @property
+    def compliant(self) -> int:
+        """Number of targets already in the desired state."""
+        return sum(1 for item in self.items if item.compliant)
+
+    @property
+    def is_compliant(self) -> bool:
+        return self.complete and self.changes == 0
+
+    @property
+    def drifted(self) -> List[CheckResult]:
+        return [item for item in self.items if not item.compliant]
+
+
+@Trace.traced_class("verify")
+class Verifier:
+    """
+    Check that a host is in the state a plan describes, without changing it.
+
+    Every planned registry key is opened once and all its values are read
+    through the same handle. Services are checked from the Start value of
+    their configuration key, plus one service enumeration if any service has
+    to be stopped, and tasks from one schtasks snapshot. Services and tasks
+    that do not exist count as compliant, the same way applying them does.
+    """
+
+    def __init__(
+        self,
+        registry_backend: Optional[RegistryBackend] = None,
+        service_controller: Optional[ServiceController] = None,
+        task_inventory: Optional[TaskInventory] = None
+    ):
+        self.registry_backend = registry_backend
+        self.service_controller = service_controller
+        self.task_inventory = task_inventory
+
+    @classmethod
+    def for_transport(cls, transport) -> "Verifier":
+        """
+        Create a verifier that checks the host behind a transport.
+
+        Args:
+            transport: The Transport of the host
+
+        Returns:
+            Verifier: Verifier using the transport's registry, services and commands
+        """
+        return cls(transport.registry, ServiceController(api=transport.services), TaskInventory(transport.run))
+
+    def check_registry(self, plan: ExecutionPlan) -> List[CheckResult]:
+        """Compare every planned registry value with the current one."""
+        transaction = RegistryTransaction(self.registry_backend)
+        for planned in plan.registry_values():
+            transaction.set_value(planned.path, planned.name, planned.value, planned.value_type, planned.hive)
+        results = []
+        for diff in transaction.diff():
+            operation = diff.operation
+            target = f"{HIVE_NAMES.get(operation.hive, operation.hive)}\\{operation.key_path}\\{operation.value_name}"
+            results.append(CheckResult("registry", target, operation.value, diff.current if diff.exists else None, diff.compliant))
+        return results
+
+    def check_services(self, plan: ExecutionPlan) -> Optional[List[CheckResult]]:
+        """
+        Check the start type and state of every planned service.
+
+        Returns:
+            list: The results, or None if the service states could not be read
+        """
+        requests = list(plan.services.values())
+        transaction = RegistryTransaction(self.registry_backend)
+        for request in requests:
+            transaction.set_value(f"{SERVICES_KEY}\\{request.service_name}", "Start", _DISABLED, REG_DWORD, HKEY_LOCAL_MACHINE)
+        configs = transaction.diff()
+
+        # States only matter for installed services that have to be stopped
+        states = {}
+        if any("stop" in request.actions and config.exists for request, config in zip(requests, configs)):
+            controller = self.service_controller or ServiceController()
+            states = controller.query_all()
+            if states is None:
+                return None
+
+        results = []
+        for request, config in zip(requests, configs):
+            installed = config.exists
+            if "disable" in request.actions:
+                actual = START_TYPE_ARGS.get(config.current, config.current) if installed else "not installed"
+                results.append(CheckResult("service", f"{request.service_name} start type", "disabled", actual,
+                                           not installed or config.compliant))
+            if "stop" in request.actions:
+                state = states.get(request.service_name.lower()) if installed else None
+                actual = _STATE_NAMES.get(state, state) if state is not None else "not installed"
+                results.append(CheckResult("service", f"{request.service_name} state", "stopped", actual,
+                                           state is None or state == SERVICE_STOPPED))
+        return results
+
+    def check_tasks(self, plan: ExecutionPlan) -> Optional[List[CheckResult]]:
+        """
+        Check that every planned task is disabled, from one fresh schtasks snapshot.
+
+        Returns:
+            list: The results, or None if the tasks could not be listed
+        """
+        if not plan.tasks:
+            return []
+        inventory = self.task_inventory or TaskInventory()
+        inventory.refresh()
+        if inventory.error is not None:
+            return None
+        results = []
+        for path in plan.tasks.values():
+            task = inventory.get(path)
+            actual = "not found" if task is None else ("enabled" if task.enabled else "disabled")
+            results.append(CheckResult("task", path, "disabled", actual, task is None or not task.enabled))
+        return results
+
+    def verify(self, plan: ExecutionPlan) -> ComplianceReport:
+        """
+        Check every registry value, service and task of a plan.
+
+        Args:
+            plan: The desired state
+
+        Returns:
+            ComplianceReport: One CheckResult per target
+        """
+        items = self.check_registry(plan)
+        services = self.check_services(plan)
+        complete = services is not None
+        if services is None:
+            services = [
+                CheckResult("service", request.service_name, " and ".join(request.actions), "unknown", False)
+                for request in plan.services.values()
+            ]
+        tasks = self.check_tasks(plan)
+        if tasks is None:
+            complete = False
+            tasks = [CheckResult("task", path, "disabled", "unknown", False) for path in plan.tasks.values()]
+        items += services + tasks
+        return ComplianceReport(items, complete)
+
+    def verify_profiles(self, profiles: Iterable[Profile]) -> ComplianceReport:
+        """Check the merged desired state of some profiles (see verify)."""
+        return self.verify(build_plan(profiles))
+
+    def execute(self, plan: ExecutionPlan) -> ComplianceReport:
+        """Same as verify, so a Verifier can stand in for a PlanExecutor (e.g. in FleetExecutor)."""
+        return self.verify(plan)
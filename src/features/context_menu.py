@@ -1,43 +1,42 @@
-import winreg
-import subprocess
+from ..core.post_actions import RESTART_EXPLORER, request_post_action
+from ..core.profiles import load_profile
+from ..core.registry_manager import RegistryManager, RegistryTransaction
+from ..core.tracing import Trace
 
+@Trace.traced_class("feature")
 class ContextMenuManager:
     def __init__(self):
-        self.path = r"Software\Classes\CLSID\{86ca1aa0-34aa-4e8b-a509-50c905bae2a2}\InprocServer32"
+        self.profile = load_profile('context_menu')
+        self.path = self.profile.registry[0].path
+        self.hive = self.profile.registry[0].hive
 
     def create_old_context_menu_key(self):
         """
         Create the registry key to activate the older Windows 10 context menu.
         """
-        try:
-            # Create the registry key
-            key = winreg.CreateKey(winreg.HKEY_CURRENT_USER, self.path)
-            winreg.SetValueEx(key, "", 0, winreg.REG_SZ, "")  # Set default value to an empty string
-            winreg.CloseKey(key)
+        # Create the registry key with its default value set to an empty string
+        transaction = RegistryTransaction().set_values(self.path, self.profile.registry[0].values, hive=self.hive)
+        result = transaction.commit()[0]
+        if result.success:
             print(f"Successfully created registry key: {self.path}")
-        except WindowsError as e:
-            print(f"Failed to create registry key {self.path}: {str(e)}")
+        else:
+            print(f"Failed to create registry key {self.path}: {result.error}")
 
     def check_key_exists(self):
         """
         Check if the context menu registry key exists.
         """
-        try:
-            key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, self.path)
-            winreg.CloseKey(key)
-            return True
-        except WindowsError:
-            return False
+        return RegistryManager.key_exists(self.path, self.hive)
         
     def restart_explorer(self):
-        try:
-            #Stop the process explorer
-            subprocess.run(["taskkill","/f", "/im", "explorer.exe"], check=True)
-            #Start it
-            subprocess.run(["start", "explorer.exe"], shell=True)
+        # Coalesced with the restarts and refreshes of other features when run from main
+        restarted = request_post_action(RESTART_EXPLORER, self.profile.name)
+        if restarted is None:
+            print("Explorer will be restarted at the end of the run")
+        elif restarted:
             print("Explorer restarted")
-        except subprocess.CalledProcessError as e:
-            print(f"Failed to restart: {str(e)}")
+        else:
+            print("Failed to restart explorer")
 
     def old_context_menu_all(self):
         if self.check_key_exists():
@@ -1,14 +1,19 @@
-import winreg
+from ..core.profiles import load_profile
+from ..core.registry_manager import RegistryTransaction
+from ..core.tracing import Trace
 
+@Trace.traced_class("feature")
 class CopilotManager:
     def __init__(self):
-        self.path = r"Software\Classes\CLSID\{86ca1aa0-34aa-4e8b-a509-50c905bae2a2}\InprocServer32"
+        self.profile = load_profile('copilot')
+        self.path = self.profile.registry[0].path
 
     def disable_copilot(self):
-        try:
-            key = winreg.CreateKeyEx(winreg.HKEY_CURRENT_USER, self.path, 0, winreg.KEY_WRITE)
-            winreg.SetValueEx(key, "DisableCopilot", 0, winreg.REG_DWORD, 1) #Set value 1
-            winreg.CloseKey(key)
+        transaction = RegistryTransaction()
+        for entry in self.profile.registry:
+            transaction.set_values(entry.path, entry.values, hive=entry.hive) #Set TurnOffWindowsCopilot to 1
+        failed = [result for result in transaction.commit() if not result.success]
+        if not failed:
             print("Successfully disabled Copilot.")
-        except WindowsError as e:
-            print(f"Failed to disable Copilot: {str(e)}.")
\ No newline at end of file
+        else:
+            print(f"Failed to disable Copilot: {failed[0].error}.")
\ No newline at end of file
@@ -1,13 +1,18 @@
-import subprocess
-import winreg
+import time
 from ..core.admin_check import AdminCheck
-from ..core.registry_manager import RegistryManager
-from ..core.service_manager import ServiceManager
+from ..core.registry_backend import HKEY_LOCAL_MACHINE, get_registry_backend
+from ..core.registry_manager import RegistryManager, RegistryTransaction
+from ..core.profiles import load_profile
+from ..core.service_manager import ServiceController, ServiceManager, ServiceRequest
 from ..core.log_manager import LogManager
+from ..core.verifier import Verifier
+from ..core.tracing import Trace
 
+@Trace.traced_class("feature")
 class CortanaManager:
     def __init__(self):
         self.is_admin = AdminCheck.is_admin()
+        self.profile = load_profile('cortana')
         self.registry = RegistryManager()
         self.service = ServiceManager()
         self.log_manager = LogManager()
@@ -23,12 +28,7 @@ class CortanaManager:
         Returns:
             bool: True if the key exists, False otherwise
         """
-        try:
-            key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, path)
-            winreg.CloseKey(key)
-            return True
-        except WindowsError:
-            return False
+        return self.registry.key_exists(path)
     
     def create_registry_key(self, path: str) -> bool:
         """
@@ -40,12 +40,13 @@ class CortanaManager:
         Returns:
             bool: True if successful, False otherwise
         """
+        backend = get_registry_backend()
         try:
-            key = winreg.CreateKeyEx(winreg.HKEY_LOCAL_MACHINE, path, 0, winreg.KEY_WRITE)
-            winreg.CloseKey(key)
+            backend.close_key(backend.open_key(HKEY_LOCAL_MACHINE, path, create=True, write=True))
             return True
-        except WindowsError as e:
-            self.logger.error(f"Failed to create registry key {path}: {str(e)}")
+        except OSError as e:
+            self.logger.error("Failed to create registry key %s: %s", path, e, extra={
+                'feature': self.logger.name, 'operation': 'registry_create', 'target': path, 'result': 'error'})
             return False
     
     def disable_cortana_registry(self) -> bool:
@@ -53,90 +54,69 @@ class CortanaManager:
         Disable Cortana through registry modifications.
         Returns True if successful, False otherwise.
         """
-        # Registry path for Cortana settings
-        path = r"SOFTWARE\Microsoft\Windows\CurrentVersion\Search"
-        
-        # Values to set
-        values = {
-            "AllowCortana": 0,
-            "CortanaEnabled": 0,
-            "DisableWebSearch": 1,
-            "BingSearchEnabled": 0
-        }
-        
-        self.logger.info(f"Checking registry path: {path}")
+        # Set values that differ - keys are created on open if they don't exist yet
+        transaction = RegistryTransaction()
+        for entry in self.profile.registry:
+            self.logger.info("Setting values in registry path: %s", entry.path, extra={
+                'feature': self.logger.name, 'operation': 'registry_set', 'target': entry.path})
+            transaction.set_values(entry.path, entry.values, hive=entry.hive)
+        results = transaction.commit(skip_compliant=True)
         
-        # Check if key exists
-        if not self.check_registry_key_exists(path):
-            self.logger.info(f"Registry key does not exist: {path}")
-            if not self.create_registry_key(path):
-                self.logger.error(f"Failed to create registry key: {path}")
-                return False
-        
-        # Set values
-        self.logger.info(f"Setting values in registry path: {path}")
-        if not self.registry.set_multiple_values(path, values):
-            self.log_manager.log_registry_change(self.logger, path, values, False)
-            return False
-        else:
-            self.log_manager.log_registry_change(self.logger, path, values, True)
-            return True
+        success = self.registry.report_failures(results)
+        for entry in self.profile.registry:
+            path_results = [r for r in results if (r.operation.hive, r.operation.key_path) == (entry.hive, entry.path)]
+            changed = {r.operation.value_name: r.operation.value for r in path_results if not r.compliant}
+            if not changed:
+                self.logger.info("Registry path already compliant: %s", entry.path, extra={
+                    'feature': self.logger.name, 'operation': 'registry_set', 'target': entry.path, 'result': 'compliant'})
+                continue
+            path_ok = all(r.success for r in path_results)
+            self.log_manager.log_registry_change(self.logger, entry.path, changed, path_ok,
+                                                 duration=sum(r.duration for r in path_results))
+        return success
     
     def verify_cortana_state(self) -> bool:
         """
-        Verify if Cortana is disabled by checking registry values.
-        Returns True if Cortana appears to be disabled, False otherwise.
+        Verify if Cortana is disabled by checking every registry value and
+        service of the profile.
+        Returns True if Cortana is disabled, False otherwise.
         """
         self.logger.info("Verifying Cortana state")
-        
-        # Check registry values
-        path = r"SOFTWARE\Microsoft\Windows\CurrentVersion\Search"
-        try:
-            key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, path)
-            for value_name in ["AllowCortana", "CortanaEnabled"]:
-                try:
-                    value, _ = winreg.QueryValueEx(key, value_name)
-                    if value != 0:
-                        self.logger.info(f"Registry value {value_name} is not disabled")
-                        winreg.CloseKey(key)
-                        return False
-                except WindowsError:
-                    self.logger.info(f"Registry value {value_name} not found")
-            winreg.CloseKey(key)
-            self.logger.info("Cortana appears to be disabled")
-            return True
-        except WindowsError:
-            self.logger.info("Registry key not found")
-            return True  # Consider it disabled if the key doesn't exist
+        report = Verifier().verify_profiles([self.profile])
+        for item in report.drifted:
+            self.logger.info("%s is %r, expected %r", item.target, item.actual, item.expected, extra={
+                'feature': self.logger.name, 'operation': 'verify', 'target': item.target, 'result': 'drifted'})
+        if report.is_compliant:
+            self.logger.info("Cortana is disabled")
+        return report.is_compliant
     
     def disable_cortana_service(self) -> bool:
         """
         Disable only the Cortana service while keeping Windows Search service intact.
         Returns True if successful, False otherwise.
         """
-        # Only disable Cortana service, not Windows Search service
-        service_name = "Cortana"
-        
-        try:
-            # First check if the service exists
-            result = subprocess.run(["sc", "query", service_name], capture_output=True, text=True)
-            if "The specified service does not exist" in result.stdout:
-                self.logger.info(f"Service {service_name} does not exist - skipping service disable")
-                return True  # Consider this a success since Cortana is effectively disabled
-            
-            # If service exists, try to stop it
-            subprocess.run(["sc", "stop", service_name], check=True)
-            self.logger.info(f"Stopped {service_name} service")
+        # Only the Cortana service is listed in the profile, not Windows Search service
+        success = True
+        controller = ServiceController()
+        for service in self.profile.services:
+            # One query decides existence by exit code, then stop waits for the service to finish stopping
+            result = controller.apply(ServiceRequest(service.name, service.actions))
+            if not result.exists:
+                self.logger.info("Service %s does not exist - skipping service disable", service.name, extra={
+                    'feature': self.logger.name, 'operation': 'service_disable', 'target': service.name, 'result': 'missing'})
+                continue  # Consider this a success since Cortana is effectively disabled
             
-            # Then disable it
-            subprocess.run(["sc", "config", service_name, "start=disabled"], check=True)
-            self.logger.info(f"Disabled {service_name} service")
+            actions = result.actions or {}
+            if actions.get("stop"):
+                self.logger.info("Stopped %s service", service.name, extra={
+                    'feature': self.logger.name, 'operation': 'service_stop', 'target': service.name, 'result': 'success'})
+            if actions.get("disable"):
+                self.logger.info("Disabled %s service", service.name, extra={
+                    'feature': self.logger.name, 'operation': 'service_disable', 'target': service.name, 'result': 'success'})
             
-            self.log_manager.log_service_change(self.logger, service_name, "disable", True)
-            return True
-        except subprocess.CalledProcessError as e:
-            self.log_manager.log_service_change(self.logger, service_name, "disable", False)
-            return False
+            self.log_manager.log_service_change(self.logger, service.name, "disable", result.success, duration=result.duration)
+            success = success and result.success
+        return success
     
     def disable_all_cortana(self) -> bool:
         """
@@ -144,6 +124,7 @@ class CortanaManager:
         Returns True if successful, False otherwise.
         """
         self.logger.info("Starting Cortana disable process")
+        started = time.perf_counter()
         
         if not self.is_admin:
             self.logger.error("Script requires administrator privileges")
@@ -152,7 +133,8 @@ class CortanaManager:
         
         # Check current state
         current_state = self.verify_cortana_state()
-        self.logger.info(f"Current Cortana state: {'Disabled' if current_state else 'Enabled'}")
+        self.logger.info("Current Cortana state: %s", "Disabled" if current_state else "Enabled", extra={
+            'feature': self.logger.name, 'operation': 'verify'})
         
         self.logger.info("Warning: This will disable Cortana personal assistant features")
         self.logger.info("Core Windows Search functionality will remain intact")
@@ -166,15 +148,18 @@ class CortanaManager:
             # Verify changes
             new_state = self.verify_cortana_state()
             if new_state:
-                self.log_manager.log_operation(self.logger, "Cortana disable", "success", "Cortana disabled successfully")
+                self.log_manager.log_operation(self.logger, "Cortana disable", "success", "Cortana disabled successfully",
+                                               duration=time.perf_counter() - started)
                 print("\nSuccessfully disabled Cortana personal assistant features!")
                 print("Note: Core Windows Search functionality remains active.")
             else:
-                self.log_manager.log_operation(self.logger, "Cortana disable", "warning", "Changes applied but verification failed")
+                self.log_manager.log_operation(self.logger, "Cortana disable", "warning", "Changes applied but verification failed",
+                                               duration=time.perf_counter() - started)
                 print("\nChanges applied but some features may still be active.")
                 print("Please check the logs for details.")
         else:
-            self.log_manager.log_operation(self.logger, "Cortana disable", "error", "Failed to disable Cortana")
+            self.log_manager.log_operation(self.logger, "Cortana disable", "error", "Failed to disable Cortana",
+                                           duration=time.perf_counter() - started)
             print("\nFailed to disable Cortana. Check the error messages above.")
         
         return success 
\ No newline at end of file
@@ -1,32 +1,127 @@
-import subprocess
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from ..core.log_manager import LogManager
+from ..core.stream_runner import ProgressEvent, StreamResult, StreamRunner
+from ..core.tracing import Trace
 
+SFC_COMMAND = ["sfc", "/scannow"]
+DISM_SCAN_COMMAND = ["DISM", "/Online", "/Cleanup-Image", "/ScanHealth"]
+DISM_RESTORE_COMMAND = ["DISM", "/Online", "/Cleanup-Image", "/RestoreHealth"]
+
+@Trace.traced_class("feature")
 class IntegrityCheckManager:
+    def __init__(
+        self,
+        runner: Optional[StreamRunner] = None,
+        timeout: Optional[float] = 3600,
+        parallel_scan: bool = False,
+        report_dir: Optional[str] = ''
+    ):
+        """
+        Args:
+            runner: Runner used to start the tools (default: StreamRunner)
+            timeout: Seconds before a stage is killed (default: one hour)
+            parallel_scan: Run the read-only DISM /ScanHealth while sfc runs
+            report_dir: Directory for the JSON report, '' for the log directory
+                (see LogManager.configure), or None for no report
+        """
+        self.runner = runner or StreamRunner()
+        self.timeout = timeout
+        self.parallel_scan = parallel_scan
+        self.report_dir = report_dir
+        self.results: Dict[str, StreamResult] = {}
+        self._print_lock = threading.Lock()
+
+    def print_progress(self, event: ProgressEvent):
+        "Prints a progress update"
+        with self._print_lock:
+            print(f"[{event.stage}] {event.percent:.1f}% ({event.elapsed:.0f}s)")
+
+    def run_stage(self, stage: str, args) -> StreamResult:
+        "Runs one tool and keeps its result for the report"
+        result = self.runner.run(stage, args, self.timeout, on_progress=self.print_progress)
+        self.results[stage] = result
+        return result
+
     def run_sfc(self):
         "Runs sfc command"
         print("Running System File Checker...")
-        try:
-            result = subprocess.run(["sfc", "/scannow"], capture_output=True, text=True)
-            print(result.stdout) #Prints output
-            if result.returncode == 0:
-                print("System File Checker was completed successfully.")
-            else:
-                print("System File Checker encountered issues.")
-        except Exception as e:
-            print(f"The process encountered issues: {str(e)}.")
+        result = self.run_stage("sfc", SFC_COMMAND)
+        if result.lines:
+            print(result.lines[-1]) #Prints the verdict
+        if result.timed_out:
+            print(f"System File Checker timed out after {self.timeout} seconds.")
+        elif result.returncode == 0:
+            print("System File Checker was completed successfully.")
+        else:
+            print("System File Checker encountered issues.")
+        return result
+
+    def run_dism_scan(self):
+        "Runs the read-only DISM component store scan"
+        print("Running DISM ScanHealth")
+        result = self.run_stage("dism-scan", DISM_SCAN_COMMAND)
+        if result.timed_out:
+            print(f"DISM ScanHealth timed out after {self.timeout} seconds.")
+        elif result.returncode != 0:
+            print("DISM ScanHealth encountered issues")
+        return result
 
     def run_dism(self):
         print("Running DISM")
+        result = self.run_stage("dism", DISM_RESTORE_COMMAND)
+        if result.lines:
+            print(result.lines[-1])
+        if result.timed_out:
+            print(f"DISM timed out after {self.timeout} seconds.")
+        elif result.returncode == 0:
+            print("DISM completed successfully.")
+        else:
+            print("DISM encountered issues")
+        return result
+
+    def write_report(self) -> Optional[str]:
+        "Writes the parsed results of all stages to a JSON report"
+        if self.report_dir is None:
+            return None
+        # Resolved here, so a log directory configured after construction applies
+        report_dir = self.report_dir or LogManager.current_log_dir()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(report_dir, f'integrity_{timestamp}.json')
+        report = {
+            stage: {
+                "command": " ".join(result.args),
+                "returncode": result.returncode,
+                "duration": round(result.duration, 3),
+                "timed_out": result.timed_out,
+                "percent": result.percent,
+                "output_tail": result.lines,
+            }
+            for stage, result in self.results.items()
+        }
         try:
-            result = subprocess.run(["DISM", "/Online", "/Cleanup-Image", "/RestoreHealth"], capture_output=True, text=True)
-            print(result.stdout)
-            if result.returncode == 0:
-                print("DISM completed successfully.")
-            else:
-                print("DISM encountered issues")
-        except Exception as e:
-            print(f"The process was not completed: {str(e)}")
+            os.makedirs(report_dir, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            print(f"Failed to write integrity report: {str(e)}")
+            return None
+        print(f"Integrity report written to {path}")
+        return path
 
     def run_integrity_check(self):
-        """Run both"""
+        """Run both, with the DISM scan next to sfc if parallel_scan is set"""
+        self.results = {}
+        scan = None
+        if self.parallel_scan:
+            # ScanHealth only reads the component store, so it can overlap with sfc
+            scan = threading.Thread(target=self.run_dism_scan)
+            scan.start()
         self.run_sfc()
-        self.run_dism()
\ No newline at end of file
+        if scan is not None:
+            scan.join()
+        self.run_dism()
+        self.write_report()
@@ -1,14 +1,20 @@
-import subprocess
 from ..core.admin_check import AdminCheck
-from ..core.registry_manager import RegistryManager
-from ..core.service_manager import ServiceManager
+from ..core.registry_manager import RegistryManager, RegistryTransaction
+from ..core.profiles import load_profile
+from ..core.service_manager import ServiceManager, ServiceRequest
+from ..core.step_scheduler import Step, StepScheduler
+from ..core.task_manager import TaskInventory
 from ..core.log_manager import LogManager
+from ..core.tracing import Trace
 
+@Trace.traced_class("feature")
 class TelemetryManager:
     def __init__(self):
         self.is_admin = AdminCheck.is_admin()
+        self.profile = load_profile('telemetry')
         self.registry = RegistryManager()
         self.service = ServiceManager()
+        self.tasks = TaskInventory()
         self.log_manager = LogManager()
         self.logger = self.log_manager.get_logger('Telemetry')
     
@@ -17,31 +23,26 @@ class TelemetryManager:
         Disable telemetry through registry modifications.
         Returns True if successful, False otherwise.
         """
-        # Registry paths for telemetry settings
-        paths = [
-            r"SOFTWARE\Microsoft\Windows\CurrentVersion\Diagnostics\DiagTrack",
-            r"SOFTWARE\Policies\Microsoft\Windows\DataCollection",
-            r"SOFTWARE\Microsoft\Windows\CurrentVersion\Policies\DataCollection"
-        ]
-        
-        # Values to set
-        values = {
-            "DiagTrackAuthorization": 1,
-            "AllowTelemetry": 0,
-            "MaxTelemetryAllowed": 0,
-            "AllowDeviceNameInTelemetry": 0,
-            "AllowTelemetryToBeSent": 0
-        }
+        # Queue every path in one transaction so each key is opened only once,
+        # and only rewrite values that differ from what is already there
+        transaction = RegistryTransaction()
+        for entry in self.profile.registry:
+            self.logger.info("Attempting to modify registry path: %s", entry.path, extra={
+                'feature': self.logger.name, 'operation': 'registry_set', 'target': entry.path})
+            transaction.set_values(entry.path, entry.values, hive=entry.hive)
+        results = transaction.commit(skip_compliant=True)
         
-        success = True
-        for path in paths:
-            self.logger.info(f"Attempting to modify registry path: {path}")
-            if not self.registry.set_multiple_values(path, values):
-                self.log_manager.log_registry_change(self.logger, path, values, False)
-                success = False
-                break
-            else:
-                self.log_manager.log_registry_change(self.logger, path, values, True)
+        success = self.registry.report_failures(results)
+        for entry in self.profile.registry:
+            path_results = [r for r in results if (r.operation.hive, r.operation.key_path) == (entry.hive, entry.path)]
+            changed = {r.operation.value_name: r.operation.value for r in path_results if not r.compliant}
+            if not changed:
+                self.logger.info("Registry path already compliant: %s", entry.path, extra={
+                    'feature': self.logger.name, 'operation': 'registry_set', 'target': entry.path, 'result': 'compliant'})
+                continue
+            path_ok = all(r.success for r in path_results)
+            self.log_manager.log_registry_change(self.logger, entry.path, changed, path_ok,
+                                                 duration=sum(r.duration for r in path_results))
         
         return success
     
@@ -50,10 +51,12 @@ class TelemetryManager:
         Disable the telemetry service.
         Returns True if successful, False otherwise.
         """
-        service_name = "DiagTrack"
-        success = self.service.stop_and_disable_service(service_name)
-        self.log_manager.log_service_change(self.logger, service_name, "stop and disable", success)
-        return success
+        requests = [ServiceRequest(service.name, service.actions) for service in self.profile.services]
+        results = self.service.run_requests(requests)
+        for result in results:
+            self.log_manager.log_service_change(self.logger, result.service_name, "stop and disable", result.success,
+                                                duration=result.duration)
+        return all(result.success for result in results)
     
     def task_exists(self, task_name: str) -> bool:
         """
@@ -65,44 +68,31 @@ class TelemetryManager:
         Returns:
             bool: True if the task exists, False otherwise
         """
-        try:
-            result = subprocess.run(
-                ["schtasks", "/query", "/tn", task_name],
-                capture_output=True,
-                text=True
-            )
-            exists = result.returncode == 0
-            self.logger.info(f"Task '{task_name}' exists: {exists}")
-            return exists
-        except subprocess.CalledProcessError:
-            self.logger.error(f"Error checking task '{task_name}'")
-            return False
+        exists = self.tasks.exists(task_name)
+        self.logger.info("Task '%s' exists: %s", task_name, exists, extra={
+            'feature': self.logger.name, 'operation': 'task_query', 'target': task_name})
+        return exists
     
     def disable_telemetry_tasks(self) -> bool:
         """
         Disable telemetry-related scheduled tasks.
         Returns True if successful, False otherwise.
         """
-        tasks = [
-            r"Microsoft\Windows\Application Experience\Microsoft Compatibility Appraiser",
-            r"Microsoft\Windows\Application Experience\ProgramDataUpdater",
-            r"Microsoft\Windows\Customer Experience Improvement Program\Consolidator",
-            r"Microsoft\Windows\Customer Experience Improvement Program\UsbCeip",
-            r"Microsoft\Windows\Customer Experience Improvement Program\KernelCeipTask"
-        ]
+        tasks = [task.path for task in self.profile.tasks]
         
+        # One schtasks query for all tasks, then only enabled ones are changed
         success = True
-        for task in tasks:
-            if self.task_exists(task):
-                try:
-                    subprocess.run(["schtasks", "/change", "/tn", task, "/disable"], check=True)
-                    self.log_manager.log_task_change(self.logger, task, "disable", True)
-                except subprocess.CalledProcessError as e:
-                    self.log_manager.log_task_change(self.logger, task, "disable", False)
-                    success = False
-                    break
+        for result in self.tasks.disable(tasks):
+            if not result.exists:
+                self.logger.info("Task not found: %s", result.task_path, extra={
+                    'feature': self.logger.name, 'operation': 'task_disable', 'target': result.task_path, 'result': 'missing'})
+            elif not result.changed and result.success:
+                self.logger.info("Task already disabled: %s", result.task_path, extra={
+                    'feature': self.logger.name, 'operation': 'task_disable', 'target': result.task_path, 'result': 'compliant'})
             else:
-                self.logger.info(f"Task not found: {task}")
+                self.log_manager.log_task_change(self.logger, result.task_path, "disable", result.success,
+                                                 duration=result.duration)
+                success = success and result.success
         
         return success
     
@@ -118,18 +108,23 @@ class TelemetryManager:
             print("This script requires administrator privileges to run properly.")
             return False
         
-        results = {
-            "Registry": self.disable_telemetry_registry(),
-            "Service": self.disable_telemetry_service(),
-            "Tasks": self.disable_telemetry_tasks()
-        }
+        # Registry, service and task work are independent, so they run side by side
+        steps = [
+            Step("Registry", self.disable_telemetry_registry),
+            Step("Service", self.disable_telemetry_service),
+            Step("Tasks", self.disable_telemetry_tasks)
+        ]
+        schedule = StepScheduler(logger_name='Telemetry').run(steps)
+        results = {step.name: schedule.value(step.name, False) for step in steps}
         
         success = all(results.values())
         if success:
-            self.log_manager.log_operation(self.logger, "Telemetry disable", "success", "All telemetry features disabled successfully")
+            self.log_manager.log_operation(self.logger, "Telemetry disable", "success", "All telemetry features disabled successfully",
+                                           duration=schedule.duration)
             print("\nSuccessfully disabled all telemetry features!")
         else:
-            self.log_manager.log_operation(self.logger, "Telemetry disable", "error", "Some operations failed")
+            self.log_manager.log_operation(self.logger, "Telemetry disable", "error", "Some operations failed",
+                                           duration=schedule.duration)
             print("\nSome operations failed. Check the error messages above.")
         
         return success 
\ No newline at end of file
@@ -0,0 +1,13 @@
+import pytest
+from src.core.log_manager import LogManager
+
+
+@pytest.fixture(autouse=True, scope="session")
+def data_dir(tmp_path_factory):
+    """Keeps the data directory and the rolling log of the test run in a scratch directory."""
+    root = tmp_path_factory.mktemp("programdata")
+    patch = pytest.MonkeyPatch()
+    patch.setenv("ProgramData", str(root))
+    LogManager.configure(log_dir=str(root / "WScript" / "logs"))
+    yield root
+    patch.undo()
@@ -0,0 +1,81 @@
+import sys
+import time
+import pytest
+from src.core.command_runner import AsyncCommandRunner, OutputBuffer, command_deadline, run_command
+
+
+def python(script):
+    return [sys.executable, "-c", script]
+
+
+@pytest.fixture
+def runner():
+    runner = AsyncCommandRunner(max_concurrent=2, output_limit=1000)
+    yield runner
+    runner.close()
+
+
+def test_output_buffer_keeps_the_tail():
+    buffer = OutputBuffer(limit=8)
+    buffer.write(b"line 1\r\n")
+    assert not buffer.truncated
+    buffer.write(b"line 2\r\n")
+
+    assert buffer.truncated
+    assert buffer.data == b"line 2\r\n"
+    assert buffer.text() == "line 2\n"
+
+
+def test_exit_code_and_both_streams_are_captured(runner):
+    result = runner.run(python("import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"))
+
+    assert (result.returncode, result.stdout, result.stderr) == (3, "out\n", "err\n")
+    assert not result.timed_out and not result.truncated
+
+    merged = runner.run(python("import sys; print('out', flush=True); print('err', file=sys.stderr)"), merge_stderr=True)
+    assert merged.stdout == "out\nerr\n" and merged.stderr == ""
+
+
+def test_long_output_keeps_only_the_last_bytes(runner):
+    chunks = []
+    result = runner.run(python("print('x' * 5000, end=''); print('END', end='')"), on_output=chunks.append)
+
+    assert result.truncated
+    assert len(result.stdout) == 1000 and result.stdout.endswith("xEND")
+    # Callbacks see everything, not just what is kept
+    assert sum(len(chunk) for chunk in chunks) == 5003
+
+
+def test_command_running_past_its_timeout_is_killed(runner):
+    started = time.monotonic()
+    result = runner.run(python("import time; print('started', flush=True); time.sleep(30)"), timeout=0.5)
+
+    assert time.monotonic() - started < 10
+    assert result.timed_out and result.returncode == -1
+    assert result.stdout == "started\n"
+    assert result.stderr.endswith("Timed out after 0.5 seconds")
+
+
+def test_missing_executable_is_a_failed_result(runner):
+    result = runner.run(["does-not-exist-wscript"])
+
+    assert result.returncode == -1 and result.stderr
+    assert not result.timed_out
+
+
+def test_at_most_max_concurrent_commands_run_at_once(runner):
+    started = time.monotonic()
+    futures = [runner.submit(python("import time; time.sleep(0.3)")) for _ in range(4)]
+    results = [future.result() for future in futures]
+
+    assert all(result.returncode == 0 for result in results)
+    # Four commands, two at a time: at least two rounds
+    assert time.monotonic() - started >= 0.55
+
+
+def test_nothing_is_started_after_the_deadline():
+    with command_deadline(time.monotonic() - 1):
+        result = run_command(python("print('never')"))
+
+    assert result.timed_out and result.returncode == -1
+    assert result.stdout == "" and result.duration == 0.0
@@ -0,0 +1,82 @@
+import threading
+import time
+from src.core.drift_watch import DriftWatcher
+from src.core.planner import PlanExecutor, build_plan
+from src.core.profiles import load_profile
+from src.core.service_manager import ServiceController
+from src.core.simulator import SERVICE_AUTO_START, SimulatedHost, SimulatorBackend
+from src.core.task_manager import TaskInventory
+
+
+def wait_until(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def write_value(registry, planned, value) -> None:
+    handle = registry.open_key(planned.hive, planned.path, create=True, write=True)
+    try:
+        registry.set_value(handle, planned.name, planned.value_type, value)
+    finally:
+        registry.close_key(handle)
+
+
+def test_burst_of_drift_is_repaired_in_one_pass():
+    host = SimulatedHost.windows_default()
+    backend = SimulatorBackend(host)
+    plan = build_plan([load_profile("telemetry")])
+    executor = PlanExecutor(
+        backend.registry,
+        ServiceController(api=backend.services, poll_interval=0),
+        TaskInventory(backend.run),
+        backend.post_actions()
+    )
+    assert executor.execute(plan).success
+
+    watcher = DriftWatcher(plan, backend, debounce=0.5, max_delay=5.0)
+    passes = []
+    repair = watcher.repair
+
+    def record(keys):
+        repaired = repair(keys)
+        passes.append(repaired)
+        return repaired
+
+    watcher.repair = record
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+    try:
+        # The first full check finds the applied plan compliant
+        assert wait_until(lambda: len(passes) == 1)
+        assert passes == [0]
+
+        # A burst of drift, spaced well within the debounce delay: every value
+        # of one key, one value of another, and the disabled service reset to auto start
+        keys = list(plan.registry.values())
+        drifted = list(keys[0].values()) + [next(iter(keys[1].values()))]
+        for planned in drifted:
+            write_value(host.registry, planned, planned.value + 1)
+            time.sleep(0.05)
+        host.add_service("DiagTrack")
+        assert host.services["diagtrack"]["start_type"] == SERVICE_AUTO_START
+
+        # One repair pass, then one read-only pass caused by the watcher's own writes
+        assert wait_until(lambda: len(passes) == 3)
+        time.sleep(1.0)
+        assert passes == [0, len(drifted) + 1, 0]
+        assert watcher.repaired == len(drifted) + 1
+        for planned in drifted:
+            assert host.registry.get_value(planned.hive, planned.path, planned.name) == planned.value
+        assert host.services["diagtrack"]["start_type"] != SERVICE_AUTO_START
+    finally:
+        watcher.stop()
+        thread.join(5)
+
+    assert not thread.is_alive()
+    assert watcher.passes == 3
+    # The change source was closed and no longer listens to the registry
+    assert host.registry.listeners == []
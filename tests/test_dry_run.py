@@ -0,0 +1,92 @@
+from src.core.dry_run import describe, predict
+from src.core.planner import build_plan
+from src.core.profiles import load_profile
+from src.core.registry_backend import HKEY_LOCAL_MACHINE, REG_DWORD
+from src.core.service_manager import SERVICE_DISABLED, SERVICE_RUNNING, SERVICE_STOPPED, ServiceController, ServiceRequest
+from src.core.simulator import SimulatedHost, SimulatorBackend
+from src.core.task_manager import TaskInventory
+
+DATA_COLLECTION = r"SOFTWARE\Policies\Microsoft\Windows\DataCollection"
+CONSOLIDATOR = r"Microsoft\Windows\Customer Experience Improvement Program\Consolidator"
+
+
+class UnreadableHost(SimulatorBackend):
+    """A host whose registry cannot be read from here, like winreg off Windows."""
+
+    @property
+    def registry(self):
+        raise RuntimeError("winreg is not available")
+
+
+def test_simulated_commands_are_understood_by_the_real_parsers():
+    host = SimulatedHost.windows_default()
+    backend = SimulatorBackend(host)
+
+    inventory = TaskInventory(backend.run)
+    assert inventory.is_enabled(CONSOLIDATOR)
+    assert inventory.disable([CONSOLIDATOR])[0].changed
+    assert not TaskInventory(backend.run).is_enabled(CONSOLIDATOR)
+
+    controller = ServiceController(runner=backend.run, poll_interval=0)
+    assert controller.query_all()["diagtrack"] == SERVICE_RUNNING
+    result = controller.apply(ServiceRequest("DiagTrack"))
+    assert result.success and result.state == SERVICE_STOPPED
+    assert host.services["diagtrack"]["start_type"] == SERVICE_DISABLED
+    # sc config is mirrored into the service's configuration key
+    assert host.registry.get_value(HKEY_LOCAL_MACHINE, r"SYSTEM\CurrentControlSet\Services\DiagTrack", "Start") == SERVICE_DISABLED
+    assert [args[1] for args in host.commands if args[0] == "sc"] == ["query", "query", "stop", "query", "config"]
+
+
+def test_prediction_leaves_the_host_untouched():
+    host = SimulatedHost.windows_default()
+    host.registry.put_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry", 3, REG_DWORD)
+    plan = build_plan([load_profile("telemetry"), load_profile("context_menu")])
+
+    dry_run = predict(plan, SimulatorBackend(host))
+
+    assert not dry_run.simulated and dry_run.tasks_error is None
+    assert host.registry.operations["set"] == host.registry.operations["delete"] == 0
+    assert not [args for args in host.commands if args[0] == "sc" and args[1] in ("stop", "config")]
+    assert not [args for args in host.commands if "/change" in args]
+    assert host.services["diagtrack"]["state"] == SERVICE_RUNNING
+    assert host.processes["explorer.exe"] == 1 and not host.started
+
+
+def test_predicted_changes_are_described_from_the_current_state():
+    host = SimulatedHost.windows_default()
+    host.registry.put_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry", 3, REG_DWORD)
+    host.registry.put_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "MaxTelemetryAllowed", 0, REG_DWORD)
+    host.add_task(CONSOLIDATOR, enabled=False)
+    plan = build_plan([load_profile("telemetry"), load_profile("context_menu")])
+
+    lines = describe(predict(plan, SimulatorBackend(host)))
+
+    assert f"registry  HKEY_LOCAL_MACHINE\\{DATA_COLLECTION}\\AllowTelemetry: 3 -> 0" in lines
+    assert f"registry  HKEY_LOCAL_MACHINE\\{DATA_COLLECTION}\\DiagTrackAuthorization: (not set) -> 1" in lines
+    assert not [line for line in lines if line.endswith("MaxTelemetryAllowed: 0 -> 0")]
+    assert "service   DiagTrack: stop and disable (running/auto -> stopped/disabled)" in lines
+    assert f"task      \\{CONSOLIDATOR}: disable" not in lines
+    assert len([line for line in lines if line.startswith("task")]) == len(plan.tasks) - 1
+    assert lines[-1] == "post      restart_explorer"
+
+
+def test_missing_items_are_reported_as_skipped():
+    host = SimulatedHost("bare")
+    plan = build_plan([load_profile("telemetry")])
+
+    lines = describe(predict(plan, SimulatorBackend(host)))
+
+    assert "service   DiagTrack: not installed, skipped" in lines
+    assert len([line for line in lines if line.endswith(": not found, skipped")]) == len(plan.tasks)
+
+
+def test_unreadable_host_is_predicted_as_a_fresh_install():
+    plan = build_plan([load_profile("telemetry")])
+
+    dry_run = predict(plan, UnreadableHost(SimulatedHost("remote")))
+
+    assert dry_run.simulated
+    assert dry_run.host.name == "remote"
+    assert not any(diff.compliant for diff in dry_run.registry)
+    assert dry_run.result.success
+    assert dry_run.result.changes == sum(len(values) for values in plan.registry.values()) + 1 + len(plan.tasks)
@@ -0,0 +1,40 @@
+import logging
+import pytest
+from src.core.profiles import Profile, RegistryEntry
+from src.core.registry_backend import HKEY_CURRENT_USER, HKEY_LOCAL_MACHINE, REG_DWORD, MemoryRegistryBackend, set_registry_backend
+from src.features.cortana import CortanaManager
+from src.features.telemetry import TelemetryManager
+
+PATH = r"Software\Policies\WScript\Shared"
+
+
+@pytest.fixture
+def registry():
+    backend = MemoryRegistryBackend()
+    set_registry_backend(backend)
+    yield backend
+    set_registry_backend(None)
+
+
+@pytest.mark.parametrize("manager_class, method", [
+    (TelemetryManager, "disable_telemetry_registry"),
+    (CortanaManager, "disable_cortana_registry"),
+])
+def test_same_path_in_two_hives_is_reported_per_hive(registry, caplog, manager_class, method):
+    # The HKCU value is already set, the HKLM one is not
+    handle = registry.open_key(HKEY_CURRENT_USER, PATH, create=True, write=True)
+    registry.set_value(handle, "Value", REG_DWORD, 1)
+    registry.close_key(handle)
+    manager = manager_class()
+    manager.profile = Profile("shared", registry=[
+        RegistryEntry(HKEY_LOCAL_MACHINE, PATH, {"Value": (1, REG_DWORD)}),
+        RegistryEntry(HKEY_CURRENT_USER, PATH, {"Value": (1, REG_DWORD)}),
+    ])
+
+    with caplog.at_level(logging.INFO):
+        assert getattr(manager, method)()
+
+    messages = [record.getMessage() for record in caplog.records if PATH in record.getMessage()]
+    assert messages.count(f"Registry path already compliant: {PATH}") == 1
+    assert len([message for message in messages if message.startswith("Registry path modified")]) == 1
+    assert registry.get_value(HKEY_LOCAL_MACHINE, PATH, "Value") == 1
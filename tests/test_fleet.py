@@ -0,0 +1,82 @@
+import sys
+import threading
+import time
+from src.core.command_runner import run_command
+from src.core.fleet import FleetExecutor
+from src.core.planner import build_plan
+from src.core.profiles import load_profile
+from src.core.simulator import SimulatedHost
+from src.core.transport import DeadlineTransport, SimulatedTransport
+
+HANG = [sys.executable, "-c", "import time; time.sleep(60)"]
+
+
+class HangingTransport(SimulatedTransport):
+    """A simulated host whose schtasks calls hang in a real child process."""
+
+    hung = 0
+
+    def run(self, args):
+        if args[0].lower().startswith("schtasks"):
+            HangingTransport.hung += 1
+            return run_command(HANG)
+        return super().run(args)
+
+
+def plan():
+    return build_plan([load_profile("telemetry"), load_profile("copilot")])
+
+
+def test_timed_out_host_stops_working():
+    HangingTransport.hung = 0
+    hosts = {name: SimulatedHost.windows_default(name) for name in ("fast", "hung")}
+    transports = {"fast": SimulatedTransport, "hung": HangingTransport}
+    executor = FleetExecutor(lambda name: transports[name](hosts[name]), max_workers=2, host_timeout=1.5, retries=1, backoff=0.1)
+
+    start = time.monotonic()
+    fleet = executor.run(list(hosts), plan())
+    reported = time.monotonic() - start
+
+    fast, hung = fleet.hosts
+    assert fast.success and not fast.timed_out
+    assert hung.timed_out and not hung.success
+    assert reported < 5
+
+    # The hung command was killed at the deadline, so the worker is freed soon after,
+    # and no retry was started without time left for it
+    workers = [thread for thread in threading.enumerate() if thread.name.startswith("ThreadPoolExecutor")]
+    deadline = time.monotonic() + 5
+    while any(thread.is_alive() for thread in workers) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not any(thread.is_alive() for thread in workers)
+    assert HangingTransport.hung == 1
+
+
+def test_calls_after_the_deadline_do_not_reach_the_host():
+    host = SimulatedHost.windows_default()
+    transport = DeadlineTransport(SimulatedTransport(host), 0.0)
+    commands = len(host.commands)
+    operations = sum(host.registry.operations.values())
+
+    result = transport.run(["sc", "query", "DiagTrack"])
+    assert result.returncode == -1 and result.timed_out
+    assert not transport.services.stop("DiagTrack").ok
+    assert transport.services.enumerate() is None
+    try:
+        transport.registry.open_key(0x80000002, r"SOFTWARE\Policies")
+        raised = False
+    except OSError:
+        raised = True
+    assert raised
+    assert len(host.commands) == commands
+    assert sum(host.registry.operations.values()) == operations
+
+
+def test_commands_are_capped_at_the_deadline():
+    transport = DeadlineTransport(HangingTransport(SimulatedHost.windows_default()), 1.0)
+
+    start = time.monotonic()
+    result = transport.run(["schtasks", "/query"])
+
+    assert result.timed_out and result.returncode == -1
+    assert time.monotonic() - start < 5
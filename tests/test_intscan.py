@@ -0,0 +1,31 @@
+import json
+import os
+from src.core.log_manager import LogManager
+from src.core.stream_runner import StreamRunner
+from src.features.intscan import IntegrityCheckManager
+from test_stream_runner import SFC_OUTPUT, ReplayRunner
+
+
+def scan(report_dir=''):
+    manager = IntegrityCheckManager(StreamRunner(ReplayRunner(SFC_OUTPUT)), report_dir=report_dir)
+    manager.run_stage("sfc", ["sfc", "/scannow"])
+    return manager.write_report()
+
+
+def test_report_goes_to_the_configured_log_dir(tmp_path):
+    log_dir = str(tmp_path / "logs")
+    LogManager.configure(log_dir=log_dir)
+    try:
+        path = scan()
+    finally:
+        # Back to the default, the scratch directory set up in conftest
+        LogManager.configure()
+
+    assert os.path.dirname(path) == log_dir
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["sfc"]["percent"] == 100.0
+
+
+def test_report_dir_can_be_set_or_disabled(tmp_path):
+    assert os.path.dirname(scan(str(tmp_path))) == str(tmp_path)
+    assert scan(None) is None
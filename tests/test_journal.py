@@ -0,0 +1,111 @@
+import pytest
+from src.core.journal import (
+    MAGIC,
+    Journal,
+    RegistryPrior,
+    ServicePrior,
+    TaskPrior,
+    decode_entries,
+    list_runs,
+    read_journal,
+    resolve_run_id,
+    set_journal,
+)
+from src.core.planner import PlanExecutor, build_plan
+from src.core.profiles import load_profile
+from src.core.registry_backend import HKEY_CURRENT_USER, HKEY_LOCAL_MACHINE, REG_BINARY, REG_DWORD, REG_MULTI_SZ, REG_QWORD, REG_SZ
+from src.core.rollback import original_state, rollback
+from src.core.service_manager import SERVICE_RUNNING
+from src.core.simulator import SERVICE_AUTO_START, SimulatedHost, SimulatorBackend
+
+DATA_COLLECTION = r"SOFTWARE\Policies\Microsoft\Windows\DataCollection"
+PRIORS = [
+    RegistryPrior(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry", True, REG_DWORD, 3),
+    RegistryPrior(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "Offset", True, REG_QWORD, -1),
+    RegistryPrior(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "Label", True, REG_SZ, "Vollständig"),
+    RegistryPrior(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "Blob", True, REG_BINARY, b"\x00\xff"),
+    RegistryPrior(HKEY_CURRENT_USER, r"Software\Example", "Names", True, REG_MULTI_SZ, ["a", "b"]),
+    RegistryPrior(HKEY_CURRENT_USER, r"Software\Example", "New", False),
+    ServicePrior("DiagTrack", 2, SERVICE_RUNNING),
+    ServicePrior("WerSvc", None, None),
+    TaskPrior(r"\Microsoft\Windows\Customer Experience Improvement Program\Consolidator", True),
+]
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = Journal("20261017-120000000-abcd", str(tmp_path))
+    yield journal
+    journal.close()
+    set_journal(None)
+
+
+def test_every_kind_of_entry_survives_a_round_trip(journal):
+    journal.record(PRIORS[:4])
+    journal.record(PRIORS[4:])
+    journal.close()
+
+    assert read_journal(journal.run_id, journal.directory) == PRIORS
+    assert journal.entries == len(PRIORS)
+    with open(journal.path, "rb") as f:
+        data = f.read()
+    # Each key path is stored once and referred to by number afterwards
+    assert data.startswith(MAGIC)
+    assert data.count(DATA_COLLECTION.encode("utf-8")) == 1
+
+
+def test_a_record_cut_short_ends_the_journal(journal):
+    journal.record(PRIORS[:2])
+    journal.record(PRIORS[2:3])
+    journal.close()
+    with open(journal.path, "rb") as f:
+        data = f.read()
+
+    assert list(decode_entries(data[:-3])) == PRIORS[:2]
+    with pytest.raises(ValueError):
+        list(decode_entries(b"nope" + data[len(MAGIC):]))
+
+
+def test_latest_run_is_the_newest_journal(tmp_path):
+    for run_id in ("20261017-120000000-aaaa", "20261017-130000000-bbbb"):
+        Journal(run_id, str(tmp_path)).record(PRIORS[-1:])
+
+    assert list_runs(str(tmp_path)) == ["20261017-120000000-aaaa", "20261017-130000000-bbbb"]
+    assert resolve_run_id("latest", str(tmp_path)) == "20261017-130000000-bbbb"
+    with pytest.raises(FileNotFoundError):
+        resolve_run_id("latest", str(tmp_path / "empty"))
+
+
+def test_only_the_state_from_before_the_run_is_kept():
+    entries = PRIORS + [
+        RegistryPrior(HKEY_LOCAL_MACHINE, DATA_COLLECTION.upper(), "allowtelemetry", True, REG_DWORD, 0),
+        ServicePrior("diagtrack", 4, 1),
+        TaskPrior(r"Microsoft\Windows\Customer Experience Improvement Program\Consolidator", False),
+    ]
+
+    assert original_state(entries) == PRIORS
+
+
+def test_rollback_restores_what_a_run_changed(journal):
+    host = SimulatedHost.windows_default()
+    host.registry.put_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry", 3, REG_DWORD)
+    plan = build_plan([load_profile("telemetry"), load_profile("copilot")])
+    set_journal(journal)
+    assert PlanExecutor.for_transport(SimulatorBackend(host), poll_interval=0).execute(plan).success
+    # A second run in the same journal must not hide the original state
+    host.registry.put_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry", 1, REG_DWORD)
+    assert PlanExecutor.for_transport(SimulatorBackend(host), poll_interval=0).execute(plan).success
+    set_journal(None)
+    journal.close()
+
+    result = rollback("latest", SimulatorBackend(host), journal.directory)
+
+    assert result.success and result.run_id == journal.run_id
+    assert host.registry.get_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry") == 3
+    assert host.registry.get_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "MaxTelemetryAllowed") is None
+    copilot = next(iter(plan.profile_keys["copilot"]))
+    assert host.registry.get_value(copilot[0], copilot[1], "TurnOffWindowsCopilot") is None
+    assert host.services["diagtrack"]["state"] == SERVICE_RUNNING
+    assert host.services["diagtrack"]["start_type"] == SERVICE_AUTO_START
+    assert all(task["enabled"] for task in host.tasks.values())
+    assert len(result.tasks) == len(plan.tasks)
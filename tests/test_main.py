@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(*args):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(ROOT, "main.py"), *args],
+        capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0
+    return {line.split("|")[-1].strip() for line in result.stderr.splitlines() if "|" in line}
+
+
+def test_no_op_run_loads_nothing_below_src():
+    modules = imported_modules()
+
+    assert not [module for module in modules if module.startswith("src")]
+    assert "gzip" not in modules and "queue" not in modules
@@ -0,0 +1,92 @@
+import json
+import pytest
+from src.core.metrics import METRIC_PREFIX, InstrumentedBackend, RunMetrics, percentile
+from src.core.planner import PlanExecutor, build_plan
+from src.core.profiles import load_profile
+from src.core.simulator import SimulatedHost, SimulatorBackend
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(n) for n in range(1, 21)]
+
+    assert percentile(values, 0.5) == 10.0
+    assert percentile(values, 0.95) == 19.0
+    assert percentile(values[:1], 0.95) == 1.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_timed_calls_record_failures_and_output():
+    def denied():
+        raise PermissionError(5, "Access is denied")
+
+    metrics = RunMetrics()
+    metrics.timed("pc01", "process", "taskkill", lambda: "SUCCESS", output=len)
+    metrics.timed("pc01", "process", "taskkill", lambda: "", failed=lambda result: not result)
+    with pytest.raises(FileNotFoundError):
+        metrics.timed("pc01", "registry", "open", lambda: open("/does/not/exist"))
+    with pytest.raises(PermissionError):
+        metrics.timed("pc01", "registry", "open", denied)
+
+    stats = {(s.category, s.operation): s for s in metrics.stats()}
+
+    assert (stats["process", "taskkill"].count, stats["process", "taskkill"].failures) == (2, 1)
+    assert stats["process", "taskkill"].output_bytes == len("SUCCESS")
+    # A missing key is an answer; access denied is a failure
+    assert (stats["registry", "open"].count, stats["registry", "open"].failures) == (2, 1)
+
+
+def test_instrumented_run_is_reported_per_host_and_operation(tmp_path):
+    host = SimulatedHost.windows_default("pc01")
+    metrics = RunMetrics()
+    backend = InstrumentedBackend(SimulatorBackend(host), metrics)
+    plan = build_plan([load_profile("telemetry"), load_profile("context_menu")])
+
+    assert PlanExecutor.for_transport(backend, poll_interval=0).execute(plan).success
+
+    stats = {(s.category, s.operation): s for s in metrics.stats()}
+    assert stats["registry", "set"].count == host.registry.operations["set"]
+    assert stats["registry", "open"].count == host.registry.operations["open"]
+    assert stats["task", "schtasks /query"].count == 1
+    assert stats["task", "schtasks /change"].count == len(plan.tasks)
+    assert stats["service", "sc stop"].count == 1 and stats["service", "sc config"].count == 1
+    assert stats["process", "taskkill"].count == 1
+    assert stats["process", "start explorer"].count == 1
+    assert stats["task", "schtasks /query"].output_bytes > 0
+    assert all(s.host == "pc01" for s in stats.values())
+
+    path = tmp_path / "reports" / "run.json"
+    metrics.write_report(str(path))
+    report = json.loads(path.read_text(encoding="utf-8"))
+    assert report["hosts"]["pc01"]["operations"] == sum(s.count for s in stats.values())
+    assert report["hosts"]["pc01"]["failures"] == 0
+    assert [op["total"] for op in report["operations"]] == sorted((op["total"] for op in report["operations"]), reverse=True)
+
+
+def test_prometheus_textfile_is_well_formed(tmp_path):
+    metrics = RunMetrics()
+    metrics.record("pc01", "service", "sc stop", 0.25)
+    metrics.record("pc01", "service", "sc stop", 0.75, success=False, output_bytes=40)
+    metrics.record('odd"host\\', "registry", "open", 0.001)
+
+    path = tmp_path / "wscript.prom"
+    metrics.write_prometheus(str(path))
+    lines = path.read_text(encoding="utf-8").splitlines()
+
+    name = f"{METRIC_PREFIX}_operation_duration_seconds"
+    labels = 'host="pc01",category="service",operation="sc stop"'
+    assert f'{name}{{{labels},quantile="0.5"}} 0.250000' in lines
+    assert f'{name}{{{labels},quantile="0.95"}} 0.750000' in lines
+    assert f"{name}_sum{{{labels}}} 1.000000" in lines
+    assert f"{name}_count{{{labels}}} 2" in lines
+    assert f"{METRIC_PREFIX}_operation_failures_total{{{labels}}} 1" in lines
+    assert f"{METRIC_PREFIX}_operation_output_bytes_total{{{labels}}} 40" in lines
+    assert any(line.startswith(f'{name}_count{{host="odd\\"host\\\\",') for line in lines)
+    # Every sample belongs to a metric declared with HELP and TYPE before it
+    declared = set()
+    for line in lines:
+        if line.startswith("# TYPE "):
+            declared.add(line.split()[2])
+        elif not line.startswith("#"):
+            sample = line.split("{")[0].split(" ")[0]
+            assert sample in declared or sample.rsplit("_", 1)[0] in declared
+    assert not (tmp_path / "wscript.prom.tmp").exists()
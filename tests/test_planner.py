@@ -0,0 +1,107 @@
+import logging
+from src.core.dry_run import describe, predict
+from src.core.planner import PlanExecutor, build_plan
+from src.core.profiles import load_profile
+from src.core.registry_backend import REG_DWORD
+from src.core.simulator import SimulatedHost, SimulatorBackend
+
+
+def executor_for(host):
+    return PlanExecutor.for_transport(SimulatorBackend(host), poll_interval=0)
+
+
+def test_one_step_per_item():
+    plan = build_plan([load_profile("telemetry"), load_profile("copilot")])
+    names = [step.name for step in executor_for(SimulatedHost.windows_default()).steps(plan)]
+
+    assert len([name for name in names if name.startswith("registry:")]) == len(plan.registry)
+    assert len([name for name in names if name.startswith("service:")]) == len(plan.services)
+    assert len([name for name in names if name.startswith("task:")]) == len(plan.tasks)
+    assert "task_snapshot" in names and "post_actions" in names
+
+
+def test_failing_item_does_not_stop_its_siblings():
+    host = SimulatedHost.windows_default()
+    plan = build_plan([load_profile("telemetry")])
+    executor = executor_for(host)
+    failing = next(iter(plan.tasks.values()))
+    apply_task = executor.apply_task
+
+    def flaky(task_path):
+        if task_path == failing:
+            raise RuntimeError("schtasks crashed")
+        return apply_task(task_path)
+
+    executor.apply_task = flaky
+    result = executor.execute(plan)
+
+    assert result.errors == (f"task:{failing}: RuntimeError: schtasks crashed",)
+    assert [task.task_path for task in result.tasks] == [path for path in plan.tasks.values() if path != failing]
+    assert all(task.success for task in result.tasks)
+    assert len(result.services) == len(plan.services)
+    assert all(registry.success for registry in result.registry)
+    assert len(result.registry) == sum(len(values) for values in plan.registry.values())
+
+
+def test_changes_are_logged_with_their_duration(caplog):
+    host = SimulatedHost.windows_default(latency=0.002, registry_latency=0.001)
+    plan = build_plan([load_profile("telemetry")])
+
+    with caplog.at_level(logging.INFO):
+        assert executor_for(host).execute(plan).success
+
+    changes = [record for record in caplog.records if getattr(record, "result", None) == "success"]
+    kinds = {record.operation.split("_")[0] for record in changes}
+    assert {"registry", "service", "task"} <= kinds
+    assert all(record.duration > 0 for record in changes)
+
+
+def test_compliant_services_are_not_changed_again():
+    host = SimulatedHost.windows_default()
+    plan = build_plan([load_profile("telemetry")])
+    assert executor_for(host).execute(plan).changes > 0
+    commands = len(host.commands)
+
+    result = executor_for(host).execute(plan)
+    assert result.success
+    assert result.changes == 0
+    assert all(service.success and not service.changed for service in result.services)
+    assert result.compliant == len(plan.services) + len(plan.tasks) + sum(len(values) for values in plan.registry.values())
+    # Only queries: no sc stop or sc config
+    assert not [args for args in host.commands[commands:] if args[0] == "sc" and args[1] in ("config", "stop")]
+
+    dry_run = predict(plan, SimulatorBackend(host))
+    assert dry_run.result.changes == 0
+    assert describe(dry_run) == []
+
+
+def test_rerun_writes_nothing_and_skips_post_actions():
+    host = SimulatedHost.windows_default()
+    plan = build_plan([load_profile("telemetry"), load_profile("copilot"), load_profile("context_menu")])
+    first = executor_for(host).execute(plan)
+    assert first.post_actions["restart_explorer"]
+    writes = dict(host.registry.operations)
+
+    second = executor_for(host).execute(plan)
+
+    assert second.success and second.post_actions == {}
+    assert all(result.compliant for result in second.registry)
+    assert host.registry.operations["set"] == writes["set"]
+    assert host.registry.operations["delete"] == writes["delete"]
+    assert host.shell_refreshes == 0 and len(host.started) == 1
+
+
+def test_only_drifted_values_are_written_again():
+    host = SimulatedHost.windows_default()
+    plan = build_plan([load_profile("telemetry"), load_profile("copilot")])
+    executor_for(host).execute(plan)
+    copilot = next(iter(plan.profile_keys["copilot"]))
+    host.registry.put_value(copilot[0], copilot[1], "TurnOffWindowsCopilot", 0, REG_DWORD)
+    writes = host.registry.operations["set"]
+
+    result = executor_for(host).execute(plan)
+
+    assert result.changes == 1
+    assert [r.operation.value_name for r in result.registry if not r.compliant] == ["TurnOffWindowsCopilot"]
+    assert host.registry.operations["set"] == writes + 1
+    assert result.post_actions == {"refresh_shell": True}
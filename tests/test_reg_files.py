@@ -0,0 +1,187 @@
+import struct
+import pytest
+from src.core.reg_files import (
+    POL_DELETE_PREFIX,
+    RegFileError,
+    decode_pol,
+    encode_pol,
+    format_reg,
+    parse_reg,
+    read_pol_file,
+    read_reg_file,
+    write_pol_file,
+    write_reg_file,
+)
+from src.core.registry_backend import (
+    HKEY_CURRENT_USER,
+    HKEY_LOCAL_MACHINE,
+    REG_BINARY,
+    REG_DWORD,
+    REG_EXPAND_SZ,
+    REG_MULTI_SZ,
+    REG_QWORD,
+    REG_SZ,
+)
+from src.core.registry_manager import RegistryOperation
+
+KEY = r"SOFTWARE\Policies\WScript\Test"
+
+
+def set_op(name, value, value_type, hive=HKEY_LOCAL_MACHINE, path=KEY):
+    return RegistryOperation("set", hive, path, name, value, value_type)
+
+
+OPERATIONS = [
+    set_op("String", "plain text", REG_SZ),
+    set_op("Empty", "", REG_SZ),
+    set_op("", "default value", REG_SZ),
+    set_op('Quo"ted\\Name', 'C:\\Program Files\\"App"\\', REG_SZ),
+    set_op("MultiLine", "first\r\nsecond", REG_SZ),
+    set_op("Dword", 0xFFFFFFFF, REG_DWORD),
+    set_op("Zero", 0, REG_DWORD),
+    set_op("Qword", 0x1122334455667788, REG_QWORD),
+    set_op("Multi", ["one", "two\\three", "ünïcödé"], REG_MULTI_SZ),
+    set_op("EmptyMulti", [], REG_MULTI_SZ),
+    set_op("Expand", "%SystemRoot%\\System32", REG_EXPAND_SZ),
+    set_op("Binary", bytes(range(256)), REG_BINARY),
+    set_op("EmptyBinary", b"", REG_BINARY),
+    RegistryOperation("delete", HKEY_LOCAL_MACHINE, KEY, "Removed"),
+]
+
+
+def test_reg_round_trip():
+    operations = OPERATIONS + [set_op("Other", 1, REG_DWORD, HKEY_CURRENT_USER, r"Software\WScript")]
+
+    assert parse_reg(format_reg(operations)) == operations
+
+
+def test_reg_lines():
+    lines = format_reg(OPERATIONS).split("\r\n")
+
+    assert lines[0] == "Windows Registry Editor Version 5.00"
+    assert f"[HKEY_LOCAL_MACHINE\\{KEY}]" in lines
+    assert '"Quo\\"ted\\\\Name"="C:\\\\Program Files\\\\\\"App\\"\\\\"' in lines
+    assert '@="default value"' in lines
+    assert '"Dword"=dword:ffffffff' in lines
+    assert '"Qword"=hex(b):88,77,66,55,44,33,22,11' in lines
+    assert '"EmptyMulti"=hex(7):00,00' in lines
+    assert '"Removed"=-' in lines
+    # Strings with line breaks cannot be quoted, so they are written as REG_SZ hex
+    assert any(line.startswith('"MultiLine"=hex(1):66,00,69,00,72,00,73,00,74,00,0d,00,0a,00,') for line in lines)
+    # Long hex data is wrapped with a trailing backslash, as regedit does
+    start = next(index for index, line in enumerate(lines) if line.startswith('"Binary"=hex:'))
+    end = next(index for index in range(start + 1, len(lines)) if not lines[index].startswith("  "))
+    binary = lines[start:end]
+    assert len(binary) > 1
+    assert all(len(line) <= 80 for line in binary)
+    assert all(line.endswith("\\") for line in binary[:-1])
+
+
+def test_reg_hex_encodings():
+    text = format_reg([
+        set_op("Multi", ["a", "b"], REG_MULTI_SZ),
+        set_op("Expand", "%TEMP%", REG_EXPAND_SZ),
+    ])
+
+    assert '"Multi"=hex(7):61,00,00,00,62,00,00,00,00,00' in text
+    assert '"Expand"=hex(2):25,00,54,00,45,00,4d,00,50,00,25,00,00,00' in text
+
+
+def test_parse_regedit_export():
+    # As written by regedit: BOM, spaces after commas, continuation lines, comments
+    text = (
+        "\ufeffWindows Registry Editor Version 5.00\r\n\r\n"
+        "; exported\r\n"
+        "[HKEY_CURRENT_USER\\Software\\Classes\\CLSID\\{86ca1aa0-34aa-4e8b-a509-50c905bae2a2}\\InprocServer32]\r\n"
+        "@=\"\"\r\n"
+        "\"Path\"=hex(2):25,00,54,00,\\\r\n"
+        "  45,00,4d,00,50,00,25,00,00,00\r\n"
+        "\"Flag\"=dword:0000000A\r\n"
+    )
+    operations = parse_reg(text)
+
+    path = r"Software\Classes\CLSID\{86ca1aa0-34aa-4e8b-a509-50c905bae2a2}\InprocServer32"
+    assert operations == [
+        RegistryOperation("set", HKEY_CURRENT_USER, path, "", "", REG_SZ),
+        RegistryOperation("set", HKEY_CURRENT_USER, path, "Path", "%TEMP%", REG_EXPAND_SZ),
+        RegistryOperation("set", HKEY_CURRENT_USER, path, "Flag", 10, REG_DWORD),
+    ]
+
+
+@pytest.mark.parametrize("text", [
+    "REGEDIT4\r\n\r\n[HKEY_LOCAL_MACHINE\\Software]\r\n",
+    "Windows Registry Editor Version 5.00\r\n\r\n[HKEY_NOWHERE\\Software]\r\n",
+    "Windows Registry Editor Version 5.00\r\n\r\n[-HKEY_LOCAL_MACHINE\\Software\\Gone]\r\n",
+    "Windows Registry Editor Version 5.00\r\n\r\n\"Orphan\"=dword:00000001\r\n",
+    "Windows Registry Editor Version 5.00\r\n\r\n[HKEY_LOCAL_MACHINE\\Software]\r\n\"Bad\"=float:1.0\r\n",
+])
+def test_parse_reg_rejects(text):
+    with pytest.raises(RegFileError):
+        parse_reg(text)
+
+
+def test_reg_file_round_trip(tmp_path):
+    path = str(tmp_path / "export.reg")
+    write_reg_file(path, OPERATIONS)
+
+    with open(path, "rb") as f:
+        data = f.read()
+    # UTF-16LE with a BOM and Windows line endings, as reg import expects
+    assert data.startswith(b"\xff\xfeW\x00i\x00n\x00")
+    assert "\r\n".encode("utf-16-le") in data
+    assert read_reg_file(path) == OPERATIONS
+
+
+def test_pol_round_trip():
+    operations = decode_pol(encode_pol(OPERATIONS))
+
+    # Deletes come back as **del. entries; everything else unchanged
+    assert operations[:-1] == OPERATIONS[:-1]
+    assert operations[-1].action == "delete"
+    assert operations[-1].value_name == "Removed"
+    assert decode_pol(encode_pol(OPERATIONS), HKEY_CURRENT_USER)[0].hive == HKEY_CURRENT_USER
+
+
+def test_pol_framing():
+    data = encode_pol([set_op("Value", 1, REG_DWORD, path="\\SOFTWARE\\Policies\\X\\")])
+
+    def text(value):
+        return value.encode("utf-16-le")
+
+    expected = (
+        b"PReg" + struct.pack("<I", 1)
+        + text("[") + text("SOFTWARE\\Policies\\X\0") + text(";") + text("Value\0") + text(";")
+        + struct.pack("<I", REG_DWORD) + text(";") + struct.pack("<I", 4) + text(";")
+        + struct.pack("<I", 1) + text("]")
+    )
+    assert data == expected
+
+
+def text_in(data: bytes, value: str) -> bool:
+    return value.encode("utf-16-le") in data
+
+
+def test_pol_delete_entry():
+    data = encode_pol([RegistryOperation("delete", HKEY_LOCAL_MACHINE, KEY, "Removed")])
+
+    assert text_in(data, POL_DELETE_PREFIX + "Removed\0")
+    assert decode_pol(data) == [RegistryOperation("delete", HKEY_LOCAL_MACHINE, KEY, "Removed")]
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"PRef\x01\x00\x00\x00",
+    b"PReg\x02\x00\x00\x00",
+    b"PReg\x01\x00\x00\x00" + "[SOFTWARE".encode("utf-16-le"),
+])
+def test_decode_pol_rejects(data):
+    with pytest.raises(RegFileError):
+        decode_pol(data)
+
+
+def test_pol_file_round_trip(tmp_path):
+    path = str(tmp_path / "Registry.pol")
+    policies = [operation for operation in OPERATIONS if operation.action == "set"]
+    write_pol_file(path, policies)
+
+    assert read_pol_file(path) == policies
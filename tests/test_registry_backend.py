@@ -0,0 +1,102 @@
+from src.core.registry_backend import HKEY_CURRENT_USER, HKEY_LOCAL_MACHINE, HKEY_USERS, REG_DWORD, CachedRegistryBackend, MemoryRegistryBackend
+from src.core.registry_manager import RegistryTransaction
+
+DATA_COLLECTION = r"SOFTWARE\Policies\Microsoft\Windows\DataCollection"
+CLSID = r"Software\Classes\CLSID"
+
+
+def memory_with_keys(*paths, hive=HKEY_LOCAL_MACHINE):
+    memory = MemoryRegistryBackend()
+    for path in paths:
+        memory.put_key(hive, path)
+    return memory
+
+
+def test_read_then_write_costs_one_upgrade_and_later_runs_no_opens():
+    memory = memory_with_keys(DATA_COLLECTION)
+    cached = CachedRegistryBackend(memory)
+
+    RegistryTransaction(cached).set_value(DATA_COLLECTION, "AllowTelemetry", 0).commit(skip_compliant=True)
+    # One read handle for the diff, replaced by a writable one for the commit
+    assert memory.operations["open"] == 2 and memory.open_handles == 1
+
+    RegistryTransaction(cached).set_value(DATA_COLLECTION, "AllowTelemetry", 1).commit(skip_compliant=True)
+    assert memory.operations["open"] == 2
+    assert memory.get_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry") == 1
+
+    cached.close()
+    assert memory.open_handles == 0
+
+
+def test_least_recently_used_idle_keys_are_evicted():
+    paths = [f"SOFTWARE\\Key{n}" for n in range(3)]
+    memory = memory_with_keys(*paths)
+    cached = CachedRegistryBackend(memory, capacity=2)
+
+    for path in paths[:2]:
+        cached.close_key(cached.open_key(HKEY_LOCAL_MACHINE, path))
+    cached.close_key(cached.open_key(HKEY_LOCAL_MACHINE, paths[0]))
+    cached.close_key(cached.open_key(HKEY_LOCAL_MACHINE, paths[2]))
+
+    assert memory.open_handles == 2
+    opens = memory.operations["open"]
+    cached.close_key(cached.open_key(HKEY_LOCAL_MACHINE, paths[0].lower()))
+    assert memory.operations["open"] == opens
+    cached.close_key(cached.open_key(HKEY_LOCAL_MACHINE, paths[1]))
+    assert memory.operations["open"] == opens + 1
+
+
+def test_keys_in_use_are_never_closed_under_their_user():
+    paths = [f"SOFTWARE\\Key{n}" for n in range(3)]
+    memory = memory_with_keys(*paths)
+    cached = CachedRegistryBackend(memory, capacity=1)
+
+    handles = [cached.open_key(HKEY_LOCAL_MACHINE, path) for path in paths]
+    assert memory.open_handles == 3
+
+    # A read handle replaced by a writable one stays usable until released
+    writable = cached.open_key(HKEY_LOCAL_MACHINE, paths[0], write=True)
+    cached.set_value(writable, "Value", REG_DWORD, 1)
+    assert cached.query_value(handles[0], "Value") == (1, REG_DWORD)
+    assert memory.open_handles == 4
+
+    for handle in handles + [writable]:
+        cached.close_key(handle)
+    assert memory.open_handles == 1
+
+
+def test_subkeys_are_opened_relative_to_a_cached_parent():
+    memory = memory_with_keys(CLSID, hive=HKEY_CURRENT_USER)
+    cached = CachedRegistryBackend(memory)
+    opened = []
+    open_key = memory.open_key
+
+    def record(hive, key_path, create=False, write=False):
+        opened.append((hive, key_path))
+        return open_key(hive, key_path, create, write)
+
+    memory.open_key = record
+    cached.close_key(cached.open_key(HKEY_CURRENT_USER, CLSID, create=True, write=True))
+    handle = cached.open_key(HKEY_CURRENT_USER, CLSID + r"\{86ca1aa0}\InprocServer32", create=True, write=True)
+    cached.set_value(handle, "", 1, "")
+    cached.close_key(handle)
+
+    assert opened == [
+        (HKEY_CURRENT_USER, CLSID),
+        ((HKEY_CURRENT_USER, CLSID.lower()), r"{86ca1aa0}\InprocServer32"),
+    ]
+    assert memory.get_value(HKEY_CURRENT_USER, CLSID + r"\{86ca1aa0}\InprocServer32", "") == ""
+
+
+def test_idle_handles_under_a_user_hive_are_closed_before_it_is_unloaded():
+    memory = MemoryRegistryBackend()
+    memory.hive_files[r"c:\users\alice\ntuser.dat"] = {"": {}, "software": {}}
+    cached = CachedRegistryBackend(memory)
+    cached.load_hive("S-1-5-21-1", r"C:\Users\Alice\NTUSER.DAT")
+    cached.close_key(cached.open_key(HKEY_USERS, r"S-1-5-21-1\Software"))
+    cached.close_key(cached.open_key(HKEY_LOCAL_MACHINE, "SOFTWARE", create=True))
+
+    cached.unload_hive("S-1-5-21-1")
+
+    assert memory.open_handles == 1
+    assert r"c:\users\alice\ntuser.dat" in memory.hive_files
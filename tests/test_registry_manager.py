@@ -0,0 +1,147 @@
+from src.core.journal import Journal, RegistryPrior, read_journal
+from src.core.registry_backend import HKEY_CURRENT_USER, HKEY_LOCAL_MACHINE, REG_DWORD, REG_SZ, MemoryRegistryBackend
+from src.core.registry_manager import RegistryOperationResult, RegistryTransaction
+
+DATA_COLLECTION = r"SOFTWARE\Policies\Microsoft\Windows\DataCollection"
+ADVERTISING = r"Software\Microsoft\Windows\CurrentVersion\AdvertisingInfo"
+
+
+def registry_with_telemetry_on():
+    registry = MemoryRegistryBackend()
+    registry.put_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry", 3, REG_DWORD)
+    registry.put_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "Obsolete", "x", REG_SZ)
+    return registry
+
+
+def test_each_key_is_opened_once_for_all_its_values():
+    registry = MemoryRegistryBackend()
+    results = (
+        RegistryTransaction(registry)
+        .set_values(DATA_COLLECTION, {"AllowTelemetry": 0, "MaxTelemetryAllowed": 0, "Label": ("off", REG_SZ)})
+        .set_value(ADVERTISING, "Enabled", 0, hive=HKEY_CURRENT_USER)
+        .set_value(DATA_COLLECTION.upper(), "DoNotShowFeedbackNotifications", 1)
+        .commit()
+    )
+
+    assert all(result.success for result in results)
+    assert [result.operation.value_name for result in results] == [
+        "AllowTelemetry", "MaxTelemetryAllowed", "Label", "Enabled", "DoNotShowFeedbackNotifications"]
+    assert registry.operations["open"] == 2 and registry.operations["set"] == 5
+    assert registry.open_handles == 0
+    assert registry.get_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "Label") == "off"
+    assert registry.keys[(HKEY_LOCAL_MACHINE, DATA_COLLECTION.lower())]["label"][2] == REG_SZ
+    assert registry.get_value(HKEY_CURRENT_USER, ADVERTISING, "Enabled") == 0
+
+
+def test_diff_replays_earlier_operations_on_the_same_value():
+    transaction = (
+        RegistryTransaction(registry_with_telemetry_on())
+        .set_value(DATA_COLLECTION, "AllowTelemetry", 3)
+        .set_value(DATA_COLLECTION, "AllowTelemetry", 0)
+        .set_value(DATA_COLLECTION, "AllowTelemetry", 3, REG_SZ)
+        .delete_value(DATA_COLLECTION, "Obsolete")
+        .delete_value(DATA_COLLECTION, "Obsolete")
+        .set_value(r"SOFTWARE\Does\Not\Exist", "Value", 1)
+    )
+
+    diffs = transaction.diff()
+
+    assert [diff.compliant for diff in diffs] == [True, False, False, False, True, False]
+    assert (diffs[0].current, diffs[0].current_type, diffs[0].exists) == (3, REG_DWORD, True)
+    assert (diffs[2].current, diffs[2].exists) == (0, True)
+    assert not diffs[4].exists
+    assert (diffs[5].current, diffs[5].exists) == (None, False)
+
+
+def test_compliant_values_are_not_written():
+    registry = registry_with_telemetry_on()
+    registry.put_value(HKEY_CURRENT_USER, ADVERTISING, "Enabled", 0, REG_DWORD)
+    results = (
+        RegistryTransaction(registry)
+        .set_value(DATA_COLLECTION, "AllowTelemetry", 0)
+        .set_value(ADVERTISING, "Enabled", 0, hive=HKEY_CURRENT_USER)
+        .commit(skip_compliant=True)
+    )
+
+    assert [(result.success, result.compliant) for result in results] == [(True, False), (True, True)]
+    assert registry.operations["set"] == 1
+    # Read once each, then only the key with a change is opened again to write
+    assert registry.operations["open"] == 3
+
+
+def test_a_key_that_cannot_be_opened_fails_only_its_own_operations():
+    registry = registry_with_telemetry_on()
+    open_key = registry.open_key
+
+    def deny_advertising(hive, key_path, create=False, write=False):
+        if write and hive == HKEY_CURRENT_USER:
+            raise PermissionError(5, "Access is denied", key_path)
+        return open_key(hive, key_path, create, write)
+
+    registry.open_key = deny_advertising
+    results = (
+        RegistryTransaction(registry)
+        .set_value(ADVERTISING, "Enabled", 0, hive=HKEY_CURRENT_USER)
+        .set_value(DATA_COLLECTION, "AllowTelemetry", 0)
+        .delete_value(DATA_COLLECTION, "Missing")
+        .commit()
+    )
+
+    assert not results[0].success and "Access is denied" in results[0].error
+    assert results[1].success
+    assert not results[2].success
+    assert registry.get_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry") == 0
+
+
+def test_prior_values_are_journaled_before_the_first_write(tmp_path):
+    registry = registry_with_telemetry_on()
+    journal = Journal("run", str(tmp_path))
+    recorded = []
+    record = journal.record
+
+    def record_before_writes(entries):
+        assert registry.operations["set"] == 0 and registry.operations["delete"] == 0
+        entries = list(entries)
+        recorded.extend(entries)
+        record(entries)
+
+    journal.record = record_before_writes
+    results = (
+        RegistryTransaction(registry, journal)
+        .set_value(DATA_COLLECTION, "AllowTelemetry", 0)
+        .set_value(DATA_COLLECTION, "AllowTelemetry", 0)
+        .delete_value(DATA_COLLECTION, "Obsolete")
+        .set_value(ADVERTISING, "Enabled", 0, hive=HKEY_CURRENT_USER)
+        .commit(skip_compliant=True)
+    )
+    journal.close()
+
+    assert [result.compliant for result in results] == [False, True, False, False]
+    assert recorded == read_journal("run", str(tmp_path)) == [
+        RegistryPrior(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry", True, REG_DWORD, 3),
+        RegistryPrior(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "Obsolete", True, REG_SZ, "x"),
+        RegistryPrior(HKEY_CURRENT_USER, ADVERTISING, "Enabled", False),
+    ]
+
+
+def test_nothing_is_written_if_the_journal_cannot_be_written():
+    registry = registry_with_telemetry_on()
+
+    class FullDisk(Journal):
+        def record(self, entries):
+            raise OSError(28, "No space left on device")
+
+    transaction = (
+        RegistryTransaction(registry, FullDisk("run", "unused"))
+        .set_value(DATA_COLLECTION, "AllowTelemetry", 3)
+        .set_value(DATA_COLLECTION, "MaxTelemetryAllowed", 0)
+    )
+
+    assert transaction.prepare(skip_compliant=True)[0] == RegistryOperationResult(
+        transaction.operations[0], True, compliant=True)
+    results = transaction.commit(skip_compliant=True)
+
+    assert results[0].success and results[0].compliant
+    assert not results[1].success and results[1].error.startswith("Could not journal prior values")
+    assert registry.operations["set"] == 0
+    assert registry.get_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "MaxTelemetryAllowed") is None
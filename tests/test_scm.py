@@ -0,0 +1,130 @@
+import sys
+import pytest
+from src.core import transport
+from src.core.backend import WindowsBackend
+from src.core.command_runner import CommandResult
+from src.core.scm import NativeServiceApi
+from src.core.service_manager import (
+    ERROR_SERVICE_DOES_NOT_EXIST,
+    ERROR_SERVICE_NOT_ACTIVE,
+    SERVICE_DISABLED,
+    SERVICE_RUNNING,
+    SERVICE_STOPPED,
+    ScServiceApi,
+    ServiceController,
+    ServiceRequest,
+)
+
+# `sc` output on a German install: labels are translated, state names and exit codes are not
+QUERY_DE = """
+SERVICE_NAME: DiagTrack
+        TYP                : 10  WIN32_OWN_PROCESS
+        STATUS             : 4  RUNNING
+                                (STOPPABLE, NOT_PAUSABLE, ACCEPTS_SHUTDOWN)
+"""
+QC_DE = """[SC] QueryServiceConfig ERFOLG
+
+SERVICE_NAME: DiagTrack
+        TYP                : 10  WIN32_OWN_PROCESS
+        START_TYPE         : 2   AUTO_START
+"""
+MISSING_DE = """[SC] OpenService FEHLER 1060:
+
+Der angegebene Dienst ist kein installierter Dienst.
+"""
+ENUM_DE = """
+SERVICE_NAME: DiagTrack
+ANZEIGENAME: Benutzererfahrung und Telemetrie im verbundenen Modus
+        TYP                : 10  WIN32_OWN_PROCESS
+        STATUS             : 4  RUNNING
+
+SERVICE_NAME: WerSvc
+ANZEIGENAME: Windows-Fehlerberichterstattungsdienst
+        TYP                : 10  WIN32_OWN_PROCESS
+        STATUS             : 1  STOPPED
+"""
+
+
+class GermanSc:
+    """Answers sc command lines like a German Windows install with DiagTrack running."""
+
+    def __init__(self):
+        self.state = SERVICE_RUNNING
+        self.calls = []
+
+    def __call__(self, args):
+        self.calls.append(list(args))
+        command, name = args[1], args[2]
+        if command == "query" and name == "type=":
+            return CommandResult(args, 0, ENUM_DE)
+        if name != "DiagTrack":
+            return CommandResult(args, ERROR_SERVICE_DOES_NOT_EXIST, MISSING_DE)
+        if command == "query":
+            return CommandResult(args, 0, QUERY_DE if self.state == SERVICE_RUNNING else QUERY_DE.replace("4  RUNNING", "1  STOPPED"))
+        if command == "qc":
+            return CommandResult(args, 0, QC_DE)
+        if command == "stop":
+            if self.state == SERVICE_STOPPED:
+                return CommandResult(args, ERROR_SERVICE_NOT_ACTIVE, "[SC] ControlService FEHLER 1062:\n")
+            self.state = SERVICE_STOPPED
+            return CommandResult(args, 0, "")
+        return CommandResult(args, 0, "[SC] ChangeServiceConfig ERFOLG\n")
+
+
+def test_sc_calls_are_decided_by_exit_code_on_a_localized_install():
+    api = ScServiceApi(GermanSc())
+
+    assert api.query_state("DiagTrack").value == SERVICE_RUNNING
+    assert api.query_start_type("DiagTrack").value == 2
+    assert api.enumerate() == {"diagtrack": SERVICE_RUNNING, "wersvc": SERVICE_STOPPED}
+    missing = api.query_state("dmwappushservice")
+    assert missing.error == ERROR_SERVICE_DOES_NOT_EXIST and not missing.ok
+    assert "kein installierter Dienst" in missing.message
+    assert api.stop("DiagTrack").ok
+    assert api.stop("DiagTrack").error == ERROR_SERVICE_NOT_ACTIVE
+
+
+def test_controller_over_sc_stops_and_disables():
+    sc = GermanSc()
+    controller = ServiceController(runner=sc, poll_interval=0)
+
+    results = controller.run([ServiceRequest("DiagTrack"), ServiceRequest("dmwappushservice")])
+
+    assert results[0].success and results[0].changed
+    assert not results[1].exists
+    assert ["sc", "config", "DiagTrack", "start=", "disabled"] in sc.calls
+    assert sum(1 for args in sc.calls if args[1] == "query" and args[2] != "type=") == 1
+
+
+def test_truncated_enumeration_is_not_trusted():
+    def more_data(args):
+        return CommandResult(args, 0, ENUM_DE + "\n[SC] EnumServicesStatus: more data, need 5120 bytes\n")
+
+    assert ScServiceApi(more_data).enumerate() is None
+
+
+def test_failed_call_without_output_names_the_command():
+    call = ScServiceApi(lambda args: CommandResult(args, 5)).set_start_type("DiagTrack", SERVICE_DISABLED)
+
+    assert call.error == 5 and call.message == "sc config exited with 5"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs a host without advapi32")
+def test_backends_fall_back_to_sc_without_the_scm_api(monkeypatch):
+    with pytest.raises(OSError):
+        NativeServiceApi()
+    assert isinstance(WindowsBackend().services, ScServiceApi)
+
+    calls = []
+    monkeypatch.setattr(transport, "run_command", lambda args: calls.append(args) or CommandResult(args, 0, QUERY_DE))
+    remote = transport.RemoteTransport("pc01")
+    services = remote.services
+
+    assert isinstance(services, ScServiceApi)
+    assert services is remote.services
+    assert services.query_state("DiagTrack").value == SERVICE_RUNNING
+    assert services.set_start_type("DiagTrack", SERVICE_DISABLED).ok
+    assert calls == [
+        ["sc", "\\\\pc01", "query", "DiagTrack"],
+        ["sc", "\\\\pc01", "config", "DiagTrack", "start=", "disabled"],
+    ]
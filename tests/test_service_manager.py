@@ -0,0 +1,165 @@
+import threading
+from src.core.journal import Journal, ServicePrior, read_journal
+from src.core.service_manager import (
+    ERROR_SERVICE_DOES_NOT_EXIST,
+    ERROR_SERVICE_NOT_ACTIVE,
+    SERVICE_DISABLED,
+    SERVICE_RUNNING,
+    SERVICE_STOP_PENDING,
+    SERVICE_STOPPED,
+    ServiceApi,
+    ServiceCall,
+    ServiceController,
+    ServiceRequest,
+)
+
+
+class FakeServiceApi(ServiceApi):
+    """Services in memory; a stopped service stays STOP_PENDING for `pending_polls` queries."""
+
+    def __init__(self, services, pending_polls=0, can_enumerate=True):
+        # Lower-cased name -> [state, start type]
+        self.services = {name.lower(): list(service) for name, service in services.items()}
+        self.pending_polls = pending_polls
+        self.can_enumerate = can_enumerate
+        self.calls = []
+        self.waiting = {}
+        self.lock = threading.Lock()
+
+    def _record(self, call, service_name=None):
+        with self.lock:
+            self.calls.append((call, service_name) if service_name else (call,))
+        return self.services.get(service_name.lower()) if service_name else None
+
+    def enumerate(self):
+        self._record("enumerate")
+        if not self.can_enumerate:
+            return None
+        return {name: service[0] for name, service in self.services.items()}
+
+    def query_state(self, service_name):
+        service = self._record("query_state", service_name)
+        if service is None:
+            return ServiceCall(ERROR_SERVICE_DOES_NOT_EXIST, None, "The specified service does not exist")
+        if service[0] == SERVICE_STOP_PENDING:
+            remaining = self.waiting[service_name.lower()]
+            if remaining == 0:
+                service[0] = SERVICE_STOPPED
+            self.waiting[service_name.lower()] = remaining - 1
+        return ServiceCall(0, service[0])
+
+    def query_start_type(self, service_name):
+        service = self._record("query_start_type", service_name)
+        return ServiceCall(0, service[1]) if service else ServiceCall(ERROR_SERVICE_DOES_NOT_EXIST)
+
+    def set_start_type(self, service_name, start_type):
+        self._record("set_start_type", service_name)[1] = start_type
+        return ServiceCall()
+
+    def stop(self, service_name):
+        service = self._record("stop", service_name)
+        if service[0] == SERVICE_STOPPED:
+            return ServiceCall(ERROR_SERVICE_NOT_ACTIVE, None, "The service has not been started")
+        service[0] = SERVICE_STOP_PENDING
+        self.waiting[service_name.lower()] = self.pending_polls
+        return ServiceCall()
+
+    def start(self, service_name):
+        self._record("start", service_name)[0] = SERVICE_RUNNING
+        return ServiceCall()
+
+    def count(self, call):
+        return sum(1 for recorded in self.calls if recorded[0] == call)
+
+
+def controller_for(api, **kwargs):
+    sleeps = []
+    return ServiceController(api=api, sleep=sleeps.append, poll_interval=0.5, **kwargs), sleeps
+
+
+def test_stop_waits_for_the_service_to_finish_stopping():
+    api = FakeServiceApi({"DiagTrack": (SERVICE_RUNNING, 2)}, pending_polls=3)
+    controller, sleeps = controller_for(api)
+
+    result = controller.apply(ServiceRequest("DiagTrack"))
+
+    assert result.success and result.changed
+    assert result.actions == {"stop": True, "disable": True}
+    assert result.state == SERVICE_STOPPED
+    assert sleeps == [0.5, 0.5, 0.5]
+    assert api.services["diagtrack"] == [SERVICE_STOPPED, SERVICE_DISABLED]
+
+
+def test_a_service_that_does_not_stop_in_time_fails():
+    api = FakeServiceApi({"DiagTrack": (SERVICE_RUNNING, 2)}, pending_polls=10 ** 6)
+    controller, _ = controller_for(api, stop_timeout=0)
+
+    result = controller.apply(ServiceRequest("DiagTrack"))
+
+    assert not result.success
+    assert result.actions == {"stop": False, "disable": True}
+    assert result.state == SERVICE_STOP_PENDING
+    assert result.error == "stop: Service did not stop within 0 seconds"
+
+
+def test_missing_service_is_reported_without_trying_its_actions():
+    api = FakeServiceApi({})
+    controller, _ = controller_for(api)
+
+    result = controller.apply(ServiceRequest("dmwappushservice"))
+
+    assert not result.success and not result.exists
+    assert result.actions is None
+    assert api.calls == [("query_state", "dmwappushservice")]
+
+
+def test_stopped_and_disabled_service_is_left_alone():
+    api = FakeServiceApi({"DiagTrack": (SERVICE_STOPPED, SERVICE_DISABLED)})
+    controller, _ = controller_for(api)
+
+    result = controller.apply(ServiceRequest("DiagTrack"))
+
+    assert result.success and not result.changed
+    assert api.count("stop") == api.count("set_start_type") == 0
+
+
+def test_many_services_share_one_enumeration():
+    api = FakeServiceApi({
+        "DiagTrack": (SERVICE_RUNNING, 2),
+        "dmwappushservice": (SERVICE_RUNNING, 3),
+        "WerSvc": (SERVICE_STOPPED, 3),
+    })
+    controller, _ = controller_for(api, max_workers=3)
+    requests = [ServiceRequest(name) for name in ("DiagTrack", "dmwappushservice", "WerSvc", "Missing")]
+
+    results = controller.run(requests)
+
+    assert [result.service_name for result in results] == ["DiagTrack", "dmwappushservice", "WerSvc", "Missing"]
+    assert [result.success for result in results] == [True, True, True, False]
+    assert not results[3].exists
+    assert api.count("enumerate") == 1
+    # Only the services that were stopped are polled; the snapshot answers the rest
+    assert api.count("query_state") == 2
+    assert controller.snapshot is None
+
+
+def test_services_are_queried_one_by_one_if_the_enumeration_fails():
+    api = FakeServiceApi({"DiagTrack": (SERVICE_STOPPED, 2), "WerSvc": (SERVICE_STOPPED, 3)}, can_enumerate=False)
+    controller, _ = controller_for(api)
+
+    results = controller.run([ServiceRequest("DiagTrack", ("disable",)), ServiceRequest("WerSvc", ("disable",))])
+
+    assert all(result.success and result.changed for result in results)
+    assert api.count("enumerate") == 1 and api.count("query_state") == 2
+
+
+def test_prior_state_is_journaled_before_the_change(tmp_path):
+    api = FakeServiceApi({"DiagTrack": (SERVICE_RUNNING, 2)})
+    journal = Journal("run", str(tmp_path))
+    controller, _ = controller_for(api, journal=journal)
+
+    assert controller.apply(ServiceRequest("DiagTrack")).success
+    journal.close()
+
+    assert read_journal("run", str(tmp_path)) == [ServicePrior("DiagTrack", 2, SERVICE_RUNNING)]
+    assert api.calls.index(("query_start_type", "DiagTrack")) < api.calls.index(("stop", "DiagTrack"))
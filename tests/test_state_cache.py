@@ -0,0 +1,103 @@
+import json
+from src.core.planner import PlanExecutor, build_plan
+from src.core.profiles import load_profile
+from src.core.registry_backend import HKEY_LOCAL_MACHINE, REG_DWORD
+from src.core.simulator import SimulatedHost, SimulatorBackend
+from src.core.state_cache import ComplianceCache, StateDetector, record_results, split_unchanged
+
+DATA_COLLECTION = r"SOFTWARE\Policies\Microsoft\Windows\DataCollection"
+
+
+def apply(host, profiles, cache):
+    backend = SimulatorBackend(host)
+    detector = StateDetector(backend)
+    pending, unchanged = split_unchanged(profiles, cache, detector)
+    if pending:
+        result = PlanExecutor.for_transport(backend, poll_interval=0).execute(build_plan(pending))
+        record_results(pending, result, cache, detector)
+    return [profile.name for profile in pending], [profile.name for profile in unchanged]
+
+
+def test_unchanged_profiles_are_skipped_until_their_targets_change(tmp_path):
+    host = SimulatedHost.windows_default()
+    cache = ComplianceCache(str(tmp_path / "compliance.json"))
+    profiles = [load_profile("telemetry"), load_profile("copilot")]
+
+    assert apply(host, profiles, cache) == (["telemetry", "copilot"], [])
+    commands = len(host.commands)
+    assert apply(host, profiles, cache) == ([], ["telemetry", "copilot"])
+    # Skipping costs one service enumeration and one task listing, no changes
+    assert [args[:2] for args in host.commands[commands:]] == [["sc", "query"], ["schtasks", "/query"]]
+
+    # Rewriting a value, even with the same data, moves the key's last write time
+    host.registry.put_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry", 0, REG_DWORD)
+    assert apply(host, profiles, cache) == (["telemetry"], ["copilot"])
+    assert apply(host, profiles, cache) == ([], ["telemetry", "copilot"])
+
+    host.services["diagtrack"]["state"] = 4
+    assert apply(host, profiles, cache) == (["telemetry"], ["copilot"])
+
+    host.tasks[next(iter(host.tasks))]["enabled"] = True
+    assert apply(host, profiles, cache) == (["telemetry"], ["copilot"])
+
+
+def test_edited_profiles_are_applied_again(tmp_path):
+    host = SimulatedHost.windows_default()
+    cache = ComplianceCache(str(tmp_path / "compliance.json"))
+    copilot = load_profile("copilot")
+    apply(host, [copilot], cache)
+
+    edited = copilot._replace(post_actions=["restart_explorer"])
+
+    assert apply(host, [edited], cache) == (["copilot"], [])
+
+
+def test_failed_profiles_are_not_recorded(tmp_path):
+    host = SimulatedHost.windows_default()
+    cache = ComplianceCache(str(tmp_path / "compliance.json"))
+    telemetry = load_profile("telemetry")
+    apply(host, [telemetry], cache)
+    host.services["diagtrack"]["state"] = 4
+    host.failure_rate = 1.0
+
+    assert apply(host, [telemetry], cache) == (["telemetry"], [])
+    assert cache.entries == {}
+
+
+def test_nothing_is_skipped_without_a_task_listing(tmp_path):
+    host = SimulatedHost.windows_default()
+    cache = ComplianceCache(str(tmp_path / "compliance.json"))
+    telemetry = load_profile("telemetry")
+    apply(host, [telemetry], cache)
+
+    run = host.run
+    host.run = lambda args: run(["schtasks", "/bogus"]) if args[0] == "schtasks" else run(args)
+
+    assert apply(host, [telemetry], cache) == (["telemetry"], [])
+
+
+def test_cache_survives_a_restart_and_evicts_old_entries(tmp_path):
+    path = str(tmp_path / "cache" / "compliance.json")
+    cache = ComplianceCache(path, max_entries=2, max_age=100)
+    profile = load_profile("copilot")
+    for host in ("a", "b", "c"):
+        cache.record(host, profile, {"registry:x": 1})
+    cache.entries["c|copilot"]["time"] -= 50
+    cache.save()
+
+    reloaded = ComplianceCache(path, max_entries=2, max_age=100)
+    assert sorted(reloaded.entries) == ["a|copilot", "b|copilot"]
+    assert reloaded.is_current("A", profile, {"registry:x": 1})
+    assert not reloaded.is_current("a", profile, {"registry:x": 2})
+
+    assert reloaded.evict(now=reloaded.entries["a|copilot"]["time"] + 101) == 2
+    assert reloaded.entries == {}
+
+
+def test_unreadable_or_outdated_cache_files_start_empty(tmp_path):
+    path = tmp_path / "compliance.json"
+    path.write_text("{not json", encoding="utf-8")
+    assert ComplianceCache(str(path)).entries == {}
+
+    path.write_text(json.dumps({"version": 0, "entries": {"a|copilot": {"time": 0}}}), encoding="utf-8")
+    assert ComplianceCache(str(path)).entries == {}
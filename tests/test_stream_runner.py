@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+from typing import List
+from src.core.command_runner import AsyncCommandRunner, CommandResult
+from src.core.stream_runner import StreamRunner, parse_progress
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+SFC_OUTPUT = os.path.join(FIXTURES, "sfc_scannow.out")
+DISM_OUTPUT = os.path.join(FIXTURES, "dism_restorehealth.out")
+
+
+class ReplayRunner:
+    """Stands in for AsyncCommandRunner and replays captured output in small chunks."""
+
+    def __init__(self, path: str, chunk_size: int = 5, returncode: int = 0):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.chunk_size = chunk_size
+        self.returncode = returncode
+        self.calls: List[List[str]] = []
+
+    def run(self, args, timeout=None, on_output=None, merge_stderr=False) -> CommandResult:
+        self.calls.append(list(args))
+        for offset in range(0, len(self.data), self.chunk_size):
+            on_output(self.data[offset:offset + self.chunk_size])
+        return CommandResult(list(args), self.returncode, "", "", 0.01)
+
+
+def test_parse_progress():
+    assert parse_progress("Verification 45% complete.") == 45.0
+    assert parse_progress("[=====       20.0%          ]") == 20.0
+    assert parse_progress("[====      62,3%      ]") == 62.3
+    assert parse_progress("Beginning system scan.") is None
+    assert parse_progress("250% done") is None
+
+
+def test_sfc_progress_from_utf16_output():
+    # Odd chunk sizes split UTF-16 code units and lines across callbacks
+    runner = ReplayRunner(SFC_OUTPUT, chunk_size=5)
+    events = []
+    lines = []
+    result = StreamRunner(runner).run("sfc", ["sfc", "/scannow"], on_progress=events.append, on_line=lines.append)
+
+    assert [event.percent for event in events] == [float(percent) for percent in range(101)]
+    assert all(event.stage == "sfc" for event in events)
+    assert events[-1].line == "Verification 100% complete."
+    assert lines == [
+        "Beginning system scan.  This process will take some time.",
+        "Beginning verification phase of system scan.",
+        "Windows Resource Protection did not find any integrity violations.",
+    ]
+    assert result.returncode == 0
+    assert not result.timed_out
+    assert result.percent == 100.0
+
+
+def test_dism_progress_bar():
+    runner = ReplayRunner(DISM_OUTPUT, chunk_size=7)
+    events = []
+    result = StreamRunner(runner).run("dism", ["DISM", "/Online", "/Cleanup-Image", "/RestoreHealth"], on_progress=events.append)
+
+    # The redrawn 4.4% bar is reported once
+    assert [event.percent for event in events] == [0.0, 4.4, 10.1, 20.0, 38.2, 62.3, 84.9, 100.0]
+    assert events[-1].line.startswith("[") and "100.0%" in events[-1].line
+    assert result.lines[-2:] == ["The restore operation completed successfully.", "The operation completed successfully."]
+
+
+def test_output_tail_is_bounded():
+    result = StreamRunner(ReplayRunner(DISM_OUTPUT), max_lines=2).run("dism", ["DISM"])
+
+    assert result.lines == ["The restore operation completed successfully.", "The operation completed successfully."]
+
+
+def test_replayed_process_end_to_end():
+    # A real child process writes the capture through the shared runner's pipes
+    script = (
+        "import sys, time\n"
+        f"data = open({DISM_OUTPUT!r}, 'rb').read()\n"
+        "for offset in range(0, len(data), 64):\n"
+        "    sys.stdout.buffer.write(data[offset:offset + 64]); sys.stdout.flush(); time.sleep(0.001)\n"
+    )
+    runner = AsyncCommandRunner()
+    try:
+        events = []
+        result = StreamRunner(runner).run("dism", [sys.executable, "-c", script], timeout=30, on_progress=events.append)
+    finally:
+        runner.close()
+
+    assert result.returncode == 0
+    assert [event.percent for event in events][-1] == 100.0
+    assert result.lines[-1] == "The operation completed successfully."
+
+
+def test_timeout_kills_the_process(tmp_path):
+    # Half of the capture is written, then the process hangs
+    pid_file = tmp_path / "pid"
+    script = (
+        "import os, sys, time\n"
+        f"open({str(pid_file)!r}, 'w').write(str(os.getpid()))\n"
+        f"data = open({SFC_OUTPUT!r}, 'rb').read()\n"
+        "sys.stdout.buffer.write(data[:len(data) // 2]); sys.stdout.flush()\n"
+        "time.sleep(60)\n"
+    )
+    runner = AsyncCommandRunner()
+    try:
+        events = []
+        start = time.monotonic()
+        result = StreamRunner(runner).run("sfc", [sys.executable, "-c", script], timeout=2, on_progress=events.append)
+        elapsed = time.monotonic() - start
+    finally:
+        runner.close()
+
+    assert result.timed_out
+    assert result.returncode is None
+    assert elapsed < 10
+    assert events and 0 < result.percent < 100
+    assert result.percent == events[-1].percent
+    assert result.lines[:2] == [
+        "Beginning system scan.  This process will take some time.",
+        "Beginning verification phase of system scan.",
+    ]
+    # Killed and reaped, so the pid no longer exists
+    pid = int(pid_file.read_text())
+    try:
+        os.kill(pid, 0)
+        alive = True
+    except ProcessLookupError:
+        alive = False
+    assert not alive
+
+
+def test_command_that_cannot_start():
+    runner = AsyncCommandRunner()
+    try:
+        result = StreamRunner(runner).run("sfc", ["definitely-not-a-command-wscript"])
+    finally:
+        runner.close()
+
+    assert result.returncode is None
+    assert not result.timed_out
+    assert len(result.lines) == 1 and result.lines[0]
@@ -0,0 +1,141 @@
+import os
+from src.core.command_runner import CommandResult
+from src.core.dry_run import describe, predict
+from src.core.planner import PlanExecutor, build_plan
+from src.core.profiles import load_profile
+from src.core.simulator import SimulatedHost, SimulatorBackend
+from src.core.task_manager import TaskInventory, parse_schtasks_csv
+from src.core.verifier import Verifier
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+APPRAISER = r"Microsoft\Windows\Application Experience\Microsoft Compatibility Appraiser"
+UPDATER = r"Microsoft\Windows\Application Experience\ProgramDataUpdater"
+CONSOLIDATOR = r"Microsoft\Windows\Customer Experience Improvement Program\Consolidator"
+USB_CEIP = r"Microsoft\Windows\Customer Experience Improvement Program\UsbCeip"
+KERNEL_CEIP = r"Microsoft\Windows\Customer Experience Improvement Program\KernelCeipTask"
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def replay(output: str, returncode: int = 0):
+    calls = []
+
+    def runner(args):
+        calls.append(list(args))
+        return CommandResult(list(args), returncode, output if returncode == 0 else "", "" if returncode == 0 else "ERROR: Access is denied.")
+    return runner, calls
+
+
+def test_repeated_headers_and_triggers_are_collapsed():
+    tasks = parse_schtasks_csv(read_fixture("schtasks_query_en.csv"))
+
+    # Three folders with a header each, three tasks listed once per trigger
+    assert len(tasks) == 7
+    assert "\\hostname" not in tasks and "\\taskname" not in tasks
+    assert tasks["\\" + APPRAISER.lower()].path == "\\" + APPRAISER
+    assert tasks["\\" + APPRAISER.lower()].status == "Ready"
+
+
+def test_inventory_lookups_from_english_output():
+    runner, calls = replay(read_fixture("schtasks_query_en.csv"))
+    inventory = TaskInventory(runner)
+
+    assert inventory.get(APPRAISER).enabled
+    assert inventory.get("\\" + APPRAISER.upper()) == inventory.get(APPRAISER)
+    assert inventory.is_enabled(CONSOLIDATOR)
+    assert inventory.is_enabled(KERNEL_CEIP)
+    assert inventory.get(r"Microsoft\Windows\Application Experience\PcaPatchDbTask").status == "Running"
+    assert not inventory.is_enabled(UPDATER)
+    assert inventory.exists(UPDATER)
+    assert not inventory.is_enabled(USB_CEIP)
+    assert inventory.get(r"Microsoft\Windows\Does Not Exist") is None
+    # Every lookup is answered from one snapshot
+    assert calls == [["schtasks", "/query", "/fo", "CSV", "/v"]]
+
+
+def test_inventory_lookups_from_localized_output():
+    runner, _ = replay(read_fixture("schtasks_query_de.csv"))
+    inventory = TaskInventory(runner)
+
+    assert len(inventory.refresh()) == 4
+    appraiser = inventory.get(APPRAISER)
+    assert appraiser.path == "\\" + APPRAISER
+    assert appraiser.status == "Bereit" and appraiser.enabled
+    assert inventory.is_enabled(CONSOLIDATOR)
+    assert not inventory.is_enabled(UPDATER)
+    assert not inventory.is_enabled(USB_CEIP)
+    assert not inventory.exists(KERNEL_CEIP)
+
+
+def test_failed_query_leaves_the_tasks_unknown():
+    runner, calls = replay("", returncode=1)
+    inventory = TaskInventory(runner)
+
+    assert inventory.refresh() == {}
+    assert inventory.error == "ERROR: Access is denied."
+    # Not "not found": the change fails, without trying schtasks /change
+    results = inventory.disable([APPRAISER, UPDATER])
+    assert [result.success for result in results] == [False, False]
+    assert all(result.exists for result in results)
+    assert results[0].error == "Could not list scheduled tasks: ERROR: Access is denied."
+    assert len(calls) == 1
+
+
+def test_timed_out_query_leaves_the_tasks_unknown():
+    inventory = TaskInventory(lambda args: CommandResult(list(args), -1, "", "", 30.0, timed_out=True))
+
+    assert not inventory.enable([APPRAISER])[0].success
+    assert inventory.error == "schtasks timed out"
+
+
+def test_successful_query_clears_the_error():
+    outputs = [("", 1), (read_fixture("schtasks_query_en.csv"), 0)]
+
+    def runner(args):
+        output, returncode = outputs.pop(0)
+        return CommandResult(list(args), returncode, output, "denied" if returncode else "")
+
+    inventory = TaskInventory(runner)
+    inventory.refresh()
+    assert inventory.error == "denied"
+    inventory.refresh()
+    assert inventory.error is None and inventory.is_enabled(APPRAISER)
+
+
+class UnlistableTasks(SimulatorBackend):
+    """A simulated host on which schtasks /query is denied."""
+
+    def run(self, args):
+        if args[:2] == ["schtasks", "/query"]:
+            return CommandResult(list(args), 1, "", "ERROR: Access is denied.")
+        return super().run(args)
+
+
+def test_unlisted_tasks_are_not_compliant():
+    plan = build_plan([load_profile("telemetry")])
+    backend = UnlistableTasks(SimulatedHost.windows_default())
+
+    report = Verifier.for_transport(backend).verify(plan)
+    assert not report.complete
+    tasks = [item for item in report.items if item.kind == "task"]
+    assert len(tasks) == len(plan.tasks)
+    assert all(item.actual == "unknown" and not item.compliant for item in tasks)
+
+    result = PlanExecutor.for_transport(backend, poll_interval=0).execute(plan)
+    assert not result.success
+    assert all(task.exists and not task.success for task in result.tasks)
+
+
+def test_dry_run_reports_unlisted_tasks_as_unknown():
+    plan = build_plan([load_profile("telemetry")])
+    dry_run = predict(plan, UnlistableTasks(SimulatedHost.windows_default()))
+
+    assert dry_run.tasks_error == "ERROR: Access is denied."
+    assert not dry_run.result.success
+    lines = [line for line in describe(dry_run) if line.startswith("task")]
+    assert len(lines) == len(plan.tasks)
+    assert all(line.endswith("unknown (Could not list scheduled tasks: ERROR: Access is denied.)") for line in lines)
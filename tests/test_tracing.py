@@ -0,0 +1,67 @@
+import json
+import pytest
+from src.core.planner import PlanExecutor, build_plan
+from src.core.profiles import load_profile
+from src.core.simulator import SimulatedHost, SimulatorBackend
+from src.core.tracing import Trace, Tracer, set_tracer
+
+
+@pytest.fixture
+def tracer():
+    tracer = Tracer()
+    set_tracer(tracer)
+    yield tracer
+    set_tracer(None)
+
+
+def run_plan(*profiles):
+    plan = build_plan([load_profile(name) for name in profiles])
+    executor = PlanExecutor.for_transport(SimulatorBackend(SimulatedHost.windows_default()), poll_interval=0)
+    assert executor.execute(plan).success
+    return plan
+
+
+def test_every_plan_step_records_the_features_it_serves(tracer):
+    plan = run_plan("telemetry", "copilot")
+
+    steps = {event["name"]: event for event in tracer.events if event["cat"] == "feature"}
+    for task_path in plan.tasks.values():
+        assert steps[f"task:{task_path}"]["args"]["features"] == "telemetry"
+    for request in plan.services.values():
+        assert steps[f"service:{request.service_name}"]["args"]["features"] == "telemetry"
+    registry = [event for name, event in steps.items() if name.startswith("registry:")]
+    assert len(registry) == len(plan.registry)
+    assert {event["args"]["features"] for event in registry} == {"telemetry", "copilot"}
+    assert steps["post_actions"]["args"]["features"] == "copilot"
+
+
+def test_calls_nest_under_their_step(tracer):
+    plan = run_plan("telemetry")
+
+    stacks = tracer.folded_stacks()
+    task_path = next(iter(plan.tasks.values()))
+    assert any(f";task:{task_path};PlanExecutor.apply_task;" in stack for stack in stacks)
+
+
+def test_chrome_trace_and_folded_files(tracer, tmp_path):
+    run_plan("telemetry")
+    set_tracer(None)
+
+    chrome = tmp_path / "trace.json"
+    tracer.write(str(chrome))
+    trace = json.loads(chrome.read_text(encoding="utf-8"))
+    events = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert len(events) == len(tracer.events)
+    assert [event["ts"] for event in events] == sorted(event["ts"] for event in events)
+    assert {event["tid"] for event in events} == {
+        event["tid"] for event in trace["traceEvents"] if event["ph"] == "M"}
+
+    folded = tmp_path / "trace.folded"
+    tracer.write(str(folded))
+    lines = folded.read_text(encoding="utf-8").splitlines()
+    assert lines == tracer.folded_stacks()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_spans_are_shared_no_ops_while_tracing_is_off():
+    assert Trace.span("registry:a", "feature") is Trace.span("registry:b", "feature")
@@ -0,0 +1,97 @@
+from src.core.planner import build_plan
+from src.core.profiles import load_profile
+from src.core.registry_backend import HKEY_LOCAL_MACHINE, HKEY_USERS, REG_EXPAND_SZ
+from src.core.simulator import SimulatedHost
+from src.core.user_hives import (
+    NTUSER_FILE,
+    PROFILE_LIST_KEY,
+    USRCLASS_FILE,
+    UserHiveApplier,
+    UserProfile,
+    list_user_profiles,
+    user_location,
+)
+
+ALICE = "S-1-5-21-1000-1001"
+BOB = "S-1-5-21-1000-1002"
+COPILOT = r"software\policies\microsoft\windows\windowscopilot"
+INPROC = r"clsid\{86ca1aa0-34aa-4e8b-a509-50c905bae2a2}\inprocserver32"
+
+
+def host_with_users():
+    host = SimulatedHost()
+    host.add_user_profile(ALICE, r"C:\Users\alice", logged_on=True)
+    host.add_user_profile(BOB, r"C:\Users\bob")
+    # Service accounts have profiles too, but no settings to change
+    host.registry.put_value(HKEY_LOCAL_MACHINE, f"{PROFILE_LIST_KEY}\\S-1-5-18", "ProfileImagePath",
+                            r"C:\Windows\system32\config\systemprofile", REG_EXPAND_SZ)
+    return host
+
+
+def user_plan():
+    return build_plan([load_profile("copilot"), load_profile("context_menu"), load_profile("telemetry")])
+
+
+def test_classes_keys_live_in_their_own_hive():
+    assert user_location(ALICE, r"Software\Classes\CLSID\{x}\InprocServer32") == (
+        ALICE + "_Classes", ALICE + r"_Classes\CLSID\{x}\InprocServer32")
+    assert user_location(ALICE, "\\software\\classes\\") == (ALICE + "_Classes", ALICE + "_Classes")
+    assert user_location(ALICE, r"Software\ClassesExtra") == (ALICE, ALICE + r"\Software\ClassesExtra")
+    assert user_location(ALICE, r"Software\Policies") == (ALICE, ALICE + r"\Software\Policies")
+
+
+def test_only_user_accounts_are_listed():
+    host = host_with_users()
+    host.registry.put_key(HKEY_LOCAL_MACHINE, f"{PROFILE_LIST_KEY}\\S-1-5-21-1000-1003")
+
+    assert list_user_profiles(host.registry) == [
+        UserProfile(ALICE, r"C:\Users\alice"),
+        UserProfile(BOB, r"C:\Users\bob"),
+    ]
+
+
+def test_every_user_gets_the_settings_and_offline_hives_are_unloaded():
+    host = host_with_users()
+
+    results = UserHiveApplier(host.registry).apply(user_plan())
+
+    assert [result.sid for result in results] == [ALICE, BOB]
+    assert all(result.success and result.changes == 2 for result in results)
+    assert results[0].mounted == []
+    assert sorted(results[1].mounted) == [BOB, BOB + "_Classes"]
+    assert host.registry.get_value(HKEY_USERS, f"{ALICE}\\{COPILOT}", "TurnOffWindowsCopilot") == 1
+    assert host.registry.get_value(HKEY_USERS, f"{ALICE}_Classes\\{INPROC}", "") == ""
+    # Bob's changes are in his hive files, and nothing of his is left under HKEY_USERS
+    assert host.registry.loaded_hives == {}
+    assert not [key for key in host.registry.keys if key[0] == HKEY_USERS and key[1].startswith(BOB.lower())]
+    ntuser = host.registry.hive_files[f"C:\\Users\\bob\\{NTUSER_FILE}".lower()]
+    usrclass = host.registry.hive_files[f"C:\\Users\\bob\\{USRCLASS_FILE}".lower()]
+    assert ntuser[COPILOT]["turnoffwindowscopilot"][1] == 1
+    assert INPROC in usrclass
+    # HKLM values are not the applier's business
+    assert not [key for key in host.registry.keys if "datacollection" in key[1]]
+
+    again = UserHiveApplier(host.registry).apply(user_plan())
+    assert [result.changes for result in again] == [0, 0]
+
+
+def test_a_user_whose_hive_cannot_be_loaded_does_not_stop_the_others():
+    host = host_with_users()
+    host.registry.hive_files.pop(f"C:\\Users\\bob\\{USRCLASS_FILE}".lower())
+
+    alice, bob = UserHiveApplier(host.registry).apply(user_plan())
+
+    assert alice.success
+    assert not bob.success and bob.error.startswith("Could not load the user's hive")
+    assert bob.registry == []
+    assert host.registry.loaded_hives == {}
+    assert COPILOT not in host.registry.hive_files[f"C:\\Users\\bob\\{NTUSER_FILE}".lower()]
+
+
+def test_plans_without_user_settings_touch_no_hive():
+    host = host_with_users()
+    hive_files = dict(host.registry.hive_files)
+
+    assert UserHiveApplier(host.registry).apply(build_plan([load_profile("telemetry")])) == []
+    assert host.registry.hive_files == hive_files
+    assert host.registry.operations["set"] == 0
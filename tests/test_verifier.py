@@ -0,0 +1,105 @@
+from src.core.planner import PlanExecutor, build_plan
+from src.core.profiles import load_profile
+from src.core.registry_backend import HKEY_LOCAL_MACHINE, REG_DWORD, REG_SZ
+from src.core.service_manager import SERVICE_RUNNING
+from src.core.simulator import SimulatedHost, SimulatorBackend
+from src.core.verifier import CheckResult, Verifier
+
+DATA_COLLECTION = r"SOFTWARE\Policies\Microsoft\Windows\DataCollection"
+
+
+class NoEnumeration(SimulatorBackend):
+    """A host whose service enumeration fails."""
+
+    def run(self, args):
+        if args[:2] == ["sc", "query"] and len(args) > 2 and args[2] == "type=":
+            return super().run(["sc"])
+        return super().run(args)
+
+
+def telemetry_plan():
+    return build_plan([load_profile("telemetry"), load_profile("copilot")])
+
+
+def test_fresh_host_is_reported_item_by_item():
+    host = SimulatedHost.windows_default()
+    plan = telemetry_plan()
+
+    report = Verifier.for_transport(SimulatorBackend(host)).verify(plan)
+
+    assert report.complete and not report.is_compliant
+    value_count = sum(len(values) for values in plan.registry.values())
+    assert report.changes == len(report.items) == value_count + 2 + len(plan.tasks)
+    assert CheckResult("service", "DiagTrack start type", "disabled", "auto", False) in report.items
+    assert CheckResult("service", "DiagTrack state", "stopped", "running", False) in report.items
+    assert CheckResult("registry", f"HKEY_LOCAL_MACHINE\\{DATA_COLLECTION}\\AllowTelemetry", 0, None, False) in report.items
+
+
+def test_applied_host_is_compliant_and_checking_changes_nothing():
+    host = SimulatedHost.windows_default()
+    plan = telemetry_plan()
+    PlanExecutor.for_transport(SimulatorBackend(host), poll_interval=0).execute(plan)
+    writes = dict(host.registry.operations)
+    commands = len(host.commands)
+
+    report = Verifier.for_transport(SimulatorBackend(host)).verify(plan)
+
+    assert report.is_compliant and report.compliant == len(report.items)
+    assert (host.registry.operations["set"], host.registry.operations["delete"]) == (writes["set"], writes["delete"])
+    # One service enumeration and one task listing
+    assert [args[:2] for args in host.commands[commands:]] == [["sc", "query"], ["schtasks", "/query"]]
+
+
+def test_drift_is_reported_with_the_actual_value():
+    host = SimulatedHost.windows_default()
+    plan = telemetry_plan()
+    PlanExecutor.for_transport(SimulatorBackend(host), poll_interval=0).execute(plan)
+    host.registry.put_value(HKEY_LOCAL_MACHINE, DATA_COLLECTION, "AllowTelemetry", "0", REG_SZ)
+    host.add_service("DiagTrack", SERVICE_RUNNING, 3)
+
+    report = Verifier.for_transport(SimulatorBackend(host)).verify(plan)
+
+    assert [(item.target, item.actual) for item in report.drifted] == [
+        (f"HKEY_LOCAL_MACHINE\\{DATA_COLLECTION}\\AllowTelemetry", "0"),
+        ("DiagTrack start type", "demand"),
+        ("DiagTrack state", "running"),
+    ]
+
+
+def test_missing_services_and_tasks_count_as_compliant():
+    host = SimulatedHost("bare")
+    plan = build_plan([load_profile("telemetry")])
+    for planned in plan.registry_values():
+        host.registry.put_value(planned.hive, planned.path, planned.name, planned.value, planned.value_type)
+
+    report = Verifier.for_transport(SimulatorBackend(host)).verify(plan)
+
+    assert report.is_compliant
+    assert {item.actual for item in report.items if item.kind != "registry"} == {"not installed", "not found"}
+    # Nothing to stop, so the services are not enumerated
+    assert not [args for args in host.commands if args[0] == "sc"]
+
+
+def test_unreadable_service_states_make_the_report_incomplete():
+    host = SimulatedHost.windows_default()
+    plan = telemetry_plan()
+    PlanExecutor.for_transport(SimulatorBackend(host), poll_interval=0).execute(plan)
+
+    report = Verifier.for_transport(NoEnumeration(host)).verify(plan)
+
+    assert not report.complete and not report.success and not report.is_compliant
+    assert [item for item in report.items if item.kind == "service"] == [
+        CheckResult("service", "DiagTrack", "stop and disable", "unknown", False)]
+    assert all(item.compliant for item in report.items if item.kind != "service")
+
+
+def test_disable_only_services_are_checked_without_sc():
+    host = SimulatedHost.windows_default()
+    host.registry.put_value(HKEY_LOCAL_MACHINE, r"SYSTEM\CurrentControlSet\Services\DiagTrack", "Start", 4, REG_DWORD)
+    profile = load_profile("telemetry")
+    plan = build_plan([profile._replace(services=[profile.services[0]._replace(actions=["disable"])], tasks=[])])
+
+    report = Verifier.for_transport(SimulatorBackend(host)).verify(plan)
+
+    assert CheckResult("service", "DiagTrack start type", "disabled", "disabled", True) in report.items
+    assert host.commands == []